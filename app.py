@@ -2,9 +2,11 @@ import os
 import pathlib
 import secrets
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, Response, stream_with_context
 from src.RAG import RAGPipeline
+from src.LLMScheduler import SchedulerBusyError
 from src.Text2Image import Text2Image
+import itertools
 import json
 
 app = Flask(__name__)
@@ -12,7 +14,12 @@ app = Flask(__name__)
 app.secret_key = secrets.token_hex(16)
 ROOT = pathlib.Path(__file__).resolve().parent
 
-rag = RAGPipeline(os.path.join(ROOT, 'static/rooms.json'))
+# 房型向量索引保存在 vector_db 資料夾，重新啟動時只需嵌入新增或變動的房型
+# 候選房型的檢索與意圖分類同時進行，縮短房型推薦的等待時間；重複或相近的問題直接回傳快取的回應
+# 向量檢索結合特色欄位的關鍵字檢索，「浴缸」這類明確的設施需求在較小的 k 下也能取回
+# 每個聊天查詢最多 30 秒：時間不足時略過 LLM 審查、縮減房型數量，或直接以房型目錄排序回答（回應的 meta 中回報）
+rag = RAGPipeline(os.path.join(ROOT, 'static/rooms.json'), persist_directory=os.path.join(ROOT, 'vector_db'),
+                  speculative_retrieval=True, cache_responses=True, hybrid_retrieval=True, query_deadline=30)
 
 """
 首頁：顯示所有房型資料
@@ -40,6 +47,46 @@ def chat():
     response = rag.query(user_input)      # 取得 RAG 回應
     return jsonify({'response': response})
 
+"""
+將 query_stream 產生的事件格式化成 Server-Sent Events 的文字，資料以 JSON 編碼
+範例：
+    format_sse("token", "推薦房型：")
+    return：'event: token\ndata: {"text": "推薦房型："}\n\n'
+"""
+def format_sse(event, data):
+    payload = {'text': data} if event == 'token' else {'response': data}
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+"""
+串流聊天 API，推薦內容一產生就以 Server-Sent Events 逐段送出，最後送出完整的房型資訊
+範例：
+    POST /chat/stream
+    body: {"message": "請推薦一個適合三人入住的房型"}
+回傳（text/event-stream）：
+    event: token
+    data: {"text": "推薦房型："}
+
+    event: done
+    data: {"response": {"rooms": {...}, "conclusion": "..."}}
+"""
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    user_input = request.json['message']
+    events = rag.query_stream(user_input)
+    # 先取得第一個事件：LLM 排程器忙碌時在送出 200 之前拋出 SchedulerBusyError，改回傳 503
+    first = next(events)
+    events = (format_sse(event, data) for event, data in itertools.chain([first], events))
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+"""
+LLM 排程器忙碌（排隊已滿或等待逾時）時回傳 503，Retry-After 為建議的重試秒數
+return {"error": "LLM 排隊的請求已滿，請於 3 秒後重試", "retry_after": 3}
+"""
+@app.errorhandler(SchedulerBusyError)
+def llm_busy(error):
+    return jsonify({'error': str(error), 'retry_after': error.retry_after}), 503, {'Retry-After': str(error.retry_after)}
+
 """
 登入頁面，使用 session 管理登入狀態
 GET（顯示登入頁面） 和 POST（提交登入表單）
@@ -88,6 +135,16 @@ def auto_recommend():
     else:
         return jsonify({'error': '無法推薦房型'}), 404
 
+"""
+執行統計 API（僅限登入後存取），例如規則式意圖分類的命中率
+return {"intent": {"total": 10, "rule_hits": 7, "hit_rate": 0.7, ...}}
+"""
+@app.route('/stats', methods=['GET'])
+def stats():
+    if not session.get('logged_in'):
+        return jsonify({'error': '請先登入'}), 401
+    return jsonify(rag.stats())
+
 """
 根據房型描述生成圖片 API
 return {"image_url": "/static/image/img_XX_temp.png"}
@@ -171,26 +228,69 @@ def add_room():
     with open(os.path.join(ROOT, 'static/rooms.json'), 'w', encoding='utf-8') as f:
         json.dump(rooms, f, ensure_ascii=False, indent=4)
 
-    # 把剛剛更新完的 rooms.json 完整同步到 RAG pipeline 的內部資料
-    rag.data = rooms
+    # 只把新房型嵌入並寫入既有的向量資料庫，不重建整個索引
+    rag.upsert_room(new_room)
 
-    # 找出目前資料中最大 ID，用來後續新增房型時自動遞增 ID
-    rag.maxID = max([int(item['id']) for item in rag.data])
+    return jsonify({'success': True})
 
-    # 把每一個房型轉成 langchain 的 Document 格式
-    rag.docs = [
-        __import__('langchain').docstore.document.Document(
-            page_content=f"名稱:{item['name']} 價格:{item['price']} 面積:{item['area']} 特色:{item['features']} 風格:{item.get('style', '')} 床數:{item.get('maxOccupancy', '')}"
-        ) for item in rag.data
-    ]
+"""
+更新房型資料 API
+input：
+    body: {id, 以及要更新的欄位 name, price, area, features, style, maxOccupancy}
+return：{"success": True, "room": {...}}；找不到房型時回傳 404。
+"""
+@app.route('/update_room', methods=['POST'])
+def update_room():
+    data = request.get_json()
+    room_id = data.get('id')
 
-    # 建立向量資料庫
-    rag.vectorstore = __import__('langchain_community').vectorstores.Chroma.from_documents(
-        rag.docs, __import__('langchain_community').embeddings.FastEmbedEmbeddings()
-    )
+    with open(os.path.join(ROOT, 'static/rooms.json'), 'r', encoding='utf-8') as f:
+        rooms = json.load(f)
+
+    room = next((room for room in rooms if str(room['id']) == str(room_id)), None)
+    if room is None:
+        return jsonify({'error': '找不到房型'}), 404
+
+    # 只允許更新房型描述欄位，id 與圖片路徑維持不變
+    for field in ('name', 'price', 'area', 'features', 'style', 'maxOccupancy'):
+        if field in data:
+            room[field] = data[field]
+
+    # 與新增房型相同，只傳數字時補上「人房」
+    if str(room['maxOccupancy']).isdigit():
+        room['maxOccupancy'] = f"{room['maxOccupancy']}人房"
+
+    with open(os.path.join(ROOT, 'static/rooms.json'), 'w', encoding='utf-8') as f:
+        json.dump(rooms, f, ensure_ascii=False, indent=4)
+
+    # 只重新嵌入被修改的房型
+    rag.upsert_room(room)
+
+    return jsonify({'success': True, 'room': room})
+
+"""
+刪除房型資料 API
+input：
+    body: {id}
+return：{"success": True}；找不到房型時回傳 404。
+"""
+@app.route('/delete_room', methods=['POST'])
+def delete_room():
+    data = request.get_json()
+    room_id = data.get('id')
+
+    with open(os.path.join(ROOT, 'static/rooms.json'), 'r', encoding='utf-8') as f:
+        rooms = json.load(f)
+
+    remaining = [room for room in rooms if str(room['id']) != str(room_id)]
+    if len(remaining) == len(rooms):
+        return jsonify({'error': '找不到房型'}), 404
+
+    with open(os.path.join(ROOT, 'static/rooms.json'), 'w', encoding='utf-8') as f:
+        json.dump(remaining, f, ensure_ascii=False, indent=4)
 
-    # 設定檢索器，這樣 RAGPipeline 就可以使用向量資料庫進行檢索
-    rag.retriever = rag.vectorstore.as_retriever(search_kwargs={"k": 10})
+    # 從向量資料庫中移除該房型
+    rag.delete_room(room_id)
 
     return jsonify({'success': True})
 
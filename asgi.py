@@ -0,0 +1,130 @@
+import json
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app, format_sse, rag
+from src.LLMScheduler import SchedulerBusyError
+
+"""
+ASGI 進入點：POST /chat 與 POST /chat/stream 以非同步的 rag.aquery / rag.aquery_stream 處理，等待 LLM 回應時不佔用執行緒，
+可同時服務大量聊天對話；其餘路由交給原本的 Flask app 處理。
+
+啟動方式：
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+flask_app = WsgiToAsgi(app)
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+async def send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode())] + list(headers)
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+"""
+讀取聊天請求中的 message，格式錯誤時回傳 400 並回傳 None
+"""
+async def read_message(receive, send):
+    body = await read_body(receive)
+    if body is None:
+        return None
+
+    try:
+        return json.loads(body)['message']
+    except (ValueError, TypeError, KeyError):
+        await send_json(send, {'error': '請提供 message'}, status=400)
+        return None
+
+
+"""
+LLM 排程器忙碌時回傳 503 與 Retry-After，格式與 Flask 的 llm_busy 相同
+"""
+async def send_busy(send, error):
+    await send_json(send, {'error': str(error), 'retry_after': error.retry_after}, status=503,
+                    headers=[(b"retry-after", str(error.retry_after).encode())])
+
+
+"""
+非同步聊天 API，輸入與回傳格式與 Flask 的 /chat 相同
+範例：
+    POST /chat
+    body: {"message": "請推薦一個適合三人入住的房型"}
+回傳：{"response": "推薦房型資訊..."}
+"""
+async def chat(scope, receive, send):
+    user_input = await read_message(receive, send)
+    if user_input is None:
+        return
+
+    try:
+        response = await rag.aquery(user_input)
+    except SchedulerBusyError as error:
+        await send_busy(send, error)
+        return
+    await send_json(send, {'response': response})
+
+
+"""
+非同步串流聊天 API，輸入與回傳格式與 Flask 的 /chat/stream 相同（Server-Sent Events）
+"""
+async def chat_stream(scope, receive, send):
+    user_input = await read_message(receive, send)
+    if user_input is None:
+        return
+
+    events = rag.aquery_stream(user_input)
+    # 先取得第一個事件，LLM 排程器忙碌時在送出 200 之前改回傳 503
+    try:
+        first = await events.__anext__()
+    except SchedulerBusyError as error:
+        await send_busy(send, error)
+        return
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no")]
+    })
+    await send({"type": "http.response.body", "body": format_sse(*first).encode("utf-8"), "more_body": True})
+    async for event, data in events:
+        await send({"type": "http.response.body", "body": format_sse(event, data).encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(scope, receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/chat" and scope["method"] == "POST":
+        await chat(scope, receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/chat/stream" and scope["method"] == "POST":
+        await chat_stream(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_community.llms import Ollama
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmark.stub_ollama import start_stub_server
+from src.RAG import RAGPipeline
+
+"""
+比較同步 query 與非同步 aquery 在多個對話同時進行時的效能。
+LLM 使用本機的模擬 Ollama 伺服器（固定延遲），嵌入使用 DeterministicFakeEmbedding，只量測服務端的排程與等待。
+  sync：以固定數量的執行緒（模擬 WSGI worker）執行 rag.query，超過執行緒數的對話需要排隊
+  async：在單一事件迴圈中以 asyncio.gather 同時執行 rag.aquery
+
+範例：
+    python -m benchmark.async_chat_benchmark --sessions 64 --threads 8 --latency 0.2
+"""
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 不含價格、人數等關鍵字的問題，意圖分類、推薦與審查都需要呼叫 LLM
+QUESTION = "想找安靜一點的房間"
+
+
+def report(name, elapsed, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:<6} total={elapsed:.2f}s  throughput={len(latencies) / elapsed:.1f} req/s  "
+          f"p50={statistics.median(latencies):.2f}s  p95={p95:.2f}s")
+
+
+def run_sync(rag, sessions, threads):
+    def timed_query(_):
+        start = time.perf_counter()
+        rag.query(QUESTION)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(timed_query, range(sessions)))
+    return time.perf_counter() - start, latencies
+
+
+def run_async(rag, sessions):
+    async def timed_query():
+        start = time.perf_counter()
+        await rag.aquery(QUESTION)
+        return time.perf_counter() - start
+
+    async def run():
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(timed_query() for _ in range(sessions)))
+        return time.perf_counter() - start, latencies
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步與非同步聊天查詢的並行效能比較")
+    parser.add_argument("--sessions", type=int, default=64, help="同時進行的對話數")
+    parser.add_argument("--threads", type=int, default=8, help="同步模式的執行緒數")
+    parser.add_argument("--latency", type=float, default=0.2, help="模擬 LLM 每次呼叫的延遲（秒）")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.latency)
+    try:
+        with tempfile.TemporaryDirectory() as persist_directory:
+            rag = RAGPipeline(os.path.join(ROOT, 'static/rooms.json'), persist_directory=persist_directory,
+                              embeddings=DeterministicFakeEmbedding(size=64), speculative_retrieval=True)
+            rag.llm = Ollama(model="stub", base_url=base_url)
+
+            print(f"sessions={args.sessions} threads={args.threads} llm_latency={args.latency}s")
+            report("sync", *run_sync(rag, args.sessions, args.threads))
+            report("async", *run_async(rag, args.sessions))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import re
+import time
+
+from src.ConstraintParser import parse_numeric_constraints
+
+"""
+比較原本的正規表示式條件提取（extract_price_range、extract_area_range、extract_occupancy 各自多次 re.search）
+與 parse_numeric_constraints 一次掃描的解析速度，並列出兩者結果不同的問題（通常是中文數字或單位判斷的差異）。
+parse_numeric_constraints 有快取，"single-pass" 量測的是不使用快取的解析時間，"cached" 為同一個問題重複解析的時間。
+
+範例：
+    python -m benchmark.constraint_parser_benchmark --repeat 2000
+"""
+QUESTIONS = [
+    "3000元以下的工業雙人房，要有浴缸",
+    "價格2000~3000元",
+    "我要3000~4000元的房型，30~40坪",
+    "大於2000元，4000元以內的4人房",
+    "面積大於40m²，預算5000以下",
+    "想要有陽台的房間",
+    "預算三千到五千，30坪以上的兩人房",
+    "十二人的家庭房，兩萬元以內",
+    "請推薦安靜的房間",
+    "低於1800元的房型",
+]
+
+
+"""
+原本 RAGPipeline 的條件提取實作（每次呼叫時才編譯並逐一比對正規表示式），只用於比較
+"""
+class LegacyExtractor:
+    ZH2NUM = {'零': 0, '一': 1, '二': 2, '兩': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9, '十': 10}
+
+    def extract_price_range(self, text):
+        min_price, max_price, min_strict, max_strict = None, None, False, False
+        range_match = re.search(r'(\d{3,5})\s*(元)?\s*(~|到|至|\-|—)\s*(\d{3,5})', text)
+        if range_match:
+            return int(range_match.group(1)), int(range_match.group(4)), False, False
+        if match := re.search(r'(\d{3,5})\s*(元)?\s*(以上|起|以上的)', text):
+            min_price = int(match.group(1))
+        elif match := re.search(r'(大於|超過|高於)\s*(\d{3,5})\s*(元)?\s*', text):
+            min_price, min_strict = int(match.group(2)), True
+        if match := re.search(r'(\d{3,5})\s*(元)?\s*(以下|以內|之內)', text):
+            max_price = int(match.group(1))
+        elif match := re.search(r'(小於|少於|低於)\s*(\d{3,5})\s*(元)?\s*', text):
+            max_price, max_strict = int(match.group(2)), True
+        return min_price, max_price, min_strict, max_strict
+
+    def extract_area_range(self, text):
+        min_area, max_area, min_strict, max_strict = None, None, False, False
+        if not re.search(r'(面積|坪|平方|m²|平方米|平方公尺)', text):
+            return min_area, max_area, min_strict, max_strict
+        range_match = re.search(r'(\d{2,4})\s*(m²|平方公尺|平方米|坪)?\s*(~|到|至|\-|—)\s*(\d{2,4})', text)
+        if range_match:
+            return int(range_match.group(1)), int(range_match.group(4)), False, False
+        if match := re.search(r'(\d{2,4})\s*(m²|平方公尺|平方米|坪)?\s*(以上|起|以上的)', text):
+            min_area = int(match.group(1))
+        elif match := re.search(r'(大於|超過|多於)\s*(\d{2,4})', text):
+            min_area, min_strict = int(match.group(2)), True
+        if match := re.search(r'(\d{2,4})\s*(m²|平方公尺|平方米|坪)?\s*(以下|以內|之內)', text):
+            max_area = int(match.group(1))
+        elif match := re.search(r'(小於|少於|低於)\s*(\d{2,4})', text):
+            max_area, max_strict = int(match.group(2)), True
+        return min_area, max_area, min_strict, max_strict
+
+    def extract_occupancy(self, text):
+        if '單人房' in text:
+            return 1
+        if '雙人' in text:
+            return 2
+        match = re.search(r'(\d{1,2}|[一二兩三四五六七八九十]{1,3})\s*(人|位)', text)
+        if not match:
+            return None
+        return self._parse_max_occupancy(match.group(1))
+
+    def _parse_max_occupancy(self, value):
+        value = str(value)
+        match = re.search(r'\d+', value)
+        if match:
+            return int(match.group(0))
+        if value.startswith('十'):
+            return 10 + (self.ZH2NUM[value[1]] if len(value) > 1 and value[1] in self.ZH2NUM else 0)
+        if '十' in value:
+            parts = value.split('十')
+            num = self.ZH2NUM.get(parts[0], 0) * 10
+            if len(parts) > 1 and parts[1] and parts[1][0] in self.ZH2NUM:
+                num += self.ZH2NUM[parts[1][0]]
+            return num
+        for key in self.ZH2NUM:
+            if key in value:
+                return self.ZH2NUM[key]
+        return 1
+
+    def parse(self, text):
+        return self.extract_price_range(text), self.extract_area_range(text), self.extract_occupancy(text)
+
+
+def measure(parse, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for question in QUESTIONS:
+            parse(question)
+    return (time.perf_counter() - start) / (repeat * len(QUESTIONS)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="條件提取的效能比較")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    legacy = LegacyExtractor()
+    results = {
+        "legacy": measure(legacy.parse, args.repeat),
+        "single-pass": measure(parse_numeric_constraints.__wrapped__, args.repeat),
+        "cached": measure(parse_numeric_constraints, args.repeat),
+    }
+    for name, micros in results.items():
+        print(f"{name:<12} {micros:7.2f} us/question")
+
+    print("結果不同的問題：")
+    for question in QUESTIONS:
+        old, new = legacy.parse(question), parse_numeric_constraints(question)
+        if old != new:
+            print(f"  {question}\n    legacy: {old}\n    new:    {new}")
+
+
+if __name__ == '__main__':
+    main()
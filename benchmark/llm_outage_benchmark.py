@@ -0,0 +1,75 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmark.stub_ollama import start_stub_server
+from src.RAG import RAGPipeline
+
+"""
+模擬 Ollama 變慢（每個請求都超過 llm_timeout）期間，房型推薦查詢的延遲與回應類型。
+依序執行三個階段，每個階段送出 --queries 個查詢：
+  healthy：模擬伺服器正常回應
+  outage：模擬伺服器的延遲超過 llm_timeout，前幾個查詢等到逾時後改用 LLM 無法使用時的回應，斷路器開啟後直接回應
+  recovered：伺服器恢復，等待 llm_breaker_open_duration 秒後斷路器放行試探呼叫並關閉
+比較斷路器開啟（預設）與關閉（--no-breaker，min_calls 設為無限大，每個查詢都等到逾時）時各階段的延遲。
+
+範例：
+    python -m benchmark.llm_outage_benchmark --queries 20 --latency 0.05 --outage-latency 3 --timeout 1
+"""
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS = ["想找安靜一點的房間", "3000元以下的雙人房", "有浴缸的日式房型"]
+
+
+def run_phase(rag, queries):
+    latencies, degraded = [], 0
+    for index in range(queries):
+        start = time.perf_counter()
+        response = rag.query(QUESTIONS[index % len(QUESTIONS)])
+        latencies.append(time.perf_counter() - start)
+        degraded += bool(response.get("degraded"))
+    return sorted(latencies), degraded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama 變慢期間斷路器與 LLM 無法使用時回應的延遲")
+    parser.add_argument("--queries", type=int, default=20, help="每個階段的查詢數")
+    parser.add_argument("--latency", type=float, default=0.05, help="伺服器正常時每次呼叫的延遲（秒）")
+    parser.add_argument("--outage-latency", type=float, default=3.0, help="伺服器變慢時每次呼叫的延遲（秒）")
+    parser.add_argument("--timeout", type=int, default=1, help="llm_timeout（秒）")
+    parser.add_argument("--open-duration", type=float, default=5.0, help="斷路器開啟後多久放行試探呼叫（秒）")
+    parser.add_argument("--no-breaker", action="store_true", help="停用斷路器（永遠不開啟）")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.latency)
+    handler = server.RequestHandlerClass
+    try:
+        with tempfile.TemporaryDirectory() as persist_directory:
+            RAGPipeline.llm_timeout = args.timeout
+            RAGPipeline.llm_breaker_open_duration = args.open_duration
+            if args.no_breaker:
+                RAGPipeline.llm_breaker_min_calls = float("inf")
+            rag = RAGPipeline(os.path.join(ROOT, 'static/rooms.json'), persist_directory=persist_directory,
+                              embeddings=DeterministicFakeEmbedding(size=64))
+            rag.llm = rag.create_llm(base_url=base_url)
+
+            print(f"queries={args.queries} latency={args.latency}s outage_latency={args.outage_latency}s "
+                  f"timeout={args.timeout}s breaker={'off' if args.no_breaker else 'on'}")
+            for phase, latency in (("healthy", args.latency), ("outage", args.outage_latency), ("recovered", args.latency)):
+                handler.latency = latency
+                if phase == "recovered":
+                    time.sleep(args.open_duration)
+                latencies, degraded = run_phase(rag, args.queries)
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                fast = sum(1 for value in latencies if value < 0.1)
+                print(f"{phase:<10} total={sum(latencies):6.2f}s  p50={statistics.median(latencies) * 1e3:8.1f}ms  "
+                      f"p95={p95 * 1e3:8.1f}ms  under_100ms={fast:<3} degraded={degraded:<3} breaker={rag.llm_breaker.state}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmark.stub_ollama import start_stub_server
+from src.LLMScheduler import SchedulerBusyError
+from src.RAG import RAGPipeline
+
+"""
+模擬後台自動推薦（auto_recommend_room）的大量請求與旅客聊天同時送往同一台 GPU 伺服器時，聊天查詢的延遲。
+模擬伺服器同時處理超過 --capacity 個請求時每個請求依比例變慢；--background 個執行緒持續呼叫 auto_recommend_room，
+--chats 個執行緒各送出 --queries 個聊天查詢。
+比較 LLM 排程器開啟（預設，llm_max_concurrency 為 --capacity，聊天優先）與關閉（--no-scheduler，不限制同時呼叫數）時，
+聊天查詢的延遲、後台完成的推薦數量，以及被拒絕（503）的查詢數量。
+
+範例：
+    python -m benchmark.llm_scheduler_benchmark --chats 4 --background 16 --queries 5 --latency 0.1 --capacity 4
+"""
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS = ["想找安靜一點的房間", "3000元以下的雙人房", "有浴缸的日式房型"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="後台自動推薦與聊天同時進行時，LLM 排程器對聊天延遲的影響")
+    parser.add_argument("--chats", type=int, default=4, help="聊天執行緒數量")
+    parser.add_argument("--background", type=int, default=16, help="持續呼叫自動推薦的執行緒數量")
+    parser.add_argument("--queries", type=int, default=5, help="每個聊天執行緒送出的查詢數")
+    parser.add_argument("--latency", type=float, default=0.1, help="伺服器未滿載時每次呼叫的延遲（秒）")
+    parser.add_argument("--capacity", type=int, default=4, help="模擬的 GPU 同時處理請求數量")
+    parser.add_argument("--no-scheduler", action="store_true", help="停用排程器（不限制同時呼叫數）")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.latency, capacity=args.capacity)
+    try:
+        with tempfile.TemporaryDirectory() as persist_directory:
+            RAGPipeline.llm_max_concurrency = 10 ** 6 if args.no_scheduler else args.capacity
+            RAGPipeline.llm_max_queue_time = 60.0
+            rag = RAGPipeline(os.path.join(ROOT, 'static/rooms.json'), persist_directory=persist_directory,
+                              embeddings=DeterministicFakeEmbedding(size=64))
+            rag.llm = rag.create_llm(base_url=base_url)
+
+            stop = threading.Event()
+            lock = threading.Lock()
+            latencies, generated, busy = [], [0], [0]
+
+            def background():
+                while not stop.is_set():
+                    try:
+                        room = rag.auto_recommend_room()
+                    except SchedulerBusyError:
+                        continue
+                    with lock:
+                        generated[0] += room is not None
+
+            def chat(offset):
+                for index in range(args.queries):
+                    start = time.perf_counter()
+                    try:
+                        rag.query(QUESTIONS[(offset + index) % len(QUESTIONS)])
+                    except SchedulerBusyError:
+                        with lock:
+                            busy[0] += 1
+                        continue
+                    with lock:
+                        latencies.append(time.perf_counter() - start)
+
+            workers = [threading.Thread(target=background) for _ in range(args.background)]
+            for worker in workers:
+                worker.start()
+            time.sleep(args.latency * 2)
+
+            start = time.perf_counter()
+            chats = [threading.Thread(target=chat, args=(offset,)) for offset in range(args.chats)]
+            for thread in chats:
+                thread.start()
+            for thread in chats:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+            stats = rag.llm_scheduler.stats()
+            print(f"chats={args.chats} background={args.background} queries={args.queries} latency={args.latency}s "
+                  f"capacity={args.capacity} scheduler={'off' if args.no_scheduler else 'on'}")
+            print(f"chat       p50={statistics.median(latencies) * 1e3 if latencies else 0.0:8.1f}ms  p95={p95 * 1e3:8.1f}ms  "
+                  f"answered={len(latencies):<4} busy={busy[0]:<4} elapsed={elapsed:6.2f}s")
+            print(f"background generated={generated[0]:<4} peak_queued={stats['peak_queued']:<4} "
+                  f"average_wait={stats['average_wait'] * 1e3:8.1f}ms")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
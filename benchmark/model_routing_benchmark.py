@@ -0,0 +1,77 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmark.stub_ollama import start_stub_server
+from src.RAG import RAGPipeline
+
+"""
+比較不同的模型分派設定（stage_models）下，房型推薦查詢的端對端延遲。
+以兩個本機模擬 Ollama 伺服器代表大模型與小模型（各自固定延遲），大模型為預設的 self.llm，
+各設定只改變意圖分類、審查等階段送往哪一個伺服器。嵌入使用 DeterministicFakeEmbedding，不快取回應。
+  single：所有階段都使用大模型
+  small-intent：意圖分類使用小模型
+  small-intent-review：意圖分類與推薦審查使用小模型
+
+範例：
+    python -m benchmark.model_routing_benchmark --queries 20 --large-latency 0.3 --small-latency 0.05
+"""
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 規則無法判斷意圖的問題，意圖分類需要呼叫 LLM；推薦內容中沒有可檢查的條件時審查也交給 LLM
+QUESTIONS = ["想找安靜一點的房間", "適合度假放鬆的房型", "想要浪漫一點的住宿"]
+
+
+def routing_profiles(small_url, max_tokens):
+    small = {"model": "small", "base_url": small_url, "temperature": 0, "max_tokens": max_tokens}
+    return {
+        "single": {},
+        "small-intent": {"intent": small},
+        "small-intent-review": {"intent": small, "review": small},
+    }
+
+
+def run_profile(rag, queries):
+    latencies = []
+    for index in range(queries):
+        start = time.perf_counter()
+        rag.query(QUESTIONS[index % len(QUESTIONS)])
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="各呼叫階段模型分派的端對端延遲比較")
+    parser.add_argument("--queries", type=int, default=20, help="每個設定執行的查詢數")
+    parser.add_argument("--large-latency", type=float, default=0.3, help="模擬大模型每次呼叫的延遲（秒）")
+    parser.add_argument("--small-latency", type=float, default=0.05, help="模擬小模型每次呼叫的延遲（秒）")
+    parser.add_argument("--max-tokens", type=int, default=16, help="小模型階段的輸出 token 上限")
+    args = parser.parse_args()
+
+    large_server, large_url = start_stub_server(args.large_latency)
+    small_server, small_url = start_stub_server(args.small_latency)
+    try:
+        with tempfile.TemporaryDirectory() as persist_directory:
+            rag = RAGPipeline(os.path.join(ROOT, 'static/rooms.json'), persist_directory=persist_directory,
+                              embeddings=DeterministicFakeEmbedding(size=64))
+            rag.llm = rag.create_llm(model="large", base_url=large_url)
+
+            print(f"queries={args.queries} large_latency={args.large_latency}s small_latency={args.small_latency}s")
+            for name, stage_models in routing_profiles(small_url, args.max_tokens).items():
+                rag.stage_models = rag.validate_stage_models(stage_models)
+                rag.metrics.clear()
+                latencies = sorted(run_profile(rag, args.queries))
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                calls = {stage: value["calls"] for stage, value in rag.stats()["prompt_tokens"].items()}
+                print(f"{name:<20} total={sum(latencies):.2f}s  p50={statistics.median(latencies):.3f}s  "
+                      f"p95={p95:.3f}s  llm_calls={calls}")
+    finally:
+        large_server.shutdown()
+        small_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
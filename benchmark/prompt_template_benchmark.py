@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import random
+import time
+
+from langchain.prompts import ChatPromptTemplate
+from langchain_community.llms import Ollama
+from langchain_core.language_models import FakeListLLM
+
+from benchmark.stub_ollama import start_stub_server
+from src.PromptBuilder import build_room_table
+from src.PromptTemplates import PROMPT_MESSAGES, PromptRegistry
+
+"""
+比較 prompt 模板登錄表（PromptRegistry）與原本每次呼叫都重建模板的差異：
+  per-call overhead：以不經網路的 FakeListLLM 量測每次呼叫中建立模板、組合 chain 與格式化 prompt 的時間
+  prompt eval：連續送出不同問題的房型推薦請求，比較原本的模板（固定的回覆格式說明放在使用者問題與房型資料之後）
+              與目前的模板（固定說明都在前綴）實際需要預填的 token 數量與時間
+
+prompt eval 預設使用本機的模擬 Ollama 伺服器（依與最近 prompt 的共同前綴模擬 KV 快取），
+也可以用 --base-url 與 --model 指定真正的 Ollama 伺服器，數值取自 Ollama 回傳的 prompt_eval_count / prompt_eval_duration。
+
+範例：
+    python -m benchmark.prompt_template_benchmark --calls 2000 --requests 20 --prefill 0.0005
+    python -m benchmark.prompt_template_benchmark --base-url http://localhost:11434 --model gemma3:27b-it-qat
+"""
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS = [
+    "想找安靜一點的房間",
+    "預算5000以下的雙人房",
+    "有浴缸的房型推薦",
+    "適合家庭出遊的四人房",
+    "想要有陽台、景觀好的房間",
+    "日式風格的房型",
+    "可以帶寵物的房間",
+    "商務出差要有書桌",
+]
+
+# 原本的推薦模板：回覆格式說明在使用者問題與房型資料之後，每個請求的 prompt 從使用者問題開始就不同
+LEGACY_PREDICTION_MESSAGES = (
+    ("system", PROMPT_MESSAGES["prediction"][0][1].split("\n\n房型資料每行一個房型")[0]),
+    ("user",
+     "使用者需求：{input}\n"
+     "房型資料：{rooms}\n\n"
+     "請根據上述資訊，推薦最符合使用者需求的房型，並給出推薦理由與結語。\n"
+     "回覆格式如下（每個房型請依照範例填寫）：\n\n"
+     "推薦房型：\n"
+     "房型名稱\n"
+     "推薦理由：...\n\n"
+     "房型名稱\n"
+     "推薦理由：...\n\n"
+     "房型名稱\n"
+     "推薦理由：...\n\n"
+     "結語：..."),
+)
+
+
+def sample_inputs(count, seed=0):
+    with open(os.path.join(ROOT, "static", "rooms.json"), encoding="utf-8") as f:
+        rooms = json.load(f)
+    rng = random.Random(seed)
+    return [{"input": QUESTIONS[index % len(QUESTIONS)],
+             "rooms": build_room_table(rng.sample(rooms, min(10, len(rooms)))).text}
+            for index in range(count)]
+
+
+def measure_overhead(calls):
+    llm = FakeListLLM(responses=["推薦內容"])
+    inputs = sample_inputs(1)[0]
+    registry = PromptRegistry()
+
+    def rebuild():
+        (ChatPromptTemplate.from_messages(list(PROMPT_MESSAGES["prediction"])) | llm).invoke(inputs)
+
+    def cached():
+        registry.chain("prediction", llm).invoke(inputs)
+
+    results = {}
+    for name, call in (("rebuild", rebuild), ("registry", cached)):
+        call()
+        start = time.perf_counter()
+        for _ in range(calls):
+            call()
+        results[name] = (time.perf_counter() - start) / calls * 1e6
+    return results
+
+
+def measure_prompt_eval(template, requests, base_url, model):
+    llm = Ollama(model=model, base_url=base_url)
+    evaluated, duration = 0, 0
+    start = time.perf_counter()
+    for inputs in sample_inputs(requests):
+        # 與 chain.invoke 送出的 prompt 相同，改用 generate 才能取得 Ollama 回傳的 prompt_eval 統計
+        prompt = template.format_prompt(**inputs).to_string()
+        info = llm.generate([prompt]).generations[0][0].generation_info or {}
+        evaluated += info.get("prompt_eval_count", 0)
+        duration += info.get("prompt_eval_duration", 0)
+    return evaluated / requests, duration / requests / 1e6, (time.perf_counter() - start) / requests * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="prompt 模板登錄表的效能比較")
+    parser.add_argument("--calls", type=int, default=2000, help="量測每次呼叫開銷的呼叫次數")
+    parser.add_argument("--requests", type=int, default=20, help="量測 prompt eval 的請求數量")
+    parser.add_argument("--prefill", type=float, default=0.0005, help="模擬伺服器每個未快取 token 的預填時間（秒）")
+    parser.add_argument("--base-url", default=None, help="真正的 Ollama 伺服器，未指定時使用模擬伺服器")
+    parser.add_argument("--model", default="stub")
+    args = parser.parse_args()
+
+    print("per-call overhead（FakeListLLM）：")
+    for name, micros in measure_overhead(args.calls).items():
+        print(f"  {name:<9} {micros:8.1f} us/call")
+
+    print("prompt eval（房型推薦，每個請求平均）：")
+    layouts = (("legacy", ChatPromptTemplate.from_messages(list(LEGACY_PREDICTION_MESSAGES))),
+               ("registry", PromptRegistry.template("prediction")))
+    for name, template in layouts:
+        server = None
+        base_url = args.base_url
+        if base_url is None:
+            server, base_url = start_stub_server(prefill=args.prefill)
+        try:
+            tokens, eval_ms, total_ms = measure_prompt_eval(template, args.requests, base_url, args.model)
+        finally:
+            if server is not None:
+                server.shutdown()
+        print(f"  {name:<9} prompt_eval_count={tokens:7.1f}  prompt_eval={eval_ms:7.1f} ms  total={total_ms:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.PromptBuilder import estimate_tokens
+
+"""
+模擬 Ollama /api/generate 的本機伺服器，供效能測試使用，不需要 GPU 或真正的模型。
+每個請求等待 latency 秒後，依 prompt 內容回傳固定格式的回應（以 JSON lines 串流回傳，與 Ollama 相同）：
+  意圖分類 → 房型推薦
+  需求解析 → 房型推薦的 JSON
+  房型推薦 → 推薦 prompt 中第一個房型
+  推薦審查 → 推薦內容符合使用者需求
+  自動推薦 → 一個新房型的 JSON
+
+prefill 大於 0 時另外模擬 prompt 的預填（prefill）時間：與最近處理過的 prompt 相同的前綴視為已在 KV 快取中，
+只有其餘部分依估算的 token 數量計時，並與 Ollama 一樣在最後一行回傳 prompt_eval_count 與 prompt_eval_duration（奈秒）。
+
+capacity 大於 0 時模擬 GPU 的處理能力：同時處理的請求超過 capacity 個時，每個請求的延遲依比例增加
+（例如 capacity=4 時同時 8 個請求，每個都需要 2 倍的時間）。
+
+範例：
+    python -m benchmark.stub_ollama --port 11434 --latency 0.5 --prefill 0.001
+"""
+# 推薦 prompt 中的第一個房型：「名稱:房型」摘要或精簡表格欄位名稱下一行的第一欄
+ROOM_NAME_PATTERN = re.compile(r'名稱:(\S+)|名稱\|[^\n]*\n([^|\n]+)\|')
+# 模擬的 KV 快取保留最近幾個 prompt（相當於 Ollama 的平行 slot 數量）
+PREFIX_CACHE_SLOTS = 4
+
+
+def stub_response(prompt):
+    if "請判斷以下使用者輸入屬於哪一種類型" in prompt:
+        return "房型推薦"
+    if "需求解析器" in prompt:
+        return json.dumps({"intent": "房型推薦", "price": None, "area": None, "occupancy": None,
+                           "styles": [], "amenities": []}, ensure_ascii=False)
+    if "審查助手" in prompt:
+        return "推薦內容符合使用者需求，無需變更。"
+    if "請推薦一個房型，並只回傳 JSON" in prompt:
+        return json.dumps({"name": f"測試房型{time.monotonic_ns()}", "price": 3000, "area": 20,
+                           "features": "浴缸", "style": "現代", "maxOccupancy": 2}, ensure_ascii=False)
+
+    match = ROOM_NAME_PATTERN.search(prompt)
+    name = (match.group(1) or match.group(2)) if match else "和式套房"
+    return f"推薦房型：\n房型名稱：{name}\n推薦理由：符合您的需求。\n\n結語：歡迎入住！"
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 預設的 backlog 只有 5，大量並行連線時會被拒絕重試而拉長延遲
+    request_queue_size = 1024
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recent_prompts = []
+        self.prompts_lock = threading.Lock()
+        self.active = 0
+        self.active_lock = threading.Lock()
+
+    """
+    回傳 prompt 中不在模擬 KV 快取內的部分（與最近的 prompt 共同前綴以外的文字），並將 prompt 加入快取
+    """
+    def uncached_suffix(self, prompt):
+        with self.prompts_lock:
+            cached = max((len(os.path.commonprefix([prompt, recent])) for recent in self.recent_prompts), default=0)
+            self.recent_prompts = ([prompt] + [recent for recent in self.recent_prompts if recent != prompt])[:PREFIX_CACHE_SLOTS]
+        return prompt[cached:]
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    # 每個未快取的 prompt token 的模擬預填時間（秒），0 代表不模擬
+    prefill = 0.0
+    # 模擬的 GPU 同時處理請求數量，0 代表不限制
+    capacity = 0
+
+    """
+    GET /api/tags：回傳模型列表，供 OllamaPool 的健康檢查使用
+    """
+    def do_GET(self):
+        if self.path != "/api/tags":
+            self.send_error(404)
+            return
+        body = json.dumps({"models": [{"name": "stub"}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+
+        prompt = payload.get("prompt", "")
+        done = {"model": payload.get("model"), "response": "", "done": True}
+        if self.prefill:
+            evaluated = estimate_tokens(self.server.uncached_suffix(prompt))
+            done.update(prompt_eval_count=evaluated, prompt_eval_duration=int(evaluated * self.prefill * 1e9))
+            time.sleep(evaluated * self.prefill)
+
+        with self.server.active_lock:
+            self.server.active += 1
+            load = self.server.active / self.capacity if self.capacity else 1.0
+        try:
+            time.sleep(self.latency * max(1.0, load))
+        finally:
+            with self.server.active_lock:
+                self.server.active -= 1
+        text = stub_response(prompt)
+        lines = [json.dumps({"model": payload.get("model"), "response": text, "done": False}, ensure_ascii=False),
+                 json.dumps(done)]
+        body = ("\n".join(lines) + "\n").encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+"""
+在背景執行緒啟動模擬伺服器，回傳 (server, base_url)；使用完畢請呼叫 server.shutdown()
+port 為 0 時由系統分配可用的連接埠
+"""
+def start_stub_server(latency=0.0, port=0, prefill=0.0, capacity=0):
+    handler = type("Handler", (StubOllamaHandler,), {"latency": latency, "prefill": prefill, "capacity": capacity})
+    server = StubOllamaServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="模擬 Ollama /api/generate 的本機伺服器")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.5, help="每個請求的模擬延遲（秒）")
+    parser.add_argument("--prefill", type=float, default=0.0, help="每個未快取 prompt token 的模擬預填時間（秒）")
+    parser.add_argument("--capacity", type=int, default=0, help="模擬的 GPU 同時處理請求數量（0 代表不限制）")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.latency, args.port, args.prefill, args.capacity)
+    print(f"stub ollama listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,112 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.NumpyVectorStore import NumpyVectorStore
+
+"""
+比較 Chroma 與 NumpyVectorStore 在不同房型數量下的建立時間、查詢延遲與記憶體用量。
+向量以亂數產生（維度與 FastEmbed 預設模型相同），只量測向量資料庫本身，不包含嵌入模型的時間。
+查詢分為不篩選與以價格 where 條件篩選兩種，與 RAGPipeline.getRoomIdsByRAG 的用法相同。
+
+範例：
+    python -m benchmark.vector_backend_benchmark --sizes 500 2000 10000 --queries 200
+"""
+DIMENSION = 384
+
+
+class RandomEmbedding(Embeddings):
+    def __init__(self, dimension=DIMENSION, seed=0):
+        self.dimension = dimension
+        self.rng = np.random.default_rng(seed)
+
+    def embed_documents(self, texts):
+        vectors = self.rng.standard_normal((len(texts), self.dimension)).astype(np.float32)
+        return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+"""
+目前行程的常駐記憶體（位元組），讀取 /proc/self/statm，其他平台回傳 None
+"""
+def resident_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def make_documents(size, rng):
+    prices = rng.integers(1000, 10000, size)
+    return [Document(page_content=f"名稱:房型{i} 價格:{prices[i]}",
+                     metadata={"room_id": str(i), "price": int(prices[i]), "occupancy": int(rng.integers(1, 7))})
+            for i in range(size)]
+
+
+def measure(name, store, documents, queries, k, batch_size=1000):
+    before = resident_bytes()
+    start = time.perf_counter()
+    for offset in range(0, len(documents), batch_size):
+        batch = documents[offset:offset + batch_size]
+        store.add_documents(batch, ids=[doc.metadata["room_id"] for doc in batch])
+    build = time.perf_counter() - start
+    after = resident_bytes()
+
+    where = {"$and": [{"price": {"$gte": 0}}, {"price": {"$lte": 4000}}]}
+    results = {}
+    for label, search_filter in (("all", None), ("where", where)):
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            store.similarity_search_by_vector(query, k=k, filter=search_filter)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        results[label] = (statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1])
+
+    rss = "n/a" if before is None else f"{(after - before) / 2 ** 20:.1f}MB"
+    print(f"  {name:<14} build={build:6.2f}s  "
+          f"all p50={results['all'][0]:6.2f}ms p95={results['all'][1]:6.2f}ms  "
+          f"where p50={results['where'][0]:6.2f}ms p95={results['where'][1]:6.2f}ms  rss+={rss}", end="")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chroma 與 NumPy 向量檢索後端的效能比較")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 10000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rng = np.random.default_rng(size)
+        documents = make_documents(size, rng)
+        queries = RandomEmbedding(seed=size + 1).embed_documents(["q"] * args.queries)
+        print(f"rooms={size}")
+
+        with tempfile.TemporaryDirectory() as persist_directory:
+            chroma = Chroma(collection_name=f"rooms_{size}", embedding_function=RandomEmbedding(seed=size),
+                            persist_directory=persist_directory)
+            measure("chroma", chroma, documents, queries, args.k)
+            print(f"  disk={directory_bytes(persist_directory) / 2 ** 20:.1f}MB")
+
+        for dtype in ("float32", "float16"):
+            store = NumpyVectorStore(RandomEmbedding(seed=size), dtype=dtype)
+            measure(f"numpy-{dtype}", store, documents, queries, args.k)
+            print(f"  matrix={store.nbytes() / 2 ** 20:.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
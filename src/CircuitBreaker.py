@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+"""
+LLM 無法使用時拋出：呼叫失敗（連線錯誤、逾時、5xx 等），或斷路器開啟而沒有送出呼叫。stage 為 LLM 呼叫階段名稱
+"""
+class LLMUnavailableError(RuntimeError):
+    def __init__(self, stage, detail=""):
+        super().__init__(f"LLM {stage} 呼叫無法完成：{detail}" if detail else f"LLM {stage} 呼叫無法完成")
+        self.stage = stage
+
+
+"""
+斷路器開啟，呼叫直接被拒絕（沒有送出請求）
+"""
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+
+"""
+以最近呼叫的錯誤率與延遲判斷下游服務（Ollama）是否可用的斷路器：
+  - closed：正常放行。最近 window 次呼叫中（至少 min_calls 次），失敗比例達到 failure_rate，
+    或超過 slow_call 秒的呼叫比例達到 slow_rate 時開啟
+  - open：拒絕所有呼叫，呼叫端應立即改用不需要 LLM 的回應；open_duration 秒後進入 half_open
+  - half_open：只放行一次試探呼叫，成功且不慢則關閉，否則再次開啟
+呼叫端在呼叫前以 allow() 取得許可，呼叫結束後以 record() 回報結果；被取消的呼叫不需回報（release() 歸還試探許可）。
+
+範例：
+  breaker = CircuitBreaker(window=20, min_calls=5, failure_rate=0.5, slow_call=20.0)
+  if breaker.allow():
+      start = time.monotonic()
+      try:
+          result = llm.invoke(prompt)
+      except Exception:
+          breaker.record(time.monotonic() - start, ok=False)
+          raise
+      breaker.record(time.monotonic() - start)
+"""
+class CircuitBreaker:
+    def __init__(self, window=20, min_calls=5, failure_rate=0.5, slow_call=20.0, slow_rate=0.5, open_duration=30.0,
+                 clock=time.monotonic):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_duration = open_duration
+        self.clock = clock
+        # 最近的呼叫結果：(是否失敗, 是否過慢)
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.trips = 0
+        self.rejected = 0
+
+    """
+    目前的狀態；開啟超過 open_duration 秒後視為 half_open
+    """
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self.clock() - self._opened_at >= self.open_duration:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    """
+    斷路器開啟中（不會放行任何呼叫），呼叫端可直接略過需要 LLM 的步驟；half_open 時還可以放行試探呼叫，回傳 False
+    """
+    @property
+    def is_open(self):
+        return self.state == OPEN
+
+    """
+    是否放行這次呼叫；half_open 時只放行一個試探呼叫，其餘呼叫在試探完成前都被拒絕
+    """
+    def allow(self):
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    """
+    回報一次呼叫的結果：latency 為呼叫時間（秒），ok 為是否成功
+    """
+    def record(self, latency, ok=True):
+        failed = not ok
+        slow = self.slow_call is not None and latency >= self.slow_call
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                if failed or slow:
+                    self._trip()
+                else:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                self._probing = False
+                return
+            if state == OPEN:
+                return
+
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for failure, _ in self._outcomes if failure)
+            slows = sum(1 for _, slow_call in self._outcomes if slow_call)
+            if failures / calls >= self.failure_rate or slows / calls >= self.slow_rate:
+                self._trip()
+
+    """
+    放行的呼叫沒有結果就結束（例如被取消）時歸還試探許可，讓下一個呼叫可以試探
+    """
+    def release(self):
+        with self._lock:
+            self._probing = False
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = self.clock()
+        self._outcomes.clear()
+        self.trips += 1
+
+    """
+    手動關閉斷路器並清除統計
+    """
+    def reset(self):
+        with self._lock:
+            self._state = CLOSED
+            self._opened_at = None
+            self._probing = False
+            self._outcomes.clear()
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state()
+            calls = len(self._outcomes)
+            return {
+                "state": state,
+                "calls": calls,
+                "failure_rate": sum(1 for failure, _ in self._outcomes if failure) / calls if calls else 0.0,
+                "slow_rate": sum(1 for _, slow in self._outcomes if slow) / calls if calls else 0.0,
+                "trips": self.trips,
+                "rejected": self.rejected
+            }
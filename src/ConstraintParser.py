@@ -0,0 +1,183 @@
+import re
+from functools import lru_cache
+
+CHINESE_DIGITS = {'零': 0, '一': 1, '二': 2, '兩': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+CHINESE_UNITS = {'十': 10, '百': 100, '千': 1000}
+
+PRICE_UNITS = ('元', '塊')
+AREA_UNITS = ('m²', '平方公尺', '平方米', '平方', '坪')
+OCCUPANCY_UNITS = ('人', '位')
+UNIT_PATTERN = r'元|塊|m²|平方公尺|平方米|平方|坪|人|位'
+
+# 中文數字（可接在阿拉伯數字之後，例如 "3千"、"1.5萬"）；後面的單位為選擇性比對，只用來取得第 3 組，
+# normalize_numbers 只轉換帶有十百千萬、接在阿拉伯數字之後或緊接單位的數字，避免誤判「一下」這類用語
+CHINESE_NUMBER_PATTERN = re.compile(r'(\d+(?:\.\d+)?)?([零一二兩三四五六七八九十百千萬]+)(?=\s*(' + UNIT_PATTERN + r')?)')
+CHINESE_NUMERAL_PATTERN = re.compile(r'[零一二兩三四五六七八九十百千萬]')
+AREA_KEYWORD_PATTERN = re.compile(r'面積|坪|平方|m²')
+# 一次掃描問題時辨識的詞彙：主題（價格或面積）、比較詞、數字（可帶單位、區間或上下限）
+TOKEN_PATTERN = re.compile(
+    r'(?P<topic>面積|價格|價錢|預算|費用)'
+    r'|(?P<compare>大於|超過|高於|多於|小於|少於|低於)?\s*'
+    r'(?P<number>\d+)\s*(?P<unit>' + UNIT_PATTERN + r')?\s*'
+    r'(?:(?:~|到|至|-|—)\s*(?P<upper>\d+)\s*(?P<upper_unit>' + UNIT_PATTERN + r')?|(?P<bound>以上|起|以下|以內|之內))?'
+)
+MIN_COMPARE = ('大於', '超過', '高於', '多於')
+MIN_BOUND = ('以上', '起')
+
+"""
+將中文數字轉為整數，支援個位數、十百千萬與前面接阿拉伯數字的寫法，無法解析則回傳 None。
+
+範例：
+  value："兩"，return：2
+  value："十二"，return：12
+  value："二十三"，return：23
+  value："五千"，return：5000
+  value："1.5萬"，return：15000
+  value："一萬二千"，return：12000
+  value："兩千五"，return：2500（口語省略的單位為前一個單位的下一級）
+  value："一萬五"，return：15000
+  value："一千零五"，return：1005
+"""
+def parse_chinese_number(value):
+    match = CHINESE_NUMBER_PATTERN.search(str(value))
+    if not match:
+        return None
+    total, section, digit = 0, 0, float(match.group(1)) if match.group(1) else None
+    # 緊接在單位之後、結尾的個位數字要乘上的倍數，例如「兩千五」的「五」為 500
+    scale = 1
+    for char in match.group(2):
+        if char in CHINESE_DIGITS:
+            digit = CHINESE_DIGITS[char]
+            if char == '零':
+                scale = 1
+        elif char in CHINESE_UNITS:
+            section += (1 if digit is None else digit) * CHINESE_UNITS[char]
+            digit, scale = None, CHINESE_UNITS[char] // 10
+        else:
+            total += (section + (digit or 0)) * 10000
+            section, digit, scale = 0, None, 1000
+    return int(total + section + (digit or 0) * scale)
+
+"""
+將問題中的中文數字換成阿拉伯數字，例如 "預算五千以下的兩人房" -> "預算5000以下的2人房"
+"""
+def normalize_numbers(text):
+    if not CHINESE_NUMERAL_PATTERN.search(text):
+        return text
+
+    def replace(match):
+        if match.group(1) or match.group(3) or any(char in match.group(2) for char in '十百千萬'):
+            return str(parse_chinese_number(match.group(0)))
+        return match.group(0)
+    return CHINESE_NUMBER_PATTERN.sub(replace, text)
+
+
+class _RangeBuilder:
+    __slots__ = ("range", "min_bound", "min_compare", "max_bound", "max_compare")
+
+    def __init__(self):
+        self.range = self.min_bound = self.min_compare = self.max_bound = self.max_compare = None
+
+    """
+    區間（例如 3000~5000）優先；否則「以上／以下」優先於「大於／小於」，與原本逐一比對的順序相同
+    """
+    def result(self):
+        if self.range is not None:
+            return self.range[0], self.range[1], False, False
+        min_value, min_strict = self.min_bound or self.min_compare or (None, False)
+        max_value, max_strict = self.max_bound or self.max_compare or (None, False)
+        return min_value, max_value, min_strict, max_strict
+
+    def add(self, number, upper, compare, bound):
+        if upper is not None:
+            if self.range is None:
+                self.range = (number, upper)
+        elif bound is not None:
+            if bound in MIN_BOUND:
+                self.min_bound = self.min_bound or (number, False)
+            else:
+                self.max_bound = self.max_bound or (number, False)
+        elif compare is not None:
+            if compare in MIN_COMPARE:
+                self.min_compare = self.min_compare or (number, True)
+            else:
+                self.max_compare = self.max_compare or (number, True)
+
+
+"""
+將人數區間換算成房型需要容納的人數：有上限時取上限（嚴格小於時減一），否則取下限（嚴格大於時加一）
+
+範例：
+  guests = (2, 4, False, False)，return：4
+  guests = (None, 3, False, True)，return：2
+"""
+def _required_occupancy(guests):
+    min_value, max_value, min_strict, max_strict = guests
+    if max_value is not None:
+        value = max_value - max_strict
+    elif min_value is not None:
+        value = min_value + min_strict
+    else:
+        return None
+    return value if value >= 1 else None
+
+
+"""
+一次掃描問題，同時取得價格區間、面積區間與入住人數，回傳 (price_range, area_range, occupancy)。
+區間的格式與 extract_price_range / extract_area_range 相同：(最小值, 最大值, 是否嚴格大於, 是否嚴格小於)。
+
+數字依單位判斷屬於哪個條件：元/塊 為價格，坪/平方公尺/m² 為面積，人/位 為入住人數；
+沒有單位時依前面最近的主題詞（面積、價格、預算）判斷，沒有主題詞時 3~5 位數視為價格，
+問題中提到面積時 2 位數視為面積。人數的區間或上下限換算成房型需要容納的人數（2到4人為 4、少於3人為 2、3人以上為 3）；
+沒有寫出人數時，單人房、雙人視為 1 人、2 人。同一個問題的解析結果會被快取，extract_* 重複呼叫時不需再次掃描。
+
+範例：
+  text = "預算三千到五千，30坪以上的兩人房"
+  return：((3000, 5000, False, False), (30, None, False, False), 2)
+"""
+@lru_cache(maxsize=1024)
+def parse_numeric_constraints(text):
+    normalized = normalize_numbers(text)
+    has_area_keyword = AREA_KEYWORD_PATTERN.search(normalized) is not None
+    price, area, guests = _RangeBuilder(), _RangeBuilder(), _RangeBuilder()
+    occupancy = None
+    topic = None
+
+    for match in TOKEN_PATTERN.finditer(normalized):
+        topic_word, compare, digits, unit, upper, upper_unit, bound = match.groups()
+        if topic_word:
+            topic = '面積' if topic_word == '面積' else '價格'
+            continue
+
+        unit = unit or upper_unit
+        if unit in OCCUPANCY_UNITS:
+            if len(digits) > 2:
+                continue
+            if upper is None and compare is None and bound is None:
+                occupancy = int(digits) if occupancy is None else occupancy
+            else:
+                guests.add(int(digits), int(upper) if upper else None, compare, bound)
+            continue
+
+        if unit in PRICE_UNITS:
+            field = price
+        elif unit in AREA_UNITS:
+            field = area
+        elif topic is not None:
+            field = area if topic == '面積' else price
+        elif 3 <= len(digits) <= 5:
+            field = price
+        elif has_area_keyword and len(digits) == 2:
+            field = area
+        else:
+            continue
+        field.add(int(digits), int(upper) if upper else None, compare, bound)
+
+    if occupancy is None:
+        occupancy = _required_occupancy(guests.result())
+    # 明確寫出的人數（例如「雙人房 3人」）優先於房型名稱
+    if occupancy is None and '單人房' in text:
+        occupancy = 1
+    elif occupancy is None and '雙人' in text:
+        occupancy = 2
+    return price.result(), area.result(), occupancy
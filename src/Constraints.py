@@ -0,0 +1,40 @@
+"""
+使用者對房型的需求條件。
+  price_range / area_range: (最小值, 最大值, 是否嚴格大於, 是否嚴格小於)，與 extract_price_range / extract_area_range 的回傳格式相同
+  occupancy: 入住人數，None 代表沒有限制
+  styles: 需要的房型風格
+  amenities: 需要的設施
+
+範例：
+  "3000元以下的工業風雙人房，要有浴缸"
+  RoomConstraints(price_range=(None, 3000, False, False), area_range=(None, None, False, False),
+                  occupancy=2, styles=["工業"], amenities=["浴缸"])
+"""
+class RoomConstraints:
+    __slots__ = ("price_range", "area_range", "occupancy", "styles", "amenities")
+
+    EMPTY_RANGE = (None, None, False, False)
+
+    def __init__(self, price_range=EMPTY_RANGE, area_range=EMPTY_RANGE, occupancy=None, styles=(), amenities=()):
+        self.price_range = tuple(price_range)
+        self.area_range = tuple(area_range)
+        self.occupancy = occupancy
+        self.styles = list(styles)
+        self.amenities = list(amenities)
+
+    """
+    是否有價格、面積或入住人數等可直接以數值篩選的條件
+    """
+    def has_numeric(self):
+        return (self.price_range[:2] != (None, None)
+                or self.area_range[:2] != (None, None)
+                or self.occupancy is not None)
+
+    def __eq__(self, other):
+        if not isinstance(other, RoomConstraints):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"RoomConstraints({fields})"
@@ -0,0 +1,93 @@
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from src.CircuitBreaker import LLMUnavailableError
+
+"""
+LLM 呼叫超過查詢的時間預算時拋出，呼叫端以 LLM 無法使用的方式處理（改用不需要 LLM 的回應）
+"""
+class DeadlineExceededError(LLMUnavailableError):
+    pass
+
+
+"""
+單一查詢的時間預算（秒），從建立時開始計時；budget 為 None 代表不限制時間，remaining() 永遠是無限大。
+degradations 依序記錄這次查詢為了趕上時間（或因 LLM 無法使用）而採取的降級處理，會回報在回應的 meta 中。
+cacheable 為 False 代表這次查詢的回應不可寫入回應快取（例如隨機挑選房型的泛用推薦）。
+
+範例：
+  deadline = Deadline(10)
+  deadline.allows(3)，return：True（剩餘時間至少 3 秒）
+  deadline.degrade("skip_review")
+  deadline.metadata()
+  return：{"deadline": 10, "elapsed": 0.002, "degradations": ["skip_review"]}
+"""
+class Deadline:
+    __slots__ = ("budget", "clock", "started", "expires_at", "degradations", "cacheable")
+
+    def __init__(self, budget=None, clock=time.monotonic):
+        self.budget = budget
+        self.clock = clock
+        self.started = clock()
+        self.expires_at = None if budget is None else self.started + budget
+        self.degradations = []
+        self.cacheable = True
+
+    def remaining(self):
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - self.clock())
+
+    def elapsed(self):
+        return self.clock() - self.started
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    """
+    剩餘時間是否還夠執行需要 seconds 秒的階段
+    """
+    def allows(self, seconds):
+        return self.remaining() >= seconds
+
+    def degrade(self, name):
+        if name not in self.degradations:
+            self.degradations.append(name)
+
+    def metadata(self):
+        return {
+            "deadline": self.budget,
+            "elapsed": round(self.elapsed(), 3),
+            "degradations": list(self.degradations)
+        }
+
+    def __repr__(self):
+        return f"Deadline(budget={self.budget}, remaining={self.remaining():.3f}, degradations={self.degradations})"
+
+
+_current_deadline = ContextVar("deadline", default=None)
+
+"""
+目前查詢的時間預算，不在 deadline_scope 之內時回傳 None。
+以 ContextVar 保存，同一個執行緒（或 asyncio 工作）中的各個階段不需要逐層傳遞參數
+"""
+def current_deadline():
+    return _current_deadline.get()
+
+"""
+在 with 區塊內將 deadline 設為目前查詢的時間預算
+
+範例：
+  with deadline_scope(Deadline(30)) as deadline:
+      response = rag._answer(question)
+"""
+@contextmanager
+def deadline_scope(deadline):
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
@@ -0,0 +1,157 @@
+import re
+import threading
+from collections import Counter
+
+ROOM_RECOMMEND = "房型推薦"
+GREETING = "打招呼"
+GENERIC_RECOMMEND = "泛用推薦"
+
+GREETING_WORDS = ("你好", "您好", "哈囉", "哈嘍", "嗨", "安安", "在嗎", "早安", "午安", "晚安", "hello", "hi", "hey")
+GENERIC_PHRASES = ("有什麼推薦", "有甚麼推薦", "可以推薦", "請推薦", "推薦一下", "幫我推薦", "推薦")
+
+# 判斷剩餘內容時可忽略的語助詞、客套話與標點符號
+FILLER_PATTERN = re.compile(r'[\s,，.。!！?？~～、]|請問|請|你們|妳們|您|你|我|想|要|有|的|嗎|呢|啊|呀|喔|哦|一下|什麼|甚麼|可以|房型|房間|一些|幾個|嘛')
+
+PRICE_PATTERN = re.compile(r'\d{3,5}\s*(元|塊)|預算|價格|價錢|便宜|\d{3,5}\s*(以上|以下|以內|之內|起|~|到|至|-|—)')
+AREA_PATTERN = re.compile(r'面積|坪|平方|m²')
+OCCUPANCY_PATTERN = re.compile(r'單人|雙人|(\d{1,2}|[一二兩三四五六七八九十]{1,3})\s*(人|位)|家庭|親子')
+
+# 詢問房型目錄中「是否有」或「有幾間」某種風格、設施的問題
+LOOKUP_EXISTS = "是否有"
+LOOKUP_COUNT = "有幾間"
+EXISTENCE_PATTERN = re.compile(r'是否有|有沒有|有無|有哪些|有哪幾|有.*[嗎嘛]|有.*[?？]\s*$')
+COUNT_PATTERN = re.compile(r'幾(間|種|個|款)|多少(間|種|個|款)')
+# 判斷是否還有其他需求時可忽略的詞彙：查詢用語，以及可直接以房型目錄判斷的價格、面積、人數條件
+LOOKUP_FILLER_PATTERN = re.compile(
+    r'是否|沒有|有無|哪些|哪幾|幾|多少|房型|房間|房|間|種|個|款|附|含|帶|設有|提供|風格|風|設施|設備|元|塊|坪|平方公尺|m²|'
+    r'以上|以下|以內|之內|起|到|至|~|-|—|預算|價格|價錢|面積|單人|雙人|家庭|人|位|入住|住|'
+    r'\d+|[一二兩三四五六七八九十百千萬]+'
+)
+# 否定用語：「沒有浴缸」、「不要工業風」這類排除條件無法直接以房型目錄回答（LOOKUP_FILLER_PATTERN 會去除「沒有」）；
+# 檢查前先去除詢問用的「有沒有」、「有無」
+NEGATION_PATTERN = r'(?:沒有|沒|無|不是|不要|不想要|不需要|不用|不含|不附)(?:附|含|帶|有|設有|提供|的)?'
+QUESTION_NEGATION_PATTERN = re.compile(r'有沒有|有無')
+
+"""
+規則式意圖分類器，放在 LLM 意圖分類之前作為快速路徑。
+只有在規則能高度確定時才回傳意圖，其餘情況回傳 None 交給 LLM 判斷：
+  1. 出現價格、面積、入住人數、房型風格或設施關鍵字 → 房型推薦
+  2. 只有泛用推薦用語（去除語助詞後沒有其他內容） → 泛用推薦
+  3. 只有打招呼用語（去除語助詞後沒有其他內容） → 打招呼
+
+並記錄規則命中與交給 LLM 的次數，用來觀察快速路徑的命中率。
+"""
+class RuleIntentClassifier:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    """
+    判斷輸入是否在去除指定詞彙與語助詞後沒有剩餘內容
+    """
+    @staticmethod
+    def _only_contains(text, words):
+        for word in sorted(words, key=len, reverse=True):
+            text = text.replace(word, "")
+        return FILLER_PATTERN.sub("", text) == ""
+
+    """
+    依規則判斷使用者輸入的意圖，無法確定時回傳 None。
+    參數：
+        text: 使用者輸入
+        styles: 房型目錄中的風格詞彙
+        amenities: 房型目錄中的設施詞彙
+
+    範例：
+      text = "3000元以下雙人房"，return："房型推薦"
+      text = "你好"，return："打招呼"
+      text = "請問有什麼推薦的房型嗎？"，return："泛用推薦"
+      text = "今天天氣如何？"，return：None
+    """
+    def classify(self, text, styles=(), amenities=()):
+        normalized = text.strip().lower()
+        intent = None
+
+        if (PRICE_PATTERN.search(normalized) or AREA_PATTERN.search(normalized)
+                or OCCUPANCY_PATTERN.search(normalized)
+                or any(style in normalized for style in styles)
+                or any(amenity in normalized for amenity in amenities)):
+            intent = ROOM_RECOMMEND
+        elif any(phrase in normalized for phrase in GENERIC_PHRASES):
+            if self._only_contains(normalized, GENERIC_PHRASES + GREETING_WORDS):
+                intent = GENERIC_RECOMMEND
+        elif any(word in normalized for word in GREETING_WORDS):
+            if self._only_contains(normalized, GREETING_WORDS):
+                intent = GREETING
+
+        with self._lock:
+            self.counts["total"] += 1
+            if intent is None:
+                self.counts["llm_fallback"] += 1
+            else:
+                self.counts[intent] += 1
+        return intent
+
+    """
+    判斷輸入是否只是在詢問房型目錄中是否有（或有幾間）某種風格、設施的房型，可直接查詢房型目錄回答，不需呼叫 LLM。
+    去除提到的風格與設施、查詢用語、價格／面積／人數條件與語助詞後仍有其他內容（例如「安靜」、「適合蜜月」），
+    代表還有需要 LLM 判斷的需求，回傳 None；風格或設施前面有否定用語（例如「沒有浴缸」）時也回傳 None。
+    參數：
+        text: 使用者輸入
+        keywords: 輸入中提到的房型目錄風格與設施詞彙
+
+    範例：
+      text = "是否有工業風？"，keywords = ["工業風"]，return："是否有"
+      text = "有幾間有浴缸的雙人房"，keywords = ["浴缸"]，return："有幾間"
+      text = "有沒有安靜又有浴缸的房間"，keywords = ["浴缸"]，return：None
+      text = "有沒有沒有浴缸的房間"，keywords = ["浴缸"]，return：None
+    """
+    def lookup_question(self, text, keywords):
+        if not keywords:
+            return None
+        normalized = text.strip().lower()
+        if COUNT_PATTERN.search(normalized):
+            kind = LOOKUP_COUNT
+        elif EXISTENCE_PATTERN.search(normalized):
+            kind = LOOKUP_EXISTS
+        else:
+            return None
+
+        if self.negated_keywords(normalized, keywords):
+            return None
+
+        for keyword in sorted(keywords, key=len, reverse=True):
+            normalized = normalized.replace(keyword.lower(), "")
+        remaining = FILLER_PATTERN.sub("", LOOKUP_FILLER_PATTERN.sub("", normalized))
+        return kind if remaining == "" else None
+
+    """
+    輸入中以否定用語排除的風格或設施（依 keywords 的順序）
+
+    範例：
+      text = "有沒有沒有浴缸的房間"，keywords = ["浴缸"]，return：["浴缸"]
+      text = "有沒有附浴缸的房間"，keywords = ["浴缸"]，return：[]
+    """
+    @staticmethod
+    def negated_keywords(text, keywords):
+        text = QUESTION_NEGATION_PATTERN.sub("", text.lower())
+        return [keyword for keyword in keywords if re.search(NEGATION_PATTERN + re.escape(keyword.lower()), text)]
+
+    """
+    回傳規則命中統計。
+
+    範例：
+      {"total": 10, "rule_hits": 7, "llm_fallback": 3, "hit_rate": 0.7, "by_intent": {"房型推薦": 5, "打招呼": 2}}
+    """
+    def stats(self):
+        with self._lock:
+            total = self.counts["total"]
+            by_intent = {intent: self.counts[intent] for intent in (ROOM_RECOMMEND, GREETING, GENERIC_RECOMMEND) if self.counts[intent]}
+            rule_hits = sum(by_intent.values())
+            return {
+                "total": total,
+                "rule_hits": rule_hits,
+                "llm_fallback": self.counts["llm_fallback"],
+                "hit_rate": rule_hits / total if total else 0.0,
+                "by_intent": by_intent
+            }
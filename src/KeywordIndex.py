@@ -0,0 +1,127 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+# 中日韓文字以連續字元為一段，其餘以英數字詞為單位
+CJK_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+')
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+"""
+將文字切成檢索用的詞彙：中文以相鄰兩字（bigram）為單位，單獨一個字時保留該字；英數字以完整的詞為單位。
+
+範例：
+  text = "浴缸、日式榻榻米"，return：["浴缸", "日式", "式榻", "榻榻", "榻米"]
+  text = "King Size 床"，return：["床", "king", "size"]
+"""
+def tokenize(text):
+    text = str(text).lower()
+    tokens = []
+    for run in CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(WORD_PATTERN.findall(text))
+    return tokens
+
+
+"""
+以倒數排名融合（Reciprocal Rank Fusion）合併多個排序結果，不需要各排序分數的尺度一致。
+每個項目的分數為 sum(1 / (rrf_k + 名次))，名次從 1 開始；同分時依第一次出現的順序。
+
+範例：
+  rankings = [["a", "b", "c"], ["c", "a"]]
+  return：["a", "c", "b"]
+"""
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1 / (rrf_k + rank)
+    return sorted(scores, key=lambda item: -scores[item])
+
+
+"""
+記憶體內的 BM25 倒排索引，以 tokenize 切出的 bigram 為詞彙，支援逐筆新增、取代與刪除文件，
+新增房型時不需重建整個索引。
+
+範例：
+  index = BM25Index()
+  index.add("0", "和式套房 日式榻榻米、茶几 日式")
+  index.add("1", "工業風雙人房 浴缸 工業風")
+  index.search("有浴缸的房間嗎")，return：[("1", 0.71)]
+"""
+class BM25Index:
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)
+        self._doc_tokens = {}
+        self._lengths = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._lengths
+
+    """
+    新增文件；doc_id 已存在時以新的內容取代
+    """
+    def add(self, doc_id, text):
+        counts = Counter(tokenize(text))
+        with self._lock:
+            self._remove(doc_id)
+            for token, count in counts.items():
+                self._postings[token][doc_id] = count
+            self._doc_tokens[doc_id] = list(counts)
+            length = sum(counts.values())
+            self._lengths[doc_id] = length
+            self._total_length += length
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for token in self._doc_tokens.pop(doc_id):
+            postings = self._postings[token]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[token]
+
+    """
+    以 BM25 計算問題與各文件的分數，回傳 [(doc_id, 分數)]，依分數由高到低排序，只包含分數大於 0 的文件。
+    參數：
+        query: 使用者問題
+        k: 最多回傳的文件數量，None 代表全部
+        allowed: 只計算這些 doc_id（例如已符合價格條件的房型），None 代表不限制
+    """
+    def search(self, query, k=None, allowed=None):
+        with self._lock:
+            total = len(self._lengths)
+            if total == 0:
+                return []
+            average_length = self._total_length / total
+
+            scores = defaultdict(float)
+            for token in set(tokenize(query)):
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return ranked if k is None else ranked[:k]
@@ -0,0 +1,81 @@
+from collections import deque
+
+"""
+以 Aho-Corasick 自動機同時比對多個關鍵字，只需掃描文字一次就能找出所有出現在文字中的關鍵字，
+比對時間與文字長度及命中數量有關，與關鍵字數量（例如房型目錄中的風格、設施與房型名稱數量）無關。
+結果與逐一以 keyword in text 檢查相同，包含重疊與互相包含的關鍵字（例如「浴缸」與「按摩浴缸」）。
+
+範例：
+  matcher = KeywordMatcher(["浴缸", "按摩浴缸", "陽台"])
+  matcher.find("想要有按摩浴缸和陽台的房間")，return：["按摩浴缸", "浴缸", "陽台"]
+  matcher.contains_any("安靜的房間")，return：False
+"""
+class KeywordMatcher:
+    def __init__(self, keywords=()):
+        self.keywords = list(dict.fromkeys(keyword for keyword in keywords if keyword))
+        # 每個狀態的轉移、失敗連結與輸出（到達該狀態時命中的關鍵字）
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for keyword in self.keywords:
+            self._insert(keyword)
+        self._link()
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def _insert(self, keyword):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] = (keyword,)
+
+    """
+    以廣度優先建立失敗連結，並將失敗連結上的輸出合併到各狀態，比對時不需再沿著失敗連結收集命中的關鍵字
+    """
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fallback = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fallback if fallback != next_state else 0
+                self._output[next_state] += self._output[self._fail[next_state]]
+                queue.append(next_state)
+
+    def _scan(self, text):
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                yield output[state]
+
+    """
+    回傳出現在文字中的所有關鍵字（不重複），依在文字中出現（結束）的位置排序
+    """
+    def find(self, text):
+        if not self.keywords or not text:
+            return []
+        found = {}
+        for keywords in self._scan(text):
+            for keyword in keywords:
+                found.setdefault(keyword, None)
+        return list(found)
+
+    def contains_any(self, text):
+        if not self.keywords or not text:
+            return False
+        return next(self._scan(text), None) is not None
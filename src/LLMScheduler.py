@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+# 優先順序：數字越小越先取得執行名額；相同優先順序依排隊順序
+CHAT_PRIORITY = 0
+BACKGROUND_PRIORITY = 10
+PRIORITY_NAMES = {CHAT_PRIORITY: "chat", BACKGROUND_PRIORITY: "background"}
+
+"""
+排隊的請求過多或等待超過 max_queue_time 時拋出，retry_after 為建議的重試等待秒數（對應 HTTP 503 的 Retry-After）
+"""
+class SchedulerBusyError(RuntimeError):
+    def __init__(self, retry_after, detail="LLM 忙碌中"):
+        super().__init__(f"{detail}，請於 {retry_after} 秒後重試")
+        self.retry_after = retry_after
+
+
+"""
+排隊中的請求；granted 為 True 代表已由 release() 交給它一個執行名額
+"""
+class _Waiter:
+    __slots__ = ("priority", "seq", "enqueued", "granted", "cancelled", "wake")
+
+    def __init__(self, priority, seq, wake):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+        self.wake = wake
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+"""
+所有 LLM 呼叫共用的排程器（admission control）：
+  - 同時執行的呼叫最多 max_concurrency 個，其餘依優先順序排隊（聊天 CHAT_PRIORITY 優先於後台的 BACKGROUND_PRIORITY）
+  - 排隊數量達到 max_queue 時直接拒絕，排隊超過 max_queue_time 秒仍未輪到也放棄，兩者都拋出 SchedulerBusyError
+  - 同一個排程器可同時用於執行緒（slot）與 asyncio（aslot），名額釋放時直接交給優先順序最高的排隊請求
+stats() 回傳執行中與排隊中的數量（依優先順序）、排隊的最大深度與等待時間等統計。
+
+範例：
+  scheduler = LLMScheduler(max_concurrency=4, max_queue_time=10)
+  with scheduler.slot(CHAT_PRIORITY):
+      llm.invoke(prompt)
+  async with scheduler.aslot(BACKGROUND_PRIORITY):
+      await llm.ainvoke(prompt)
+"""
+class LLMScheduler:
+    def __init__(self, max_concurrency=4, max_queue=64, max_queue_time=10.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_time = max_queue_time
+        self.active = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._queued = {}
+        self.peak_queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._wait_total = 0.0
+        self._service_average = None
+
+    """
+    排隊中的請求數量，依優先順序名稱分組
+    """
+    def queue_depth(self):
+        with self._lock:
+            return self._queue_depth()
+
+    def _queue_depth(self):
+        return {PRIORITY_NAMES.get(priority, str(priority)): count for priority, count in self._queued.items() if count}
+
+    def _queued_total(self):
+        return sum(self._queued.values())
+
+    """
+    建議的重試等待秒數：依排隊數量與近期每個呼叫的平均執行時間估算所有排隊請求完成所需的時間，至少 1 秒
+    """
+    def retry_after(self):
+        with self._lock:
+            return self._retry_after()
+
+    def _retry_after(self):
+        service = self._service_average if self._service_average is not None else 1.0
+        return max(1, math.ceil(service * (self._queued_total() + 1) / self.max_concurrency))
+
+    """
+    嘗試立即取得名額；沒有空閒名額時將請求放入佇列，回傳 _Waiter（已取得名額時回傳 None）
+    """
+    def _enqueue(self, priority, wake):
+        with self._lock:
+            if self.active < self.max_concurrency and not self._queued_total():
+                self.active += 1
+                self.admitted += 1
+                return None
+            if self.max_queue is not None and self._queued_total() >= self.max_queue:
+                self.rejected += 1
+                raise SchedulerBusyError(self._retry_after(), "LLM 排隊的請求已滿")
+            waiter = _Waiter(priority, next(self._seq), wake)
+            heapq.heappush(self._queue, waiter)
+            self._queued[priority] = self._queued.get(priority, 0) + 1
+            self.peak_queued = max(self.peak_queued, self._queued_total())
+            return waiter
+
+    """
+    等待逾時或被取消時離開佇列；若在此之前已被交付名額，回傳 True（呼叫端需使用或歸還名額）
+    """
+    def _abandon(self, waiter):
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self._queued[waiter.priority] -= 1
+            return False
+
+    def _admitted(self, waiter):
+        with self._lock:
+            self._wait_total += time.monotonic() - waiter.enqueued
+            self.admitted += 1
+
+    """
+    歸還名額：有排隊的請求時直接交給優先順序最高者，否則減少執行中的數量。duration 為這次呼叫佔用名額的時間
+    """
+    def release(self, duration=None):
+        with self._lock:
+            if duration is not None:
+                # 平均執行時間以指數移動平均計算，用來估算 Retry-After
+                self._service_average = duration if self._service_average is None \
+                    else 0.8 * self._service_average + 0.2 * duration
+            while self._queue:
+                waiter = heapq.heappop(self._queue)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._queued[waiter.priority] -= 1
+                waiter.wake()
+                return
+            self.active -= 1
+
+    def _timeout(self, timeout):
+        return self.max_queue_time if timeout is None else min(timeout, self.max_queue_time)
+
+    """
+    以執行緒等待名額，timeout 為呼叫端額外的等待上限（例如查詢剩餘的時間預算），實際等待不超過 max_queue_time
+    """
+    def acquire(self, priority=CHAT_PRIORITY, timeout=None):
+        event = threading.Event()
+        waiter = self._enqueue(priority, event.set)
+        if waiter is None:
+            return
+        if not event.wait(self._timeout(timeout)) and not self._abandon(waiter):
+            self._reject_timeout()
+        self._admitted(waiter)
+
+    async def aacquire(self, priority=CHAT_PRIORITY, timeout=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+        waiter = self._enqueue(priority, wake)
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self._timeout(timeout))
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                self._reject_timeout()
+        except asyncio.CancelledError:
+            # 取得名額後才被取消時，名額交給下一個排隊的請求
+            if self._abandon(waiter):
+                self.release()
+            raise
+        self._admitted(waiter)
+
+    def _reject_timeout(self):
+        with self._lock:
+            self.timed_out += 1
+            retry_after = self._retry_after()
+        raise SchedulerBusyError(retry_after, "LLM 排隊等待逾時")
+
+    @contextmanager
+    def slot(self, priority=CHAT_PRIORITY, timeout=None):
+        self.acquire(priority, timeout)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    @asynccontextmanager
+    async def aslot(self, priority=CHAT_PRIORITY, timeout=None):
+        await self.aacquire(priority, timeout)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "max_concurrency": self.max_concurrency,
+                "queued": self._queued_total(),
+                "queued_by_priority": self._queue_depth(),
+                "peak_queued": self.peak_queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "average_wait": self._wait_total / self.admitted if self.admitted else 0.0,
+                "average_service": self._service_average,
+                "retry_after": self._retry_after()
+            }
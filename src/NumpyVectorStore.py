@@ -0,0 +1,405 @@
+import base64
+import glob
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+"""
+以 NumPy 矩陣保存房型向量的記憶體內向量資料庫，可取代 Chroma 作為 RAGPipeline 的檢索後端。
+所有向量正規化後存放在連續的 float32（或 float16）矩陣中，查詢時以一次矩陣乘法計算餘弦相似度，
+再以 argpartition 取出前 k 名，不需經過 SQLite 與 collection 的額外開銷。
+
+支援 RAGPipeline 使用到的 Chroma 介面：add_documents、delete、get、similarity_search、
+similarity_search_by_vector 與 as_retriever；filter 使用與 Chroma 相同的 where 格式
+（$and、$or、$eq、$ne、$gt、$gte、$lt、$lte、$in、$nin），數值欄位以向量化的遮罩篩選。
+
+persist_directory 不為 None 時將向量與文件保存在該資料夾，重新啟動時直接載入：每次異動只將異動的文件附加到異動紀錄
+（changes.<世代>.jsonl），新增或刪除一個房型不需重寫整個矩陣；異動紀錄累積超過 max(COMPACT_MIN_CHANGES, 快照的文件數) 筆時
+才在鎖之外重寫完整的快照並刪除已併入快照的紀錄，平均每次異動的寫入量與文件數無關。
+快照的向量寫在帶有世代編號的 vectors.<世代>.npy，documents.json 記錄同一個世代與對應的向量檔名，取代 documents.json 即完成快照；
+寫入中斷時 documents.json 仍指向上一個世代的向量檔，載入時不會把不同世代的向量與文件配對。
+
+範例：
+  store = NumpyVectorStore(embedding_function=FastEmbedEmbeddings(), dtype="float16")
+  store.add_documents(docs, ids=["0", "1"])
+  store.similarity_search("工業風雙人房", k=3, filter={"price": {"$lte": 3000}})
+"""
+class NumpyVectorStore(VectorStore):
+    VECTORS_FILE = "vectors.{}.npy"
+    DOCUMENTS_FILE = "documents.json"
+    # float16 矩陣以區塊轉成 float32 後再計算，限制暫存記憶體的大小
+    SEARCH_BLOCK_ROWS = 1024
+    CHANGES_FILE = "changes.{}.jsonl"
+    COMPACT_MIN_CHANGES = 64
+
+    def __init__(self, embedding_function, persist_directory=None, dtype="float32", collection_name="rooms"):
+        self.embedding_function = embedding_function
+        self.dtype = np.dtype(dtype)
+        self.persist_directory = None if persist_directory is None else os.path.join(persist_directory, collection_name)
+        self._lock = threading.RLock()
+
+        self._matrix = None
+        self._size = 0
+        self._ids = []
+        self._texts = []
+        self._metadatas = []
+        self._row_of = {}
+        self._columns = {}
+        # 目前寫入的異動紀錄世代、快照之後的異動筆數、最近一次快照的文件數，以及已寫入的快照所涵蓋的世代（None 代表還沒有快照）
+        self._log_generation = 0
+        self._log_changes = 0
+        self._snapshot_size = 0
+        self._snapshot_generation = None
+        self._persist_lock = threading.Lock()
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, **kwargs):
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    """
+    確保矩陣至少有 rows 列的空間，容量不足時加倍，避免每次新增都重新配置整個矩陣
+    """
+    def _reserve(self, rows, dim):
+        if self._matrix is None or (self._size == 0 and self._matrix.shape[1] != dim):
+            # 沒有任何文件時可改用新的維度（例如更換嵌入模型後清空的索引）
+            self._matrix = np.empty((max(rows, 16), dim), dtype=self.dtype)
+        elif self._matrix.shape[1] != dim:
+            raise ValueError(f"向量維度不一致：{self._matrix.shape[1]} != {dim}")
+        elif rows > len(self._matrix):
+            matrix = np.empty((max(rows, len(self._matrix) * 2), dim), dtype=self.dtype)
+            matrix[:self._size] = self._matrix[:self._size]
+            self._matrix = matrix
+
+    """
+    新增或取代文件；id 已存在時以新的內容與向量取代
+    """
+    def add_texts(self, texts, metadatas=None, *, ids=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = [str(room_id) for room_id in ids] if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        vectors = self._normalize(self.embedding_function.embed_documents(texts))
+
+        with self._lock:
+            self._reserve(self._size + len(texts), vectors.shape[1])
+            for doc_id, text, metadata, vector in zip(ids, texts, metadatas, vectors):
+                self._upsert(doc_id, text, metadata, vector)
+            self._columns = {}
+            snapshot = self._log([self._upsert_record(doc_id, text, metadata, vector)
+                                  for doc_id, text, metadata, vector in zip(ids, texts, metadatas, vectors)])
+        self._save(snapshot)
+        return ids
+
+    def _upsert(self, doc_id, text, metadata, vector):
+        row = self._row_of.get(doc_id)
+        if row is None:
+            row = self._size
+            self._size += 1
+            self._row_of[doc_id] = row
+            self._ids.append(doc_id)
+            self._texts.append(text)
+            self._metadatas.append(dict(metadata or {}))
+        else:
+            self._texts[row] = text
+            self._metadatas[row] = dict(metadata or {})
+        self._matrix[row] = vector
+
+    """
+    刪除指定 id 的文件，以最後一列填補被刪除的位置，矩陣維持連續
+    """
+    def delete(self, ids=None, **kwargs):
+        if ids is None:
+            return False
+        with self._lock:
+            deleted = [doc_id for doc_id in map(str, ids) if self._delete(doc_id)]
+            self._columns = {}
+            snapshot = self._log([{"op": "delete", "id": doc_id} for doc_id in deleted])
+        self._save(snapshot)
+        return True
+
+    def _delete(self, doc_id):
+        row = self._row_of.pop(doc_id, None)
+        if row is None:
+            return False
+        last = self._size - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = self._ids[last]
+            self._texts[row] = self._texts[last]
+            self._metadatas[row] = self._metadatas[last]
+            self._row_of[self._ids[row]] = row
+        self._ids.pop()
+        self._texts.pop()
+        self._metadatas.pop()
+        self._size = last
+        return True
+
+    """
+    與 Chroma 的 get 相同格式，回傳所有文件的 id、metadata 與內容
+    """
+    def get(self, ids=None, include=("metadatas", "documents")):
+        with self._lock:
+            rows = range(self._size) if ids is None else [self._row_of[i] for i in map(str, ids) if i in self._row_of]
+            result = {"ids": [self._ids[row] for row in rows]}
+            if "metadatas" in include:
+                result["metadatas"] = [self._metadatas[row] for row in rows]
+            if "documents" in include:
+                result["documents"] = [self._texts[row] for row in rows]
+        return result
+
+    """
+    取得 metadata 欄位的陣列，在文件異動前重複使用。
+    numeric 為 True 時回傳數值陣列（缺少或非數值時為 NaN，任何大小比較都不成立），否則回傳原始值
+    """
+    def _column(self, key, numeric):
+        column = self._columns.get((key, numeric))
+        if column is None:
+            values = [metadata.get(key) for metadata in self._metadatas]
+            if numeric:
+                column = np.array([value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+                                   for value in values], dtype=np.float64)
+            else:
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+            self._columns[(key, numeric)] = column
+        return column
+
+    def _condition_mask(self, key, condition):
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        mask = np.ones(self._size, dtype=bool)
+        for operator, value in condition.items():
+            if operator == "$eq":
+                mask &= self._column(key, False) == value
+            elif operator == "$ne":
+                mask &= self._column(key, False) != value
+            elif operator == "$gt":
+                mask &= self._column(key, True) > value
+            elif operator == "$gte":
+                mask &= self._column(key, True) >= value
+            elif operator == "$lt":
+                mask &= self._column(key, True) < value
+            elif operator == "$lte":
+                mask &= self._column(key, True) <= value
+            elif operator in ("$in", "$nin"):
+                values = set(value)
+                found = np.fromiter((item in values for item in self._column(key, False)), dtype=bool, count=self._size)
+                mask &= found if operator == "$in" else ~found
+            else:
+                raise ValueError(f"不支援的 where 運算子：{operator}")
+        return mask
+
+    """
+    將 Chroma 格式的 where 條件轉成布林遮罩
+    """
+    def _where_mask(self, where):
+        mask = np.ones(self._size, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._where_mask(clause)
+            elif key == "$or":
+                any_mask = np.zeros(self._size, dtype=bool)
+                for clause in condition:
+                    any_mask |= self._where_mask(clause)
+                mask &= any_mask
+            else:
+                mask &= self._condition_mask(key, condition)
+        return mask
+
+    def _scores(self, query):
+        if self.dtype == np.float32:
+            return self._matrix[:self._size] @ query
+        scores = np.empty(self._size, dtype=np.float32)
+        for start in range(0, self._size, self.SEARCH_BLOCK_ROWS):
+            block = self._matrix[start:min(start + self.SEARCH_BLOCK_ROWS, self._size)]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return scores
+
+    """
+    以問題向量檢索最相似的 k 個文件，回傳 [(Document, 餘弦相似度)]，依相似度由高到低排序
+    """
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None, **kwargs):
+        query = self._normalize(embedding)
+        with self._lock:
+            if self._size == 0:
+                return []
+            scores = self._scores(query)
+            if filter:
+                scores = np.where(self._where_mask(filter), scores, -np.inf)
+                k = min(k, int(np.isfinite(scores).sum()))
+            k = min(k, self._size)
+            if k <= 0:
+                return []
+
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return [
+                (Document(page_content=self._texts[row], metadata=dict(self._metadatas[row]), id=self._ids[row]),
+                 float(scores[row]))
+                for row in top
+            ]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding_function.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1) / 2
+
+    def _changes_path(self, generation):
+        return os.path.join(self.persist_directory, self.CHANGES_FILE.format(generation))
+
+    def _vectors_path(self, generation):
+        return os.path.join(self.persist_directory, self.VECTORS_FILE.format(generation))
+
+    """
+    資料夾中以 template（CHANGES_FILE 或 VECTORS_FILE）命名的檔案的世代編號，由小到大排序
+    """
+    def _generations(self, template):
+        pattern = os.path.join(self.persist_directory, template.format("*"))
+        prefix, suffix = template.split("{}")
+        names = (os.path.basename(path)[len(prefix):-len(suffix)] for path in glob.glob(pattern))
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def _log_generations(self):
+        return self._generations(self.CHANGES_FILE)
+
+    """
+    載入快照，再依序套用快照之後的異動紀錄
+    """
+    def _load(self):
+        if self.persist_directory is None:
+            return
+        documents_path = os.path.join(self.persist_directory, self.DOCUMENTS_FILE)
+        generation = 0
+        documents = None
+        if os.path.exists(documents_path):
+            with open(documents_path, 'r', encoding='utf-8') as f:
+                documents = json.load(f)
+        # 只載入 documents.json 指定的同一世代的向量檔
+        vectors_path = None if documents is None else self._vectors_path(documents.get("log_generation", 0))
+        if documents is not None and documents.get("vectors_file") == os.path.basename(vectors_path) \
+                and os.path.exists(vectors_path):
+            vectors = np.load(vectors_path)
+            if documents["ids"] and len(documents["ids"]) == len(vectors):
+                self._matrix = vectors.astype(self.dtype)
+                self._size = len(vectors)
+                self._ids = documents["ids"]
+                self._texts = documents["texts"]
+                self._metadatas = documents["metadatas"]
+                self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+                generation = documents.get("log_generation", 0)
+                self._snapshot_size = self._size
+                self._snapshot_generation = generation
+
+        generations = [value for value in self._log_generations() if value >= generation]
+        for value in generations:
+            with open(self._changes_path(value), 'r', encoding='utf-8') as f:
+                for line in f:
+                    # 寫入中斷時最後一行可能不完整，略過
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._replay(record)
+                    self._log_changes += 1
+        self._log_generation = max([generation] + generations)
+
+    def _replay(self, record):
+        if record["op"] == "delete":
+            self._delete(record["id"])
+            return
+        vector = np.frombuffer(base64.b64decode(record["vector"]), dtype=record["dtype"])
+        self._reserve(self._size + 1, len(vector))
+        self._upsert(record["id"], record["text"], record["metadata"], vector)
+
+    def _upsert_record(self, doc_id, text, metadata, vector):
+        vector = np.ascontiguousarray(vector, dtype=self.dtype)
+        return {"op": "upsert", "id": doc_id, "text": text, "metadata": dict(metadata or {}),
+                "dtype": vector.dtype.str, "vector": base64.b64encode(vector.tobytes()).decode("ascii")}
+
+    """
+    將異動附加到異動紀錄（呼叫端持有 self._lock）。還沒有快照，或紀錄累積超過 max(COMPACT_MIN_CHANGES, 快照的文件數) 筆時
+    改寫到下一個世代的紀錄，並回傳目前內容的複本，由呼叫端在鎖之外以 _save 寫成快照；其餘情況回傳 None
+    """
+    def _log(self, records):
+        if self.persist_directory is None or not records:
+            return None
+        os.makedirs(self.persist_directory, exist_ok=True)
+        with open(self._changes_path(self._log_generation), 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        self._log_changes += len(records)
+        if self._snapshot_generation is not None and self._log_changes < max(self.COMPACT_MIN_CHANGES, self._snapshot_size):
+            return None
+
+        self._log_generation += 1
+        self._log_changes = 0
+        self._snapshot_size = self._size
+        matrix = self._matrix[:self._size].copy() if self._matrix is not None else np.empty((0, 0), dtype=self.dtype)
+        return self._log_generation, matrix, list(self._ids), list(self._texts), list(self._metadatas)
+
+    """
+    將 _log 回傳的複本寫成快照（先寫入暫存檔再取代，避免中斷時留下不完整的檔案），並刪除已併入快照的異動紀錄。
+    在 self._lock 之外執行，寫入期間不阻擋檢索與新的異動
+    """
+    def _save(self, snapshot):
+        if snapshot is None:
+            return
+        generation, matrix, ids, texts, metadatas = snapshot
+        with self._persist_lock:
+            # 較新的快照已寫入時不以舊的內容覆蓋
+            if self._snapshot_generation is not None and self._snapshot_generation >= generation:
+                return
+            vectors_path = self._vectors_path(generation)
+            documents_path = os.path.join(self.persist_directory, self.DOCUMENTS_FILE)
+            with open(vectors_path + ".tmp", 'wb') as f:
+                np.save(f, matrix)
+            os.replace(vectors_path + ".tmp", vectors_path)
+            with open(documents_path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump({"ids": ids, "texts": texts, "metadatas": metadatas, "log_generation": generation,
+                           "vectors_file": os.path.basename(vectors_path)}, f, ensure_ascii=False)
+            # 取代 documents.json 後新的快照才生效
+            os.replace(documents_path + ".tmp", documents_path)
+            self._snapshot_generation = generation
+            for value in self._generations(self.VECTORS_FILE):
+                if value != generation:
+                    os.remove(self._vectors_path(value))
+            for value in self._log_generations():
+                if value < generation:
+                    os.remove(self._changes_path(value))
+
+    """
+    矩陣實際使用的記憶體（位元組），供效能測試比較
+    """
+    def nbytes(self):
+        return 0 if self._matrix is None else self._matrix[:self._size].nbytes
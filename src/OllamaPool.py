@@ -0,0 +1,449 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+"""
+計算一組延遲的 p 分位數（0~1），沒有資料時回傳 None
+
+範例：
+  values = [0.1, 0.2, 0.3, 0.4]，quantile = 0.5，return：0.3
+"""
+def percentile(values, quantile):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * quantile))]
+
+
+"""
+Ollama 回應非 200 的狀態碼時拋出，status 為 HTTP 狀態碼
+"""
+class OllamaResponseError(ValueError):
+    def __init__(self, status, detail=""):
+        super().__init__(f"Ollama call failed with status code {status}. Details: {detail}")
+        self.status = status
+
+
+"""
+是否為伺服器本身的問題（連線失敗、逾時或 5xx），這類錯誤會讓伺服器被標記為不健康；
+4xx（例如模型不存在）屬於請求的問題，不影響伺服器的健康狀態
+"""
+def is_endpoint_failure(error):
+    if isinstance(error, OllamaResponseError):
+        return error.status >= 500
+    return isinstance(error, (requests.RequestException, aiohttp.ClientError, asyncio.TimeoutError, OSError))
+
+
+"""
+單一 Ollama 伺服器的狀態：進行中的請求數（outstanding）、健康狀態與請求統計
+"""
+class OllamaEndpoint:
+    __slots__ = ("base_url", "outstanding", "healthy", "requests", "failures")
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = True
+        self.requests = 0
+        self.failures = 0
+
+    def __repr__(self):
+        return f"OllamaEndpoint({self.base_url!r}, outstanding={self.outstanding}, healthy={self.healthy})"
+
+
+"""
+多個 Ollama 伺服器（同一個模型的多個副本）的用戶端連線池：
+  - 以 requests.Session 與 aiohttp.ClientSession（每個事件迴圈一個）保持持久的 HTTP 連線，不必每次請求重新建立連線
+  - 每個請求送往健康且進行中請求數最少的伺服器（least outstanding requests）
+  - 背景執行緒每隔 health_interval 秒以 GET /api/tags 檢查各伺服器；請求失敗的伺服器先標記為不健康，直到下次檢查通過。
+    所有伺服器都不健康時仍會送出請求，避免因檢查誤判而完全停止服務
+  - hedge 開啟時，非串流請求超過同一模型近期延遲的 p95（hedge_quantile）仍未完成，就再送一份到另一台伺服器，
+    採用先完成的結果，較慢的請求隨即中止（關閉連線，Ollama 偵測到斷線後停止生成）；延遲樣本少於 hedge_min_samples 時不送出備援請求
+串流請求只送往一台伺服器，不做備援。
+
+範例：
+  pool = OllamaPool(["http://gpu-1:11434", "http://gpu-2:11434"], hedge=True)
+  pool.generate({"model": "gemma3:27b-it-qat", "prompt": "你好"})
+  return：{"model": "gemma3:27b-it-qat", "response": "您好！", "done": True, ...}
+"""
+class OllamaPool:
+    def __init__(self, base_urls, hedge=False, hedge_quantile=0.95, hedge_min_samples=20, hedge_min_delay=0.05,
+                 health_interval=10.0, health_timeout=2.0, timeout=None, max_connections=32, latency_window=200):
+        if isinstance(base_urls, str):
+            base_urls = [base_urls]
+        self.endpoints = [OllamaEndpoint(url) for url in dict.fromkeys(base_urls)]
+        if not self.endpoints:
+            raise ValueError("OllamaPool 至少需要一個伺服器")
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.latency_window = latency_window
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=max_connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._async_sessions = {}
+        self._health_thread = None
+        self._closed = threading.Event()
+
+    """
+    備援請求使用的執行緒池，第一次需要備援時建立
+    """
+    @property
+    def executor(self):
+        if getattr(self, '_executor', None) is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_connections, thread_name_prefix="ollama-pool")
+        return self._executor
+
+    """
+    取得健康且進行中請求數最少的伺服器並將其請求數加一；exclude 中的伺服器不列入考慮，沒有可用的伺服器時回傳 None
+    """
+    def acquire(self, exclude=()):
+        self._ensure_health_checks()
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+            healthy = [endpoint for endpoint in candidates if endpoint.healthy]
+            candidates = healthy or candidates
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda item: item.outstanding)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    """
+    請求結束時呼叫：請求數減一；latency 不為 None 時記錄為該模型的延遲樣本；失敗時將伺服器標記為不健康
+    """
+    def release(self, endpoint, model=None, latency=None, ok=True):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if not ok:
+                endpoint.failures += 1
+                endpoint.healthy = False
+            elif latency is not None:
+                samples = self._latencies.get(model)
+                if samples is None:
+                    samples = self._latencies[model] = deque(maxlen=self.latency_window)
+                samples.append(latency)
+
+    """
+    送出備援請求前的等待時間：同一模型近期延遲的 p95，樣本不足或未開啟 hedge 時回傳 None
+    """
+    def hedge_delay(self, model):
+        if not self.hedge or len(self.endpoints) < 2:
+            return None
+        with self._lock:
+            samples = list(self._latencies.get(model, ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, percentile(samples, self.hedge_quantile))
+
+    def _payload(self, payload):
+        return {**payload, "stream": True}
+
+    """
+    在指定的伺服器上執行 /api/generate，逐行回傳 Ollama 的 JSON 回應；
+    cancelled（threading.Event）被設定時停止讀取並關閉連線，未讀完的回應不會放回連線池，Ollama 隨即停止生成
+    """
+    def _iter_lines(self, endpoint, payload, cancelled=None):
+        with self.session.post(f"{endpoint.base_url}/api/generate", json=self._payload(payload),
+                               stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                raise OllamaResponseError(response.status_code, response.text)
+            for line in response.iter_lines():
+                if cancelled is not None and cancelled.is_set():
+                    return
+                if line:
+                    yield json.loads(line)
+
+    """
+    在指定的伺服器上完成一次非串流的生成，回傳合併後的回應（response 為完整文字，其餘欄位取自最後一行）；
+    備援請求中較慢的一方被中止時回傳 None，且不記錄延遲樣本
+    """
+    def _generate_on(self, endpoint, payload, cancelled=None):
+        start = time.perf_counter()
+        try:
+            result = self._merge(self._iter_lines(endpoint, payload, cancelled))
+        except BaseException as error:
+            self.release(endpoint, ok=not is_endpoint_failure(error))
+            raise
+        if cancelled is not None and cancelled.is_set():
+            self.release(endpoint)
+            return None
+        self.release(endpoint, payload.get("model"), time.perf_counter() - start)
+        return result
+
+    @staticmethod
+    def _merge(lines):
+        parts, final = [], {}
+        for data in lines:
+            parts.append(data.get("response", ""))
+            final = data
+        return {**final, "response": "".join(parts)}
+
+    """
+    非串流生成：payload 為 Ollama /api/generate 的請求內容（model、prompt、options），回傳合併後的回應；
+    送出備援請求後，先完成的結果會被採用，另一個請求在讀到下一行回應時中止
+    """
+    def generate(self, payload):
+        delay = self.hedge_delay(payload.get("model"))
+        primary = self.acquire()
+        if delay is None:
+            return self._generate_on(primary, payload)
+
+        cancelled = threading.Event()
+        futures = {self.executor.submit(self._generate_on, primary, payload, cancelled): primary}
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            secondary = self.acquire(exclude=(primary,))
+            if secondary is not None:
+                futures[self.executor.submit(self._generate_on, secondary, payload, cancelled)] = secondary
+                self._count_hedge()
+
+        pending, error = set(futures), None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        self._count_hedge_win(futures[future] is not primary)
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            cancelled.set()
+
+    """
+    串流生成：逐行回傳 Ollama 的 JSON 回應（不做備援）
+    """
+    def stream(self, payload):
+        endpoint = self.acquire()
+        try:
+            yield from self._iter_lines(endpoint, payload)
+        except BaseException as error:
+            # 使用端提早結束串流（GeneratorExit）不算伺服器失敗
+            self.release(endpoint, ok=not is_endpoint_failure(error))
+            raise
+        self.release(endpoint)
+
+    """
+    目前事件迴圈使用的 aiohttp 連線，第一次使用時建立，之後同一個事件迴圈中的請求共用持久連線
+    """
+    def _async_session(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for other in [other for other in self._async_sessions if other.is_closed()]:
+                del self._async_sessions[other]
+            session = self._async_sessions.get(loop)
+            if session is None or session.closed:
+                connector = aiohttp.TCPConnector(limit=self.max_connections)
+                timeout = aiohttp.ClientTimeout(total=self.timeout)
+                session = self._async_sessions[loop] = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            return session
+
+    async def _aiter_lines(self, endpoint, payload):
+        session = self._async_session()
+        async with session.post(f"{endpoint.base_url}/api/generate", json=self._payload(payload)) as response:
+            if response.status != 200:
+                raise OllamaResponseError(response.status, await response.text())
+            async for line in response.content:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    async def _agenerate_on(self, endpoint, payload):
+        start = time.perf_counter()
+        try:
+            parts, final = [], {}
+            async for data in self._aiter_lines(endpoint, payload):
+                parts.append(data.get("response", ""))
+                final = data
+        except BaseException as error:
+            # 備援請求中較慢的一方被取消（CancelledError）不算伺服器失敗
+            self.release(endpoint, ok=not is_endpoint_failure(error))
+            raise
+        self.release(endpoint, payload.get("model"), time.perf_counter() - start)
+        return {**final, "response": "".join(parts)}
+
+    """
+    generate 的非同步版本；送出備援請求後，先完成的結果會被採用，另一個請求隨即取消
+    """
+    async def agenerate(self, payload):
+        delay = self.hedge_delay(payload.get("model"))
+        primary = self.acquire()
+        if delay is None:
+            return await self._agenerate_on(primary, payload)
+
+        tasks = {asyncio.ensure_future(self._agenerate_on(primary, payload)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            secondary = self.acquire(exclude=(primary,))
+            if secondary is not None:
+                tasks[asyncio.ensure_future(self._agenerate_on(secondary, payload))] = secondary
+                self._count_hedge()
+
+        pending, error = set(tasks), None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._count_hedge_win(tasks[task] is not primary)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def astream(self, payload):
+        endpoint = self.acquire()
+        try:
+            async for data in self._aiter_lines(endpoint, payload):
+                yield data
+        except BaseException as error:
+            self.release(endpoint, ok=not is_endpoint_failure(error))
+            raise
+        self.release(endpoint)
+
+    def _count_hedge(self):
+        with self._lock:
+            self._hedged += 1
+
+    def _count_hedge_win(self, won):
+        if won:
+            with self._lock:
+                self._hedge_wins += 1
+
+    """
+    以 GET /api/tags 檢查每台伺服器，回傳 {base_url: 是否健康}
+    """
+    def check_health(self):
+        result = {}
+        for endpoint in self.endpoints:
+            try:
+                healthy = self.session.get(f"{endpoint.base_url}/api/tags", timeout=self.health_timeout).status_code == 200
+            except requests.RequestException:
+                healthy = False
+            with self._lock:
+                endpoint.healthy = healthy
+            result[endpoint.base_url] = healthy
+        return result
+
+    def _ensure_health_checks(self):
+        if self._health_thread is not None or not self.health_interval or self._closed.is_set():
+            return
+        with self._lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(target=self._health_loop, daemon=True, name="ollama-health")
+                self._health_thread.start()
+
+    def _health_loop(self):
+        while not self._closed.wait(self.health_interval):
+            self.check_health()
+
+    """
+    停止健康檢查並關閉同步連線；非同步連線請在對應的事件迴圈中以 aclose() 關閉
+    """
+    def close(self):
+        self._closed.set()
+        self.session.close()
+        executor = getattr(self, '_executor', None)
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._async_sessions.pop(loop, None)
+        if session is not None:
+            await session.close()
+
+    """
+    各伺服器的狀態與備援請求統計
+    """
+    def stats(self):
+        with self._lock:
+            latencies = {model: percentile(samples, self.hedge_quantile) for model, samples in self._latencies.items()}
+            return {
+                "endpoints": [{"base_url": endpoint.base_url, "healthy": endpoint.healthy,
+                               "outstanding": endpoint.outstanding, "requests": endpoint.requests,
+                               "failures": endpoint.failures} for endpoint in self.endpoints],
+                "latency_p95": latencies,
+                "hedged": self._hedged,
+                "hedge_wins": self._hedge_wins
+            }
+
+
+"""
+以 OllamaPool 送出請求的 langchain LLM，可直接與 prompt 模板組成 chain（template | llm），用法與 langchain 的 Ollama 相同。
+base_url 為連線池中所有伺服器的網址。
+
+範例：
+  llm = PooledOllama(pool=OllamaPool(["http://gpu-1:11434", "http://gpu-2:11434"]), model="gemma3:27b-it-qat")
+  llm.invoke("你好")
+"""
+class PooledOllama(LLM):
+    pool: Any
+    model: str
+    temperature: Optional[float] = None
+    num_predict: Optional[int] = None
+
+    @property
+    def _llm_type(self):
+        return "ollama-pool"
+
+    @property
+    def base_url(self):
+        return tuple(endpoint.base_url for endpoint in self.pool.endpoints)
+
+    @property
+    def _identifying_params(self):
+        return {"model": self.model, "base_url": self.base_url,
+                "temperature": self.temperature, "num_predict": self.num_predict}
+
+    def _request(self, prompt, stop):
+        options = {"temperature": self.temperature, "num_predict": self.num_predict, "stop": stop}
+        return {"model": self.model, "prompt": prompt,
+                "options": {key: value for key, value in options.items() if value is not None}}
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return self.pool.generate(self._request(prompt, stop))["response"]
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        return (await self.pool.agenerate(self._request(prompt, stop)))["response"]
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        for data in self.pool.stream(self._request(prompt, stop)):
+            chunk = GenerationChunk(text=data.get("response", ""), generation_info=data if data.get("done") else None)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        async for data in self.pool.astream(self._request(prompt, stop)):
+            chunk = GenerationChunk(text=data.get("response", ""), generation_info=data if data.get("done") else None)
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
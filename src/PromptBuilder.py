@@ -0,0 +1,123 @@
+import math
+import re
+
+from src.RoomCatalog import UNKNOWN, parse_number, split_features
+
+# 估算 token 數量用：中日韓文字每字約一個 token，英數字每 4 個字元約一個 token，其餘符號各一個 token
+TOKEN_ESTIMATE_PATTERN = re.compile(r'([\u3400-\u9fff\uf900-\ufaff])|([A-Za-z0-9]+)|\S')
+
+# 精簡的表格格式：第一行為欄位名稱，之後每行一個房型，欄位以 | 分隔，特色以 、 分隔
+ROOM_TABLE_COLUMNS = ("名稱", "價格", "面積", "風格", "人數", "特色")
+ROOM_TABLE_HEADER = "|".join(ROOM_TABLE_COLUMNS)
+
+"""
+估算文字的 token 數量（不依賴模型的 tokenizer），用於控制 prompt 長度與記錄 prefill 的成本。
+中文模型的 tokenizer 常會把常用詞合併成一個 token，因此估算值通常略高於實際值。
+
+範例：
+  text = "工業風雙人房"，return：6
+  text = "King Size 3000元"，return：4
+"""
+def estimate_tokens(text):
+    tokens = 0
+    for match in TOKEN_ESTIMATE_PATTERN.finditer(str(text)):
+        word = match.group(2)
+        tokens += math.ceil(len(word) / 4) if word else 1
+    return tokens
+
+"""
+依使用者需要的風格與設施排序候選房型：符合的關鍵字越多排越前面，相同時保留原本（檢索）的順序。
+
+範例：
+  rooms = [{"name": "A", "style": "日式", ...}, {"name": "B", "style": "工業", "features": "浴缸", ...}]
+  keywords = ["工業", "浴缸"]
+  return：[B, A]
+"""
+def rank_rooms(rooms, keywords=()):
+    keywords = [keyword for keyword in keywords if keyword]
+    if not keywords:
+        return list(rooms)
+
+    def score(item):
+        text = f"{item.get('style', '')} {item.get('features', '')}"
+        return sum(keyword in text for keyword in keywords)
+    return sorted(rooms, key=lambda item: -score(item))
+
+"""
+將單一房型序列化成表格中的一行，入住人數只保留數字；features 為 None 時使用完整的特色欄位。
+
+範例：
+  item = {"name": "和式套房", "price": "5000", "area": "30", "features": "日式榻榻米、茶几", "style": "日式", "maxOccupancy": "2人房"}
+  return："和式套房|5000|30|日式|2|日式榻榻米、茶几"
+"""
+def format_room_row(item, features=None):
+    if features is None:
+        features = split_features(item.get('features'))
+    occupancy = parse_number(item.get('maxOccupancy'))
+    return "|".join((
+        str(item.get('name', '')),
+        str(item.get('price', '')),
+        str(item.get('area', '')),
+        str(item.get('style', '')),
+        str(occupancy) if occupancy != UNKNOWN else str(item.get('maxOccupancy', '')),
+        "、".join(features)
+    ))
+
+
+"""
+組合好的房型表格與其統計：text 為提供給 LLM 的文字，tokens 為估算的 token 數量，
+rooms 為放入表格的房型數量，truncated 為特色欄位被截短的房型數量，dropped 為因超出預算而捨棄的房型數量。
+"""
+class RoomTable:
+    __slots__ = ("text", "tokens", "rooms", "truncated", "dropped")
+
+    def __init__(self, text="", tokens=0, rooms=0, truncated=0, dropped=0):
+        self.text = text
+        self.tokens = tokens
+        self.rooms = rooms
+        self.truncated = truncated
+        self.dropped = dropped
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"RoomTable({fields})"
+
+
+"""
+將已排序的候選房型組成精簡表格，總長度不超過 token_budget（估算值）。
+依排名逐一加入房型，放不下時先截短該房型的特色欄位（保留前面的特色），
+連名稱、價格等基本欄位都放不下時捨棄該房型與之後排名更低的房型（排名第一的房型一定會保留）。
+token_budget 為 None 代表不限制；沒有任何房型時回傳空字串（不含欄位名稱）。
+
+範例：
+  rooms = [{"name": "和式套房", "price": "5000", "area": "30", "features": "日式榻榻米、茶几", "style": "日式", "maxOccupancy": "2人房"}]
+  build_room_table(rooms).text
+  return："名稱|價格|面積|風格|人數|特色\n和式套房|5000|30|日式|2|日式榻榻米、茶几"
+"""
+def build_room_table(rooms, token_budget=None):
+    rooms = list(rooms)
+    if not rooms:
+        return RoomTable()
+
+    lines = [ROOM_TABLE_HEADER]
+    used = estimate_tokens(ROOM_TABLE_HEADER)
+    truncated = 0
+    for index, item in enumerate(rooms):
+        features = split_features(item.get('features'))
+        row = format_room_row(item, features)
+        # 每多一行需要一個換行符號
+        cost = estimate_tokens(row) + 1
+        if token_budget is not None and used + cost > token_budget:
+            kept = len(features)
+            while features and used + cost > token_budget:
+                features = features[:-1]
+                row = format_room_row(item, features)
+                cost = estimate_tokens(row) + 1
+            if used + cost > token_budget and index > 0:
+                return RoomTable("\n".join(lines), used, index, truncated, len(rooms) - index)
+            # 只計入確實截掉特色的房型；沒有特色可截（例如超出預算但保留的第一名）不算截短
+            if len(features) < kept:
+                truncated += 1
+        lines.append(row)
+        used += cost
+    return RoomTable("\n".join(lines), used, len(rooms), truncated, 0)
@@ -0,0 +1,156 @@
+import threading
+from functools import lru_cache
+
+from langchain.prompts import ChatPromptTemplate
+
+from src.PromptBuilder import estimate_tokens
+
+"""
+各 LLM 呼叫階段的 prompt 訊息。所有固定的說明都放在最前面的 system 訊息中，使用者輸入、房型資料等會變動的內容
+只以模板變數放在最後，讓每次請求送給 Ollama 的 prompt 開頭都是逐位元組相同的前綴，可以重複使用模型的 KV（prefix）快取。
+模板中的大括號需寫成 {{ }}，使用者輸入只透過變數傳入，不會被當成模板語法解析。
+"""
+PROMPT_MESSAGES = {
+    "intent": (
+        ("system",
+         "請判斷以下使用者輸入屬於哪一種類型：\n"
+         "1. 房型推薦需求（包含價格、風格、幾人房、設備、是否有某項特色等）\n"
+         "2. 一般打招呼或聊天（如：你好、哈囉、在嗎）\n"
+         "3. 廣泛推薦（如：有什麼推薦、請推薦、推薦一下、可以推薦嗎、請問有推薦的房型嗎等泛用推薦問題，這類問題沒有明確條件，請直接回傳 '泛用推薦'）\n"
+         "4. 其他與房型無關的問題（例如問天氣、問你是誰）\n\n"
+         "使用者可能會詢問是否有某種房型（例如：是否有工業風？是否有浴缸？），這也屬於房型推薦。\n"
+         "請你只回答：'房型推薦'、'打招呼'、'泛用推薦' 或 '其他'"),
+        ("user", "{question}"),
+    ),
+    "structured": (
+        ("system",
+         "你是飯店房型推薦系統的需求解析器。請判斷使用者輸入的意圖並擷取房型需求條件，只回傳一個 JSON 物件，不要有多餘說明。\n"
+         "intent 只能是：'房型推薦'（包含價格、風格、幾人房、設備、是否有某項特色等）、'打招呼'（如：你好、哈囉、在嗎）、"
+         "'泛用推薦'（沒有明確條件的推薦問題，如：有什麼推薦）、'其他'（與房型無關的問題）。\n"
+         "price 與 area 的 min、max 為整數或 null；『大於、超過、高於』為 min_strict=true，『小於、少於、低於』為 max_strict=true。\n"
+         "occupancy 為入住人數（整數）或 null；styles 為房型風格列表；features 為設施需求列表（如：浴缸、陽台）。\n"
+         "JSON 格式：{{\"intent\": \"房型推薦\", \"price\": {{\"min\": null, \"max\": 3000, \"min_strict\": false, \"max_strict\": false}}, "
+         "\"area\": {{\"min\": null, \"max\": null, \"min_strict\": false, \"max_strict\": false}}, "
+         "\"occupancy\": 2, \"styles\": [\"工業\"], \"features\": [\"浴缸\"]}}"),
+        ("user", "{question}"),
+    ),
+    "prediction": (
+        ("system",
+         "你是一位專業且親切的飯店房型推薦助手，專門根據使用者的需求（例如：預算、風格、入住人數等）提供最合適的房型建議。\n\n"
+         "請依據提供的房型資料中，精選出「最符合使用者需求」的房型，最多列出 3 間房型"
+         "⚠️ 請注意推薦的房型**不可重複**，若重複則**刪除其中一個房型名稱和推薦理由**。\n"
+         "⚠️ 請**『務必只使用資料庫中提供的房型名稱，不可自行編造』。\n"
+         "⚠️ 回覆內容請使用**繁體中文**。\n"
+         "⚠️ 若使用者的問題與房型推薦無關，請親切回覆：「我是一個飯店推薦助手，目前只提供房型相關的建議喔！」\n"
+         "⚠️ 請在推薦理由中明確說明房型的實際價格，並根據使用者預算範圍正確描述：\n"
+         "  - 若價格在預算範圍內，請強調『符合預算』或『價格具有優勢』。\n"
+         "  - 嚴禁出現『雖然價格稍高』、『超出預算』等與實際價格不符的描述。\n"
+         "  - 若房型價格低於預算上限，請強調其價格優勢。\n"
+         "⚠️ 若房型未完全符合使用者需求（如面積、價格等），請明確說明『此房型未達到您的需求，但為最接近的選擇』，且不得出現誤導性語句。\n\n"
+         "房型資料每行一個房型；以表格呈現時第一行為欄位名稱，欄位以 | 分隔。\n"
+         "請根據使用者需求與房型資料，推薦最符合使用者需求的房型，並給出推薦理由與結語。\n"
+         "回覆格式如下（每個房型請依照範例填寫）：\n\n"
+         "推薦房型：\n"
+         "房型名稱\n"
+         "推薦理由：...\n\n"
+         "房型名稱\n"
+         "推薦理由：...\n\n"
+         "房型名稱\n"
+         "推薦理由：...\n\n"
+         "結語：..."),
+        ("user",
+         "使用者需求：{input}\n"
+         "房型資料：\n{rooms}"),
+    ),
+    "review": (
+        ("system",
+         "你是一位專業的飯店房型審查助手。請根據使用者需求與模型原本的推薦內容，判斷是否『完全符合』使用者需求。\n"
+         "如果不符合，請回覆：『目前沒有完全符合的房型』\n"
+         "請務必使用資料庫中出現過的房型名稱，且回覆內容使用繁體中文。\n"
+         "若原本的推薦已經符合需求，則直接回覆：『推薦內容符合使用者需求，無需變更。』"),
+        ("user",
+         "使用者需求：{question}\n\n模型原本推薦內容如下：\n{recommendation}"),
+    ),
+    "auto_recommend": (
+        ("system",
+         "你是一位專業的飯店房型推薦助手，請根據資料庫內容，推薦一個最適合的房型，並只回傳一個 JSON 格式，欄位包含 name, price, area, features, style, maxOccupancy。"
+         "area、price、maxOccupancy只回傳數字，剩下內容請轉為「繁體中文」，不要有多餘說明。"
+         "請勿推薦與前次相同或相似的房型名稱，也不要與資料庫中已有的房型名稱重複。"
+         "房型名稱需能明確反映其特色（如特色設施、風格等），讓名稱與特色相對應。"),
+        ("user", "請推薦一個房型，並只回傳 JSON 格式資料。"),
+    ),
+}
+
+# 找出固定前綴時代入模板變數的標記文字
+_PREFIX_MARKER = "\x00"
+
+"""
+依名稱取得 ChatPromptTemplate，每個模板在程序中只建立一次
+"""
+@lru_cache(maxsize=None)
+def get_template(name):
+    if name not in PROMPT_MESSAGES:
+        raise KeyError(f"未知的 prompt 模板：{name}，可用的模板：{tuple(PROMPT_MESSAGES)}")
+    return ChatPromptTemplate.from_messages(list(PROMPT_MESSAGES[name]))
+
+"""
+模板格式化後、第一個變數之前的固定文字，也就是每次請求都相同、可被 Ollama 前綴快取重複使用的部分。
+
+範例：
+  static_prefix("review")
+  return："System: 你是一位專業的飯店房型審查助手。...\nHuman: 使用者需求："
+"""
+@lru_cache(maxsize=None)
+def static_prefix(name):
+    template = get_template(name)
+    text = template.format(**{variable: _PREFIX_MARKER for variable in template.input_variables})
+    return text.split(_PREFIX_MARKER, 1)[0]
+
+"""
+模板本身（不含變數內容）的估算 token 數量
+"""
+@lru_cache(maxsize=None)
+def static_tokens(name):
+    template = get_template(name)
+    return estimate_tokens(template.format(**{variable: "" for variable in template.input_variables}))
+
+
+"""
+保存各階段的 prompt 模板與「模板 | LLM」的 chain，第一次使用時建立，之後的請求直接重複使用，
+不必每次呼叫都重新解析模板與組合 chain。LLM 物件更換（例如測試中替換 rag.llm）時自動重建該階段的 chain。
+
+範例：
+  registry = PromptRegistry()
+  chain = registry.chain("review", llm)
+  chain.invoke({"question": "我要兩人房", "recommendation": "房型名稱：豪華雙人房"})
+"""
+class PromptRegistry:
+    def __init__(self):
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def names():
+        return tuple(PROMPT_MESSAGES)
+
+    @staticmethod
+    def template(name):
+        return get_template(name)
+
+    def chain(self, name, llm):
+        cached = self._chains.get(name)
+        if cached is not None and cached[0] is llm:
+            return cached[1]
+        with self._lock:
+            cached = self._chains.get(name)
+            if cached is None or cached[0] is not llm:
+                cached = (llm, self.template(name) | llm)
+                self._chains[name] = cached
+            return cached[1]
+
+    """
+    估算 prompt 的 token 數量：模板的固定部分預先計算，每次只需估算變數內容
+    """
+    @staticmethod
+    def estimate_tokens(name, inputs):
+        return static_tokens(name) + sum(estimate_tokens(value) for value in inputs.values())
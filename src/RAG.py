@@ -1,183 +1,1083 @@
+import asyncio
+import hashlib
 import json
+import logging
+import math
+import queue
 import re
+import time
 from langchain_community.llms import Ollama
-from langchain.prompts import ChatPromptTemplate
 from langchain_community.vectorstores import Chroma
 from langchain_community.embeddings import FastEmbedEmbeddings
 from langchain.docstore.document import Document
 import json as pyjson
 import random
+import threading
+import numpy as np
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from src.CircuitBreaker import CircuitBreaker, CircuitOpenError, LLMUnavailableError
+from src.ConstraintParser import parse_chinese_number, parse_numeric_constraints
+from src.Constraints import RoomConstraints
+from src.Deadline import Deadline, DeadlineExceededError, current_deadline, deadline_scope
+from src.IntentRules import LOOKUP_COUNT, RuleIntentClassifier
+from src.KeywordIndex import BM25Index, reciprocal_rank_fusion
+from src.KeywordMatcher import KeywordMatcher
+from src.LLMScheduler import BACKGROUND_PRIORITY, CHAT_PRIORITY, LLMScheduler, SchedulerBusyError
+from src.NumpyVectorStore import NumpyVectorStore
+from src.OllamaPool import OllamaPool, PooledOllama
+from src.PromptBuilder import build_room_table, rank_rooms
+from src.PromptTemplates import PromptRegistry
+from src.ResponseCache import LRUCache, ResponseCache, normalize_question
+from src.RoomCatalog import NUMBER_PATTERN, UNKNOWN, RoomCatalog, format_room, parse_number
+
+logger = logging.getLogger(__name__)
 
 class RAGPipeline:
-    def __init__(self, json_path):
+    # 向量索引寫入時每批次的文件數量，避免一次送出過多文件超過 Chroma 的批次上限
+    INDEX_BATCH_SIZE = 1000
+    # 向量索引中文件 metadata 的版本，欄位有變動時調整此值，啟動時會重新嵌入所有房型
+    INDEX_SCHEMA_VERSION = 2
+
+    # 向量檢索後端："chroma"（Chroma 向量資料庫）或 "numpy"（記憶體內 NumPy 矩陣，適合數萬筆以內的房型）
+    VECTOR_BACKENDS = ("chroma", "numpy")
+    vector_backend = "chroma"
+    # numpy 後端的向量精度，"float16" 可將記憶體減半
+    vector_dtype = "float32"
+
+    # 檢索設定：預設取回的房型數量、條件過少時最多放寬到的數量、至少需要的候選房型數量
+    retrieval_k = 10
+    max_retrieval_k = 40
+    min_candidates = 3
+    # 是否以房型名稱、特色、風格的 BM25 關鍵字檢索補足向量檢索，兩者以倒數排名融合（RRF）合併
+    hybrid_retrieval = False
+    rrf_k = 60
+
+    # 是否以單一 JSON 結構化 LLM 呼叫同時取得意圖與需求條件（失敗時退回 classify_intent + 正規表示式）
+    structured_intent = False
+    # 是否在意圖分類進行的同時，以執行緒池預先提取條件並檢索房型（意圖不是房型推薦時捨棄結果）
+    speculative_retrieval = False
+    speculative_workers = 4
+
+    # 是否快取查詢回應：完全相同或向量相似度超過門檻（且條件相同）的問題直接回傳快取的回應
+    cache_responses = False
+    response_cache_size = 256
+    response_cache_ttl = 600
+    response_cache_threshold = 0.95
+    # 問題向量與檢索結果（房型 id 列表）的 LRU 快取大小
+    embedding_cache_size = 1024
+    retrieval_cache_size = 1024
+    # 是否直接以房型目錄回答「是否有工業風？」、「有幾間有浴缸的房型？」這類查詢問題（不呼叫 LLM），以及回答中最多列出的房型數量
+    lookup_answers = True
+    lookup_max_rooms = 5
+    # 推薦 prompt 中的房型資料：是否以精簡表格（欄位名稱只出現一次）呈現，以及房型資料最多佔用的 token 數量（估算值，None 代表不限制）；
+    # 超出時依符合需求的程度排序，先截短、再捨棄排名較低的房型
+    compact_prompts = True
+    prompt_token_budget = 400
+
+    # 預設的 LLM；stage_models 中沒有設定的呼叫階段都使用此模型
+    llm_model = "gemma3:27b-it-qat"
+    llm_base_url = "http://140.124.184.213:11434"
+    # 各 LLM 呼叫階段的模型設定（model、base_url、temperature、max_tokens），未設定的欄位沿用預設值，例如讓意圖分類與審查使用小模型：
+    #   {"intent": {"model": "gemma3:4b", "temperature": 0, "max_tokens": 8}, "review": {"model": "gemma3:4b", "max_tokens": 64}}
+    LLM_STAGES = ("intent", "structured", "prediction", "review", "auto_recommend")
+    STAGE_MODEL_FIELDS = ("model", "base_url", "temperature", "max_tokens")
+    stage_models = {}
+    # base_url（預設或各階段）為多個網址的列表時，以 OllamaPool 連線到所有伺服器：持久連線、依進行中請求數分配、定期健康檢查；
+    # llm_hedge 開啟時，非串流請求超過近期延遲的 p95 仍未完成會再送一份到另一台伺服器
+    llm_hedge = True
+    llm_health_interval = 10.0
+    # 單次 LLM 請求的逾時秒數，Ollama 沒有回應時不會一直佔用處理請求的執行緒；
+    # 有 query_deadline 時不超過 query_deadline（超過預算而被放棄的呼叫最多再佔用排程器的名額到預算的長度）
+    llm_timeout = 60
+    # 所有 LLM 呼叫共用的斷路器：最近 llm_breaker_window 次呼叫中（至少 llm_breaker_min_calls 次）失敗的比例達到
+    # llm_breaker_failure_rate，或超過 llm_slow_call 秒（串流呼叫以第一段文字的時間計算）的比例達到 llm_breaker_slow_rate 時開啟；
+    # 開啟期間不呼叫 LLM，房型推薦改由房型目錄依條件排序產生（degraded_response），llm_breaker_open_duration 秒後放行一次試探呼叫
+    llm_breaker_window = 10
+    llm_breaker_min_calls = 5
+    llm_breaker_failure_rate = 0.5
+    llm_slow_call = 20.0
+    llm_breaker_slow_rate = 0.5
+    llm_breaker_open_duration = 30.0
+    # 所有 LLM 呼叫共用的排程器：同時送往模型的呼叫最多 llm_max_concurrency 個（多台伺服器時設為總容量），其餘依
+    # STAGE_PRIORITIES 的優先順序排隊（聊天優先，後台的自動推薦排在最後）；排隊已有 llm_max_queue 個，或等待超過
+    # llm_max_queue_time 秒（有時間預算時不超過剩餘時間）時拋出 SchedulerBusyError，由 app 回傳 503 與 Retry-After
+    llm_max_concurrency = 4
+    llm_max_queue = 64
+    llm_max_queue_time = 10.0
+    STAGE_PRIORITIES = {"auto_recommend": BACKGROUND_PRIORITY}
+    # LLM 無法使用時推薦的房型數量
+    degraded_max_rooms = 3
+    # 每個查詢的時間預算（秒，None 代表不限制）。預算會傳到各個階段，剩餘時間不足以執行某個階段時改用較快的做法：
+    #   剩餘時間少於 deadline_intent_reserve + deadline_prediction_reserve：不呼叫 LLM 判斷意圖，規則無法判斷時視為房型推薦（rule_intent）
+    #   剩餘時間少於 deadline_prediction_reserve + deadline_review_reserve：推薦 prompt 只放前 deadline_retrieval_k 個房型（shrink_k）
+    #   剩餘時間少於 deadline_prediction_reserve：不呼叫 LLM 推薦，改由房型目錄依條件排序（fallback_ranking）
+    #   剩餘時間少於 deadline_review_reserve：略過 LLM 審查，直接採用推薦內容（skip_review）
+    # 非串流的 LLM 呼叫最多只等待剩餘的時間；採取的降級處理回報在回應的 meta.degradations 中
+    query_deadline = None
+    deadline_intent_reserve = 2.0
+    deadline_prediction_reserve = 10.0
+    deadline_review_reserve = 5.0
+    deadline_retrieval_k = 5
+    # 有時間預算時執行 LLM 呼叫的執行緒數量（超過預算時呼叫端不再等待，呼叫在背景結束）
+    deadline_workers = 32
+
+    INTENTS = ("房型推薦", "打招呼", "泛用推薦", "其他")
+
+    def __init__(self, json_path, persist_directory=None, embeddings=None, structured_intent=False,
+                 speculative_retrieval=False, cache_responses=False, vector_backend="chroma", vector_dtype="float32",
+                 hybrid_retrieval=False, stage_models=None, llm_endpoints=None, query_deadline=None):
         with open(json_path, 'r', encoding='utf-8') as f:
             self.data = json.load(f)
 
-        self.docs = [
-            Document(page_content=f"名稱:{item['name']} 價格:{item['price']} 面積:{item['area']} 特色:{item['features']} 風格:{item.get('style', '')} 床數:{item.get('maxOccupancy', '')}")
-            for item in self.data
+        # persist_directory 為 None 時使用記憶體中的向量資料庫；指定資料夾則將向量與 collection 保存在磁碟上。
+        # 文件的內容雜湊值包含嵌入模型，需先設定 embeddings 再建立文件
+        self.embeddings = embeddings if embeddings is not None else FastEmbedEmbeddings()
+        self.docs = [self.build_document(item, index) for index, item in enumerate(self.data)]
+        self.vector_backend = vector_backend
+        self.vector_dtype = vector_dtype
+        self.persist_directory = persist_directory
+        self.vectorstore = self._create_vectorstore(persist_directory)
+        self.sync_vectorstore()
+        self.retriever = self.vectorstore.as_retriever(search_kwargs={"k": self.retrieval_k})
+        if llm_endpoints:
+            self.llm_base_url = tuple(llm_endpoints)
+        # 請求逾時依 query_deadline 決定，需在建立 LLM 之前設定
+        self.query_deadline = query_deadline
+        self.llm = self.create_llm()
+        self.stage_models = self.validate_stage_models(stage_models or {})
+        self.used_names = set()  # 新增：用於追蹤所有已推薦過的房型名稱
+        self.structured_intent = structured_intent
+        self.speculative_retrieval = speculative_retrieval
+        self.cache_responses = cache_responses
+        self.hybrid_retrieval = hybrid_retrieval
+
+    """
+    建立 Ollama LLM，未指定的參數使用預設模型與伺服器；max_tokens 對應 Ollama 的 num_predict，請求逾時見 request_timeout()。
+    base_url 為多個網址的列表（或 tuple）時，建立經由 OllamaPool 分配請求的 PooledOllama，相同網址的 LLM 共用同一個連線池
+    """
+    def create_llm(self, model=None, base_url=None, temperature=None, max_tokens=None):
+        base_url = base_url or self.llm_base_url
+        if isinstance(base_url, (list, tuple)):
+            return PooledOllama(pool=self.llm_pool(base_url), model=model or self.llm_model,
+                                temperature=temperature, num_predict=max_tokens)
+        return Ollama(model=model or self.llm_model, base_url=base_url,
+                      temperature=temperature, num_predict=max_tokens, timeout=self.request_timeout())
+
+    """
+    取得多個 Ollama 伺服器的連線池，相同的網址組合共用同一個連線池
+    """
+    def llm_pool(self, base_urls):
+        key = tuple(base_urls)
+        pools = self.llm_pools
+        pool = pools.get(key)
+        if pool is None:
+            pool = pools.setdefault(key, OllamaPool(key, hedge=self.llm_hedge, health_interval=self.llm_health_interval,
+                                                    timeout=self.request_timeout()))
+        return pool
+
+    """
+    單次 LLM 請求的逾時秒數：llm_timeout，有 query_deadline 時不超過 query_deadline（無條件進位到整數秒）。
+    查詢超過時間預算時只是不再等待，請求仍在背景執行並佔用 LLM 排程器的名額，直到請求結束或逾時；
+    逾時不超過預算，Ollama 沒有回應時被放棄的請求才不會長時間佔滿名額，讓其他查詢都收到 503
+    """
+    def request_timeout(self):
+        query_deadline = getattr(self, 'query_deadline', None)
+        if query_deadline is None:
+            return self.llm_timeout
+        return min(self.llm_timeout, max(1, math.ceil(query_deadline)))
+
+    @property
+    def llm_pools(self):
+        if getattr(self, '_llm_pools', None) is None:
+            self._llm_pools = {}
+        return self._llm_pools
+
+    """
+    檢查各階段的模型設定，階段或欄位名稱不正確時拋出 ValueError
+
+    範例：
+      stage_models = {"intent": {"model": "gemma3:4b", "max_tokens": 8}}
+      return：{"intent": {"model": "gemma3:4b", "max_tokens": 8}}
+    """
+    @classmethod
+    def validate_stage_models(cls, stage_models):
+        result = {}
+        for stage, config in stage_models.items():
+            if stage not in cls.LLM_STAGES:
+                raise ValueError(f"未知的 LLM 呼叫階段：{stage}，可用的階段：{cls.LLM_STAGES}")
+            unknown = set(config) - set(cls.STAGE_MODEL_FIELDS)
+            if unknown:
+                raise ValueError(f"未知的模型設定：{sorted(unknown)}，可用的設定：{cls.STAGE_MODEL_FIELDS}")
+            result[stage] = dict(config)
+            # 多個伺服器的網址列表轉成 tuple，才能作為共用 LLM 的鍵值
+            if isinstance(config.get("base_url"), list):
+                result[stage]["base_url"] = tuple(config["base_url"])
+        return result
+
+    """
+    取得呼叫階段使用的 LLM：stage_models 中沒有設定的階段使用 self.llm；
+    有設定時依設定內容建立 Ollama（未設定的模型名稱與伺服器沿用 self.llm），設定相同的階段共用同一個實例
+    """
+    def llm_for(self, stage):
+        config = self.stage_models.get(stage)
+        if not config:
+            return self.llm
+        key = (config.get("model") or getattr(self.llm, "model", None),
+               config.get("base_url") or getattr(self.llm, "base_url", None),
+               config.get("temperature"),
+               config.get("max_tokens"))
+        llms = self.stage_llms
+        llm = llms.get(key)
+        if llm is None:
+            llm = llms.setdefault(key, self.create_llm(*key))
+        return llm
+
+    @property
+    def stage_llms(self):
+        if getattr(self, '_stage_llms', None) is None:
+            self._stage_llms = {}
+        return self._stage_llms
+
+    """
+    各呼叫階段實際使用的模型與伺服器，供 stats() 顯示
+
+    範例：
+      return：{"intent": {"model": "gemma3:4b", "base_url": "http://localhost:11434"}, "prediction": {...}, ...}
+    """
+    def llm_routing(self):
+        routing = {}
+        for stage in self.LLM_STAGES:
+            llm = self.llm_for(stage)
+            routing[stage] = {"model": getattr(llm, "model", None), "base_url": getattr(llm, "base_url", None)}
+        return routing
+
+    """
+    依 vector_backend 建立向量資料庫，兩種後端都以房型 id 作為文件 id，並支援相同的 where 篩選格式
+    """
+    def _create_vectorstore(self, persist_directory=None):
+        if self.vector_backend == "chroma":
+            return Chroma(
+                collection_name="rooms",
+                embedding_function=self.embeddings,
+                persist_directory=persist_directory
+            )
+        if self.vector_backend == "numpy":
+            return NumpyVectorStore(
+                embedding_function=self.embeddings,
+                persist_directory=persist_directory,
+                dtype=self.vector_dtype
+            )
+        raise ValueError(f"未知的向量檢索後端：{self.vector_backend}，可用的後端：{self.VECTOR_BACKENDS}")
+
+    """
+    房型原始資料（rooms.json 的內容）。重新指定且內容不同時會讓型別化的房型目錄失效，下次使用時再重建。
+    """
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        with self.rooms_lock:
+            current = getattr(self, '_data', None)
+            self._data = value
+            # 首頁每次載入都會重新指定相同內容的資料，內容沒變時不需要讓目錄與快取失效
+            if value is current or value != current:
+                self._invalidate_catalog()
+                self._keyword_index = None
+
+    """
+    保護房型異動（upsert_room、update_room、delete_room、重新指定 data）的鎖，同一時間只有一個異動。
+    異動在目前房型目錄的快照（RoomCatalog.snapshot，共用欄位陣列，不複製整個目錄）上修改後整個替換，
+    查詢只要先取得 self.catalog 再讀取欄位，就不會看到長度不一致的欄位，不需要持有這個鎖
+    """
+    @property
+    def rooms_lock(self):
+        if getattr(self, '_rooms_lock', None) is None:
+            self._rooms_lock = threading.RLock()
+        return self._rooms_lock
+
+    """
+    房型文件（向量資料庫中的內容），以 room_id 對應列表位置，異動時只取代或移除該房型的文件
+    """
+    @property
+    def docs(self):
+        return self._docs
+
+    @docs.setter
+    def docs(self, value):
+        self._docs = value
+        self._doc_rows = None
+
+    def _doc_row_of(self):
+        if getattr(self, '_doc_rows', None) is None:
+            self._doc_rows = {doc.metadata["room_id"]: row for row, doc in enumerate(self._docs)}
+        return self._doc_rows
+
+    def _put_doc(self, doc):
+        rows = self._doc_row_of()
+        room_id = doc.metadata["room_id"]
+        row = rows.get(room_id)
+        if row is None:
+            rows[room_id] = len(self._docs)
+            self._docs.append(doc)
+        else:
+            self._docs[row] = doc
+
+    """
+    移除房型的文件，以最後一個文件填補被移除的位置（文件的順序不影響向量資料庫的同步）
+    """
+    def _remove_doc(self, room_id):
+        rows = self._doc_row_of()
+        row = rows.pop(room_id, None)
+        if row is None:
+            return
+        last = self._docs.pop()
+        if row < len(self._docs):
+            self._docs[row] = last
+            rows[last.metadata["room_id"]] = row
+
+    """
+    讓房型目錄失效並遞增目錄版本；依版本保存的快取（例如查詢回應）會因此失效
+    """
+    def _invalidate_catalog(self):
+        self._catalog = None
+        self._bump_catalog_version()
+
+    def _bump_catalog_version(self):
+        self._catalog_version = self.catalog_version + 1
+
+    @property
+    def catalog_version(self):
+        return getattr(self, '_catalog_version', 0)
+
+    """
+    型別化的欄位式房型目錄（RoomCatalog），在第一次使用時由 self.data 建立；
+    重新指定 data 後自動重建，upsert_room / delete_room 則在目錄的快照上逐筆更新欄位與點陣圖後替換
+    """
+    @property
+    def catalog(self):
+        catalog = getattr(self, '_catalog', None)
+        if catalog is None:
+            with self.rooms_lock:
+                if getattr(self, '_catalog', None) is None:
+                    self._catalog = RoomCatalog(getattr(self, '_data', []))
+                catalog = self._catalog
+        return catalog
+
+    """
+    規則式意圖分類器（快速路徑），同時保存規則命中率統計
+    """
+    @property
+    def intent_rules(self):
+        if getattr(self, '_intent_rules', None) is None:
+            self._intent_rules = RuleIntentClassifier()
+        return self._intent_rules
+
+    """
+    執行過程的計數器（例如結構化解析成功與退回的次數），多執行緒下以鎖保護
+    """
+    @property
+    def metrics(self):
+        if getattr(self, '_metrics', None) is None:
+            self._metrics = Counter()
+            self._metrics_lock = threading.Lock()
+        return self._metrics
+
+    """
+    查詢回應快取，第一次使用時建立；有嵌入模型時也比對近似問題
+    """
+    @property
+    def response_cache(self):
+        if getattr(self, '_response_cache', None) is None:
+            embeddings = getattr(self, 'embeddings', None)
+            self._response_cache = ResponseCache(
+                embed=self.embed_question if embeddings is not None else None,
+                max_size=self.response_cache_size,
+                ttl=self.response_cache_ttl,
+                similarity_threshold=self.response_cache_threshold
+            )
+        return self._response_cache
+
+    """
+    房型名稱、特色與風格的 BM25 倒排索引，第一次使用時由 self.data 建立，之後隨房型新增、修改、刪除逐筆更新
+    """
+    @property
+    def keyword_index(self):
+        if getattr(self, '_keyword_index', None) is None:
+            index = BM25Index()
+            catalog = self.catalog
+            for room_id, item in zip(catalog.ids, catalog.rooms):
+                index.add(room_id, self.keyword_text(item))
+            self._keyword_index = index
+        return self._keyword_index
+
+    @staticmethod
+    def keyword_text(item):
+        return f"{item.get('name', '')} {item.get('features', '')} {item.get('style', '')}"
+
+    """
+    問題向量的 LRU 快取，鍵值為正規化後的問題（問題向量與房型資料無關，房型異動時不需失效）
+    """
+    @property
+    def embedding_cache(self):
+        if getattr(self, '_embedding_cache', None) is None:
+            self._embedding_cache = LRUCache(self.embedding_cache_size)
+        return self._embedding_cache
+
+    """
+    檢索結果的 LRU 快取，鍵值包含正規化後的問題、篩選條件與房型目錄版本，房型異動後自動失效
+    """
+    @property
+    def retrieval_cache(self):
+        if getattr(self, '_retrieval_cache', None) is None:
+            self._retrieval_cache = LRUCache(self.retrieval_cache_size)
+        return self._retrieval_cache
+
+    """
+    預先檢索使用的執行緒池，第一次使用時建立
+    """
+    @property
+    def executor(self):
+        if getattr(self, '_executor', None) is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.speculative_workers, thread_name_prefix="rag-speculative")
+        return self._executor
+
+    """
+    有時間預算時執行同步 LLM 呼叫的執行緒池，第一次使用時建立
+    """
+    @property
+    def deadline_executor(self):
+        if getattr(self, '_deadline_executor', None) is None:
+            self._deadline_executor = ThreadPoolExecutor(max_workers=self.deadline_workers, thread_name_prefix="rag-llm")
+        return self._deadline_executor
+
+    def _count(self, name, amount=1):
+        metrics = self.metrics
+        with self._metrics_lock:
+            metrics[name] += amount
+
+    """
+    回傳各項執行統計，例如規則式意圖分類的命中率。
+    """
+    def stats(self):
+        metrics = self.metrics
+        with self._metrics_lock:
+            counters = dict(metrics)
+        reviewed = counters.get("review_skipped", 0) + counters.get("review_llm", 0)
+        return {
+            "intent": self.intent_rules.stats(),
+            "review": {
+                "skipped": counters.get("review_skipped", 0),
+                "llm": counters.get("review_llm", 0),
+                "skip_rate": counters.get("review_skipped", 0) / reviewed if reviewed else 0.0
+            },
+            "prompt_tokens": self._prompt_stats(counters),
+            "counters": counters,
+            "response_cache": self.response_cache.stats() if self.cache_responses else None,
+            "embedding_cache": self.embedding_cache.stats(),
+            "retrieval_cache": self.retrieval_cache.stats(),
+            "llm_pools": {",".join(urls): pool.stats() for urls, pool in self.llm_pools.items()},
+            "llm_breaker": self.llm_breaker.stats(),
+            "llm_scheduler": self.llm_scheduler.stats()
+        }
+
+    """
+    依 LLM 呼叫階段整理 prompt 長度統計：呼叫次數、累計與平均 token 數量（估算值）
+
+    範例：
+      counters = {"prompt_calls_prediction": 2, "prompt_tokens_prediction": 900}
+      return：{"prediction": {"calls": 2, "tokens": 900, "average": 450.0}}
+    """
+    @staticmethod
+    def _prompt_stats(counters):
+        result = {}
+        for name, calls in counters.items():
+            if name.startswith("prompt_calls_") and calls:
+                stage = name[len("prompt_calls_"):]
+                tokens = counters.get(f"prompt_tokens_{stage}", 0)
+                result[stage] = {"calls": calls, "tokens": tokens, "average": tokens / calls}
+        return result
+
+    """
+    將單一房型資料轉換成 langchain 的 Document。
+    metadata 中記錄房型 id 與 page_content 的內容雜湊值，作為向量索引增量同步的依據；
+    另外記錄解析成整數的價格、面積與入住人數，讓檢索時可以直接用 where 條件預先篩選。
+    
+    範例：
+      item = {"id": 0, "name": "和式套房", "price": "5000", "area": "30", "maxOccupancy": "2人房", ...}
+      回傳：Document(page_content="名稱:和式套房 價格:5000 ...",
+                    metadata={"room_id": "0", "content_hash": "3f2a...", "price": 5000, "area": 30, "occupancy": 2})
+    """
+    def build_document(self, item, index=0):
+        page_content = format_room(item)
+        embedding_model = self.embedding_model
+        content_hash = hashlib.sha256(f"{self.INDEX_SCHEMA_VERSION}:{embedding_model}:{page_content}".encode('utf-8')).hexdigest()
+        return Document(
+            page_content=page_content,
+            metadata={
+                "room_id": str(item.get('id', index)),
+                "content_hash": content_hash,
+                "embedding_model": embedding_model,
+                "price": parse_number(item.get('price')),
+                "area": parse_number(item.get('area')),
+                "occupancy": parse_number(item.get('maxOccupancy'))
+            }
+        )
+
+    """
+    目前使用的嵌入模型名稱（嵌入類別名稱加上模型名稱或向量維度），記錄在每份文件的 metadata 並納入內容雜湊值，
+    更換嵌入模型後啟動時會重新嵌入所有房型
+    """
+    @property
+    def embedding_model(self):
+        embeddings = getattr(self, 'embeddings', None)
+        if embeddings is None:
+            return ""
+        parts = [type(embeddings).__name__]
+        for attribute in ("model_name", "model", "size"):
+            value = getattr(embeddings, attribute, None)
+            if isinstance(value, (str, int)) and not isinstance(value, bool):
+                parts.append(str(value))
+        return ":".join(parts)
+
+    """
+    將 self.docs 與向量資料庫同步，只重新嵌入新增或內容有變動的房型，其餘直接沿用磁碟上的向量。
+    1. 讀取向量資料庫中既有的房型 id 與內容雜湊值
+    2. 刪除已不存在於房型資料中的房型
+    3. 雜湊值不同（新增或修改）的房型才重新嵌入並寫入；嵌入模型與索引中記錄的不同時清空索引，全部重新嵌入
+    
+    回傳：(重新嵌入的房型數量, 刪除的房型數量)
+    """
+    def sync_vectorstore(self):
+        stored = self.vectorstore.get(include=["metadatas"])
+        embedding_model = self.embedding_model
+        if any((metadata or {}).get("embedding_model") != embedding_model for metadata in stored["metadatas"]):
+            # 嵌入模型不同時向量不能混用（維度也可能不同），清空整個索引後全部重新嵌入
+            self._reset_vectorstore(stored["ids"])
+            stored = {"ids": [], "metadatas": []}
+        stored_hashes = {
+            room_id: (metadata or {}).get("content_hash")
+            for room_id, metadata in zip(stored["ids"], stored["metadatas"])
+        }
+        wanted = {doc.metadata["room_id"]: doc for doc in self.docs}
+
+        stale_ids = [room_id for room_id in stored_hashes if room_id not in wanted]
+        changed_docs = [
+            doc for room_id, doc in wanted.items()
+            if stored_hashes.get(room_id) != doc.metadata["content_hash"]
         ]
 
-        embeddings = FastEmbedEmbeddings()
-        self.vectorstore = Chroma.from_documents(self.docs, embeddings)
-        self.retriever = self.vectorstore.as_retriever(search_kwargs={"k": 10})
-        self.llm = Ollama(model="gemma3:27b-it-qat", base_url="http://140.124.184.213:11434")
-        self.used_names = set()  # 新增：用於追蹤所有已推薦過的房型名稱
+        if stale_ids:
+            self.vectorstore.delete(ids=stale_ids)
+
+        for start in range(0, len(changed_docs), self.INDEX_BATCH_SIZE):
+            batch = changed_docs[start:start + self.INDEX_BATCH_SIZE]
+            self.vectorstore.add_documents(batch, ids=[doc.metadata["room_id"] for doc in batch])
+
+        return len(changed_docs), len(stale_ids)
+
+    """
+    清空向量資料庫。Chroma 的 collection 會記住向量維度，需刪除整個 collection 後重新建立；其他後端刪除所有文件即可
+    """
+    def _reset_vectorstore(self, ids):
+        if hasattr(self.vectorstore, 'delete_collection'):
+            self.vectorstore.delete_collection()
+            self.vectorstore = self._create_vectorstore(getattr(self, 'persist_directory', None))
+        elif ids:
+            self.vectorstore.delete(ids=list(ids))
+
+    """
+    依房型 id 找出該房型在 self.data 中的位置，找不到則回傳 None。房型目錄的列與 self.data 的順序相同，以目錄的 id 對照表查詢
+    """
+    def _find_room_index(self, room_id):
+        return self.catalog.row_of.get(str(room_id))
+
+    """
+    新增或取代單一房型，只嵌入該房型的文件並寫入既有的向量資料庫，不重建整個索引。
+    房型目錄在快照上修改後整個替換，查詢中的執行緒不會看到修改到一半的目錄；新增房型不需複製整個目錄，為常數時間。
+    
+    範例：
+      room = {"id": 22, "name": "測試房型", "price": "1000", ...}
+      若 id 22 不存在則新增；已存在則以新資料取代。
+    """
+    def upsert_room(self, room):
+        with self.rooms_lock:
+            catalog = self.catalog.snapshot()
+            index = catalog.row_of.get(str(room['id']))
+            catalog.upsert(room)
+            if index is None:
+                self._data.append(room)
+            else:
+                self._data[index] = room
+            self._catalog = catalog
+            self._bump_catalog_version()
+
+            doc = self.build_document(room)
+            room_id = doc.metadata["room_id"]
+            self._put_doc(doc)
+            self.vectorstore.add_documents([doc], ids=[room_id])
+            if getattr(self, '_keyword_index', None) is not None:
+                self._keyword_index.add(room_id, self.keyword_text(room))
+        return room
+
+    """
+    更新指定 id 房型的部分欄位，回傳更新後的房型資料；找不到該房型則回傳 None。
+    
+    範例：
+      update_room(3, {"price": "6000"})
+      回傳：{"id": 3, "name": "泳池景家庭房", "price": "6000", ...}
+    """
+    def update_room(self, room_id, fields):
+        with self.rooms_lock:
+            index = self._find_room_index(room_id)
+            if index is None:
+                return None
+
+            room = dict(self.data[index])
+            room.update({key: value for key, value in fields.items() if key != 'id'})
+            return self.upsert_room(room)
+
+    """
+    刪除指定 id 的房型並同步移除向量資料庫中的文件，成功回傳 True，找不到該房型則回傳 False。
+    """
+    def delete_room(self, room_id):
+        with self.rooms_lock:
+            catalog = self.catalog.snapshot()
+            index = catalog.row_of.get(str(room_id))
+            if index is None:
+                return False
+
+            room_id = catalog.ids[index]
+            catalog.remove(room_id)
+            del self._data[index]
+            self._catalog = catalog
+            self._bump_catalog_version()
+            self._remove_doc(room_id)
+            self.vectorstore.delete(ids=[room_id])
+            if getattr(self, '_keyword_index', None) is not None:
+                self._keyword_index.remove(room_id)
+        return True
 
 
     """
     Classify the user's intent based on their question. (房型推薦 or 打招呼 or 泛用推薦 or 其他)
+    先以規則式分類器判斷（問候語、價格/面積/人數、風格與設施關鍵字、泛用推薦用語），
+    能確定意圖時直接回傳，不需呼叫 LLM；無法確定時才交給 LLM 判斷。
+    查詢的剩餘時間不足以同時判斷意圖與產生推薦時不呼叫 LLM，視為房型推薦。
     """
     def classify_intent(self, question):
-        prompt = ChatPromptTemplate.from_messages([
-            ("system",
-             "請判斷以下使用者輸入屬於哪一種類型：\n"
-             "1. 房型推薦需求（包含價格、風格、幾人房、設備、是否有某項特色等）\n"
-             "2. 一般打招呼或聊天（如：你好、哈囉、在嗎）\n"
-             "3. 廣泛推薦（如：有什麼推薦、請推薦、推薦一下、可以推薦嗎、請問有推薦的房型嗎等泛用推薦問題，這類問題沒有明確條件，請直接回傳 '泛用推薦'）\n"
-             "4. 其他與房型無關的問題（例如問天氣、問你是誰）\n\n"
-             "使用者可能會詢問是否有某種房型（例如：是否有工業風？是否有浴缸？），這也屬於房型推薦。\n"
-             "請你只回答：'房型推薦'、'打招呼'、'泛用推薦' 或 '其他'"
-             ),
-            ("user", question)
-        ])
-        result = (prompt | self.llm).invoke({})
+        intent = self._rule_intent(question)
+        if intent is not None:
+            return intent
+        if not self._intent_budget():
+            return "房型推薦"
+        return self._invoke_llm("intent", {"question": question}).strip()
+
+    """
+    classify_intent 的非同步版本，LLM 以 ainvoke 呼叫，等待期間不佔用執行緒
+    """
+    async def aclassify_intent(self, question):
+        intent = self._rule_intent(question)
+        if intent is not None:
+            return intent
+        if not self._intent_budget():
+            return "房型推薦"
+        result = await self._ainvoke_llm("intent", {"question": question})
         return result.strip()
 
+    def _intent_budget(self):
+        return self._budget_allows(self.deadline_intent_reserve + self.deadline_prediction_reserve, "rule_intent")
+
+    def _rule_intent(self, question):
+        catalog = self.catalog
+        return self.intent_rules.classify(question, catalog.styles, catalog.amenities)
+
+    """
+    所有 LLM 呼叫的共同入口。
+    stage 為呼叫階段名稱（intent、structured、prediction、review、auto_recommend），同時也是 prompt 模板的名稱；
+    inputs 為模板變數，使用者輸入與房型資料只透過變數傳入。
+    呼叫都經過斷路器（llm_breaker）：斷路器開啟時拋出 CircuitOpenError，呼叫失敗時拋出 LLMUnavailableError，
+    查詢流程收到這兩種錯誤時改用不需要 LLM 的回應。
+    查詢有時間預算時最多只等待剩餘的時間，超過時拋出 DeadlineExceededError（不計入斷路器的失敗）。
+    斷路器放行後再向排程器（llm_scheduler）取得執行名額，排隊被拒絕時拋出 SchedulerBusyError
+    """
+    def _invoke_llm(self, stage, inputs):
+        chain = self._guarded_chain(stage, inputs)
+        deadline = current_deadline()
+        self._acquire_llm(stage, deadline)
+        start = time.perf_counter()
+        try:
+            if deadline is None or deadline.budget is None:
+                try:
+                    result = chain.invoke(inputs)
+                finally:
+                    self._release_llm(start)
+            else:
+                future = self.deadline_executor.submit(chain.invoke, inputs)
+                # 放棄等待的呼叫仍在模型上執行，名額在呼叫真正結束時才歸還
+                future.add_done_callback(lambda _: self._release_llm(start))
+                if not wait([future], timeout=deadline.remaining()).done:
+                    future.cancel()
+                    raise DeadlineExceededError(stage, f"超過 {deadline.budget} 秒的時間預算")
+                result = future.result()
+        except DeadlineExceededError:
+            self._deadline_exceeded()
+            raise
+        except Exception as error:
+            self._llm_failed(stage, start, error)
+        except BaseException:
+            self.llm_breaker.release()
+            raise
+        self.llm_breaker.record(time.perf_counter() - start)
+        return result
+
+    async def _ainvoke_llm(self, stage, inputs):
+        chain = self._guarded_chain(stage, inputs)
+        deadline = current_deadline()
+        await self._aacquire_llm(stage, deadline)
+        start = time.perf_counter()
+        try:
+            if deadline is None or deadline.budget is None:
+                result = await chain.ainvoke(inputs)
+            else:
+                task = asyncio.ensure_future(chain.ainvoke(inputs))
+                done, _ = await asyncio.wait({task}, timeout=deadline.remaining())
+                if not done:
+                    task.cancel()
+                    raise DeadlineExceededError(stage, f"超過 {deadline.budget} 秒的時間預算")
+                result = task.result()
+        except DeadlineExceededError:
+            self._deadline_exceeded()
+            raise
+        except Exception as error:
+            self._llm_failed(stage, start, error)
+        except BaseException:
+            self.llm_breaker.release()
+            raise
+        finally:
+            self._release_llm(start)
+        self.llm_breaker.record(time.perf_counter() - start)
+        return result
+
+    """
+    以串流方式呼叫 LLM，逐段回傳模型產生的文字；斷路器以第一段文字的等待時間判斷是否過慢。
+    查詢有時間預算時，等待每段文字（包括第一段）最多只到預算用完為止，超過預算就中斷串流並拋出 DeadlineExceededError
+    """
+    def _stream_llm(self, stage, inputs):
+        chain = self._guarded_chain(stage, inputs)
+        deadline = current_deadline()
+        self._acquire_llm(stage, deadline)
+        start = time.perf_counter()
+        first_chunk = None
+        budgeted = deadline is not None and deadline.budget is not None
+        stream = self._deadline_stream(stage, chain, inputs, deadline, start) if budgeted else chain.stream(inputs)
+        try:
+            for chunk in stream:
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - start
+                if deadline is not None and deadline.expired:
+                    raise DeadlineExceededError(stage, f"超過 {deadline.budget} 秒的時間預算")
+                yield chunk
+        except DeadlineExceededError:
+            self._deadline_exceeded()
+            raise
+        except Exception as error:
+            self._llm_failed(stage, start, error)
+        except BaseException:
+            self.llm_breaker.release()
+            raise
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            # 有時間預算時由讀取串流的執行緒在串流結束後歸還名額
+            if not budgeted:
+                self._release_llm(start)
+        self.llm_breaker.record(first_chunk if first_chunk is not None else time.perf_counter() - start)
+
+    async def _astream_llm(self, stage, inputs):
+        chain = self._guarded_chain(stage, inputs)
+        deadline = current_deadline()
+        await self._aacquire_llm(stage, deadline)
+        start = time.perf_counter()
+        first_chunk = None
+        stream = chain.astream(inputs)
+        try:
+            while True:
+                try:
+                    chunk = await self._next_chunk(stage, stream, deadline)
+                except StopAsyncIteration:
+                    break
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - start
+                if deadline is not None and deadline.expired:
+                    raise DeadlineExceededError(stage, f"超過 {deadline.budget} 秒的時間預算")
+                yield chunk
+        except DeadlineExceededError:
+            self._deadline_exceeded()
+            raise
+        except Exception as error:
+            self._llm_failed(stage, start, error)
+        except BaseException:
+            self.llm_breaker.release()
+            raise
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self._release_llm(start)
+        self.llm_breaker.record(first_chunk if first_chunk is not None else time.perf_counter() - start)
+
+    """
+    在 deadline_executor 的執行緒中讀取串流，呼叫端等待每段文字最多只到時間預算用完為止（逾時拋出 DeadlineExceededError）。
+    呼叫端中斷後，讀取的執行緒在收到下一段文字時關閉串流；串流結束後才歸還 LLM 排程器的名額
+    """
+    def _deadline_stream(self, stage, chain, inputs, deadline, start):
+        chunks = queue.Queue()
+        abandoned = threading.Event()
+
+        def pump():
+            stream = chain.stream(inputs)
+            try:
+                for chunk in stream:
+                    if abandoned.is_set():
+                        break
+                    chunks.put((True, chunk))
+                chunks.put((False, None))
+            except Exception as error:
+                chunks.put((False, error))
+            finally:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+                self._release_llm(start)
+
+        self.deadline_executor.submit(pump)
+        try:
+            while True:
+                try:
+                    is_chunk, value = chunks.get(timeout=deadline.remaining())
+                except queue.Empty:
+                    raise DeadlineExceededError(stage, f"超過 {deadline.budget} 秒的時間預算") from None
+                if is_chunk:
+                    yield value
+                elif value is None:
+                    return
+                else:
+                    raise value
+        finally:
+            abandoned.set()
+
+    """
+    取得非同步串流的下一段文字；有時間預算時最多等待到預算用完，逾時拋出 DeadlineExceededError
+    """
+    @staticmethod
+    async def _next_chunk(stage, stream, deadline):
+        if deadline is None or deadline.budget is None:
+            return await stream.__anext__()
+        try:
+            return await asyncio.wait_for(stream.__anext__(), deadline.remaining())
+        except asyncio.TimeoutError:
+            # LLM 請求本身的逾時（例如 aiohttp）也是 TimeoutError，預算還沒用完時視為呼叫失敗
+            if not deadline.expired:
+                raise
+            raise DeadlineExceededError(stage, f"超過 {deadline.budget} 秒的時間預算") from None
+
+    """
+    斷路器放行時回傳該階段的 chain，開啟時拋出 CircuitOpenError（不送出請求）
+    """
+    def _guarded_chain(self, stage, inputs):
+        if not self.llm_breaker.allow():
+            self._count("llm_rejected")
+            raise CircuitOpenError(stage, "斷路器開啟中")
+        return self._chain(stage, inputs)
+
+    """
+    向排程器取得執行名額，依 STAGE_PRIORITIES 決定優先順序；有時間預算時最多排隊到預算用完為止。
+    排隊被拒絕時歸還斷路器的許可：因時間預算用完而放棄時拋出 DeadlineExceededError（改用不需要 LLM 的回應），
+    其餘（排隊已滿或等待超過 llm_max_queue_time）拋出 SchedulerBusyError
+    """
+    def _acquire_llm(self, stage, deadline):
+        try:
+            self.llm_scheduler.acquire(self.stage_priority(stage), self._queue_timeout(deadline))
+        except SchedulerBusyError as error:
+            self._llm_busy(stage, deadline, error)
+
+    async def _aacquire_llm(self, stage, deadline):
+        try:
+            await self.llm_scheduler.aacquire(self.stage_priority(stage), self._queue_timeout(deadline))
+        except SchedulerBusyError as error:
+            self._llm_busy(stage, deadline, error)
+        except BaseException:
+            self.llm_breaker.release()
+            raise
+
+    def stage_priority(self, stage):
+        return self.STAGE_PRIORITIES.get(stage, CHAT_PRIORITY)
+
+    @staticmethod
+    def _queue_timeout(deadline):
+        return None if deadline is None or deadline.budget is None else deadline.remaining()
+
+    def _llm_busy(self, stage, deadline, error):
+        self.llm_breaker.release()
+        if deadline is not None and deadline.expired:
+            self._count("deadline_llm_timeouts")
+            raise DeadlineExceededError(stage, f"排隊超過 {deadline.budget} 秒的時間預算") from error
+        self._count("llm_busy")
+        logger.warning("LLM %s call rejected by scheduler: %s", stage, error)
+        raise error
+
+    def _release_llm(self, start):
+        self.llm_scheduler.release(time.perf_counter() - start)
+
+    """
+    超過時間預算的呼叫是查詢自己放棄等待，不代表 LLM 故障，只歸還斷路器的試探許可
+    """
+    def _deadline_exceeded(self):
+        self.llm_breaker.release()
+        self._count("deadline_llm_timeouts")
+
+    """
+    查詢有時間預算且剩餘時間不足 seconds 秒時，記錄降級處理 degradation 並回傳 False；沒有時間預算時永遠回傳 True
+    """
+    def _budget_allows(self, seconds, degradation):
+        deadline = current_deadline()
+        if deadline is None or deadline.allows(seconds):
+            return True
+        deadline.degrade(degradation)
+        self._count(f"deadline_{degradation}")
+        return False
+
+    def _llm_failed(self, stage, start, error):
+        self.llm_breaker.record(time.perf_counter() - start, ok=False)
+        self._count("llm_failures")
+        logger.warning("LLM %s call failed: %r", stage, error)
+        raise LLMUnavailableError(stage, repr(error)) from error
+
+    """
+    所有 LLM 呼叫共用的斷路器，第一次使用時依 llm_breaker_* 設定建立
+    """
+    @property
+    def llm_breaker(self):
+        if getattr(self, '_llm_breaker', None) is None:
+            self._llm_breaker = CircuitBreaker(
+                window=self.llm_breaker_window,
+                min_calls=self.llm_breaker_min_calls,
+                failure_rate=self.llm_breaker_failure_rate,
+                slow_call=self.llm_slow_call,
+                slow_rate=self.llm_breaker_slow_rate,
+                open_duration=self.llm_breaker_open_duration
+            )
+        return self._llm_breaker
+
+    """
+    所有 LLM 呼叫共用的排程器，第一次使用時依 llm_max_* 設定建立
+    """
+    @property
+    def llm_scheduler(self):
+        if getattr(self, '_llm_scheduler', None) is None:
+            self._llm_scheduler = LLMScheduler(
+                max_concurrency=self.llm_max_concurrency,
+                max_queue=self.llm_max_queue,
+                max_queue_time=self.llm_max_queue_time
+            )
+        return self._llm_scheduler
+
+    """
+    各階段的 prompt 模板與 chain，第一次使用時建立，之後的請求重複使用
+    """
+    @property
+    def prompts(self):
+        if getattr(self, '_prompts', None) is None:
+            self._prompts = PromptRegistry()
+        return self._prompts
+
+    def _chain(self, stage, inputs):
+        self._record_prompt(stage, inputs)
+        return self.prompts.chain(stage, self.llm_for(stage))
+
+    """
+    記錄每次 LLM 呼叫的 prompt 長度（估算的 token 數量），依階段累計在 metrics 中，可由 stats() 觀察 prefill 的成本
+    """
+    def _record_prompt(self, stage, inputs):
+        tokens = self.prompts.estimate_tokens(stage, inputs)
+        self._count(f"prompt_calls_{stage}")
+        self._count(f"prompt_tokens_{stage}", tokens)
+        logger.info("LLM %s prompt: %d tokens (estimated)", stage, tokens)
+        return tokens
 
     """
     從使用者輸入的內容中提取價格區間，回傳最小價格、最大價格及其嚴格性判斷
+    （價格、面積與人數由 parse_numeric_constraints 一次掃描取得，同一個問題只解析一次）
+
+    範例：
+      text = "3000~5000元"，return：(3000, 5000, False, False)
+      text = "5000元起"，return：(5000, None, False, False)
+      text = "高於5000元"，return：(5000, None, True, False)
+      text = "預算五千以內"，return：(None, 5000, False, False)
+      text = "低於5000元"，return：(None, 5000, False, True)
     """
     def extract_price_range(self, text):
-        min_price = None
-        max_price = None
-        min_strict = False  # 是否嚴格大於
-        max_strict = False  # 是否嚴格小於
-
-        """
-        input = "3000~5000元"
-        group(1) => 最小價格 = 3000
-        group(2) => (元)? (? = 0 or 1 次)
-        group(3) => (~|到|至|-|—) 範圍分隔
-        group(4) => 最大價格 = 5000
-        return (3000, 5000, False, False)
-        """
-        range_match = re.search(r'(\d{3,5})\s*(元)?\s*(~|到|至|\-|—)\s*(\d{3,5})', text)
-        if range_match:
-            min_price = int(range_match.group(1))       # 最小價格
-            max_price = int(range_match.group(4))       # 最小價格
-            return min_price, max_price, min_strict, max_strict
-
-        """
-        input = "5000 元起" (>= 5000)
-        group(1) => 最小價格 = 3000
-        group(2) => (元)
-        group(3) => (以上|起|以上的) 
-        return (3000, None, False, False)
-        
-        input = "高於 5000元" (> 5000)
-        group(1) => (大於|超過|高於)
-        group(2) => 最小價格 = 5000
-        group(3) => (元)
-        return (5000, None, True, False)
-        """
-        if match := re.search(r'(\d{3,5})\s*(元)?\s*(以上|起|以上的)', text):
-            min_price = int(match.group(1))
-            min_strict = False
-        elif match := re.search(r'(大於|超過|高於)\s*(\d{3,5})\s*(元)?\s*', text):
-            min_price = int(match.group(2))
-            min_strict = True
-
-        """
-        input = "3000 之內" (<= 3000)
-        group(1) => 最高價格 = 3000
-        group(2) => (元)
-        group(3) => (以上|起|以上的) 
-        return (None, 3000, False, False)
-
-        input = "低於 5000元" (< 5000)
-        group(1) => (小於|少於|低於)
-        group(2) => = 最高價格 5000
-        group(3) => (元)
-        return (None, 3000, False, True)
-        """
-        if match := re.search(r'(\d{3,5})\s*(元)?\s*(以下|以內|之內)', text):
-            max_price = int(match.group(1))
-            max_strict = False
-        elif match := re.search(r'(小於|少於|低於)\s*(\d{3,5})\s*(元)?\s*', text):
-            max_price = int(match.group(2))
-            max_strict = True
-
-        return min_price, max_price, min_strict, max_strict
+        return parse_numeric_constraints(text)[0]
 
     """
     從使用者輸入的內容中提取面積區間，回傳最小面積、最大面積及其嚴格性判斷
+
+    範例：
+      text = "面積 50 坪 ~ 100 坪"，return：(50, 100, False, False)
+      text = "面積大於50m²"，return：(50, None, True, False)
+      text = "40平方公尺以下"，return：(None, 40, False, False)
     """
     def extract_area_range(self, text):
-        min_area = None
-        max_area = None
-        min_strict = False  # 是否嚴格大於
-        max_strict = False  # 是否嚴格小於
-
-        # 僅當有面積相關關鍵詞時才進行匹配
-        if not re.search(r'(面積|坪|平方|m²|平方米|平方公尺)', text):
-            return min_area, max_area, min_strict, max_strict
-
-        """
-        input = "面積 50 坪 ~ 100 坪"
-        group(1) 最小面積 = 50
-        group(2) => (m²|平方公尺|平方米|坪)? (可選)
-        group(3) => (~|到|至|-|—) 範圍分隔
-        group(4) 最大面積 = 100
-        return (50, 100, False, False)
-        """
-        range_match = re.search(r'(\d{2,4})\s*(m²|平方公尺|平方米|坪)?\s*(~|到|至|\-|—)\s*(\d{2,4})', text)
-        if range_match:
-            min_area = int(range_match.group(1))
-            max_area = int(range_match.group(4))
-            return min_area, max_area, False, False
-
-        """
-        input = "面積 50 坪以上" (>= 50)
-        group(1) 最小面積 = 50
-        group(2) => (m²|平方公尺|平方米|坪)? (可選)
-        group(3) => (以上|起|以上的)
-        return (50, None, False, False)
-        
-        input = "大於 50 坪" (> 50)
-        group(1) => (大於|超過|多於)
-        group(2) 最小面積 = 50
-        group(3) => (m²|平方公尺|平方米|坪)? (可選)
-        return (50, None, True, False)
-        """
-        if match := re.search(r'(\d{2,4})\s*(m²|平方公尺|平方米|坪)?\s*(以上|起|以上的)', text):
-            min_area = int(match.group(1))
-            min_strict = False
-        elif match := re.search(r'(大於|超過|多於)\s*(\d{2,4})', text):
-            min_area = int(match.group(2))
-            min_strict = True
-
-        """
-        input = "面積 50 坪以下" (<= 50)
-        group(1) 最大面積 = 50
-        group(2) => (m²|平方公尺|平方米|坪)? (可選)
-        group(3) => (以下|以內|之內)
-        return (None, 50, False, False)
-        
-        input = "小於 50 坪" (< 50)
-        group(1) => (小於|少於|低於)
-        group(2) 最大面積 = 50
-        group(3) => (m²|平方公尺|平方米|坪)? (可選)
-        return (None, 50, False, True)
-        """
-        if match := re.search(r'(\d{2,4})\s*(m²|平方公尺|平方米|坪)?\s*(以下|以內|之內)', text):
-            max_area = int(match.group(1))
-            max_strict = False
-        elif match := re.search(r'(小於|少於|低於)\s*(\d{2,4})', text):
-            max_area = int(match.group(2))
-            max_strict = True
-
-        return min_area, max_area, min_strict, max_strict
+        return parse_numeric_constraints(text)[1]
+
+    """
+    從使用者輸入的內容中提取入住人數，找不到則回傳 None
+    
+    範例：
+      text = "我要雙人房"，return：2
+      text = "4人房"，return：4
+      text = "三位入住"，return：3
+      text = "十二人"，return：12
+      text = "我要工業風"，return：None
+    """
+    def extract_occupancy(self, text):
+        return parse_numeric_constraints(text)[2]
+
+    """
+    依據價格、面積與入住人數條件產生 Chroma 的 where 篩選條件，沒有任何條件時回傳 None。
+    只設定上限時額外要求數值 >= 0，避免無法解析（-1）的房型被當成符合條件。
+    room_ids 不為 None 時只檢索這些房型（例如以設施點陣圖算出的候選房型）。
+    
+    範例：
+      price_range = (None, 3000, False, False)，occupancy = 2
+      回傳：{"$and": [{"price": {"$gte": 0}}, {"price": {"$lte": 3000}}, {"occupancy": {"$gte": 2}}]}
+    """
+    def build_where_filter(self, price_range=None, area_range=None, occupancy=None, room_ids=None):
+        conditions = []
+        for field, value_range in (("price", price_range), ("area", area_range)):
+            if value_range is None:
+                continue
+            min_value, max_value, min_strict, max_strict = value_range
+            if min_value is not None:
+                conditions.append({field: {"$gt" if min_strict else "$gte": min_value}})
+            elif max_value is not None:
+                conditions.append({field: {"$gte": 0}})
+            if max_value is not None:
+                conditions.append({field: {"$lt" if max_strict else "$lte": max_value}})
+        if occupancy is not None:
+            conditions.append({"occupancy": {"$gte": occupancy}})
+        if room_ids is not None:
+            conditions.append({"room_id": {"$in": list(room_ids)}})
+
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"$and": conditions}
 
     """
     從使用者輸入的內容中提取風格關鍵字，回傳出現在輸入中的所有房型風格
@@ -185,26 +1085,125 @@ class RAGPipeline:
     output = ["工業風"]
     """
     def extract_style_keywords(self, text):
-        styles = []
+        return self.catalog.style_matcher.find(text)
 
-        for item in self.data:
-            if item["style"] is not None and len(item["style"])!=0 and item["style"] not in styles:
-                styles.append(item["style"])
+    """
+    從使用者輸入的內容中提取設施關鍵字，回傳出現在輸入中的所有房型設施
+    input = "想要有浴缸的房間"
+    output = ["浴缸"]
+    """
+    def extract_amenity_keywords(self, text):
+        return self.catalog.amenity_matcher.find(text)
+
+    """
+    以正規表示式與房型目錄詞彙提取使用者的所有需求條件
+    
+    範例：
+      text = "3000元以下的工業雙人房"
+      回傳：RoomConstraints(price_range=(None, 3000, False, False), occupancy=2, styles=["工業"], ...)
+    """
+    def extract_constraints(self, text):
+        return RoomConstraints(
+            price_range=self.extract_price_range(text),
+            area_range=self.extract_area_range(text),
+            occupancy=self.extract_occupancy(text),
+            styles=self.extract_style_keywords(text),
+            amenities=self.extract_amenity_keywords(text)
+        )
+
+    """
+    以單一 LLM 呼叫同時取得意圖與需求條件（JSON 格式），並驗證回傳內容。
+    格式不正確（非 JSON、意圖不在允許值內、數值欄位型別錯誤等）時回傳 None。
+    
+    範例：
+      question = "3000元以下的雙人房，要有浴缸"
+      LLM 回傳：{"intent": "房型推薦", "price": {"min": null, "max": 3000, "min_strict": false, "max_strict": false},
+                "area": {"min": null, "max": null, "min_strict": false, "max_strict": false},
+                "occupancy": 2, "styles": [], "features": ["浴缸"]}
+      回傳：("房型推薦", RoomConstraints(price_range=(None, 3000, False, False), occupancy=2, amenities=["浴缸"]))
+    """
+    def parse_request(self, question):
+        return self._parse_request_result(self._invoke_llm("structured", {"question": question}))
+
+    async def aparse_request(self, question):
+        result = await self._ainvoke_llm("structured", {"question": question})
+        return self._parse_request_result(result)
+
+    def _parse_request_result(self, result):
+        match = re.search(r'\{.*\}', result, re.DOTALL)
+        if not match:
+            return None
+        try:
+            data = pyjson.loads(match.group(0))
+        except pyjson.JSONDecodeError:
+            return None
+        return self._validate_request(data)
+
+    """
+    驗證結構化解析結果，回傳 (意圖, RoomConstraints)，任一欄位不合法則回傳 None
+    """
+    def _validate_request(self, data):
+        if not isinstance(data, dict) or data.get("intent") not in self.INTENTS:
+            return None
+
+        def is_int_or_none(value):
+            return value is None or (isinstance(value, int) and not isinstance(value, bool))
+
+        ranges = []
+        for field in ("price", "area"):
+            value = data.get(field) or {}
+            if not isinstance(value, dict):
+                return None
+            min_value, max_value = value.get("min"), value.get("max")
+            min_strict, max_strict = value.get("min_strict", False), value.get("max_strict", False)
+            if not (is_int_or_none(min_value) and is_int_or_none(max_value)
+                    and isinstance(min_strict, bool) and isinstance(max_strict, bool)):
+                return None
+            ranges.append((min_value, max_value, min_strict, max_strict))
+
+        occupancy = data.get("occupancy")
+        styles = data.get("styles") or []
+        features = data.get("features") or []
+        if not is_int_or_none(occupancy) or not isinstance(styles, list) or not isinstance(features, list):
+            return None
+        if not all(isinstance(item, str) for item in styles + features):
+            return None
+
+        return data["intent"], RoomConstraints(ranges[0], ranges[1], occupancy, styles, features)
+
+    """
+    判斷使用者意圖並取得需求條件，回傳 (意圖, RoomConstraints 或 None)。
+    structured_intent 開啟時以 parse_request 一次取得意圖與條件；解析失敗（或剩餘時間不足）則退回 classify_intent，
+    條件留待需要時再以正規表示式提取（回傳 None）。
+    """
+    def understand_question(self, question):
+        if self.structured_intent and self._intent_budget():
+            parsed = self.parse_request(question)
+            if parsed is not None:
+                self._count("structured_parsed")
+                return parsed
+            self._count("structured_fallback")
+        return self.classify_intent(question), None
 
-        return [style for style in styles if style is not None and style in text]
+    async def aunderstand_question(self, question):
+        if self.structured_intent and self._intent_budget():
+            parsed = await self.aparse_request(question)
+            if parsed is not None:
+                self._count("structured_parsed")
+                return parsed
+            self._count("structured_fallback")
+        return await self.aclassify_intent(question), None
 
     """
     根據風格關鍵字對文件列表進行排序，讓與使用者需求風格相符的房型排在前面
+    （分數為文件中出現的風格關鍵字數量，每個文件只掃描一次）
     """
     def sort_by_style_match(self, docs, style_keywords):
         if not style_keywords:
             return docs
 
-        def score(doc):
-            content = doc.page_content
-            return sum(1 for kw in style_keywords if kw in content)
-
-        return sorted(docs, key=score, reverse=True)
+        matcher = style_keywords if isinstance(style_keywords, KeywordMatcher) else KeywordMatcher(style_keywords)
+        return sorted(docs, key=lambda doc: len(matcher.find(doc.page_content)), reverse=True)
 
     """
     根據價格區間篩選房型摘要內容。
@@ -323,38 +1322,19 @@ class RAGPipeline:
         return '\n'.join(result)
 
     def LLM_Prediction(self, question, rooms_summary):
-        prompt = ChatPromptTemplate.from_messages([
-            ("system",
-             "你是一位專業且親切的飯店房型推薦助手，專門根據使用者的需求（例如：預算、風格、入住人數等）提供最合適的房型建議。\n\n"
-             "請依據提供的房型資料中，精選出「最符合使用者需求」的房型，最多列出 3 間房型"
-             "⚠️ 請注意推薦的房型**不可重複**，若重複則**刪除其中一個房型名稱和推薦理由**。\n"
-             "⚠️ 請**『務必只使用資料庫中提供的房型名稱，不可自行編造』。\n"
-             "⚠️ 回覆內容請使用**繁體中文**。\n"
-             "⚠️ 若使用者的問題與房型推薦無關，請親切回覆：「我是一個飯店推薦助手，目前只提供房型相關的建議喔！」\n"
-             "⚠️ 請在推薦理由中明確說明房型的實際價格，並根據使用者預算範圍正確描述：\n"
-             "  - 若價格在預算範圍內，請強調『符合預算』或『價格具有優勢』。\n"
-             "  - 嚴禁出現『雖然價格稍高』、『超出預算』等與實際價格不符的描述。\n"
-             "  - 若房型價格低於預算上限，請強調其價格優勢。\n"
-             "⚠️ 若房型未完全符合使用者需求（如面積、價格等），請明確說明『此房型未達到您的需求，但為最接近的選擇』，且不得出現誤導性語句。"
-            ),
-            ("user",
-             "使用者需求：{input}\n"
-             "房型資料：{rooms}\n\n"
-             "請根據上述資訊，推薦最符合使用者需求的房型，並給出推薦理由與結語。\n"
-             "回覆格式如下（每個房型請依照範例填寫）：\n\n"
-             "推薦房型：\n"
-             "房型名稱\n"
-             "推薦理由：...\n\n"
-             "房型名稱\n"
-             "推薦理由：...\n\n"
-             "房型名稱\n"
-             "推薦理由：...\n\n"
-             "結語：...")
-        ])
-
-        chain = prompt | self.llm
-        result = chain.invoke({"input": question, "rooms": rooms_summary})
-        return result
+        return self._invoke_llm("prediction", {"input": question, "rooms": rooms_summary})
+
+    async def aLLM_Prediction(self, question, rooms_summary):
+        return await self._ainvoke_llm("prediction", {"input": question, "rooms": rooms_summary})
+
+    """
+    LLM_Prediction 的串流版本，逐段回傳推薦內容
+    """
+    def LLM_Prediction_stream(self, question, rooms_summary):
+        return self._stream_llm("prediction", {"input": question, "rooms": rooms_summary})
+
+    def aLLM_Prediction_stream(self, question, rooms_summary):
+        return self._astream_llm("prediction", {"input": question, "rooms": rooms_summary})
 
     """
     將使用者需求與 LLM 輸出的推薦內容一併傳給 LLM，請其判斷推薦內容是否完全符合需求。
@@ -372,17 +1352,60 @@ class RAGPipeline:
         "目前沒有完全符合的房型"
     """
     def review_recommendation(self, user_question, llm_output):
-        prompt = ChatPromptTemplate.from_messages([
-            ("system",
-             "你是一位專業的飯店房型審查助手。請根據使用者需求與模型原本的推薦內容，判斷是否『完全符合』使用者需求。\n"
-             "如果不符合，請回覆：『目前沒有完全符合的房型』\n"
-             "請務必使用資料庫中出現過的房型名稱，且回覆內容使用繁體中文。\n"
-             "若原本的推薦已經符合需求，則直接回覆：『推薦內容符合使用者需求，無需變更。』"),
-            ("user",
-             f"使用者需求：{user_question}\n\n模型原本推薦內容如下：\n{llm_output}")
-        ])
-        chain = prompt | self.llm
-        return chain.invoke({})
+        return self._invoke_llm("review", {"question": user_question, "recommendation": llm_output})
+
+    async def areview_recommendation(self, user_question, llm_output):
+        return await self._ainvoke_llm("review", {"question": user_question, "recommendation": llm_output})
+
+    """
+    找出文字中提到的房型，依房型目錄順序回傳房型 id
+    
+    範例：
+      text = "推薦房型：\n房型名稱：和式套房\n推薦理由：..."
+      回傳：["0"]
+    """
+    def find_room_ids(self, text):
+        catalog = self.catalog
+        return [catalog.ids[row] for row in catalog.rows_named(text)]
+
+    """
+    以程式檢查 LLM 推薦內容是否符合使用者需求，取代第二次 LLM 審查：
+    1. 從推薦內容中找出房型目錄中的房型名稱
+    2. 逐一檢查價格、面積、入住人數、風格與設施是否符合條件
+    
+    回傳：
+      True：推薦的房型全部符合條件，可直接採用推薦內容
+      False：有推薦的房型不符合條件
+      None：無法判斷（找不到任何房型名稱，或需求中沒有可檢查的條件），需交給 LLM 審查
+    
+    範例：
+      conclusion = "房型名稱：和式套房\n推薦理由：..."（價格 5000、日式）
+      constraints = RoomConstraints(price_range=(None, 6000, False, False), styles=["日式"])
+      回傳：True
+    """
+    def verify_recommendation(self, conclusion, constraints):
+        if constraints is None or not (constraints.has_numeric() or constraints.styles or constraints.amenities):
+            return None
+
+        room_ids = self.find_room_ids(conclusion)
+        if not room_ids:
+            return None
+
+        catalog = self.catalog
+        rows = catalog.rows(room_ids)
+        if not catalog.mask(constraints.price_range, constraints.area_range, constraints.occupancy, rows=rows).all():
+            return False
+
+        # 風格與 catalog.bitmap 使用相同的比對規則
+        style_bitmap = catalog.bitmap(styles=constraints.styles) if constraints.styles else None
+        for row in rows:
+            item = catalog.rooms[row]
+            features = str(item.get('features') or '')
+            if style_bitmap is not None and not (style_bitmap >> int(row)) & 1:
+                return False
+            if not all(amenity in features for amenity in constraints.amenities):
+                return False
+        return True
 
     """
     根據使用者問題，利用檢索增強生成（RAG）流程取得相關房型摘要。
@@ -400,20 +1423,128 @@ class RAGPipeline:
         名稱:現代風雙人房 價格:3200 面積:22 特色:... 風格:現代風 床數:2
     """
     def getRoomSummaryByRAG(self, question):
+        sorted_docs = self._retrieve_sorted_docs(question)
+        return "\n".join([doc.page_content for doc in sorted_docs])
+
+    """
+    與 getRoomSummaryByRAG 相同的檢索與風格排序流程，但只回傳房型 id，
+    讓後續篩選直接在型別化的房型目錄上進行，摘要字串留到組合 prompt 時才產生。
+    
+    價格、面積與入住人數條件會轉成 where 條件在向量檢索時預先篩選，取回的房型都已符合條件；
+    有設施條件時，先以房型目錄的點陣圖算出同時符合所有條件的候選房型，只在這些房型中檢索。
+    k 從 retrieval_k 開始（不超過符合條件的房型總數），若符合風格關鍵字的房型少於 min_candidates，
+    則將 k 加倍重新檢索，最多放寬到 max_retrieval_k；風格點陣圖顯示候選房型中已沒有更多符合風格的房型時不再放寬。
+    問題向量與檢索結果都有 LRU 快取，重複的問題不需再嵌入與檢索。
+    
+    範例：
+      question = "我要工業風雙人房"，occupancy = 2
+      回傳：["18", "6", ...]
+    style_keywords 為 None 時由 question 提取風格關鍵字；amenities 為 None 時不以設施篩選。
+    """
+    def getRoomIdsByRAG(self, question, price_range=None, area_range=None, occupancy=None, style_keywords=None,
+                        amenities=None):
+        catalog = self.catalog
+        mask = catalog.mask(price_range, area_range, occupancy, amenities=amenities)
+        matching = int(mask.sum())
+        if matching == 0:
+            return []
+
+        candidate_ids = None
+        if amenities and any(amenity in key for amenity in amenities for key in catalog.amenity_bitmaps):
+            candidate_ids = [catalog.ids[row] for row in np.flatnonzero(mask)]
+        where = self.build_where_filter(price_range, area_range, occupancy, candidate_ids)
+
+        if style_keywords is None:
+            style_keywords = self.extract_style_keywords(question)
+
+        # 相同問題與條件在房型資料未異動前的檢索結果相同，直接使用快取
+        cache_key = (normalize_question(question), self.catalog_version, price_range, area_range, occupancy,
+                     tuple(style_keywords), tuple(amenities or ()))
+        cached = self.retrieval_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+
+        target = self.min_candidates
+        if style_keywords:
+            style_rows = catalog.bitmap_mask(catalog.bitmap(styles=style_keywords))
+            target = min(target, int((mask & style_rows).sum()))
+
+        embedding = self.embed_question(question)
+        max_k = min(self.max_retrieval_k, matching)
+        k = min(self.retrieval_k, matching)
+        style_matcher = KeywordMatcher(style_keywords)
+        while True:
+            docs = self.vectorstore.similarity_search_by_vector(embedding, k=k, filter=where)
+            sorted_docs = self.sort_by_style_match(docs, style_matcher)
+            style_matched = sum(1 for doc in docs if style_matcher.contains_any(doc.page_content))
+            candidates = style_matched if style_keywords else len(docs)
+            if candidates >= target or k >= max_k:
+                break
+            k = min(k * 2, max_k)
+
+        room_ids = [doc.metadata["room_id"] for doc in sorted_docs]
+        if self.hybrid_retrieval:
+            room_ids = self._fuse_keyword_results(question, room_ids, k, mask)
+        self.retrieval_cache.put(cache_key, tuple(room_ids))
+        return room_ids
+
+    """
+    以 BM25 檢索符合條件（mask 為房型目錄的篩選遮罩）的房型，與向量檢索的排序以倒數排名融合，保留前 k 個房型。
+    向量檢索容易漏掉「浴缸」、「榻榻米」這類逐字出現在特色欄位中的需求，關鍵字檢索可補上這些房型。
+    """
+    def _fuse_keyword_results(self, question, room_ids, k, mask):
+        catalog = self.catalog
+        allowed = None if mask.all() else {catalog.ids[row] for row in np.flatnonzero(mask)}
+        keyword_ids = [room_id for room_id, _ in self.keyword_index.search(question, k=k, allowed=allowed)]
+        if not keyword_ids:
+            return room_ids
+        self._count("keyword_fused")
+        return reciprocal_rank_fusion([room_ids, keyword_ids], self.rrf_k)[:k]
+
+    """
+    取得問題的向量，相同（正規化後）的問題只嵌入一次
+    """
+    def embed_question(self, question):
+        key = normalize_question(question)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(question)
+            self.embedding_cache.put(key, embedding)
+        return embedding
+
+    def _retrieve_sorted_docs(self, question):
         docs = self.retriever.get_relevant_documents(question)
         style_keywords = self.extract_style_keywords(question)
-        sorted_docs = self.sort_by_style_match(docs, style_keywords)
-        return "\n".join([doc.page_content for doc in sorted_docs])
+        return self.sort_by_style_match(docs, style_keywords)
+
+    """
+    取得房型推薦的候選房型，回傳 (RoomConstraints, 房型 id 列表)。
+    1. constraints 為 None 時以正規表示式提取需求條件
+    2. 條件在檢索時就以 where 與設施點陣圖預先篩選
+    3. 再以房型目錄的數值欄位確認一次，避免索引與資料不同步
+    """
+    def prepare_candidates(self, question, constraints=None):
+        if constraints is None:
+            constraints = self.extract_constraints(question)
+        price_range, area_range, occupancy = constraints.price_range, constraints.area_range, constraints.occupancy
+
+        room_ids = self.getRoomIdsByRAG(question, price_range, area_range, occupancy, constraints.styles,
+                                        constraints.amenities)
+        room_ids = self.catalog.filter_ids(room_ids, price_range, area_range, occupancy, constraints.amenities)
+        return constraints, room_ids
 
     """
     處理使用者輸入的主要查詢方法。
-    依據使用者輸入自動判斷意圖（如房型推薦、打招呼、其他），並根據意圖給出不同回應：
+    依據使用者輸入自動判斷意圖（如房型推薦、打招呼、其他），並根據意圖給出不同回應
+    （structured_intent 開啟時，意圖與需求條件由同一次 LLM 呼叫取得；
+     speculative_retrieval 開啟時，候選房型的檢索與意圖分類同時進行）：
+    - 若只是詢問是否有（或有幾間）某種風格、設施的房型，直接查詢房型目錄回答，不呼叫 LLM。
     - 若為打招呼，回傳歡迎語。
     - 若為房型推薦，會依序：
-        1. 取得相關房型摘要
-        2. 根據價格、面積等條件過濾
+        1. 提取價格、面積、入住人數條件，並在向量檢索時預先篩選取得相關房型
+        2. 以房型目錄的數值欄位再次確認條件並產生房型摘要
         3. 由 LLM 產生推薦結論
-        4. 審查推薦內容是否符合需求
+        4. 以程式檢查推薦內容是否符合需求，無法判斷時才交給 LLM 審查
         5. 移除重複房型
         6. 組合回傳房型資訊與結論
     - 其他則回傳預設說明。
@@ -428,9 +1559,361 @@ class RAGPipeline:
         "conclusion": "推薦房型：\n房型名稱：工業風雙人房...\n結語：..."
       }
     """
-    def query(self, question):
-        intent = self.classify_intent(question)
+    def query(self, question, deadline=None):
+        with deadline_scope(self._new_deadline(deadline)) as budget:
+            # 問題的條件只提取一次，快取簽章、目錄查詢與檢索共用
+            extracted = self.extract_constraints(question)
+            cached = self._cached_response(question, extracted)
+            if cached is not None:
+                return self._with_metadata(cached, budget)
+
+            response = self._answer(question, extracted)
+            self._store_response(question, response, budget, extracted)
+            return self._with_metadata(response, budget)
+
+    def _answer(self, question, extracted=None):
+        if extracted is None:
+            extracted = self.extract_constraints(question)
+        response = self._lookup_response(question, extracted)
+        if response is not None:
+            return response
+
+        # 斷路器開啟時不呼叫 LLM，也不必檢索，直接以房型目錄排序回答
+        if self.llm_breaker.is_open:
+            return self.degraded_response(question, extracted)
+
+        # 預先檢索：與意圖分類同時進行向量檢索
+        speculative = self.executor.submit(self.prepare_candidates, question, extracted) if self.speculative_retrieval else None
+
+        try:
+            intent, constraints = self.understand_question(question)
+        except LLMUnavailableError:
+            self._discard_speculative(speculative)
+            return self.degraded_response(question, extracted)
+
+        response = self._intent_response(intent)
+        if response is not None:
+            self._discard_speculative(speculative)
+            return response
+
+        constraints, rooms_summary = self._recommendation_context(question, constraints or extracted, speculative)
+        if not self._budget_allows(self.deadline_prediction_reserve, "fallback_ranking"):
+            return self.degraded_response(question, constraints)
+        try:
+            conclusion = self.LLM_Prediction(question, rooms_summary)
+        except LLMUnavailableError:
+            return self.degraded_response(question, constraints)
+
+        return self._build_recommendation_response(conclusion, self._review(question, conclusion, constraints))
+
+    """
+    query 的非同步版本，流程與回傳格式與 query 相同。
+    LLM 呼叫以 ainvoke 進行，等待模型回應時不佔用執行緒，多個對話可在同一個事件迴圈中同時處理；
+    向量檢索仍是同步運算，交給 executor 執行以免阻塞事件迴圈。
+
+    範例：
+      response = await rag.aquery("預算3000元，想要工業風雙人房")
+    """
+    async def aquery(self, question, deadline=None):
+        with deadline_scope(self._new_deadline(deadline)) as budget:
+            loop = asyncio.get_running_loop()
+            extracted = self.extract_constraints(question)
+            cached = await loop.run_in_executor(self.executor, self._cached_response, question, extracted)
+            if cached is not None:
+                return self._with_metadata(cached, budget)
+
+            response = await self._aanswer(question, extracted)
+            await loop.run_in_executor(self.executor, self._store_response, question, response, budget, extracted)
+            return self._with_metadata(response, budget)
+
+    async def _aanswer(self, question, extracted=None):
+        if extracted is None:
+            extracted = self.extract_constraints(question)
+        response = self._lookup_response(question, extracted)
+        if response is not None:
+            return response
+
+        if self.llm_breaker.is_open:
+            return self.degraded_response(question, extracted)
+
+        loop = asyncio.get_running_loop()
+        speculative = loop.run_in_executor(self.executor, self.prepare_candidates, question, extracted) if self.speculative_retrieval else None
+
+        try:
+            intent, constraints = await self.aunderstand_question(question)
+        except LLMUnavailableError:
+            self._discard_speculative(speculative)
+            return self.degraded_response(question, extracted)
+        except BaseException:
+            self._discard_speculative(speculative)
+            raise
+
+        response = self._intent_response(intent)
+        if response is not None:
+            self._discard_speculative(speculative)
+            return response
+
+        constraints, rooms_summary = await self._arecommendation_context(question, constraints or extracted, speculative)
+        if not self._budget_allows(self.deadline_prediction_reserve, "fallback_ranking"):
+            return self.degraded_response(question, constraints)
+        try:
+            conclusion = await self.aLLM_Prediction(question, rooms_summary)
+        except LLMUnavailableError:
+            return self.degraded_response(question, constraints)
+
+        return self._build_recommendation_response(conclusion, await self._areview(question, conclusion, constraints))
+
+    """
+    query 的串流版本，推薦內容一產生就逐段回傳，使用者不必等待整段推薦與審查完成。
+    依序產生 (事件, 資料)：
+      ("token", 文字片段)：推薦內容的片段，可能有多個
+      ("done", 回應)：最後一個事件，格式與 query 的回傳相同；審查後的最終結論以此為準
+
+    範例：
+      for event, data in rag.query_stream("預算3000元，想要工業風雙人房"):
+          ("token", "推薦房型：\n")
+          ("token", "房型名稱：工業風雙人房...")
+          ("done", {"rooms": {...}, "conclusion": "推薦房型：\n房型名稱：工業風雙人房...\n結語：..."})
+    """
+    def query_stream(self, question, deadline=None):
+        with deadline_scope(self._new_deadline(deadline)) as budget:
+            extracted = self.extract_constraints(question)
+            cached = self._cached_response(question, extracted)
+            if cached is not None:
+                yield "token", cached["conclusion"]
+                yield "done", self._with_metadata(cached, budget)
+                return
+
+            for event, data in self._answer_stream(question, extracted):
+                if event == "done":
+                    self._store_response(question, data, budget, extracted)
+                    data = self._with_metadata(data, budget)
+                yield event, data
+
+    def _answer_stream(self, question, extracted=None):
+        if extracted is None:
+            extracted = self.extract_constraints(question)
+        response = self._lookup_response(question, extracted)
+        if response is not None:
+            yield "token", response["conclusion"]
+            yield "done", response
+            return
+
+        if self.llm_breaker.is_open:
+            response = self.degraded_response(question, extracted)
+            yield "token", response["conclusion"]
+            yield "done", response
+            return
+
+        speculative = self.executor.submit(self.prepare_candidates, question, extracted) if self.speculative_retrieval else None
+
+        try:
+            intent, constraints = self.understand_question(question)
+        except LLMUnavailableError:
+            intent, constraints = None, None
+            response = self.degraded_response(question, extracted)
+        else:
+            response = self._intent_response(intent)
+        if response is not None:
+            self._discard_speculative(speculative)
+            yield "token", response["conclusion"]
+            yield "done", response
+            return
+
+        constraints, rooms_summary = self._recommendation_context(question, constraints or extracted, speculative)
+        if not self._budget_allows(self.deadline_prediction_reserve, "fallback_ranking"):
+            response = self.degraded_response(question, constraints)
+            yield "token", response["conclusion"]
+            yield "done", response
+            return
+
+        chunks = []
+        try:
+            for chunk in self.LLM_Prediction_stream(question, rooms_summary):
+                chunks.append(chunk)
+                yield "token", chunk
+        except LLMUnavailableError:
+            # 已送出的片段會被 done 事件中的結論取代
+            response = self.degraded_response(question, constraints)
+            if not chunks:
+                yield "token", response["conclusion"]
+            yield "done", response
+            return
+        conclusion = "".join(chunks)
+
+        yield "done", self._build_recommendation_response(conclusion, self._review(question, conclusion, constraints))
+
+    """
+    query_stream 的非同步版本，事件格式相同
+    """
+    async def aquery_stream(self, question, deadline=None):
+        with deadline_scope(self._new_deadline(deadline)) as budget:
+            loop = asyncio.get_running_loop()
+            extracted = self.extract_constraints(question)
+            cached = await loop.run_in_executor(self.executor, self._cached_response, question, extracted)
+            if cached is not None:
+                yield "token", cached["conclusion"]
+                yield "done", self._with_metadata(cached, budget)
+                return
+
+            async for event, data in self._aanswer_stream(question, extracted):
+                if event == "done":
+                    await loop.run_in_executor(self.executor, self._store_response, question, data, budget, extracted)
+                    data = self._with_metadata(data, budget)
+                yield event, data
+
+    async def _aanswer_stream(self, question, extracted=None):
+        if extracted is None:
+            extracted = self.extract_constraints(question)
+        response = self._lookup_response(question, extracted)
+        if response is not None:
+            yield "token", response["conclusion"]
+            yield "done", response
+            return
+
+        if self.llm_breaker.is_open:
+            response = self.degraded_response(question, extracted)
+            yield "token", response["conclusion"]
+            yield "done", response
+            return
+
+        loop = asyncio.get_running_loop()
+        speculative = loop.run_in_executor(self.executor, self.prepare_candidates, question, extracted) if self.speculative_retrieval else None
+
+        try:
+            intent, constraints = await self.aunderstand_question(question)
+        except LLMUnavailableError:
+            intent, constraints = None, None
+            response = self.degraded_response(question, extracted)
+        except BaseException:
+            self._discard_speculative(speculative)
+            raise
+        else:
+            response = self._intent_response(intent)
+        if response is not None:
+            self._discard_speculative(speculative)
+            yield "token", response["conclusion"]
+            yield "done", response
+            return
+
+        constraints, rooms_summary = await self._arecommendation_context(question, constraints or extracted, speculative)
+        if not self._budget_allows(self.deadline_prediction_reserve, "fallback_ranking"):
+            response = self.degraded_response(question, constraints)
+            yield "token", response["conclusion"]
+            yield "done", response
+            return
+
+        chunks = []
+        try:
+            async for chunk in self.aLLM_Prediction_stream(question, rooms_summary):
+                chunks.append(chunk)
+                yield "token", chunk
+        except LLMUnavailableError:
+            response = self.degraded_response(question, constraints)
+            if not chunks:
+                yield "token", response["conclusion"]
+            yield "done", response
+            return
+        conclusion = "".join(chunks)
+
+        yield "done", self._build_recommendation_response(conclusion, await self._areview(question, conclusion, constraints))
+
+    """
+    回應快取開啟時查詢快取，命中回傳快取的回應，否則回傳 None
+    """
+    def _cached_response(self, question, constraints=None):
+        if not self.cache_responses:
+            return None
+        return self.response_cache.get(question, self.catalog_version, self._cache_signature(question, constraints))
+
+    def _store_response(self, question, response, deadline=None, constraints=None):
+        # 降級處理後的回應（LLM 無法使用、為了趕上時間略過階段）只是暫時的替代，不寫入快取；
+        # 每次結果都不同的回應（隨機挑選房型的泛用推薦）也不寫入快取，否則所有使用者在 TTL 內都拿到同一組房型
+        if deadline is not None and (deadline.degradations or not deadline.cacheable):
+            return
+        if self.cache_responses and not response.get("degraded"):
+            self.response_cache.put(question, self.catalog_version, response, self._cache_signature(question, constraints))
+
+    """
+    建立查詢的時間預算：deadline 為 None 時使用 query_deadline
+    """
+    def _new_deadline(self, deadline=None):
+        return Deadline(self.query_deadline if deadline is None else deadline)
+
+    """
+    有時間預算或有降級處理時，在回應中加入 meta（時間預算、已使用的秒數與降級處理），其餘情況回傳原本的回應
 
+    範例：
+      response = {"rooms": {...}, "conclusion": "..."}，deadline = Deadline(10)（略過了 LLM 審查）
+      return：{"rooms": {...}, "conclusion": "...", "meta": {"deadline": 10, "elapsed": 6.2, "degradations": ["skip_review"]}}
+    """
+    @staticmethod
+    def _with_metadata(response, deadline):
+        if deadline.budget is None and not deadline.degradations:
+            return response
+        return dict(response, meta=deadline.metadata())
+
+    """
+    問題的條件簽章：以正規表示式提取的價格、面積、人數、風格與設施，以及其中被否定的風格與設施，
+    近似問題的條件必須完全相同才能共用快取的回應（「有浴缸」與「沒有浴缸」的簽章不同）；constraints 為已提取的條件
+    """
+    def _cache_signature(self, question, constraints=None):
+        if constraints is None:
+            constraints = self.extract_constraints(question)
+        negated = self.intent_rules.negated_keywords(question, constraints.styles + constraints.amenities)
+        return repr((constraints, negated))
+
+    """
+    取得房型推薦所需的條件與房型摘要，優先使用預先檢索的結果。
+    查詢的剩餘時間不足以同時產生推薦與審查時，只保留前 deadline_retrieval_k 個房型，縮短推薦 prompt 的預填時間。
+    回傳：(條件, 房型摘要)
+    """
+    def _recommendation_context(self, question, constraints, speculative=None):
+        prepared = self._accept_speculative(speculative.result(), constraints) if speculative is not None else None
+        if prepared is None:
+            prepared = self.prepare_candidates(question, constraints)
+        constraints, room_ids = prepared
+        return constraints, self.rooms_summary(self._budget_room_ids(room_ids), constraints)
+
+    async def _arecommendation_context(self, question, constraints, speculative=None):
+        prepared = self._accept_speculative(await speculative, constraints) if speculative is not None else None
+        if prepared is None:
+            loop = asyncio.get_running_loop()
+            prepared = await loop.run_in_executor(self.executor, self.prepare_candidates, question, constraints)
+        constraints, room_ids = prepared
+        return constraints, self.rooms_summary(self._budget_room_ids(room_ids), constraints)
+
+    def _budget_room_ids(self, room_ids):
+        if len(room_ids) > self.deadline_retrieval_k and not self._budget_allows(
+                self.deadline_prediction_reserve + self.deadline_review_reserve, "shrink_k"):
+            return room_ids[:self.deadline_retrieval_k]
+        return room_ids
+
+    """
+    將候選房型序列化成推薦 prompt 中的房型資料。
+    compact_prompts 開啟時依符合風格與設施的程度排序後組成精簡表格，並限制在 prompt_token_budget 之內；
+    否則沿用每行一個房型的「名稱:... 價格:...」摘要。
+    """
+    def rooms_summary(self, room_ids, constraints=None):
+        if not self.compact_prompts:
+            return self.catalog.summarize(room_ids)
+
+        rooms = [self.catalog.rooms[row] for row in self.catalog.rows(room_ids)]
+        if constraints is not None:
+            rooms = rank_rooms(rooms, list(constraints.styles) + list(constraints.amenities))
+        table = build_room_table(rooms, self.prompt_token_budget)
+        if table.truncated:
+            self._count("prompt_rooms_truncated", table.truncated)
+        if table.dropped:
+            self._count("prompt_rooms_dropped", table.dropped)
+        logger.info("Room table: %d rooms, %d tokens (estimated), %d truncated, %d dropped",
+                    table.rooms, table.tokens, table.truncated, table.dropped)
+        return table.text
+
+    """
+    非房型推薦意圖的回應（打招呼、泛用推薦與其他），房型推薦回傳 None
+    """
+    def _intent_response(self, intent):
         if "打招呼" in intent:
             return {
                 "rooms": [],
@@ -438,72 +1921,276 @@ class RAGPipeline:
             }
 
         if "泛用推薦" in intent:
-            # 隨機取三個房型
+            # 隨機取三個房型，回應不寫入快取
+            deadline = current_deadline()
+            if deadline is not None:
+                deadline.cacheable = False
             sample_rooms = random.sample(self.data, min(3, len(self.data)))
             conclusion = "推薦房型：\n"
             for item in sample_rooms:
                 conclusion += f"房型名稱：{item['name']}\n推薦理由：本房型擁有{item['features']}，價格{item['price']}元，風格為{item['style']}，適合{item['maxOccupancy']}人入住。\n\n"
             conclusion += "結語：以上是我們為您精選的房型，歡迎洽詢！"
-            response = {
-                "rooms": {item['name']: {
-                    "price": item['price'],
-                    "area": item['area'],
-                    "features": item['features'],
-                    "style": item['style'],
-                    "maxOccupancy": item['maxOccupancy']
-                } for item in sample_rooms},
+            return {
+                "rooms": {item['name']: self._room_payload(item) for item in sample_rooms},
                 "conclusion": conclusion.strip()
             }
-            return response
 
         if "房型推薦" in intent:
-            rooms_summary = self.getRoomSummaryByRAG(question)
+            return None
 
-            min_price, max_price, min_strict, max_strict = self.extract_price_range(question)
-
-            rooms_summary = self.filter_by_price_range(rooms_summary, min_price, max_price, min_strict, max_strict)
+        return {
+            "rooms": [],
+            "conclusion": "你好，我是一個飯店推薦助手，目前只提供房型相關的建議喔！"
+        }
 
-            min_area, max_area, min_strict, max_strict = self.extract_area_range(question)
-            rooms_summary = self.filter_by_area_range(rooms_summary, min_area, max_area, min_strict, max_strict)
+    """
+    「是否有工業風？」、「有幾間有浴缸的雙人房？」這類只需查詢房型目錄的問題，以風格、設施點陣圖與數值欄位
+    直接找出符合的房型並以固定格式回答，不需意圖分類、檢索與 LLM 生成；問題還有其他需求（例如「安靜」）時回傳 None。
 
-            conclusion = self.LLM_Prediction(question, rooms_summary)
-            review_result = self.review_recommendation(question, conclusion)
+    範例：
+      question = "有幾間工業風的房型？"
+      回傳：
+      {
+        "rooms": {"工業風雙人房": {...}, "工業風家庭房": {...}},
+        "conclusion": "目前共有 2 間符合「工業風」的房型：\n房型名稱：工業風雙人房\n..."
+      }
+    """
+    def _lookup_response(self, question, constraints=None):
+        if not self.lookup_answers:
+            return None
+        if constraints is None:
+            constraints = self.extract_constraints(question)
+        kind = self.intent_rules.lookup_question(question, constraints.styles + constraints.amenities)
+        if kind is None:
+            return None
 
-            if "符合使用者需求" in review_result:
-                final_conclusion = conclusion
-            else:
-                final_conclusion = review_result
-            final_conclusion = self.remove_duplicate_room_names(final_conclusion)
+        catalog = self.catalog
+        mask = catalog.mask(constraints.price_range, constraints.area_range, constraints.occupancy,
+                            styles=constraints.styles, amenities=constraints.amenities)
+        rooms = [catalog.rooms[row] for row in np.flatnonzero(mask)]
+        self._count("lookup_answered")
 
-            response = {
+        label = "、".join(constraints.styles + constraints.amenities + self._describe_numeric(constraints))
+        if not rooms:
+            return {
                 "rooms": {},
-                "conclusion": final_conclusion
+                "conclusion": f"目前沒有符合「{label}」的房型，歡迎告訴我其他需求，我可以幫您推薦相近的房型喔～"
             }
 
-            # 從資料庫中找出推薦的房型並將房型資訊填入回應中
-            for item in self.data:
-                if item['name'] in final_conclusion:
-                    response['rooms'][item['name']] = {
-                        "price": item['price'],
-                        "area": item['area'],
-                        "features": item['features'],
-                        "style": item['style'],
-                        "maxOccupancy": item['maxOccupancy']
-                    }
-            return response
+        shown = rooms[:self.lookup_max_rooms]
+        if kind == LOOKUP_COUNT:
+            conclusion = f"目前共有 {len(rooms)} 間符合「{label}」的房型：\n"
+        else:
+            conclusion = f"有的！目前有 {len(rooms)} 間符合「{label}」的房型：\n"
+        for item in shown:
+            conclusion += f"房型名稱：{item['name']}\n房型資訊：價格{item['price']}元，面積{item['area']}，風格為{item['style']}，特色為{item['features']}，{item['maxOccupancy']}。\n\n"
+        if len(rooms) > len(shown):
+            conclusion += f"以上列出其中 {len(shown)} 間，"
+        conclusion += "歡迎告訴我更多需求，我可以幫您挑選最適合的房型！"
+        return {
+            "rooms": {item['name']: self._room_payload(item) for item in shown},
+            "conclusion": conclusion
+        }
+
+    """
+    將價格、面積與入住人數條件轉成回答中使用的文字，例如 ["價格3000元以下", "可入住2人"]
+    """
+    @staticmethod
+    def _describe_numeric(constraints):
+        labels = []
+        for (min_value, max_value, _, _), name, unit in ((constraints.price_range, "價格", "元"), (constraints.area_range, "面積", "")):
+            if min_value is not None and max_value is not None:
+                labels.append(f"{name}{min_value}~{max_value}{unit}")
+            elif max_value is not None:
+                labels.append(f"{name}{max_value}{unit}以下")
+            elif min_value is not None:
+                labels.append(f"{name}{min_value}{unit}以上")
+        if constraints.occupancy is not None:
+            labels.append(f"可入住{constraints.occupancy}人")
+        return labels
 
+    @staticmethod
+    def _room_payload(item):
         return {
-            "rooms": [],
-            "conclusion": "你好，我是一個飯店推薦助手，目前只提供房型相關的建議喔！"
+            "price": item['price'],
+            "area": item['area'],
+            "features": item['features'],
+            "style": item['style'],
+            "maxOccupancy": item['maxOccupancy']
         }
 
+    """
+    意圖不是房型推薦時，取消預先檢索
+    """
+    def _discard_speculative(self, speculative):
+        if speculative is not None:
+            speculative.cancel()
+            self._count("speculative_discarded")
+
+    """
+    結構化解析得到的條件與預先檢索使用的條件不同時，捨棄預先檢索的結果（回傳 None）
+    """
+    def _accept_speculative(self, prepared, constraints):
+        if constraints is not None and prepared[0] != constraints:
+            self._count("speculative_discarded")
+            return None
+        self._count("speculative_used")
+        return prepared
+
+    """
+    以程式檢查推薦內容，回傳審查結果文字；無法判斷時回傳 None，交由 LLM 審查
+    """
+    def _deterministic_review(self, conclusion, constraints):
+        verdict = self.verify_recommendation(conclusion, constraints)
+        if verdict is None:
+            self._count("review_llm")
+            return None
+        self._count("review_skipped")
+        return "推薦內容符合使用者需求，無需變更。" if verdict else "目前沒有完全符合的房型"
+
+    """
+    審查推薦內容：先以程式檢查，無法判斷時才請 LLM 審查；LLM 無法使用、排程器忙碌或剩餘時間不足時直接採用推薦內容
+    """
+    def _review(self, question, conclusion, constraints):
+        review_result = self._deterministic_review(conclusion, constraints)
+        if review_result is None and not self._budget_allows(self.deadline_review_reserve, "skip_review"):
+            return "推薦內容符合使用者需求，無需變更。"
+        if review_result is None:
+            try:
+                review_result = self.review_recommendation(question, conclusion)
+            except (LLMUnavailableError, SchedulerBusyError):
+                review_result = self._review_unavailable()
+        return review_result
+
+    async def _areview(self, question, conclusion, constraints):
+        review_result = self._deterministic_review(conclusion, constraints)
+        if review_result is None and not self._budget_allows(self.deadline_review_reserve, "skip_review"):
+            return "推薦內容符合使用者需求，無需變更。"
+        if review_result is None:
+            try:
+                review_result = await self.areview_recommendation(question, conclusion)
+            except (LLMUnavailableError, SchedulerBusyError):
+                review_result = self._review_unavailable()
+        return review_result
+
+    def _review_unavailable(self):
+        self._count("review_unavailable")
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.degrade("skip_review")
+        return "推薦內容符合使用者需求，無需變更。"
+
+    """
+    LLM 無法使用（斷路器開啟或呼叫失敗）時的回應，不呼叫 LLM，在幾毫秒內完成：
+    - 規則能判斷為打招呼、泛用推薦或其他時，回傳與平常相同的固定回應
+    - 其餘視為房型推薦，在整個房型目錄上依條件排序（RoomCatalog.rank），取前 degraded_max_rooms 間，
+      以固定格式說明每個條件是否符合；回應中 degraded 為 True
+
+    範例：
+      question = "3000元以下的工業風雙人房"
+      回傳：
+      {
+        "rooms": {"工業風雙人房": {...}, ...},
+        "conclusion": "推薦房型：\n房型名稱：工業風雙人房\n推薦理由：價格2800元，符合您的預算；面積20；最多可入住2人，符合您的入住人數；風格為工業風；特色為...。\n\n...結語：...",
+        "degraded": True
+      }
+    """
+    def degraded_response(self, question, constraints=None):
+        intent = self._rule_intent(question)
+        if intent is not None:
+            response = self._intent_response(intent)
+            if response is not None:
+                return response
+
+        if constraints is None:
+            constraints = self.extract_constraints(question)
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.degrade("fallback_ranking")
+        catalog = self.catalog
+        rows = catalog.rank(constraints.price_range, constraints.area_range, constraints.occupancy,
+                            constraints.styles, constraints.amenities, limit=self.degraded_max_rooms)
+        self._count("degraded_responses")
+
+        conclusion = "推薦房型：\n"
+        for row in rows:
+            item = catalog.rooms[row]
+            conclusion += f"房型名稱：{item['name']}\n推薦理由：{self._degraded_reason(row, constraints)}\n\n"
+        conclusion += "結語：目前推薦助手較為忙碌，以上是依照您的條件從房型資料中直接挑選的房型，歡迎稍後再詢問，我會提供更詳細的建議！"
+        return {
+            "rooms": {catalog.rooms[row]['name']: self._room_payload(catalog.rooms[row]) for row in rows},
+            "conclusion": conclusion,
+            "degraded": True
+        }
+
+    """
+    依房型實際的欄位與使用者條件產生固定格式的推薦理由
+    """
+    def _degraded_reason(self, row, constraints):
+        catalog = self.catalog
+        item = catalog.rooms[row]
+        rows = np.array([row])
+        occupancy = int(catalog.occupancy[row])
+        reasons = []
+        missed = False
+        checks = (
+            (constraints.price_range[:2] != (None, None), {"price_range": constraints.price_range},
+             f"價格{item['price']}元", "符合您的預算", "不在您的預算範圍內"),
+            (constraints.area_range[:2] != (None, None), {"area_range": constraints.area_range},
+             f"面積{item['area']}", "符合您的需求", "與您需要的面積不同"),
+            (constraints.occupancy is not None, {"occupancy": constraints.occupancy},
+             f"最多可入住{occupancy}人" if occupancy != UNKNOWN else "入住人數未標示", "符合您的入住人數", "少於您的入住人數"),
+        )
+        for active, condition, text, matched, unmatched in checks:
+            if not active:
+                reasons.append(text)
+                continue
+            ok = bool(catalog.mask(rows=rows, **condition)[0])
+            missed = missed or not ok
+            reasons.append(f"{text}，{matched if ok else unmatched}")
+
+        style = str(item.get('style') or '')
+        reasons.append(f"風格為{style}")
+        if constraints.styles and not (catalog.bitmap(styles=constraints.styles) >> int(row)) & 1:
+            missed = True
+        features = str(item.get('features') or '')
+        provided = [amenity for amenity in constraints.amenities if amenity in features]
+        reasons.append(f"提供{'、'.join(provided)}" if provided else f"特色為{features}")
+        if len(provided) < len(constraints.amenities):
+            missed = True
+
+        reason = "；".join(reasons) + "。"
+        if missed:
+            reason += "此房型未完全符合您的需求，但為最接近的選擇。"
+        return reason
+
+    """
+    依審查結果決定最終結論，並從資料庫中找出推薦的房型填入回應中
+    """
+    def _build_recommendation_response(self, conclusion, review_result):
+        if "符合使用者需求" in review_result:
+            final_conclusion = conclusion
+        else:
+            final_conclusion = review_result
+        final_conclusion = self.remove_duplicate_room_names(final_conclusion)
+
+        response = {
+            "rooms": {},
+            "conclusion": final_conclusion
+        }
+        catalog = self.catalog
+        for row in catalog.rows_named(final_conclusion):
+            item = catalog.rooms[row]
+            response['rooms'][item['name']] = self._room_payload(item)
+        return response
+
     """
     自動推薦一個最適合的房型（不重複），並以 JSON 格式回傳。
     流程：
       1. 依據資料庫內容，請 LLM 推薦一個房型。
       2. 檢查推薦房型名稱是否與資料庫或已推薦過的房型重複。
       3. 若推薦內容格式正確且不重複，則回傳該房型資訊。
-      4. 最多重試 5 次，若都失敗則回傳 None。
+      4. 最多重試 5 次，若都失敗（或 LLM 無法使用）則回傳 None。
     
     範例：
       輸出：
@@ -526,19 +2213,10 @@ class RAGPipeline:
         self.used_names.update(existing_names)
 
         for _ in range(max_retry):
-            system_msg = (
-                "你是一位專業的飯店房型推薦助手，請根據資料庫內容，推薦一個最適合的房型，並只回傳一個 JSON 格式，欄位包含 name, price, area, features, style, maxOccupancy。"
-                "area、price、maxOccupancy只回傳數字，剩下內容請轉為「繁體中文」，不要有多餘說明。"
-                "請勿推薦與前次相同或相似的房型名稱，也不要與資料庫中已有的房型名稱重複。"
-                "房型名稱需能明確反映其特色（如特色設施、風格等），讓名稱與特色相對應。"
-            )
-
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", system_msg),
-                ("user", "請推薦一個房型，並只回傳 JSON 格式資料。")
-            ])
-            chain = prompt | self.llm
-            result = chain.invoke({})
+            try:
+                result = self._invoke_llm("auto_recommend", {})
+            except LLMUnavailableError:
+                return None
 
             # 抓取 result 中 第一個從 { 到 } 的內容
             # re.DOTALL : 完整擷取多行 JSON 區塊
@@ -585,35 +2263,8 @@ class RAGPipeline:
       value："abc"，return：1
     """
     def _parse_max_occupancy(self, value):
-        zh2num = {'零':0,'一':1,'二':2,'兩':2,'三':3,'四':4,'五':5,'六':6,'七':7,'八':8,'九':9,'十':10}
         value = str(value)
-
-        """
-        優先處理阿拉伯數字
-        找到數字就直接回傳
-        """
-        match = re.search(r'\d+', value)
+        match = NUMBER_PATTERN.search(value)
         if match:
             return int(match.group(0))
-        num = 0
-        if value.startswith('十'):
-            # ex: value = "十二"
-            num = 10
-            if len(value) > 1 and value[1] in zh2num:
-                num += zh2num[value[1]]
-            return num
-        elif '十' in value:
-            # ex: value = "二十一"
-            # parts = ["二", "一"]
-            parts = value.split('十')
-            if parts[0] in zh2num:
-                num = zh2num[parts[0]] * 10
-            if len(parts) > 1 and parts[1] and parts[1][0] in zh2num:
-                num += zh2num[parts[1][0]]
-            return num
-        else:
-            # ex: value = "兩人"
-            for k in zh2num:
-                if k in value:
-                    return zh2num[k]
-        return  1
+        return parse_chinese_number(value) or 1
@@ -0,0 +1,210 @@
+import copy
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+# 正規化問題時忽略的空白與句尾標點
+WHITESPACE_PATTERN = re.compile(r'\s+')
+TRAILING_PUNCTUATION_PATTERN = re.compile(r'[\s,，.。!！?？~～、]+$')
+
+"""
+將使用者問題正規化，作為快取的鍵值：去除前後空白、轉小寫、合併連續空白、去除句尾標點。
+
+範例：
+  question = "  有浴缸的房型嗎？ "，return："有浴缸的房型嗎"
+  question = "Hello  World!"，return："hello world"
+"""
+def normalize_question(question):
+    text = WHITESPACE_PATTERN.sub(" ", question.strip().lower())
+    return TRAILING_PUNCTUATION_PATTERN.sub("", text)
+
+
+"""
+執行緒安全的 LRU 快取，超過 max_size 時淘汰最久未使用的項目，並記錄命中次數。
+
+範例：
+  cache = LRUCache(max_size=2)
+  cache.put("a", 1)
+  cache.get("a")，return：1
+  cache.get("b")，return：None
+"""
+class LRUCache:
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                self.counts["misses"] += 1
+                return default
+            self._items.move_to_end(key)
+            self.counts["hits"] += 1
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.counts["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counts["hits"] + self.counts["misses"]
+            return {
+                "size": len(self._items),
+                "hits": self.counts["hits"],
+                "misses": self.counts["misses"],
+                "evictions": self.counts["evictions"],
+                "hit_rate": self.counts["hits"] / lookups if lookups else 0.0
+            }
+
+
+class CacheEntry:
+    __slots__ = ("version", "signature", "vector", "response", "created")
+
+    def __init__(self, version, signature, vector, response, created):
+        self.version = version
+        self.signature = signature
+        self.vector = vector
+        self.response = response
+        self.created = created
+
+
+"""
+查詢回應快取，放在 RAGPipeline.query 之前，重複或幾乎相同的問題不必再經過意圖分類、檢索與 LLM 生成。
+  1. 完全相同：正規化後的問題相同
+  2. 近似問題：問題向量的餘弦相似度大於等於 similarity_threshold，且條件簽章（signature）相同，
+     避免「3000以下」與「2000以下」這類向量相近但條件不同的問題共用回應
+快取以 LRU 與 TTL 淘汰，每筆資料記錄建立時的房型目錄版本，版本不同即視為失效。
+
+參數：
+    embed: 將文字轉為向量的函式（例如 embeddings.embed_query），None 代表只比對完全相同的問題
+    max_size: 最多保存的回應數量
+    ttl: 回應的存活秒數，None 代表不過期
+    similarity_threshold: 近似問題的相似度門檻，None 代表不比對近似問題
+"""
+class ResponseCache:
+    def __init__(self, embed=None, max_size=256, ttl=600, similarity_threshold=0.95, clock=time.monotonic):
+        self.embed = embed
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, entry, version, now):
+        return entry.version != version or (self.ttl is not None and now - entry.created > self.ttl)
+
+    def _semantic_enabled(self):
+        return self.embed is not None and self.similarity_threshold is not None
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    """
+    查詢快取，命中時回傳回應的複本，否則回傳 None。
+    參數：
+        question: 使用者問題
+        version: 目前的房型目錄版本
+        signature: 問題的條件簽章，近似問題必須簽章相同才算命中
+    """
+    def get(self, question, version, signature=None):
+        key = normalize_question(question)
+        now = self.clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._expired(entry, version, now):
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    self.counts["exact_hits"] += 1
+                    return copy.deepcopy(entry.response)
+
+            candidates = [(cached_key, cached) for cached_key, cached in self._entries.items()
+                          if cached.vector is not None and cached.signature == signature
+                          and not self._expired(cached, version, now)]
+
+        if not candidates or not self._semantic_enabled():
+            self._count_miss()
+            return None
+
+        vector = self._unit(self.embed(question))
+        similarities = np.stack([cached.vector for _, cached in candidates]) @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            self._count_miss()
+            return None
+
+        cached_key, entry = candidates[best]
+        with self._lock:
+            if cached_key in self._entries:
+                self._entries.move_to_end(cached_key)
+            self.counts["semantic_hits"] += 1
+        return copy.deepcopy(entry.response)
+
+    def _count_miss(self):
+        with self._lock:
+            self.counts["misses"] += 1
+
+    """
+    保存問題的回應，超過 max_size 時淘汰最久未使用的回應
+    """
+    def put(self, question, version, response, signature=None):
+        key = normalize_question(question)
+        vector = self._unit(self.embed(question)) if self._semantic_enabled() else None
+        entry = CacheEntry(version, signature, vector, copy.deepcopy(response), self.clock())
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.counts["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    """
+    回傳快取命中統計，用來調整近似問題的相似度門檻。
+
+    範例：
+      {"size": 12, "exact_hits": 30, "semantic_hits": 5, "misses": 15, "evictions": 0, "hit_rate": 0.7}
+    """
+    def stats(self):
+        with self._lock:
+            hits = self.counts["exact_hits"] + self.counts["semantic_hits"]
+            lookups = hits + self.counts["misses"]
+            return {
+                "size": len(self._entries),
+                "exact_hits": self.counts["exact_hits"],
+                "semantic_hits": self.counts["semantic_hits"],
+                "misses": self.counts["misses"],
+                "evictions": self.counts["evictions"],
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,472 @@
+import copy
+import itertools
+import re
+from collections.abc import Sequence
+
+import numpy as np
+
+from src.KeywordMatcher import KeywordMatcher
+
+NUMBER_PATTERN = re.compile(r'\d+')
+# 房型特色欄位的分隔符號，例如 "日式榻榻米、茶几" 或 "日式榻榻米 + 西式床鋪"
+FEATURE_SEPARATOR_PATTERN = re.compile(r'\s*[、,，+/]\s*')
+
+# 數值欄位無法解析時的預設值，篩選時一律視為不符合條件
+UNKNOWN = -1
+
+"""
+從房型欄位中取出第一段數字並轉為整數，無法解析則回傳 UNKNOWN。
+
+範例：
+  value："5000"，return：5000
+  value："2人房"，return：2
+  value：30，return：30
+  value："未知"，return：-1
+"""
+def parse_number(value):
+    if value is None:
+        return UNKNOWN
+    match = NUMBER_PATTERN.search(str(value))
+    return int(match.group(0)) if match else UNKNOWN
+
+"""
+將房型特色欄位拆成個別的設施名稱，去除空白與空字串。
+
+範例：
+  features："日式榻榻米、茶几、浴衣"，return：["日式榻榻米", "茶几", "浴衣"]
+  features："日式榻榻米 + 西式床鋪、茶几"，return：["日式榻榻米", "西式床鋪", "茶几"]
+"""
+def split_features(features):
+    if not features:
+        return []
+    return [feature for feature in FEATURE_SEPARATOR_PATTERN.split(str(features)) if feature]
+
+"""
+將單一房型資料序列化成提供給向量檢索與 LLM 的文字摘要。
+
+範例：
+  item = {"name": "和式套房", "price": "5000", "area": "30", "features": "日式榻榻米", "style": "日式", "maxOccupancy": "2人房"}
+  return："名稱:和式套房 價格:5000 面積:30 特色:日式榻榻米 風格:日式 床數:2人房"
+"""
+def format_room(item):
+    return f"名稱:{item['name']} 價格:{item['price']} 面積:{item['area']} 特色:{item['features']} 風格:{item.get('style', '')} 床數:{item.get('maxOccupancy', '')}"
+
+
+"""
+共用列表的前 size 個元素（唯讀）。房型目錄的快照與之後的目錄共用同一個列表，新增的房型附加在列表後面，
+快照只看得到建立當時的房型。
+
+範例：
+  items = ["0", "1", "2"]，size = 2
+  list(RowView(items, size))：["0", "1"]
+"""
+class RowView(Sequence):
+    __slots__ = ("_items", "_size")
+
+    def __init__(self, items, size):
+        self._items = items
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._items[:self._size][index]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("row index out of range")
+        return self._items[index]
+
+    def __iter__(self):
+        return itertools.islice(self._items, self._size)
+
+    def __eq__(self, other):
+        return list(self) == list(other) if isinstance(other, (list, RowView)) else NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+"""
+以欄位為單位保存房型資料：價格、面積、入住人數在載入時就解析成 numpy 整數陣列，
+查詢時以向量化的遮罩（mask）運算篩選，不需要再對摘要字串做正規表示式解析。
+房型以字串 id 識別，與向量資料庫 metadata 中的 room_id 相同。
+
+另外為每個風格、房型名稱、設施與入住人數保存一個點陣圖（bitmap，以 Python 整數表示，第 i 個位元代表第 i 列房型），
+「工業風 + 浴缸 + 4人」這類組合條件只需要對點陣圖做位元 AND，不必逐一比對房型。
+新增、修改、刪除房型時以 upsert / remove 逐筆更新欄位與點陣圖，不需重建整個目錄。
+
+欄位陣列預留容量，容量不足時以兩倍擴充，新增房型攤銷後為常數時間。snapshot() 以常數時間建立共用欄位、列表與點陣圖的快照：
+新增房型只寫入快照長度之後的位置，持有舊快照的讀取端看到的欄位長度不變；刪除房型需要位移後面的列，會先複製成獨立的目錄。
+
+風格、設施與房型名稱各自編譯成一個 Aho-Corasick 比對器（KeywordMatcher），從使用者問題或推薦內容中找出提到的詞彙時
+只需掃描文字一次，不必逐一檢查每個房型；比對器在第一次使用時建立，房型異動後重新建立。
+"""
+class RoomCatalog:
+    # 欄位陣列擴充時的最小容量
+    MIN_CAPACITY = 16
+
+    def __init__(self, rooms):
+        self._rooms = list(rooms)
+        self._ids = [str(item.get('id', index)) for index, item in enumerate(self._rooms)]
+        self._size = len(self._ids)
+        self.row_of = {room_id: row for row, room_id in enumerate(self._ids)}
+        self._price = np.array([parse_number(item.get('price')) for item in self._rooms], dtype=np.int32)
+        self._area = np.array([parse_number(item.get('area')) for item in self._rooms], dtype=np.int32)
+        self._occupancy = np.array([parse_number(item.get('maxOccupancy')) for item in self._rooms], dtype=np.int32)
+
+        # 點陣圖依第一次出現的順序保存，鍵值即為房型目錄中的風格與設施詞彙
+        self.style_bitmaps = {}
+        self.name_bitmaps = {}
+        self.amenity_bitmaps = {}
+        self.occupancy_bitmaps = {}
+        for row, item in enumerate(self._rooms):
+            self._set_bits(row, item)
+        self._invalidate_matchers()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def rooms(self):
+        return RowView(self._rooms, self._size)
+
+    @property
+    def ids(self):
+        return RowView(self._ids, self._size)
+
+    @property
+    def price(self):
+        return self._price[:self._size]
+
+    @property
+    def area(self):
+        return self._area[:self._size]
+
+    @property
+    def occupancy(self):
+        return self._occupancy[:self._size]
+
+    """
+    房型目錄中出現過的風格（不重複，依第一次出現的順序）
+    """
+    @property
+    def styles(self):
+        return list(self.style_bitmaps)
+
+    """
+    房型目錄中出現過的設施（不重複，依第一次出現的順序）
+    """
+    @property
+    def amenities(self):
+        return list(self.amenity_bitmaps)
+
+    def _invalidate_matchers(self):
+        self._style_matcher = None
+        self._amenity_matcher = None
+        self._name_matcher = None
+        self._rows_by_name = None
+
+    @property
+    def style_matcher(self):
+        if self._style_matcher is None:
+            self._style_matcher = KeywordMatcher(list(self.style_bitmaps))
+        return self._style_matcher
+
+    @property
+    def amenity_matcher(self):
+        if self._amenity_matcher is None:
+            self._amenity_matcher = KeywordMatcher(list(self.amenity_bitmaps))
+        return self._amenity_matcher
+
+    @property
+    def name_matcher(self):
+        if self._name_matcher is None:
+            rows_by_name = {}
+            for row, item in enumerate(self._rooms[:self._size]):
+                if item.get('name'):
+                    rows_by_name.setdefault(item['name'], []).append(row)
+            self._rows_by_name = rows_by_name
+            self._name_matcher = KeywordMatcher(rows_by_name)
+        return self._name_matcher
+
+    """
+    找出名稱出現在文字中的房型，回傳列索引（依房型目錄的順序）。
+
+    範例：
+      text = "推薦房型：\n房型名稱：和式套房\n..."
+      return：[0]
+    """
+    def rows_named(self, text):
+        names = self.name_matcher.find(text)
+        return sorted(row for name in names for row in self._rows_by_name[name])
+
+    """
+    房型在各點陣圖中的鍵值：(點陣圖字典, 鍵值)
+    """
+    def _bitmap_keys(self, item):
+        keys = []
+        if item.get('style'):
+            keys.append((self.style_bitmaps, item['style']))
+        if item.get('name'):
+            keys.append((self.name_bitmaps, item['name']))
+        keys.extend((self.amenity_bitmaps, amenity) for amenity in dict.fromkeys(split_features(item.get('features'))))
+        occupancy = parse_number(item.get('maxOccupancy'))
+        if occupancy != UNKNOWN:
+            keys.append((self.occupancy_bitmaps, occupancy))
+        return keys
+
+    def _set_bits(self, row, item):
+        bit = 1 << row
+        for bitmaps, key in self._bitmap_keys(item):
+            bitmaps[key] = bitmaps.get(key, 0) | bit
+
+    def _clear_bits(self, row, item):
+        bit = 1 << row
+        for bitmaps, key in self._bitmap_keys(item):
+            bitmaps[key] &= ~bit
+            if not bitmaps[key]:
+                del bitmaps[key]
+
+    """
+    以常數時間建立快照：欄位陣列、列表與點陣圖字典與目前的目錄共用。
+    房型異動時在最新目錄的快照上 upsert / remove 後整個替換，正在讀取舊目錄的執行緒看到的欄位長度仍然一致；
+    只有最新的目錄可以修改，在較舊的快照上修改時會先複製成獨立的目錄
+    """
+    def snapshot(self):
+        return copy.copy(self)
+
+    """
+    複製成獨立的目錄：欄位陣列、列表與點陣圖字典各自複製，房型資料本身共用
+    """
+    def copy(self):
+        catalog = self.snapshot()
+        catalog._detach()
+        return catalog
+
+    """
+    不再與其他快照共用欄位、列表與點陣圖，只保留本目錄的前 len(self) 列
+    """
+    def _detach(self):
+        size, rows = self._size, (1 << self._size) - 1
+        self._rooms = self._rooms[:size]
+        self._ids = self._ids[:size]
+        self.row_of = {room_id: row for row, room_id in enumerate(self._ids)}
+        self._price = self._price[:size].copy()
+        self._area = self._area[:size].copy()
+        self._occupancy = self._occupancy[:size].copy()
+        for name in ("style_bitmaps", "name_bitmaps", "amenity_bitmaps", "occupancy_bitmaps"):
+            setattr(self, name, {key: bitmap & rows for key, bitmap in list(getattr(self, name).items()) if bitmap & rows})
+
+    """
+    欄位陣列容量不足時以兩倍擴充，舊的快照仍使用原本的陣列
+    """
+    def _grow(self):
+        capacity = max(self.MIN_CAPACITY, 2 * len(self._price))
+        for name in ("_price", "_area", "_occupancy"):
+            column = np.full(capacity, UNKNOWN, dtype=np.int32)
+            column[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, column)
+
+    """
+    新增或取代單一房型，只更新該房型的欄位與點陣圖；新增的房型寫入欄位陣列的預留容量，攤銷後為常數時間
+    """
+    def upsert(self, item):
+        # 較新的目錄已在共用的列表後面新增房型時，先複製成獨立的目錄，避免覆寫
+        if len(self._ids) != self._size:
+            self._detach()
+        room_id = str(item.get('id', self._size))
+        row = self.row_of.get(room_id)
+        if row is None:
+            row = self._size
+            if row == len(self._price):
+                self._grow()
+            self._rooms.append(item)
+            self._ids.append(room_id)
+            self._price[row] = parse_number(item.get('price'))
+            self._area[row] = parse_number(item.get('area'))
+            self._occupancy[row] = parse_number(item.get('maxOccupancy'))
+            self.row_of[room_id] = row
+            self._size += 1
+        else:
+            self._clear_bits(row, self._rooms[row])
+            self._rooms[row] = item
+            self._price[row] = parse_number(item.get('price'))
+            self._area[row] = parse_number(item.get('area'))
+            self._occupancy[row] = parse_number(item.get('maxOccupancy'))
+        self._set_bits(row, item)
+        self._invalidate_matchers()
+
+    """
+    刪除單一房型，後面的房型往前移一列（點陣圖同步位移），維持與原始資料相同的順序；找不到該房型則回傳 False。
+    需要位移後面的列，先複製成獨立的目錄，不影響共用欄位的快照
+    """
+    def remove(self, room_id):
+        row = self.row_of.get(str(room_id))
+        if row is None or row >= self._size:
+            return False
+
+        self._detach()
+        self._clear_bits(row, self._rooms[row])
+        del self._rooms[row]
+        del self._ids[row]
+        self._size -= 1
+        self.row_of = {room_id: index for index, room_id in enumerate(self._ids)}
+        self._price = np.delete(self._price, row)
+        self._area = np.delete(self._area, row)
+        self._occupancy = np.delete(self._occupancy, row)
+
+        low = (1 << row) - 1
+        for bitmaps in (self.style_bitmaps, self.name_bitmaps, self.amenity_bitmaps, self.occupancy_bitmaps):
+            for key, bitmap in bitmaps.items():
+                bitmaps[key] = (bitmap & low) | ((bitmap >> (row + 1)) << row)
+        self._invalidate_matchers()
+        return True
+
+    """
+    依風格、設施與入住人數計算符合所有條件的房型點陣圖。
+    參數：
+        styles: 符合任一風格即可；風格關鍵字出現在房型的風格或名稱中即符合，例如「日式」同時比對「日式」與「日式/現代」，
+                推薦驗證與降級推薦也以此規則判斷風格
+        amenities: 必須具備所有設施；設施關鍵字比對包含該字詞的設施，例如「浴缸」同時比對「浴缸」與「按摩浴缸」，
+                   房型目錄中完全沒有出現過的設施（例如 LLM 解析出的同義詞）無法判斷，不列入篩選
+        occupancy: 只保留最大入住人數大於等於此人數的房型
+    
+    範例：
+      styles = ["工業風"]，amenities = ["浴缸"]，occupancy = 4
+      return：0b1001（第 0 與第 3 列的房型符合）
+    """
+    def bitmap(self, styles=None, amenities=None, occupancy=None):
+        # 點陣圖字典可能與較新的目錄共用：先取得項目的複本再逐一比對，並只保留本目錄的列
+        bitmap = (1 << self._size) - 1
+        if styles:
+            any_style = 0
+            for bitmaps in (self.style_bitmaps, self.name_bitmaps):
+                for key, value in list(bitmaps.items()):
+                    if any(style in key for style in styles):
+                        any_style |= value
+            bitmap &= any_style
+        for amenity in amenities or ():
+            matched = [value for key, value in list(self.amenity_bitmaps.items()) if amenity in key]
+            if matched:
+                any_amenity = 0
+                for value in matched:
+                    any_amenity |= value
+                bitmap &= any_amenity
+        if occupancy is not None:
+            enough = 0
+            for value, rows in list(self.occupancy_bitmaps.items()):
+                if value >= occupancy:
+                    enough |= rows
+            bitmap &= enough
+        return bitmap
+
+    """
+    將點陣圖轉成長度與房型數量相同的布林陣列
+    """
+    def bitmap_mask(self, bitmap):
+        size = self._size
+        packed = np.frombuffer(bitmap.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+        return np.unpackbits(packed, count=size, bitorder='little').astype(bool)
+
+    """
+    依區間條件產生布林遮罩，未設定的上下限不做限制；只要有設定條件，無法解析的值一律不符合。
+    """
+    @staticmethod
+    def _range_mask(values, min_value=None, max_value=None, min_strict=False, max_strict=False):
+        mask = np.ones(len(values), dtype=bool)
+        if min_value is None and max_value is None:
+            return mask
+
+        mask &= values != UNKNOWN
+        if min_value is not None:
+            mask &= (values > min_value) if min_strict else (values >= min_value)
+        if max_value is not None:
+            mask &= (values < max_value) if max_strict else (values <= max_value)
+        return mask
+
+    """
+    產生整個房型目錄的篩選遮罩。
+    參數：
+        price_range: (最小價格, 最大價格, 是否嚴格大於, 是否嚴格小於)，與 extract_price_range 的回傳格式相同
+        area_range: (最小面積, 最大面積, 是否嚴格大於, 是否嚴格小於)，與 extract_area_range 的回傳格式相同
+        occupancy: 需要的入住人數，只保留最大入住人數大於等於此人數的房型
+        rows: 只對這些列索引計算遮罩，None 代表整個房型目錄
+        styles / amenities: 以點陣圖篩選風格與設施，規則與 bitmap 相同
+    回傳：
+        布林陣列（長度與 rows 或房型數量相同）
+    """
+    def mask(self, price_range=None, area_range=None, occupancy=None, rows=None, styles=None, amenities=None):
+        price = self.price if rows is None else self.price[rows]
+        area = self.area if rows is None else self.area[rows]
+        max_occupancy = self.occupancy if rows is None else self.occupancy[rows]
+
+        mask = np.ones(len(price), dtype=bool)
+        if price_range is not None:
+            mask &= self._range_mask(price, *price_range)
+        if area_range is not None:
+            mask &= self._range_mask(area, *area_range)
+        if occupancy is not None:
+            mask &= max_occupancy >= occupancy
+        if styles or amenities:
+            bitmap_mask = self.bitmap_mask(self.bitmap(styles, amenities))
+            mask &= bitmap_mask if rows is None else bitmap_mask[rows]
+        return mask
+
+    """
+    不需檢索與 LLM 的房型排序（LLM 無法使用時的推薦），回傳前 limit 個房型的列索引。
+    排序依序為：符合的價格、面積、入住人數條件數量，符合的風格與設施數量，房型目錄的順序；
+    沒有房型完全符合時仍會回傳最接近的房型。
+
+    範例：
+      price_range = (None, 3000, False, False)，styles = ["工業風"]
+      第 2 列（2800 元、工業風）、第 0 列（2500 元、日式）、第 5 列（3500 元、工業風）
+      return：[2, 0, 5]
+    """
+    def rank(self, price_range=None, area_range=None, occupancy=None, styles=None, amenities=None, limit=None):
+        size = self._size
+        numeric = np.zeros(size, dtype=np.int32)
+        # 未設定的條件所有房型都符合，不影響排序
+        for condition in ({"price_range": price_range}, {"area_range": area_range}, {"occupancy": occupancy}):
+            numeric += self.mask(**condition)
+        keywords = np.zeros(size, dtype=np.int32)
+        if styles:
+            keywords += self.bitmap_mask(self.bitmap(styles=styles))
+        for amenity in amenities or ():
+            keywords += self.bitmap_mask(self.bitmap(amenities=[amenity]))
+        # np.lexsort 以最後一個鍵為主要排序鍵，順序相同時維持目錄順序
+        order = np.lexsort((np.arange(size), -keywords, -numeric))
+        return order[:limit].tolist()
+
+    """
+    將房型 id 轉成目錄中的列索引，不存在的 id 會被略過
+    """
+    def rows(self, room_ids):
+        row_of, size = self.row_of, self._size
+        rows = (row_of.get(room_id) for room_id in room_ids)
+        return np.array([row for row in rows if row is not None and row < size], dtype=np.int64)
+
+    """
+    保留 room_ids 中符合條件的房型，並維持原本的排序（例如檢索的相似度排序）。
+
+    範例：
+      room_ids = ["3", "0", "5"]，price_range = (None, 5000, False, False)
+      價格分別為 6500、5000、4200
+      return：["0", "5"]
+    """
+    def filter_ids(self, room_ids, price_range=None, area_range=None, occupancy=None, amenities=None):
+        rows = self.rows(room_ids)
+        keep = self.mask(price_range, area_range, occupancy, rows=rows, amenities=amenities)
+        return [self._ids[row] for row in rows[keep]]
+
+    def get(self, room_id):
+        row = self.row_of.get(str(room_id))
+        return None if row is None or row >= self._size else self._rooms[row]
+
+    """
+    在組合 prompt 時才將房型序列化成摘要字串（每行一個房型）
+    """
+    def summarize(self, room_ids):
+        return "\n".join(format_room(self._rooms[row]) for row in self.rows(room_ids))
@@ -66,76 +66,127 @@ $(document).ready(function() {
         // 新增：顯示 loading 時自動滾動到底部
         $('#chat-messages').scrollTop($('#chat-messages')[0].scrollHeight);
 
-        $.ajax({
-            url: '/chat',
-            method: 'POST',
-            contentType: 'application/json',
-            data: JSON.stringify({ message: message }),
-            success: function(data) {
-                const response = data.response;
-                const rooms = response.rooms;
-                const conclusion = response.conclusion;
-
+        // 以串流方式接收回應：推薦內容一產生就顯示，最後再顯示房型卡片
+        let bubble = null;
+        let text = '';
+        let finished = false;
+
+        function handleEvent(raw) {
+            let event = 'message';
+            let data = '';
+            raw.split('\n').forEach(function(line) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (!data) return;
+            const payload = JSON.parse(data);
+
+            if (event === 'token') {
+                // 收到第一段內容時，以 AI 訊息取代 loading 卡片
+                if (!bubble) {
+                    $(`#${loadingId}`).remove();
+                    bubble = appendAiBubble();
+                }
+                text += payload.text;
+                bubble.find('.chat-text').html(text.replace(/\n/g, '<br>'));
+                $('#chat-messages').scrollTop($('#chat-messages')[0].scrollHeight);
+            } else if (event === 'done') {
+                finished = true;
+                const response = payload.response;
                 console.log("response:", response)
-                console.log("rooms:", rooms)
-                console.log("conclusion:", conclusion)
-
-                const aiTimestamp = getCurrentTime();
 
-                // 移除 loading 卡片
                 $(`#${loadingId}`).remove();
+                if (!bubble) bubble = appendAiBubble();
+                // 審查後的最終結論可能與串流內容不同，以最終結論為準
+                bubble.find('.chat-text').html(response.conclusion.replace(/\n/g, '<br>'));
+                bubble.find('.chat-time').text(getCurrentTime());
+                renderRooms(response.rooms);
+                $('#chat-messages').scrollTop($('#chat-messages')[0].scrollHeight);
+            }
+        }
 
-                // AI 結論訊息 + 右下角時間戳
-                $('#chat-messages').append(`
-                    <div class="chat-message ai">
-                        <img src="/static/image/ai-avatar.png" class="chat-avatar">
-                        <div class="chat-bubble ai d-flex flex-column">
-                            <div>${conclusion.replace(/\n/g, '<br>')}</div>
-                            <div class="text-end text-muted mt-1" style="font-size: 0.7rem;">${aiTimestamp}</div>
-                        </div>
+        fetch('/chat/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ message: message })
+        }).then(function(res) {
+            if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            function read() {
+                return reader.read().then(function({ done, value }) {
+                    if (done) {
+                        if (!finished) throw new Error('stream closed');
+                        return;
+                    }
+                    buffer += decoder.decode(value, { stream: true });
+                    // 每個 Server-Sent Event 以空行分隔
+                    let index;
+                    while ((index = buffer.indexOf('\n\n')) >= 0) {
+                        handleEvent(buffer.slice(0, index));
+                        buffer = buffer.slice(index + 2);
+                    }
+                    return read();
+                });
+            }
+            return read();
+        }).catch(function(err) {
+            console.log("error:", err)
+            $(`#${loadingId}`).remove();
+            const aiTimestamp = getCurrentTime();
+            $('#chat-messages').append(`
+                <div class="chat-message ai">
+                    <img src="/static/image/ai-avatar.png" class="chat-avatar">
+                    <div class="chat-bubble ai d-flex flex-column">
+                        <div>抱歉，伺服器出現問題，請稍後再試。</div>
+                        <div class="text-end text-muted mt-1" style="font-size: 0.7rem;">${aiTimestamp}</div>
                     </div>
-                `);
-
-                if (rooms && Object.keys(rooms).length > 0) {
-                    Object.entries(rooms).forEach(([name, room]) => {
-                        const roomTimestamp = getCurrentTime();
-                        const cardHtml = `
-                            <div class="chat-message ai">
-                                <img src="/static/image/ai-avatar.png" class="chat-avatar">
-                                <div class="card mb-2" style="width: 100%;">
-                                    <div class="card-body d-flex flex-column">
-                                        <h5 class="card-title">${name}</h5>
-                                        <h6 class="card-subtitle mb-2 text-muted">價格：${room.price} 元</h6>
-                                        <p class="card-text">
-                                            面積：${room.area}<br>
-                                            特色：${room.features}<br>
-                                            風格：${room.style}<br>
-                                            床數：${room.maxOccupancy}
-                                        </p>
-                                        <div class="text-end text-muted mt-1" style="font-size: 0.7rem;">${roomTimestamp}</div>
-                                    </div>
-                                </div>
-                            </div>
-                        `;
-                        $('#chat-messages').append(cardHtml);
-                    });
-                }
+                </div>
+            `);
+        });
+    }
 
-                $('#chat-messages').scrollTop($('#chat-messages')[0].scrollHeight);
-            },
-            error: function() {
-                $(`#${loadingId}`).remove();
-                const aiTimestamp = getCurrentTime();
-                $('#chat-messages').append(`
-                    <div class="chat-message ai">
-                        <img src="/static/image/ai-avatar.png" class="chat-avatar">
-                        <div class="chat-bubble ai d-flex flex-column">
-                            <div>抱歉，伺服器出現問題，請稍後再試。</div>
-                            <div class="text-end text-muted mt-1" style="font-size: 0.7rem;">${aiTimestamp}</div>
+    // 新增一則 AI 訊息，內容與時間戳稍後填入
+    function appendAiBubble() {
+        const bubble = $(`
+            <div class="chat-message ai">
+                <img src="/static/image/ai-avatar.png" class="chat-avatar">
+                <div class="chat-bubble ai d-flex flex-column">
+                    <div class="chat-text"></div>
+                    <div class="chat-time text-end text-muted mt-1" style="font-size: 0.7rem;"></div>
+                </div>
+            </div>
+        `);
+        $('#chat-messages').append(bubble);
+        return bubble;
+    }
+
+    function renderRooms(rooms) {
+        if (!rooms || Object.keys(rooms).length === 0) return;
+
+        Object.entries(rooms).forEach(([name, room]) => {
+            const roomTimestamp = getCurrentTime();
+            const cardHtml = `
+                <div class="chat-message ai">
+                    <img src="/static/image/ai-avatar.png" class="chat-avatar">
+                    <div class="card mb-2" style="width: 100%;">
+                        <div class="card-body d-flex flex-column">
+                            <h5 class="card-title">${name}</h5>
+                            <h6 class="card-subtitle mb-2 text-muted">價格：${room.price} 元</h6>
+                            <p class="card-text">
+                                面積：${room.area}<br>
+                                特色：${room.features}<br>
+                                風格：${room.style}<br>
+                                床數：${room.maxOccupancy}
+                            </p>
+                            <div class="text-end text-muted mt-1" style="font-size: 0.7rem;">${roomTimestamp}</div>
                         </div>
                     </div>
-                `);
-            }
+                </div>
+            `;
+            $('#chat-messages').append(cardHtml);
         });
     }
 });
@@ -0,0 +1,84 @@
+import unittest
+
+from src.CircuitBreaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, LLMUnavailableError
+
+
+"""
+可手動前進的時鐘，測試開啟時間不需要真的等待
+"""
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(window=4, min_calls=3, failure_rate=0.5, slow_call=1.0, slow_rate=0.5,
+                                      open_duration=10.0, clock=self.clock)
+
+    def test_errors(self):
+        error = CircuitOpenError("intent", "斷路器開啟中")
+        self.assertIsInstance(error, LLMUnavailableError)
+        self.assertEqual(error.stage, "intent")
+
+    def test_trips_on_failure_rate(self):
+        self.breaker.record(0.1)
+        self.breaker.record(0.1, ok=False)
+        # 呼叫次數未達 min_calls 前不會開啟
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.record(0.1, ok=False)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker.allow())
+        stats = self.breaker.stats()
+        self.assertEqual((stats["trips"], stats["rejected"]), (1, 1))
+
+    def test_trips_on_slow_calls(self):
+        for latency in (0.2, 1.5, 2.0):
+            self.breaker.record(latency)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_healthy_calls_keep_closed(self):
+        for _ in range(10):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(0.1)
+        # 只保留最近 window 次的結果，早期的失敗不影響目前的判斷
+        self.breaker.record(0.1, ok=False)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.stats()["failure_rate"], 0.25)
+
+    def test_half_open_probe(self):
+        for _ in range(3):
+            self.breaker.record(0.1, ok=False)
+        self.clock.now = 10.0
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        # 只放行一次試探呼叫
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(0.1, ok=False)
+        self.assertEqual(self.breaker.state, OPEN)
+
+        self.clock.now = 20.0
+        self.assertTrue(self.breaker.allow())
+        # 試探呼叫被取消時歸還許可
+        self.breaker.release()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.stats()["trips"], 2)
+
+    def test_reset(self):
+        for _ in range(3):
+            self.breaker.record(0.1, ok=False)
+        self.breaker.reset()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.stats()["calls"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from src.ConstraintParser import normalize_numbers, parse_chinese_number, parse_numeric_constraints
+
+EMPTY = (None, None, False, False)
+
+
+class TestConstraintParser(unittest.TestCase):
+    def test_parse_chinese_number(self):
+        self.assertEqual(parse_chinese_number("兩"), 2)
+        self.assertEqual(parse_chinese_number("十二"), 12)
+        self.assertEqual(parse_chinese_number("二十三"), 23)
+        self.assertEqual(parse_chinese_number("一百零五"), 105)
+        self.assertEqual(parse_chinese_number("五千"), 5000)
+        self.assertEqual(parse_chinese_number("一萬二千"), 12000)
+        self.assertEqual(parse_chinese_number("1.5萬"), 15000)
+        self.assertEqual(parse_chinese_number("3千"), 3000)
+        self.assertIsNone(parse_chinese_number("未知"))
+
+    def test_parse_colloquial_chinese_number(self):
+        # 口語省略最後的單位：結尾的數字為前一個單位的下一級
+        self.assertEqual(parse_chinese_number("兩千五"), 2500)
+        self.assertEqual(parse_chinese_number("一萬五"), 15000)
+        self.assertEqual(parse_chinese_number("一千二"), 1200)
+        self.assertEqual(parse_chinese_number("三百五"), 350)
+        self.assertEqual(parse_chinese_number("一萬二千五"), 12500)
+        self.assertEqual(parse_chinese_number("一千零五"), 1005)
+        self.assertEqual(parse_numeric_constraints("預算兩千五以下")[0], (None, 2500, False, False))
+
+    def test_normalize_numbers(self):
+        self.assertEqual(normalize_numbers("預算五千以下的兩人房"), "預算5000以下的2人房")
+        # 沒有單位的單一數字（例如「一下」）不轉換
+        self.assertEqual(normalize_numbers("等一下，三千元"), "等一下，3000元")
+
+    def test_chinese_amounts(self):
+        self.assertEqual(parse_numeric_constraints("預算三千到五千"), ((3000, 5000, False, False), EMPTY, None))
+        self.assertEqual(parse_numeric_constraints("1.5萬以下"), ((None, 15000, False, False), EMPTY, None))
+        self.assertEqual(parse_numeric_constraints("兩萬元以內的十二人房"), ((None, 20000, False, False), EMPTY, 12))
+
+    def test_units_decide_the_field(self):
+        # 有單位時依單位判斷，價格與面積的區間不會互相混用
+        self.assertEqual(parse_numeric_constraints("我要3000~4000元的房型，30~40坪"),
+                         ((3000, 4000, False, False), (30, 40, False, False), None))
+        self.assertEqual(parse_numeric_constraints("面積100~200坪"), (EMPTY, (100, 200, False, False), None))
+        self.assertEqual(parse_numeric_constraints("面積120以下，價格3000以上"),
+                         ((3000, None, False, False), (None, 120, False, False), None))
+
+    def test_occupancy(self):
+        self.assertEqual(parse_numeric_constraints("雙人房")[2], 2)
+        self.assertEqual(parse_numeric_constraints("單人房")[2], 1)
+        self.assertEqual(parse_numeric_constraints("我們三位")[2], 3)
+        self.assertEqual(parse_numeric_constraints("4人房，3000元以下")[2], 4)
+        self.assertIsNone(parse_numeric_constraints("我要工業風")[2])
+
+    def test_explicit_occupancy_overrides_room_type(self):
+        self.assertEqual(parse_numeric_constraints("雙人房 3人")[2], 3)
+        self.assertEqual(parse_numeric_constraints("單人房，我們兩位")[2], 2)
+        self.assertEqual(parse_numeric_constraints("4人的雙人房")[2], 4)
+
+    def test_occupancy_compare_and_range(self):
+        # 人數區間或上下限換算成房型需要容納的人數
+        self.assertEqual(parse_numeric_constraints("2到4人")[2], 4)
+        self.assertEqual(parse_numeric_constraints("2人~4人的房間")[2], 4)
+        self.assertEqual(parse_numeric_constraints("少於3人")[2], 2)
+        self.assertEqual(parse_numeric_constraints("3人以下")[2], 3)
+        self.assertEqual(parse_numeric_constraints("多於3人")[2], 4)
+        self.assertEqual(parse_numeric_constraints("5人以上的雙人房")[2], 5)
+        self.assertEqual(parse_numeric_constraints("兩到四位，三千元以下"),
+                         ((None, 3000, False, False), EMPTY, 4))
+
+    def test_bound_takes_precedence_over_compare(self):
+        self.assertEqual(parse_numeric_constraints("大於2000元，3000元以上")[0], (3000, None, False, False))
+        self.assertEqual(parse_numeric_constraints("大於2000元，小於4000元")[0], (2000, 4000, True, True))
@@ -0,0 +1,58 @@
+import math
+import unittest
+
+from src.CircuitBreaker import LLMUnavailableError
+from src.Deadline import Deadline, DeadlineExceededError, current_deadline, deadline_scope
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDeadline(unittest.TestCase):
+    def test_unlimited(self):
+        deadline = Deadline()
+        self.assertEqual(deadline.remaining(), math.inf)
+        self.assertFalse(deadline.expired)
+        self.assertTrue(deadline.allows(1e9))
+
+    def test_remaining_and_allows(self):
+        clock = FakeClock()
+        deadline = Deadline(10, clock=clock)
+        clock.now += 4
+        self.assertEqual(deadline.remaining(), 6)
+        self.assertTrue(deadline.allows(6))
+        self.assertFalse(deadline.allows(6.5))
+        clock.now += 7
+        self.assertEqual(deadline.remaining(), 0)
+        self.assertTrue(deadline.expired)
+
+    def test_metadata(self):
+        clock = FakeClock()
+        deadline = Deadline(10, clock=clock)
+        deadline.degrade("skip_review")
+        deadline.degrade("skip_review")
+        deadline.degrade("fallback_ranking")
+        clock.now += 1.2345
+        self.assertEqual(deadline.metadata(),
+                         {"deadline": 10, "elapsed": 1.234, "degradations": ["skip_review", "fallback_ranking"]})
+
+    def test_scope(self):
+        self.assertIsNone(current_deadline())
+        with deadline_scope(Deadline(5)) as outer:
+            self.assertIs(current_deadline(), outer)
+            with deadline_scope(Deadline(1)) as inner:
+                self.assertIs(current_deadline(), inner)
+            self.assertIs(current_deadline(), outer)
+        self.assertIsNone(current_deadline())
+
+    def test_error(self):
+        self.assertIsInstance(DeadlineExceededError("prediction"), LLMUnavailableError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+from src.IntentRules import RuleIntentClassifier
+
+
+class TestRuleIntentClassifier(unittest.TestCase):
+    def setUp(self):
+        self.classifier = RuleIntentClassifier()
+        self.styles = ["日式", "現代", "工業"]
+        self.amenities = ["浴缸", "日式榻榻米", "陽台"]
+
+    def classify(self, text):
+        return self.classifier.classify(text, self.styles, self.amenities)
+
+    def test_room_recommend_by_constraints(self):
+        self.assertEqual(self.classify("3000元以下雙人房"), "房型推薦")
+        self.assertEqual(self.classify("預算五千"), "房型推薦")
+        self.assertEqual(self.classify("30坪以上"), "房型推薦")
+        self.assertEqual(self.classify("我們有4位"), "房型推薦")
+
+    def test_room_recommend_by_style_and_amenity(self):
+        self.assertEqual(self.classify("是否有工業風？"), "房型推薦")
+        self.assertEqual(self.classify("有浴缸的房型嗎"), "房型推薦")
+        # 問候語加上具體需求仍屬於房型推薦
+        self.assertEqual(self.classify("你好，我想要有陽台的房間"), "房型推薦")
+
+    def test_greeting(self):
+        self.assertEqual(self.classify("你好"), "打招呼")
+        self.assertEqual(self.classify("哈囉，在嗎？"), "打招呼")
+        self.assertEqual(self.classify("Hello!"), "打招呼")
+
+    def test_generic_recommend(self):
+        self.assertEqual(self.classify("請問有什麼推薦的房型嗎？"), "泛用推薦")
+        self.assertEqual(self.classify("推薦一下"), "泛用推薦")
+        self.assertEqual(self.classify("你好，可以推薦嗎"), "泛用推薦")
+
+    def test_uncertain_falls_back_to_llm(self):
+        # 無法確定的輸入回傳 None，交給 LLM 判斷
+        self.assertIsNone(self.classify("今天天氣如何？"))
+        self.assertIsNone(self.classify("你是誰"))
+        self.assertIsNone(self.classify("你好，請問附近有什麼好吃的"))
+        self.assertIsNone(self.classify("請推薦安靜一點的"))
+
+    def test_stats(self):
+        self.classify("你好")
+        self.classify("3000元以下雙人房")
+        self.classify("今天天氣如何？")
+        self.classify("推薦一下")
+        stats = self.classifier.stats()
+        self.assertEqual(stats["total"], 4)
+        self.assertEqual(stats["rule_hits"], 3)
+        self.assertEqual(stats["llm_fallback"], 1)
+        self.assertAlmostEqual(stats["hit_rate"], 0.75)
+        self.assertEqual(stats["by_intent"], {"房型推薦": 1, "打招呼": 1, "泛用推薦": 1})
+
+    def test_stats_empty(self):
+        self.assertEqual(self.classifier.stats()["hit_rate"], 0.0)
+
+    def test_lookup_question(self):
+        lookup = self.classifier.lookup_question
+        self.assertEqual(lookup("是否有工業風？", ["工業"]), "是否有")
+        self.assertEqual(lookup("有沒有附浴缸的雙人房", ["浴缸"]), "是否有")
+        self.assertEqual(lookup("3000元以下有陽台的房間有哪些", ["陽台"]), "是否有")
+        self.assertEqual(lookup("有幾間日式的房型", ["日式"]), "有幾間")
+
+    def test_lookup_question_with_soft_requirements(self):
+        # 還有其他需求或要求推薦時交給完整的推薦流程
+        lookup = self.classifier.lookup_question
+        self.assertIsNone(lookup("有沒有安靜又有浴缸的房間", ["浴缸"]))
+        self.assertIsNone(lookup("有推薦有浴缸的房間嗎", ["浴缸"]))
+        self.assertIsNone(lookup("我要工業風雙人房", ["工業"]))
+        self.assertIsNone(lookup("有安靜的房間嗎", []))
+
+    # 否定的條件（「沒有浴缸」）不能以房型目錄中有該設施的房型回答
+    def test_lookup_question_with_negation(self):
+        lookup = self.classifier.lookup_question
+        self.assertIsNone(lookup("有沒有沒有浴缸的房間", ["浴缸"]))
+        self.assertIsNone(lookup("有幾間不是工業風的房型", ["工業"]))
+        self.assertIsNone(lookup("有無不含早餐的房間", ["早餐"]))
+        self.assertEqual(lookup("有無附早餐的房間", ["早餐"]), "是否有")
+        self.assertEqual(self.classifier.negated_keywords("不要工業風，要有浴缸", ["工業", "浴缸"]), ["工業"])
@@ -0,0 +1,41 @@
+import unittest
+
+from src.KeywordIndex import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+class TestKeywordIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add("0", "和式套房 日式榻榻米、茶几、浴衣 日式")
+        self.index.add("1", "工業風雙人房 浴缸、投影機 工業風")
+        self.index.add("2", "北歐風家庭房 陽台、沙發 北歐風")
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("浴缸、日式榻榻米"), ["浴缸", "日式", "式榻", "榻榻", "榻米"])
+        self.assertEqual(tokenize("King Size 床"), ["床", "king", "size"])
+
+    def test_search_exact_amenity(self):
+        self.assertEqual([doc_id for doc_id, _ in self.index.search("有浴缸的房間嗎")], ["1"])
+        self.assertEqual(self.index.search("榻榻米")[0][0], "0")
+        self.assertEqual(self.index.search("今天天氣如何"), [])
+
+    def test_search_allowed(self):
+        self.assertEqual(self.index.search("浴缸", allowed={"0", "2"}), [])
+
+    def test_incremental_update(self):
+        self.index.add("3", "湖景套房 浴缸、大床 現代")
+        self.assertEqual(sorted(doc_id for doc_id, _ in self.index.search("浴缸")), ["1", "3"])
+
+        # 取代既有文件與刪除文件
+        self.index.add("1", "工業風雙人房 投影機 工業風")
+        self.index.remove("3")
+        self.assertEqual(self.index.search("浴缸"), [])
+        self.assertEqual(len(self.index), 3)
+
+    def test_reciprocal_rank_fusion(self):
+        self.assertEqual(reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]]), ["a", "c", "b"])
+        self.assertEqual(reciprocal_rank_fusion([["a", "b"], []]), ["a", "b"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import random
+import unittest
+
+from src.KeywordMatcher import KeywordMatcher
+
+
+class TestKeywordMatcher(unittest.TestCase):
+    def test_find_overlapping_keywords(self):
+        matcher = KeywordMatcher(["浴缸", "按摩浴缸", "陽台", "日式", "日式/現代"])
+        self.assertEqual(matcher.find("想要有按摩浴缸和陽台的房間"), ["按摩浴缸", "浴缸", "陽台"])
+        self.assertEqual(matcher.find("日式/現代風"), ["日式", "日式/現代"])
+        # 同一個關鍵字出現多次只回傳一次
+        self.assertEqual(matcher.find("浴缸浴缸"), ["浴缸"])
+
+    def test_no_match(self):
+        matcher = KeywordMatcher(["浴缸", "陽台"])
+        self.assertEqual(matcher.find("安靜的房間"), [])
+        self.assertFalse(matcher.contains_any("安靜的房間"))
+        self.assertTrue(matcher.contains_any("有陽台嗎"))
+
+    def test_empty(self):
+        matcher = KeywordMatcher(["", None])
+        self.assertEqual(len(matcher), 0)
+        self.assertEqual(matcher.find("浴缸"), [])
+        self.assertEqual(KeywordMatcher(["浴缸"]).find(""), [])
+
+    """
+    與逐一以 keyword in text 檢查的結果相同（隨機產生重疊度高的關鍵字與文字）
+    """
+    def test_matches_substring_search(self):
+        rng = random.Random(0)
+        for _ in range(500):
+            keywords = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))]
+            text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 20)))
+            matcher = KeywordMatcher(keywords)
+            self.assertEqual(set(matcher.find(text)), {keyword for keyword in keywords if keyword in text})
+            self.assertEqual(matcher.contains_any(text), any(keyword in text for keyword in keywords))
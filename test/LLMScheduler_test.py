@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from src.LLMScheduler import BACKGROUND_PRIORITY, CHAT_PRIORITY, LLMScheduler, SchedulerBusyError
+
+
+class TestLLMScheduler(unittest.TestCase):
+    def wait_for_queue(self, scheduler, count):
+        deadline = time.monotonic() + 2
+        while scheduler.stats()["queued"] < count and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(scheduler.stats()["queued"], count)
+
+    def test_concurrency_limit(self):
+        scheduler = LLMScheduler(max_concurrency=2, max_queue_time=2)
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        def call():
+            with scheduler.slot():
+                with lock:
+                    running[0] += 1
+                    peak[0] = max(peak[0], running[0])
+                time.sleep(0.05)
+                with lock:
+                    running[0] -= 1
+
+        threads = [threading.Thread(target=call) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+        stats = scheduler.stats()
+        self.assertEqual((stats["active"], stats["queued"], stats["admitted"]), (0, 0, 6))
+        self.assertGreater(stats["peak_queued"], 0)
+
+    """
+    名額空出時交給優先順序最高的請求：聊天優先於後台，相同優先順序依排隊順序
+    """
+    def test_priority_order(self):
+        scheduler = LLMScheduler(max_concurrency=1, max_queue_time=2)
+        scheduler.acquire()
+        order = []
+
+        def call(name, priority):
+            with scheduler.slot(priority):
+                order.append(name)
+
+        threads = []
+        for name, priority in [("background", BACKGROUND_PRIORITY), ("chat-1", CHAT_PRIORITY), ("chat-2", CHAT_PRIORITY)]:
+            thread = threading.Thread(target=call, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            self.wait_for_queue(scheduler, len(threads))
+        self.assertEqual(scheduler.queue_depth(), {"chat": 2, "background": 1})
+
+        scheduler.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ["chat-1", "chat-2", "background"])
+
+    def test_queue_full(self):
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1, max_queue_time=2)
+        scheduler.acquire()
+
+        def wait_and_release():
+            scheduler.acquire()
+            scheduler.release()
+
+        waiter = threading.Thread(target=wait_and_release)
+        waiter.start()
+        self.wait_for_queue(scheduler, 1)
+
+        with self.assertRaises(SchedulerBusyError) as context:
+            scheduler.acquire()
+        self.assertGreaterEqual(context.exception.retry_after, 1)
+        self.assertEqual(scheduler.stats()["rejected"], 1)
+        scheduler.release()
+        waiter.join()
+
+    def test_queue_timeout(self):
+        scheduler = LLMScheduler(max_concurrency=1, max_queue_time=5)
+        scheduler.acquire()
+        start = time.perf_counter()
+        # 呼叫端的 timeout 比 max_queue_time 短時以 timeout 為準
+        with self.assertRaises(SchedulerBusyError):
+            scheduler.acquire(timeout=0.05)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        stats = scheduler.stats()
+        self.assertEqual((stats["timed_out"], stats["queued"]), (1, 0))
+
+        # 逾時離開的請求不會拿到名額
+        scheduler.release()
+        self.assertEqual(scheduler.stats()["active"], 0)
+        with scheduler.slot():
+            self.assertEqual(scheduler.stats()["active"], 1)
+
+    def test_retry_after(self):
+        scheduler = LLMScheduler(max_concurrency=2)
+        self.assertEqual(scheduler.retry_after(), 1)
+        scheduler.acquire()
+        scheduler.release(4.0)
+        self.assertEqual(scheduler.stats()["average_service"], 4.0)
+        self.assertEqual(scheduler.retry_after(), 2)
+
+    def test_async_acquire(self):
+        scheduler = LLMScheduler(max_concurrency=1, max_queue_time=2)
+        order = []
+
+        async def call(name, priority, delay=0.0):
+            async with scheduler.aslot(priority):
+                order.append(name)
+                await asyncio.sleep(delay)
+
+        async def run():
+            first = asyncio.ensure_future(call("first", CHAT_PRIORITY, 0.05))
+            await asyncio.sleep(0)
+            background = asyncio.ensure_future(call("background", BACKGROUND_PRIORITY))
+            chat = asyncio.ensure_future(call("chat", CHAT_PRIORITY))
+            cancelled = asyncio.ensure_future(call("cancelled", CHAT_PRIORITY))
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+            await asyncio.gather(first, background, chat, cancelled, return_exceptions=True)
+
+            with self.assertRaises(SchedulerBusyError):
+                async with scheduler.aslot():
+                    await scheduler.aacquire(timeout=0.05)
+
+        asyncio.run(run())
+        self.assertEqual(order, ["first", "chat", "background"])
+        self.assertEqual(scheduler.stats()["active"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.NumpyVectorStore import NumpyVectorStore
+
+
+class TestNumpyVectorStore(unittest.TestCase):
+    def setUp(self):
+        self.embeddings = DeterministicFakeEmbedding(size=16)
+        self.docs = [Document(page_content=f"房型{i}", metadata={"room_id": str(i), "price": 1000 + i * 500, "style": "日式" if i % 2 else "現代"})
+                     for i in range(10)]
+        self.store = NumpyVectorStore(self.embeddings)
+        self.store.add_documents(self.docs, ids=[doc.metadata["room_id"] for doc in self.docs])
+
+    """
+    以逐筆計算的餘弦相似度驗證前 k 名的結果與排序
+    """
+    def test_similarity_search_matches_brute_force(self):
+        query = self.embeddings.embed_query("房型3")
+        vectors = np.array(self.embeddings.embed_documents([doc.page_content for doc in self.docs]))
+        similarities = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+        expected = [str(i) for i in np.argsort(-similarities)[:4]]
+
+        results = self.store.similarity_search_by_vector_with_score(query, k=4)
+        self.assertEqual([doc.metadata["room_id"] for doc, _ in results], expected)
+        self.assertEqual(results[0][0].page_content, "房型3")
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+
+    def test_where_filter(self):
+        where = {"$and": [{"price": {"$gte": 2000}}, {"price": {"$lte": 4000}}]}
+        docs = self.store.similarity_search("房型", k=10, filter=where)
+        self.assertEqual(sorted(doc.metadata["room_id"] for doc in docs), ["2", "3", "4", "5", "6"])
+
+        docs = self.store.similarity_search("房型", k=10, filter={"$or": [{"style": "日式"}, {"price": {"$lt": 1500}}]})
+        self.assertEqual(sorted(doc.metadata["room_id"] for doc in docs), ["0", "1", "3", "5", "7", "9"])
+
+        self.assertEqual(self.store.similarity_search("房型", k=3, filter={"price": {"$gt": 100000}}), [])
+
+        docs = self.store.similarity_search("房型", k=10, filter={"$and": [{"room_id": {"$in": ["1", "4", "7"]}}, {"price": {"$gte": 2000}}]})
+        self.assertEqual(sorted(doc.metadata["room_id"] for doc in docs), ["4", "7"])
+        docs = self.store.similarity_search("房型", k=10, filter={"room_id": {"$nin": ["0", "1"]}})
+        self.assertEqual(len(docs), 8)
+
+    def test_upsert_and_delete(self):
+        self.store.add_documents([Document(page_content="房型3", metadata={"room_id": "3", "price": 9999})], ids=["3"])
+        self.assertEqual(len(self.store), 10)
+        self.assertEqual(self.store.get(ids=["3"])["metadatas"], [{"room_id": "3", "price": 9999}])
+
+        self.store.delete(ids=["0", "3", "404"])
+        self.assertEqual(len(self.store), 8)
+        self.assertEqual(sorted(self.store.get()["ids"]), ["1", "2", "4", "5", "6", "7", "8", "9"])
+        # 被最後一列填補的文件仍能以自己的內容找到
+        doc = self.store.similarity_search("房型9", k=1)[0]
+        self.assertEqual((doc.page_content, doc.metadata["room_id"]), ("房型9", "9"))
+
+    def test_float16(self):
+        store = NumpyVectorStore(self.embeddings, dtype="float16")
+        store.SEARCH_BLOCK_ROWS = 3
+        store.add_documents(self.docs, ids=[doc.metadata["room_id"] for doc in self.docs])
+        self.assertEqual(store.nbytes(), self.store.nbytes() // 2)
+        self.assertEqual(store.similarity_search("房型7", k=1)[0].metadata["room_id"], "7")
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = NumpyVectorStore(self.embeddings, persist_directory=tmp_dir)
+            store.add_documents(self.docs, ids=[doc.metadata["room_id"] for doc in self.docs])
+            store.delete(ids=["1"])
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, "rooms", NumpyVectorStore.VECTORS_FILE.format(1))))
+
+            reloaded = NumpyVectorStore(self.embeddings, persist_directory=tmp_dir)
+            self.assertEqual(reloaded.get(include=["metadatas"]), store.get(include=["metadatas"]))
+            self.assertEqual(reloaded.similarity_search("房型5", k=1)[0].metadata["room_id"], "5")
+
+    """
+    快照之後的異動只附加到異動紀錄，不重寫整個矩陣；紀錄累積到門檻後重寫快照並刪除舊的紀錄
+    """
+    def test_persistence_appends_changes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = NumpyVectorStore(self.embeddings, persist_directory=tmp_dir)
+            store.COMPACT_MIN_CHANGES = 4
+            store.add_documents(self.docs, ids=[doc.metadata["room_id"] for doc in self.docs])
+            directory = os.path.join(tmp_dir, "rooms")
+            vectors_path = os.path.join(directory, NumpyVectorStore.VECTORS_FILE.format(1))
+            snapshot_time = os.stat(vectors_path).st_mtime_ns
+
+            store.add_documents([Document(page_content="房型3", metadata={"room_id": "3", "price": 9999})], ids=["3"])
+            store.add_documents([Document(page_content="房型10", metadata={"room_id": "10"})], ids=["10"])
+            store.delete(ids=["1"])
+            self.assertEqual(os.stat(vectors_path).st_mtime_ns, snapshot_time)
+            # 第一次寫入直接寫成快照，之後的異動在下一個世代的紀錄中
+            self.assertEqual(sorted(os.listdir(directory)), ["changes.1.jsonl", "documents.json", "vectors.1.npy"])
+
+            reloaded = NumpyVectorStore(self.embeddings, persist_directory=tmp_dir)
+            self.assertEqual(reloaded.get(include=["metadatas"]), store.get(include=["metadatas"]))
+            self.assertEqual(reloaded.similarity_search("房型10", k=1)[0].metadata["room_id"], "10")
+
+            # 異動筆數達到 max(COMPACT_MIN_CHANGES, 快照的文件數) 時重寫快照
+            for i in range(11, 18):
+                store.add_documents([Document(page_content=f"房型{i}", metadata={"room_id": str(i)})], ids=[str(i)])
+            self.assertEqual(sorted(os.listdir(directory)), ["documents.json", "vectors.2.npy"])
+            reloaded = NumpyVectorStore(self.embeddings, persist_directory=tmp_dir)
+            self.assertEqual(reloaded.get(include=["metadatas"]), store.get(include=["metadatas"]))
+            self.assertEqual(len(reloaded), 17)
+
+    """
+    寫入快照時在向量檔與 documents.json 之間中斷：載入時仍使用上一個世代的快照並重播異動紀錄，
+    不會把新世代的向量（列數相同但順序不同）與舊的文件配對
+    """
+    def test_interrupted_snapshot_keeps_pairs(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = NumpyVectorStore(self.embeddings, persist_directory=tmp_dir)
+            store.COMPACT_MIN_CHANGES = 4
+            store.add_documents(self.docs, ids=[doc.metadata["room_id"] for doc in self.docs])
+            documents_path = os.path.join(tmp_dir, "rooms", NumpyVectorStore.DOCUMENTS_FILE)
+            replace = os.replace
+
+            def interrupted(source, target):
+                if target == documents_path:
+                    raise OSError("interrupted")
+                replace(source, target)
+
+            # 刪除後以最後一列填補，列數不變但順序改變；第 10 筆異動時重寫快照
+            for i in range(1, 5):
+                store.delete(ids=[str(i)])
+                store.add_documents([Document(page_content=f"房型{i + 10}", metadata={"room_id": str(i + 10)})], ids=[str(i + 10)])
+            store.delete(ids=["5"])
+            with patch('src.NumpyVectorStore.os.replace', side_effect=interrupted):
+                with self.assertRaises(OSError):
+                    store.add_documents([Document(page_content="房型15", metadata={"room_id": "15"})], ids=["15"])
+
+            reloaded = NumpyVectorStore(self.embeddings, persist_directory=tmp_dir)
+            self.assertEqual(reloaded.get(include=["metadatas"]), store.get(include=["metadatas"]))
+            for i in (0, 6, 11, 15):
+                self.assertEqual(reloaded.similarity_search(f"房型{i}", k=1)[0].metadata["room_id"], str(i))
+
+    def test_as_retriever(self):
+        retriever = self.store.as_retriever(search_kwargs={"k": 2})
+        docs = retriever.invoke("房型4")
+        self.assertEqual(len(docs), 2)
+        self.assertEqual(docs[0].metadata["room_id"], "4")
+
+
+if __name__ == '__main__':
+    unittest.main()
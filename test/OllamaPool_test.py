@@ -0,0 +1,252 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.OllamaPool import OllamaPool, OllamaResponseError, PooledOllama, percentile
+from src.PromptTemplates import get_template
+
+"""
+代替 Ollama 的本機 HTTP 伺服器：/api/generate 等待 latency 秒後以 JSON lines 回傳伺服器名稱，/api/tags 作為健康檢查；
+down 為 True 時兩者都回傳 503。記錄收到的請求數與連線（用戶端位址）。
+chunks 大於 0 時改為像 Ollama 一樣以 chunked 串流逐行回傳，每行間隔 latency 秒；用戶端中途斷線時停止並記錄於 aborted。
+"""
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(503 if self.server.down else 200, b'{"models": []}')
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.connections.add(self.client_address)
+            self.server.payloads.append(payload)
+        if self.server.down:
+            self._reply(503, b'{"error": "unavailable"}')
+            return
+        if self.server.chunks:
+            self._stream(payload)
+            return
+        time.sleep(self.server.latency)
+        lines = [{"model": payload["model"], "response": self.server.name, "done": False},
+                 {"model": payload["model"], "response": "!", "done": True, "prompt_eval_count": 3}]
+        self._reply(200, "\n".join(json.dumps(line) for line in lines).encode("utf-8"), "application/x-ndjson")
+
+    def _stream(self, payload):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for index in range(self.server.chunks):
+                time.sleep(self.server.latency)
+                line = {"model": payload["model"], "response": self.server.name, "done": index == self.server.chunks - 1}
+                data = (json.dumps(line) + "\n").encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            with self.server.lock:
+                self.server.aborted += 1
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(name, latency=0.0, chunks=0):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.name, server.latency, server.down, server.chunks, server.aborted = name, latency, False, chunks, 0
+    server.requests, server.connections, server.payloads = 0, set(), []
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class TestOllamaPool(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def start(self, name, latency=0.0, chunks=0):
+        server, url = start_server(name, latency, chunks)
+        self.servers.append(server)
+        return server, url
+
+    def test_percentile(self):
+        self.assertEqual(percentile([0.1, 0.2, 0.3, 0.4], 0.5), 0.3)
+        self.assertEqual(percentile([0.4, 0.1], 0.95), 0.4)
+        self.assertIsNone(percentile([], 0.95))
+
+    def test_least_outstanding(self):
+        pool = OllamaPool(["http://a", "http://b/", "http://a"], health_interval=0)
+        self.assertEqual([endpoint.base_url for endpoint in pool.endpoints], ["http://a", "http://b"])
+        first, second = pool.acquire(), pool.acquire()
+        self.assertNotEqual(first, second)
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        # 不健康的伺服器只在沒有其他選擇時使用
+        second.healthy = False
+        self.assertIs(pool.acquire(), first)
+        self.assertIs(pool.acquire(exclude=(first,)), second)
+        self.assertIsNone(pool.acquire(exclude=(first, second)))
+
+    def test_generate_reuses_connection(self):
+        server, url = self.start("A")
+        pool = OllamaPool([url], health_interval=0)
+        for _ in range(5):
+            result = pool.generate({"model": "m", "prompt": "你好"})
+        self.assertEqual(result["response"], "A!")
+        self.assertEqual(result["prompt_eval_count"], 3)
+        self.assertTrue(server.payloads[0]["stream"])
+        self.assertEqual(server.requests, 5)
+        self.assertEqual(len(server.connections), 1)
+        pool.close()
+
+    def test_concurrent_requests_are_balanced(self):
+        server_a, url_a = self.start("A", latency=0.2)
+        server_b, url_b = self.start("B", latency=0.2)
+        pool = OllamaPool([url_a, url_b], health_interval=0)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda _: pool.generate({"model": "m", "prompt": "p"})["response"], range(4)))
+        self.assertEqual(sorted(results), ["A!", "A!", "B!", "B!"])
+        self.assertEqual((server_a.requests, server_b.requests), (2, 2))
+        pool.close()
+
+    """
+    請求失敗（5xx）的伺服器標記為不健康，之後的請求送往其他伺服器；健康檢查通過後恢復
+    """
+    def test_unhealthy_endpoint_is_skipped(self):
+        server_a, url_a = self.start("A")
+        server_b, url_b = self.start("B")
+        pool = OllamaPool([url_a, url_b], health_interval=0)
+        server_a.down = True
+        with self.assertRaises(OllamaResponseError):
+            pool.generate({"model": "m", "prompt": "p"})
+        self.assertFalse(pool.endpoints[0].healthy)
+        self.assertEqual([pool.generate({"model": "m", "prompt": "p"})["response"] for _ in range(3)], ["B!"] * 3)
+
+        self.assertEqual(pool.check_health(), {url_a: False, url_b: True})
+        server_a.down = False
+        self.assertEqual(pool.check_health(), {url_a: True, url_b: True})
+        self.assertEqual(pool.stats()["endpoints"][0]["failures"], 1)
+        pool.close()
+
+    def test_background_health_checks(self):
+        server_a, url_a = self.start("A")
+        pool = OllamaPool([url_a], health_interval=0.05)
+        server_a.down = True
+        # 健康檢查在第一次取得伺服器時啟動
+        pool.release(pool.acquire())
+        deadline = time.monotonic() + 2
+        while pool.endpoints[0].healthy and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertFalse(pool.endpoints[0].healthy)
+        pool.close()
+
+    def _hedging_pool(self):
+        slow, slow_url = self.start("slow", latency=0.6)
+        fast, fast_url = self.start("fast", latency=0.0)
+        pool = OllamaPool([slow_url, fast_url], hedge=True, hedge_min_samples=5, hedge_min_delay=0.05, health_interval=0)
+        # 近期延遲約 0.05 秒，第一個請求送往 slow（兩台進行中請求數相同時取第一台）
+        for _ in range(5):
+            pool.release(pool.acquire(), "m", 0.05)
+        return pool, slow, fast
+
+    def test_hedged_request(self):
+        pool, slow, fast = self._hedging_pool()
+        self.assertEqual(pool.hedge_delay("m"), 0.05)
+        self.assertIsNone(pool.hedge_delay("other"))
+
+        start = time.perf_counter()
+        result = pool.generate({"model": "m", "prompt": "p"})
+        self.assertEqual(result["response"], "fast!")
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual((slow.requests, fast.requests), (1, 1))
+        self.assertEqual((pool.stats()["hedged"], pool.stats()["hedge_wins"]), (1, 1))
+        pool.close()
+
+    """
+    備援請求先完成後，較慢的請求中止並關閉連線，伺服器不會繼續生成到結束
+    """
+    def test_hedged_request_cancels_loser(self):
+        slow, slow_url = self.start("slow", latency=0.05, chunks=40)
+        fast, fast_url = self.start("fast")
+        pool = OllamaPool([slow_url, fast_url], hedge=True, hedge_min_samples=5, hedge_min_delay=0.05, health_interval=0)
+        for _ in range(5):
+            pool.release(pool.acquire(), "m", 0.05)
+
+        result = pool.generate({"model": "m", "prompt": "p"})
+        self.assertEqual(result["response"], "fast!")
+        deadline = time.monotonic() + 1.5
+        while (slow.aborted == 0 or pool.endpoints[0].outstanding) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # 40 行需要 2 秒，中止後伺服器在下一次寫入時發現斷線
+        self.assertEqual(slow.aborted, 1)
+        self.assertEqual([endpoint.outstanding for endpoint in pool.endpoints], [0, 0])
+        self.assertTrue(pool.endpoints[0].healthy)
+        # 被中止的請求不記錄延遲樣本
+        self.assertEqual(len(pool._latencies["m"]), 6)
+        pool.close()
+
+    def test_async_hedged_request_cancels_loser(self):
+        pool, slow, fast = self._hedging_pool()
+
+        async def run():
+            try:
+                return await pool.agenerate({"model": "m", "prompt": "p"})
+            finally:
+                await pool.aclose()
+
+        start = time.perf_counter()
+        result = asyncio.run(run())
+        self.assertEqual(result["response"], "fast!")
+        self.assertLess(time.perf_counter() - start, 0.5)
+        # 被取消的請求不算伺服器失敗
+        self.assertEqual([endpoint.outstanding for endpoint in pool.endpoints], [0, 0])
+        self.assertTrue(pool.endpoints[0].healthy)
+        pool.close()
+
+    def test_pooled_ollama_chain(self):
+        server, url = self.start("A")
+        pool = OllamaPool([url], health_interval=0)
+        llm = PooledOllama(pool=pool, model="m", temperature=0, num_predict=8)
+        self.assertEqual(llm.base_url, (url,))
+
+        chain = get_template("intent") | llm
+        self.assertEqual(chain.invoke({"question": "你好"}), "A!")
+        self.assertEqual(list(chain.stream({"question": "你好"})), ["A", "!"])
+
+        async def run():
+            try:
+                chunks = [chunk async for chunk in chain.astream({"question": "你好"})]
+                return await chain.ainvoke({"question": "你好"}), chunks
+            finally:
+                await pool.aclose()
+
+        self.assertEqual(asyncio.run(run()), ("A!", ["A", "!"]))
+        payload = server.payloads[0]
+        self.assertEqual(payload["options"], {"temperature": 0, "num_predict": 8})
+        self.assertIn("Human: 你好", payload["prompt"])
+        self.assertEqual(len(server.connections), 2)  # 同步與非同步各一個持久連線
+        pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
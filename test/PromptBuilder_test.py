@@ -0,0 +1,68 @@
+import unittest
+
+from src.PromptBuilder import build_room_table, estimate_tokens, format_room_row, rank_rooms
+from src.RoomCatalog import format_room
+
+ROOMS = [
+    {"name": "和式套房", "price": "5000", "area": "30", "features": "日式榻榻米、茶几、浴衣、日式拉門", "style": "日式", "maxOccupancy": "2人房"},
+    {"name": "工業風雙人房", "price": "3000", "area": "22", "features": "浴缸、水泥牆、投影機", "style": "工業", "maxOccupancy": "2人房"},
+    {"name": "泳池景家庭房", "price": "6500", "area": "35", "features": "游泳池、陽台、家庭桌椅", "style": "現代", "maxOccupancy": "4人房"},
+]
+
+
+class TestPromptBuilder(unittest.TestCase):
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens("工業風雙人房"), 6)
+        self.assertEqual(estimate_tokens("King Size 3000元"), 4)
+        self.assertEqual(estimate_tokens(""), 0)
+
+    def test_format_room_row(self):
+        self.assertEqual(format_room_row(ROOMS[0]), "和式套房|5000|30|日式|2|日式榻榻米、茶几、浴衣、日式拉門")
+        self.assertEqual(format_room_row(ROOMS[0], ["茶几"]), "和式套房|5000|30|日式|2|茶几")
+        self.assertEqual(format_room_row({"name": "A", "maxOccupancy": "未知"}), "A||||未知|")
+
+    def test_rank_rooms(self):
+        ranked = rank_rooms(ROOMS, ["工業", "浴缸"])
+        self.assertEqual([item["name"] for item in ranked], ["工業風雙人房", "和式套房", "泳池景家庭房"])
+        # 沒有關鍵字時保留原本的順序
+        self.assertEqual(rank_rooms(ROOMS), ROOMS)
+
+    def test_table_is_smaller_than_summary(self):
+        table = build_room_table(ROOMS)
+        self.assertEqual(table.text.splitlines()[0], "名稱|價格|面積|風格|人數|特色")
+        self.assertEqual((table.rooms, table.truncated, table.dropped), (3, 0, 0))
+        self.assertEqual(table.tokens, estimate_tokens(table.text) + 3)
+        summary = "\n".join(format_room(item) for item in ROOMS)
+        self.assertLess(table.tokens, estimate_tokens(summary))
+
+    def test_empty(self):
+        table = build_room_table([])
+        self.assertEqual(table.text, "")
+        self.assertEqual(table.tokens, 0)
+
+    """
+    超出預算時先截短排名較低房型的特色欄位，仍放不下時捨棄該房型與之後的房型
+    """
+    def test_budget_truncates_then_drops(self):
+        full = build_room_table(ROOMS[:2])
+        table = build_room_table(ROOMS, full.tokens + 20)
+        self.assertEqual((table.rooms, table.truncated, table.dropped), (3, 1, 0))
+        self.assertLessEqual(table.tokens, full.tokens + 20)
+        self.assertTrue(table.text.splitlines()[-1].startswith("泳池景家庭房|6500|35|現代|4|"))
+        self.assertNotIn("家庭桌椅", table.text)
+
+        table = build_room_table(ROOMS, full.tokens)
+        self.assertEqual((table.rooms, table.truncated, table.dropped), (2, 0, 1))
+        self.assertEqual(table.text, full.text)
+
+    def test_budget_keeps_top_room(self):
+        table = build_room_table(ROOMS, 1)
+        self.assertEqual((table.rooms, table.truncated, table.dropped), (1, 1, 2))
+        self.assertEqual(table.text.splitlines()[1], "和式套房|5000|30|日式|2|")
+        # 沒有特色可截的房型即使超出預算也不算截短
+        table = build_room_table([dict(ROOMS[0], features="")], 1)
+        self.assertEqual((table.rooms, table.truncated, table.dropped), (1, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import MagicMock
+
+from langchain_core.language_models import FakeListLLM
+
+from src.PromptBuilder import estimate_tokens
+from src.PromptTemplates import PromptRegistry, get_template, static_prefix, static_tokens
+
+
+class TestPromptTemplates(unittest.TestCase):
+    def test_template_built_once(self):
+        self.assertIs(get_template("prediction"), get_template("prediction"))
+        with self.assertRaises(KeyError):
+            get_template("unknown")
+
+    """
+    變數只出現在 prompt 最後，不同請求格式化後的開頭都是相同的固定前綴，且前綴包含完整的 system 訊息
+    """
+    def test_static_prefix(self):
+        for name in PromptRegistry.names():
+            template = get_template(name)
+            prefix = static_prefix(name)
+            system = template.messages[0].prompt.format()
+            self.assertIn(system, prefix, name)
+            first = template.format(**{variable: "甲" for variable in template.input_variables})
+            second = template.format(**{variable: "乙{x}" for variable in template.input_variables})
+            self.assertTrue(first.startswith(prefix), name)
+            self.assertTrue(second.startswith(prefix), name)
+
+    """
+    使用者輸入中的大括號不會被當成模板語法
+    """
+    def test_user_text_is_not_template_syntax(self):
+        text = get_template("review").format(question="我要{兩人房}", recommendation="房型名稱：{A}")
+        self.assertIn("使用者需求：我要{兩人房}", text)
+        self.assertIn("房型名稱：{A}", text)
+
+    def test_estimate_tokens(self):
+        inputs = {"input": "我要兩人房", "rooms": "名稱|價格\n和式套房|五千"}
+        formatted = get_template("prediction").format(**inputs)
+        self.assertEqual(PromptRegistry.estimate_tokens("prediction", inputs), estimate_tokens(formatted))
+        self.assertEqual(PromptRegistry.estimate_tokens("auto_recommend", {}), static_tokens("auto_recommend"))
+
+    def test_chain_cached_per_llm(self):
+        registry = PromptRegistry()
+        llm = FakeListLLM(responses=["房型推薦"])
+        chain = registry.chain("intent", llm)
+        self.assertIs(registry.chain("intent", llm), chain)
+        self.assertEqual(chain.invoke({"question": "想找安靜的房間"}), "房型推薦")
+
+        other = MagicMock()
+        self.assertIsNot(registry.chain("intent", other), chain)
+        self.assertIsNot(registry.chain("review", llm), chain)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,10 @@
+import asyncio
+import threading
+import time
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+from src.CircuitBreaker import LLMUnavailableError
+from src.LLMScheduler import BACKGROUND_PRIORITY, CHAT_PRIORITY, SchedulerBusyError
 from src.RAG import RAGPipeline
 
 class TestRAGPipelineQuery(unittest.TestCase):
@@ -33,33 +38,36 @@ class TestRAGPipelineQuery(unittest.TestCase):
     5. 回傳完整推薦內容與房型資訊
     """
     @patch.object(RAGPipeline, 'classify_intent')
-    @patch.object(RAGPipeline, 'getRoomSummaryByRAG')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
     @patch.object(RAGPipeline, 'extract_price_range')
-    @patch.object(RAGPipeline, 'filter_by_price_range')
     @patch.object(RAGPipeline, 'extract_area_range')
-    @patch.object(RAGPipeline, 'filter_by_area_range')
     @patch.object(RAGPipeline, 'LLM_Prediction')
     @patch.object(RAGPipeline, 'review_recommendation')
     @patch.object(RAGPipeline, 'remove_duplicate_room_names')
     def test_query_room_recommend_fully_match(
-        self, mock_remove_dup, mock_review, mock_llm, mock_filter_area, mock_extract_area,
-        mock_filter_price, mock_extract_price, mock_get_summary, mock_intent
+        self, mock_remove_dup, mock_review, mock_llm, mock_extract_area,
+        mock_extract_price, mock_get_ids, mock_intent
     ):
         mock_intent.return_value = "房型推薦"
-        mock_get_summary.return_value = "名稱:A 價格:1000 面積:10\n名稱:B 價格:2000 面積:20"
+        mock_get_ids.return_value = ["0", "1"]
         mock_extract_price.return_value = (1000, 2000, False, False)
-        mock_filter_price.return_value = "名稱:A 價格:1000 面積:10\n名稱:B 價格:2000 面積:20"
         mock_extract_area.return_value = (10, 20, False, False)
-        mock_filter_area.return_value = "名稱:A 價格:1000 面積:10\n名稱:B 價格:2000 面積:20"
         mock_llm.return_value = "房型名稱：A\n推薦理由：好\n房型名稱：B\n推薦理由：棒\n結語：歡迎入住"
         mock_review.return_value = "推薦內容符合使用者需求"
         mock_remove_dup.side_effect = lambda x: x
 
         result = self.rag.query("我要1000~2000元的房型")
+        # 兩個房型都符合價格與面積條件，都應出現在傳給 LLM 的房型資料中
+        rooms_summary = mock_llm.call_args[0][1]
+        self.assertIn("A|1000|10|", rooms_summary)
+        self.assertIn("B|2000|20|", rooms_summary)
         self.assertIn("A", result["rooms"])
         self.assertIn("B", result["rooms"])
         # 應驗證推薦內容本身
         self.assertEqual(result["conclusion"], mock_llm.return_value)
+        # 推薦的房型都通過程式檢查，不需要再請 LLM 審查
+        mock_review.assert_not_called()
+        self.assertEqual(self.rag.stats()["review"]["skipped"], 1)
 
     """
         測試當使用者詢問房型推薦（如："我要3000~4000元的房型，30~40坪"）但資料庫無完全符合時，
@@ -69,29 +77,804 @@ class TestRAGPipelineQuery(unittest.TestCase):
         4. 得到「不符合需求」的審核結論
     """
     @patch.object(RAGPipeline, 'classify_intent')
-    @patch.object(RAGPipeline, 'getRoomSummaryByRAG')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
     @patch.object(RAGPipeline, 'extract_price_range')
-    @patch.object(RAGPipeline, 'filter_by_price_range')
     @patch.object(RAGPipeline, 'extract_area_range')
-    @patch.object(RAGPipeline, 'filter_by_area_range')
     @patch.object(RAGPipeline, 'LLM_Prediction')
     @patch.object(RAGPipeline, 'review_recommendation')
     @patch.object(RAGPipeline, 'remove_duplicate_room_names')
     def test_query_room_recommend_not_fully_match(
-        self, mock_remove_dup, mock_review, mock_llm, mock_filter_area, mock_extract_area,
-        mock_filter_price, mock_extract_price, mock_get_summary, mock_intent
+        self, mock_remove_dup, mock_review, mock_llm, mock_extract_area,
+        mock_extract_price, mock_get_ids, mock_intent
     ):
 
         mock_intent.return_value = "房型推薦"
-        mock_get_summary.return_value = "名稱:A 價格:1000 面積:10\n名稱:B 價格:2000 面積:20"
-        mock_extract_price.return_value = (3000, 4000, False, False)
-        mock_filter_price.return_value = ""  # 無符合價格範圍
-        mock_extract_area.return_value = (30, 40, False, False)
-        mock_filter_area.return_value = ""  # 無符合面積範圍
+        mock_get_ids.return_value = ["0", "1"]
+        mock_extract_price.return_value = (3000, 4000, False, False)  # 無符合價格範圍
+        mock_extract_area.return_value = (30, 40, False, False)  # 無符合面積範圍
         mock_llm.return_value = "目前沒有完全符合的房型"
         mock_review.return_value = "目前沒有完全符合的房型"
         mock_remove_dup.side_effect = lambda x: x
 
         result = self.rag.query("我要3000~4000元的房型，30~40坪")
+        # 篩選後沒有任何房型，傳給 LLM 的房型資料應為空字串
+        self.assertEqual(mock_llm.call_args[0][1], "")
+        # 推薦內容中沒有房型名稱，程式無法判斷，交給 LLM 審查
+        mock_review.assert_called_once()
         self.assertEqual(result["rooms"], {})
         self.assertIn("沒有完全符合的房型", result["conclusion"])
+
+    """
+    結構化模式：意圖與條件由同一次 LLM 呼叫取得，不再呼叫 classify_intent，且條件直接用於檢索
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'parse_request')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction')
+    @patch.object(RAGPipeline, 'review_recommendation')
+    def test_query_structured_intent(self, mock_review, mock_llm, mock_get_ids, mock_parse, mock_intent):
+        from src.Constraints import RoomConstraints
+
+        self.rag.structured_intent = True
+        constraints = RoomConstraints(price_range=(None, 1500, False, False), occupancy=2, styles=["工業風"])
+        mock_parse.return_value = ("房型推薦", constraints)
+        mock_get_ids.return_value = ["0", "1"]
+        mock_llm.return_value = "房型名稱：A\n推薦理由：好\n結語：歡迎入住"
+        mock_review.return_value = "推薦內容符合使用者需求"
+
+        result = self.rag.query("1500以下的工業風雙人房")
+
+        mock_intent.assert_not_called()
+        mock_get_ids.assert_called_once_with("1500以下的工業風雙人房", (None, 1500, False, False),
+                                             (None, None, False, False), 2, ["工業風"], [])
+        # 只有房型 A 符合價格條件
+        self.assertEqual(mock_llm.call_args[0][1], "名稱|價格|面積|風格|人數|特色\nA|1000|10|工業風|2|大")
+        self.assertEqual(list(result["rooms"]), ["A"])
+
+    """
+    結構化解析失敗時退回 classify_intent 與正規表示式提取條件
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'parse_request')
+    def test_query_structured_intent_fallback(self, mock_parse, mock_intent):
+        self.rag.structured_intent = True
+        mock_parse.return_value = None
+        mock_intent.return_value = "打招呼"
+
+        result = self.rag.query("你好")
+        mock_intent.assert_called_once_with("你好")
+        self.assertIn("很高興為您服務", result["conclusion"])
+        self.assertEqual(self.rag.stats()["counters"]["structured_fallback"], 1)
+
+    """
+    LLM 推薦了不符合價格條件的房型時，程式檢查直接判定不符合，不需呼叫 LLM 審查
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction')
+    @patch.object(RAGPipeline, 'review_recommendation')
+    def test_query_room_recommend_verifier_rejects(self, mock_review, mock_llm, mock_get_ids, mock_intent):
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["0"]
+        mock_llm.return_value = "房型名稱：B\n推薦理由：價格2000元\n結語：歡迎入住"
+
+        result = self.rag.query("1500元以下的房型")
+        mock_review.assert_not_called()
+        self.assertEqual(result["conclusion"], "目前沒有完全符合的房型")
+        self.assertEqual(result["rooms"], {})
+
+    """
+    預先檢索模式：檢索與意圖分類同時進行。
+    classify_intent 會等待檢索開始；若兩者依序執行，等待會逾時而失敗。
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction')
+    @patch.object(RAGPipeline, 'review_recommendation')
+    def test_query_speculative_retrieval_runs_concurrently(self, mock_review, mock_llm, mock_get_ids, mock_intent):
+        retrieval_started = threading.Event()
+        overlapped = []
+
+        def retrieve(*args):
+            retrieval_started.set()
+            return ["0"]
+
+        def classify(question):
+            overlapped.append(retrieval_started.wait(timeout=2))
+            return "房型推薦"
+
+        mock_get_ids.side_effect = retrieve
+        mock_intent.side_effect = classify
+        mock_llm.return_value = "房型名稱：A\n推薦理由：好"
+
+        self.rag.speculative_retrieval = True
+        result = self.rag.query("1500元以下的房型")
+
+        self.assertEqual(overlapped, [True])
+        mock_get_ids.assert_called_once()
+        self.assertEqual(list(result["rooms"]), ["A"])
+        self.assertEqual(self.rag.stats()["counters"]["speculative_used"], 1)
+
+    """
+    預先檢索模式下，意圖不是房型推薦時捨棄預先檢索的結果
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction')
+    def test_query_speculative_retrieval_discarded(self, mock_llm, mock_get_ids, mock_intent):
+        mock_intent.return_value = "其他"
+        mock_get_ids.return_value = ["0"]
+
+        self.rag.speculative_retrieval = True
+        result = self.rag.query("今天天氣如何")
+
+        self.assertIn("只提供房型相關的建議", result["conclusion"])
+        mock_llm.assert_not_called()
+        self.assertEqual(self.rag.stats()["counters"]["speculative_discarded"], 1)
+
+    """
+    非同步查詢：打招呼時直接回傳歡迎語，不呼叫任何同步的 LLM 方法
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'aclassify_intent', new_callable=AsyncMock)
+    def test_aquery_greeting(self, mock_aintent, mock_intent):
+        mock_aintent.return_value = "打招呼"
+        result = asyncio.run(self.rag.aquery("你好"))
+        self.assertEqual(result["rooms"], [])
+        self.assertIn("很高興為您服務", result["conclusion"])
+        mock_intent.assert_not_called()
+
+    """
+    非同步查詢的房型推薦流程與 query 相同：檢索、LLM 推薦、程式檢查後組合回應
+    """
+    @patch.object(RAGPipeline, 'aclassify_intent', new_callable=AsyncMock)
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'aLLM_Prediction', new_callable=AsyncMock)
+    @patch.object(RAGPipeline, 'areview_recommendation', new_callable=AsyncMock)
+    def test_aquery_room_recommend(self, mock_review, mock_llm, mock_get_ids, mock_intent):
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["0", "1"]
+        mock_llm.return_value = "房型名稱：A\n推薦理由：價格1000元\n結語：歡迎入住"
+
+        result = asyncio.run(self.rag.aquery("1500元以下的房型"))
+        # 只有房型 A 符合價格條件
+        self.assertEqual(mock_llm.call_args[0][1], "名稱|價格|面積|風格|人數|特色\nA|1000|10|工業風|2|大")
+        self.assertEqual(list(result["rooms"]), ["A"])
+        self.assertEqual(result["conclusion"], mock_llm.return_value)
+        mock_review.assert_not_called()
+
+    """
+    多個非同步查詢可在同一個事件迴圈中同時等待 LLM 回應。
+    每個 LLM 呼叫都會等待所有查詢都送出請求；若查詢依序執行，等待會逾時而失敗。
+    """
+    @patch.object(RAGPipeline, 'aclassify_intent', new_callable=AsyncMock)
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'aLLM_Prediction')
+    def test_aquery_sessions_run_concurrently(self, mock_llm, mock_get_ids, mock_intent):
+        sessions = 3
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["0"]
+
+        async def run():
+            waiting = []
+            all_waiting = asyncio.Event()
+
+            async def predict(question, rooms_summary):
+                waiting.append(question)
+                if len(waiting) == sessions:
+                    all_waiting.set()
+                await asyncio.wait_for(all_waiting.wait(), timeout=2)
+                return "房型名稱：A\n推薦理由：價格1000元"
+
+            mock_llm.side_effect = predict
+            return await asyncio.gather(*(self.rag.aquery(f"1500元以下的房型{i}") for i in range(sessions)))
+
+        results = asyncio.run(run())
+        self.assertEqual([list(result["rooms"]) for result in results], [["A"]] * sessions)
+
+    """
+    串流查詢：非房型推薦意圖時，先送出結論文字，再送出完整回應
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    def test_query_stream_greeting(self, mock_intent):
+        mock_intent.return_value = "打招呼"
+        events = list(self.rag.query_stream("你好"))
+        self.assertEqual([event for event, _ in events], ["token", "done"])
+        self.assertEqual(events[0][1], events[1][1]["conclusion"])
+
+    """
+    串流查詢：推薦內容逐段送出，最後的回應與 query 相同（經過審查並附上房型資訊）
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction_stream')
+    @patch.object(RAGPipeline, 'review_recommendation')
+    def test_query_stream_room_recommend(self, mock_review, mock_stream, mock_get_ids, mock_intent):
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["0", "1"]
+        chunks = ["推薦房型：\n", "房型名稱：A\n", "推薦理由：價格1000元"]
+        mock_stream.return_value = iter(chunks)
+
+        events = list(self.rag.query_stream("1500元以下的房型"))
+
+        self.assertEqual(events[:-1], [("token", chunk) for chunk in chunks])
+        event, response = events[-1]
+        self.assertEqual(event, "done")
+        self.assertEqual(response["conclusion"], "".join(chunks))
+        self.assertEqual(list(response["rooms"]), ["A"])
+        mock_review.assert_not_called()
+
+    """
+    串流查詢：程式檢查判定不符合時，最終結論以審查結果為準
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction_stream')
+    def test_query_stream_rejected_conclusion(self, mock_stream, mock_get_ids, mock_intent):
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["0"]
+        mock_stream.return_value = iter(["房型名稱：B\n", "推薦理由：價格2000元"])
+
+        events = list(self.rag.query_stream("1500元以下的房型"))
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[-1][1], {"rooms": {}, "conclusion": "目前沒有完全符合的房型"})
+
+    """
+    非同步串流查詢的事件格式與 query_stream 相同
+    """
+    @patch.object(RAGPipeline, 'aclassify_intent', new_callable=AsyncMock)
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'aLLM_Prediction_stream')
+    def test_aquery_stream_room_recommend(self, mock_stream, mock_get_ids, mock_intent):
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["0"]
+        chunks = ["房型名稱：A\n", "推薦理由：價格1000元"]
+
+        async def stream(question, rooms_summary):
+            for chunk in chunks:
+                yield chunk
+
+        mock_stream.side_effect = stream
+
+        async def collect():
+            return [event async for event in self.rag.aquery_stream("1500元以下的房型")]
+
+        events = asyncio.run(collect())
+        self.assertEqual(events[:-1], [("token", chunk) for chunk in chunks])
+        self.assertEqual(list(events[-1][1]["rooms"]), ["A"])
+
+    """
+    回應快取：相同問題第二次查詢直接回傳快取的回應；房型資料異動後快取失效
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction')
+    def test_query_response_cache(self, mock_llm, mock_get_ids, mock_intent):
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["0"]
+        mock_llm.return_value = "房型名稱：A\n推薦理由：價格1000元"
+
+        self.rag.cache_responses = True
+        first = self.rag.query("1500元以下的房型")
+        second = self.rag.query("1500元以下的房型？")
+        self.assertEqual(first, second)
+        mock_llm.assert_called_once()
+
+        # 重新指定相同內容的資料不影響快取，內容改變則快取失效
+        self.rag.data = [dict(item) for item in self.rag.data]
+        self.rag.query("1500元以下的房型")
+        mock_llm.assert_called_once()
+
+        self.rag.data = self.rag.data[:1]
+        self.rag.query("1500元以下的房型")
+        self.assertEqual(mock_llm.call_count, 2)
+
+        stats = self.rag.stats()["response_cache"]
+        self.assertEqual((stats["exact_hits"], stats["misses"]), (2, 2))
+
+    """
+    串流查詢命中快取時，直接送出快取的結論與回應
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    def test_query_stream_response_cache(self, mock_intent):
+        mock_intent.return_value = "打招呼"
+        self.rag.cache_responses = True
+
+        first = list(self.rag.query_stream("你好"))
+        second = list(self.rag.query_stream("你好"))
+        self.assertEqual(first, second)
+        self.assertEqual(self.rag.stats()["response_cache"]["exact_hits"], 1)
+
+    """
+    泛用推薦每次隨機挑選房型，回應不寫入快取
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    def test_query_generic_recommend_not_cached(self, mock_intent):
+        mock_intent.return_value = "泛用推薦"
+        self.rag.cache_responses = True
+
+        self.rag.query("有什麼推薦")
+        list(self.rag.query_stream("有什麼推薦"))
+        asyncio.run(self.rag.aquery("有什麼推薦"))
+        self.assertEqual(len(self.rag.response_cache), 0)
+
+    """
+    同一次查詢只提取一次條件：快取簽章、目錄查詢、預先檢索與寫入快取共用提取的結果
+    """
+    @patch.object(RAGPipeline, 'classify_intent', return_value="房型推薦")
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG', return_value=["0"])
+    @patch.object(RAGPipeline, 'LLM_Prediction', return_value="房型名稱：A\n推薦理由：價格1000元")
+    def test_query_extracts_constraints_once(self, mock_llm, mock_get_ids, mock_intent):
+        self.rag.cache_responses = True
+        with patch.object(RAGPipeline, 'extract_constraints', autospec=True,
+                          side_effect=RAGPipeline.extract_constraints) as extract:
+            self.rag.query("是否有工業風？")
+            self.assertEqual(extract.call_count, 1)
+            self.rag.query("1500元以下的房型")
+            self.assertEqual(extract.call_count, 2)
+        mock_llm.assert_called_once()
+
+    """
+    近似問題的快取：否定的條件（「沒有浴缸」）與肯定的條件（「有浴缸」）不共用快取的回應
+    """
+    @patch.object(RAGPipeline, 'embed_question', return_value=[1.0, 0.0])
+    @patch.object(RAGPipeline, 'classify_intent', return_value="房型推薦")
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG', return_value=["0"])
+    @patch.object(RAGPipeline, 'LLM_Prediction', return_value="房型名稱：A\n推薦理由：有浴缸")
+    def test_query_cache_separates_negated_constraints(self, mock_llm, mock_get_ids, mock_intent, mock_embed):
+        self.rag.data = [dict(item, features="浴缸") for item in self.rag.data]
+        self.rag.embeddings = MagicMock()
+        self.rag.cache_responses = True
+
+        self.rag.query("推薦有浴缸的房間")
+        self.rag.query("推薦有浴缸的房間吧")
+        self.assertEqual(self.rag.stats()["response_cache"]["semantic_hits"], 1)
+        self.rag.query("推薦沒有浴缸的房間")
+        self.assertEqual(mock_llm.call_count, 2)
+        self.assertEqual(self.rag.stats()["response_cache"]["semantic_hits"], 1)
+
+    """
+    詢問是否有某種風格或設施時直接查詢房型目錄回答，不呼叫意圖分類、檢索與 LLM
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction')
+    def test_query_lookup_answer(self, mock_llm, mock_get_ids, mock_intent):
+        result = self.rag.query("是否有工業風？")
+        self.assertEqual(list(result["rooms"]), ["A"])
+        self.assertIn("有的！目前有 1 間符合「工業風」的房型", result["conclusion"])
+
+        mock_intent.assert_not_called()
+        mock_get_ids.assert_not_called()
+        mock_llm.assert_not_called()
+        self.assertEqual(self.rag.stats()["counters"]["lookup_answered"], 1)
+
+        result = self.rag.query("有沒有北歐風的雙人房，價格1500元以下")
+        self.assertEqual(result["rooms"], {})
+        self.assertIn("目前沒有符合「北歐風、價格1500元以下、可入住2人」的房型", result["conclusion"])
+
+        events = list(self.rag.query_stream("有幾間北歐風"))
+        self.assertEqual(events[-1][0], "done")
+        self.assertIn("目前共有 1 間符合「北歐風」的房型", events[-1][1]["conclusion"])
+        self.assertEqual(list(events[-1][1]["rooms"]), ["B"])
+
+    """
+    查詢問題還有其他需求時仍走完整的推薦流程
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction')
+    @patch.object(RAGPipeline, 'review_recommendation')
+    def test_query_lookup_with_soft_requirement(self, mock_review, mock_llm, mock_get_ids, mock_intent):
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["0"]
+        mock_llm.return_value = "房型名稱：A\n推薦理由：安靜\n結語：歡迎入住"
+        mock_review.return_value = "推薦內容符合使用者需求"
+
+        result = self.rag.query("有沒有安靜的工業風房間")
+        mock_llm.assert_called_once()
+        self.assertEqual(list(result["rooms"]), ["A"])
+
+    """
+    推薦 prompt 以精簡表格呈現房型，符合風格的房型排在前面，超出 token 預算的房型會被捨棄
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction')
+    @patch.object(RAGPipeline, 'review_recommendation')
+    def test_query_compact_prompt_budget(self, mock_review, mock_llm, mock_get_ids, mock_intent):
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["0", "1"]
+        mock_llm.return_value = "房型名稱：B\n推薦理由：好\n結語：歡迎入住"
+        mock_review.return_value = "推薦內容符合使用者需求"
+
+        self.rag.query("想要北歐風的房間")
+        self.assertEqual(mock_llm.call_args[0][1], "名稱|價格|面積|風格|人數|特色\nB|2000|20|北歐風|3|小\nA|1000|10|工業風|2|大")
+
+        self.rag.prompt_token_budget = 35
+        self.rag.query("想要北歐風的房間")
+        self.assertEqual(mock_llm.call_args[0][1], "名稱|價格|面積|風格|人數|特色\nB|2000|20|北歐風|3|小")
+        self.assertEqual(self.rag.stats()["counters"]["prompt_rooms_dropped"], 1)
+
+        self.rag.compact_prompts = False
+        self.rag.query("想要北歐風的房間")
+        self.assertEqual(mock_llm.call_args[0][1], "名稱:A 價格:1000 面積:10 特色:大 風格:工業風 床數:2\n"
+                                                   "名稱:B 價格:2000 面積:20 特色:小 風格:北歐風 床數:3")
+
+    """
+    每次呼叫 LLM 時依階段記錄 prompt 的 token 數量（估算值）
+    """
+    def test_prompt_token_stats(self):
+        self.rag.llm = MagicMock()
+        self.rag.llm.invoke.return_value = "推薦內容"
+        self.rag.LLM_Prediction("想要北歐風的房間", "名稱|價格|面積|風格|人數|特色\nB|2000|20|北歐風|3|小")
+        self.rag.LLM_Prediction("想要北歐風的房間", "")
+
+        stats = self.rag.stats()["prompt_tokens"]["prediction"]
+        self.assertEqual(stats["calls"], 2)
+        self.assertGreater(stats["tokens"], 0)
+        self.assertEqual(stats["average"], stats["tokens"] / 2)
+
+    """
+    LLM 呼叫失敗時改以房型目錄依條件排序回答：符合價格的 A 排在只符合風格的 B 之前，推薦理由說明每個條件是否符合
+    """
+    @patch('src.RAG.PromptRegistry.chain')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    def test_query_degraded_when_llm_fails(self, mock_get_ids, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_get_ids.return_value = ["0", "1"]
+        mock_chain.return_value.invoke.side_effect = ConnectionError("connection refused")
+
+        result = self.rag.query("1500元以下的北歐風房型")
+        self.assertTrue(result["degraded"])
+        self.assertEqual(list(result["rooms"]), ["A", "B"])
+        self.assertIn("房型名稱：A\n推薦理由：價格1000元，符合您的預算；面積10；最多可入住2人；風格為工業風；特色為大。"
+                      "此房型未完全符合您的需求，但為最接近的選擇。", result["conclusion"])
+        self.assertIn("房型名稱：B\n推薦理由：價格2000元，不在您的預算範圍內；", result["conclusion"])
+        counters = self.rag.stats()["counters"]
+        self.assertEqual((counters["llm_failures"], counters["degraded_responses"]), (1, 1))
+
+    """
+    斷路器開啟後不再呼叫 LLM 與檢索，直接回傳排序結果；LLM 無法使用時的回應不寫入快取，打招呼仍以規則回答
+    """
+    @patch('src.RAG.PromptRegistry.chain')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    def test_query_degraded_when_breaker_open(self, mock_get_ids, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_get_ids.return_value = ["0", "1"]
+        mock_chain.return_value.invoke.side_effect = TimeoutError("read timed out")
+        self.rag.llm_breaker_min_calls = 1
+        self.rag.cache_responses = True
+
+        self.rag.query("想要北歐風的房間")
+        self.assertEqual(self.rag.stats()["llm_breaker"]["state"], "open")
+        mock_get_ids.reset_mock()
+        mock_chain.reset_mock()
+
+        start = time.perf_counter()
+        result = self.rag.query("想要北歐風的房間")
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertEqual(list(result["rooms"]), ["B", "A"])
+        self.assertTrue(result["degraded"])
+        mock_get_ids.assert_not_called()
+        mock_chain.assert_not_called()
+        self.assertEqual(len(self.rag.response_cache), 0)
+
+        self.assertIn("很高興為您服務", self.rag.query("你好")["conclusion"])
+        events = list(self.rag.query_stream("想要北歐風的房間"))
+        self.assertEqual([event for event, _ in events], ["token", "done"])
+        self.assertTrue(events[-1][1]["degraded"])
+
+    """
+    串流推薦中途失敗時，done 事件改送出 LLM 無法使用時的回應（取代已送出的片段）
+    """
+    @patch('src.RAG.PromptRegistry.chain')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    def test_query_stream_degraded_midway(self, mock_get_ids, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_get_ids.return_value = ["0", "1"]
+
+        def broken_stream(inputs):
+            yield "推薦房型：\n"
+            raise ConnectionError("connection reset")
+
+        mock_chain.return_value.stream.side_effect = broken_stream
+        events = list(self.rag.query_stream("想要北歐風的房間"))
+        self.assertEqual(events[0], ("token", "推薦房型：\n"))
+        self.assertEqual(events[1][0], "done")
+        self.assertTrue(events[1][1]["degraded"])
+        self.assertEqual(len(events), 2)
+
+    """
+    審查的 LLM 呼叫失敗時直接採用推薦內容
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction')
+    @patch.object(RAGPipeline, 'review_recommendation')
+    def test_query_review_unavailable(self, mock_review, mock_llm, mock_get_ids, mock_intent):
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["0", "1"]
+        mock_llm.return_value = "房型名稱：A\n推薦理由：安靜\n結語：歡迎入住"
+        mock_review.side_effect = LLMUnavailableError("review")
+
+        result = self.rag.query("想找安靜一點的房間")
+        self.assertEqual(result["conclusion"], mock_llm.return_value)
+        self.assertNotIn("degraded", result)
+        self.assertEqual(self.rag.stats()["counters"]["review_unavailable"], 1)
+
+    @patch('src.RAG.PromptRegistry.chain')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    def test_aquery_degraded_when_llm_fails(self, mock_get_ids, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_get_ids.return_value = ["0", "1"]
+        mock_chain.return_value.ainvoke = AsyncMock(side_effect=ConnectionError("connection refused"))
+
+        result = asyncio.run(self.rag.aquery("1500元以下的北歐風房型"))
+        self.assertTrue(result["degraded"])
+        self.assertEqual(list(result["rooms"]), ["A", "B"])
+        self.assertEqual(self.rag.stats()["llm_breaker"]["calls"], 1)
+
+    @patch('src.RAG.PromptRegistry.chain')
+    def test_auto_recommend_llm_unavailable(self, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_chain.return_value.invoke.side_effect = ConnectionError("connection refused")
+        self.assertIsNone(self.rag.auto_recommend_room())
+
+    """
+    串流等待第一段文字也不超過時間預算：模型遲遲沒有回應時改由房型目錄排序回答，
+    被放棄的串流在讀取的執行緒結束後才歸還排程器的名額
+    """
+    @patch('src.RAG.PromptRegistry.chain')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    def test_query_stream_deadline_bounds_first_chunk(self, mock_get_ids, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_get_ids.return_value = ["0", "1"]
+        self.rag.deadline_intent_reserve = self.rag.deadline_prediction_reserve = self.rag.deadline_review_reserve = 0
+        release = threading.Event()
+
+        def slow_stream(inputs):
+            release.wait(2)
+            yield "推薦房型：\n"
+            yield "房型名稱：B"
+
+        mock_chain.return_value.stream.side_effect = slow_stream
+        start = time.perf_counter()
+        events = list(self.rag.query_stream("想要北歐風的房間", deadline=0.3))
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual([event for event, _ in events], ["token", "done"])
+        self.assertTrue(events[-1][1]["degraded"])
+        self.assertEqual(events[-1][1]["meta"]["degradations"], ["fallback_ranking"])
+        self.assertEqual(self.rag.stats()["counters"]["deadline_llm_timeouts"], 1)
+        self.assertEqual(self.rag.llm_scheduler.stats()["active"], 1)
+
+        release.set()
+        deadline = time.monotonic() + 2
+        while self.rag.llm_scheduler.stats()["active"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.rag.llm_scheduler.stats()["active"], 0)
+
+    @patch('src.RAG.PromptRegistry.chain')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    def test_aquery_stream_deadline_bounds_first_chunk(self, mock_get_ids, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_get_ids.return_value = ["0", "1"]
+        self.rag.deadline_intent_reserve = self.rag.deadline_prediction_reserve = self.rag.deadline_review_reserve = 0
+
+        async def slow_stream(inputs):
+            await asyncio.sleep(2)
+            yield "推薦房型：\n"
+
+        mock_chain.return_value.astream.side_effect = slow_stream
+
+        async def run():
+            return [event async for event in self.rag.aquery_stream("想要北歐風的房間", deadline=0.3)]
+
+        start = time.perf_counter()
+        events = asyncio.run(run())
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertTrue(events[-1][1]["degraded"])
+        self.assertEqual(self.rag.llm_scheduler.stats()["active"], 0)
+
+    """
+    單次 LLM 請求的逾時不超過每個查詢的時間預算
+    """
+    def test_request_timeout(self):
+        self.rag.llm_timeout = 60
+        self.assertEqual(self.rag.request_timeout(), 60)
+        self.rag.query_deadline = 30
+        self.assertEqual(self.rag.request_timeout(), 30)
+        self.rag.query_deadline = 0.5
+        self.assertEqual(self.rag.request_timeout(), 1)
+
+    """
+    LLM 的執行名額都被佔用且排隊逾時時拋出 SchedulerBusyError（由 app 回傳 503），不計入斷路器；名額空出後照常回答
+    """
+    @patch('src.RAG.PromptRegistry.chain')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    def test_query_scheduler_busy(self, mock_get_ids, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_get_ids.return_value = ["0", "1"]
+        mock_chain.return_value.invoke.return_value = "房型名稱：B\n推薦理由：北歐風\n結語：歡迎入住"
+        self.rag.llm_max_concurrency = 1
+        self.rag.llm_max_queue_time = 0.1
+        self.rag.llm_scheduler.acquire()
+
+        with self.assertRaises(SchedulerBusyError) as context:
+            self.rag.query("想要北歐風的房間")
+        self.assertGreaterEqual(context.exception.retry_after, 1)
+        self.assertEqual(self.rag.stats()["counters"]["llm_busy"], 1)
+        self.assertEqual(self.rag.stats()["llm_breaker"]["calls"], 0)
+        self.assertEqual(self.rag.stats()["llm_scheduler"]["timed_out"], 1)
+
+        self.rag.llm_scheduler.release()
+        result = self.rag.query("想要北歐風的房間")
+        self.assertNotIn("degraded", result)
+        self.assertEqual(self.rag.stats()["llm_scheduler"]["active"], 0)
+
+    """
+    查詢有時間預算時最多排隊到預算用完，之後改由房型目錄排序回答
+    """
+    @patch('src.RAG.PromptRegistry.chain')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    def test_query_deadline_while_queued(self, mock_get_ids, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_get_ids.return_value = ["0", "1"]
+        self.rag.llm_max_concurrency = 1
+        self.rag.deadline_intent_reserve = self.rag.deadline_prediction_reserve = self.rag.deadline_review_reserve = 0
+        self.rag.llm_scheduler.acquire()
+
+        start = time.perf_counter()
+        result = self.rag.query("想要北歐風的房間", deadline=0.2)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertTrue(result["degraded"])
+        self.assertEqual(result["meta"]["degradations"], ["fallback_ranking"])
+        mock_chain.return_value.invoke.assert_not_called()
+        self.assertEqual(self.rag.stats()["counters"]["deadline_llm_timeouts"], 1)
+        self.rag.llm_scheduler.release()
+
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction')
+    @patch.object(RAGPipeline, 'review_recommendation')
+    def test_query_review_scheduler_busy(self, mock_review, mock_llm, mock_get_ids, mock_intent):
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["0", "1"]
+        mock_llm.return_value = "房型名稱：A\n推薦理由：安靜\n結語：歡迎入住"
+        mock_review.side_effect = SchedulerBusyError(2)
+
+        result = self.rag.query("想找安靜一點的房間")
+        self.assertEqual(result["conclusion"], mock_llm.return_value)
+        self.assertEqual(self.rag.stats()["counters"]["review_unavailable"], 1)
+
+    def test_stage_priority(self):
+        self.assertEqual(self.rag.stage_priority("auto_recommend"), BACKGROUND_PRIORITY)
+        self.assertEqual(self.rag.stage_priority("prediction"), CHAT_PRIORITY)
+
+    @patch('src.RAG.PromptRegistry.chain')
+    def test_aquery_scheduler_busy(self, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_chain.return_value.ainvoke = AsyncMock(return_value="房型推薦")
+        self.rag.llm_max_concurrency = 1
+        self.rag.llm_max_queue = 0
+        self.rag.llm_scheduler.acquire()
+        with self.assertRaises(SchedulerBusyError):
+            asyncio.run(self.rag.aquery("你們有什麼"))
+        self.assertEqual(self.rag.stats()["llm_scheduler"]["rejected"], 1)
+        self.rag.llm_scheduler.release()
+
+    """
+    剩餘時間不足以請 LLM 審查時略過審查、直接採用推薦內容，並在回應的 meta 中回報；降級處理後的回應不寫入快取
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction')
+    @patch.object(RAGPipeline, 'review_recommendation')
+    def test_query_deadline_skips_review(self, mock_review, mock_llm, mock_get_ids, mock_intent):
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["0", "1"]
+        mock_llm.return_value = "房型名稱：A\n推薦理由：安靜\n結語：歡迎入住"
+        self.rag.cache_responses = True
+        self.rag.query_deadline = 10
+        self.rag.deadline_prediction_reserve = 1
+        self.rag.deadline_review_reserve = 20
+
+        result = self.rag.query("想找安靜一點的房間")
+        self.assertEqual(result["conclusion"], mock_llm.return_value)
+        mock_review.assert_not_called()
+        self.assertEqual(result["meta"]["deadline"], 10)
+        self.assertEqual(result["meta"]["degradations"], ["skip_review"])
+        self.assertEqual(len(self.rag.response_cache), 0)
+
+        # 沒有時間預算時照常審查，回應中沒有 meta
+        mock_review.return_value = "推薦內容符合使用者需求，無需變更。"
+        self.rag.query_deadline = None
+        result = self.rag.query("想找安靜一點的房間")
+        mock_review.assert_called_once()
+        self.assertNotIn("meta", result)
+
+    """
+    剩餘時間只夠產生推薦、不夠再審查時，推薦 prompt 只放前 deadline_retrieval_k 個房型
+    """
+    @patch.object(RAGPipeline, 'classify_intent')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    @patch.object(RAGPipeline, 'LLM_Prediction')
+    @patch.object(RAGPipeline, 'review_recommendation')
+    def test_query_deadline_shrinks_k(self, mock_review, mock_llm, mock_get_ids, mock_intent):
+        mock_intent.return_value = "房型推薦"
+        mock_get_ids.return_value = ["1", "0"]
+        mock_llm.return_value = "房型名稱：B\n推薦理由：安靜"
+        mock_review.return_value = "推薦內容符合使用者需求，無需變更。"
+        self.rag.deadline_retrieval_k = 1
+
+        result = self.rag.query("想找安靜一點的房間", deadline=12)
+        self.assertEqual(mock_llm.call_args[0][1], "名稱|價格|面積|風格|人數|特色\nB|2000|20|北歐風|3|小")
+        self.assertEqual(result["meta"]["degradations"], ["shrink_k"])
+        self.assertEqual(self.rag.stats()["counters"]["deadline_shrink_k"], 1)
+
+    """
+    剩餘時間不足時不呼叫 LLM 判斷意圖（規則無法判斷時視為房型推薦），也不呼叫 LLM 推薦，改由房型目錄排序回答
+    """
+    @patch('src.RAG.PromptRegistry.chain')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    def test_query_deadline_rule_intent_and_fallback(self, mock_get_ids, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_get_ids.return_value = ["0", "1"]
+
+        result = self.rag.query("想找安靜一點的房間", deadline=1)
+        mock_chain.assert_not_called()
+        self.assertTrue(result["degraded"])
+        self.assertEqual(result["meta"]["degradations"], ["rule_intent", "fallback_ranking"])
+
+        events = list(self.rag.query_stream("想找安靜一點的房間", deadline=1))
+        self.assertEqual([event for event, _ in events], ["token", "done"])
+        self.assertEqual(events[-1][1]["meta"]["degradations"], ["rule_intent", "fallback_ranking"])
+
+    """
+    LLM 呼叫最多只等待剩餘的時間：超過時間預算時不再等待，改由房型目錄排序回答，且不計入斷路器的失敗
+    """
+    @patch('src.RAG.PromptRegistry.chain')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    def test_query_deadline_bounds_llm_call(self, mock_get_ids, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_get_ids.return_value = ["0", "1"]
+        release = threading.Event()
+        mock_chain.return_value.invoke.side_effect = lambda inputs: release.wait(2) and "推薦內容"
+        self.rag.deadline_intent_reserve = self.rag.deadline_prediction_reserve = self.rag.deadline_review_reserve = 0
+
+        start = time.perf_counter()
+        result = self.rag.query("想要北歐風的房間", deadline=0.2)
+        release.set()
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertTrue(result["degraded"])
+        self.assertEqual(result["meta"]["degradations"], ["fallback_ranking"])
+        self.assertEqual(self.rag.stats()["counters"]["deadline_llm_timeouts"], 1)
+        self.assertEqual(self.rag.stats()["llm_breaker"]["calls"], 0)
+
+    @patch('src.RAG.PromptRegistry.chain')
+    @patch.object(RAGPipeline, 'getRoomIdsByRAG')
+    def test_aquery_deadline_cancels_llm_call(self, mock_get_ids, mock_chain):
+        self.rag.llm = MagicMock()
+        mock_get_ids.return_value = ["0", "1"]
+        cancelled = []
+
+        async def slow(inputs):
+            try:
+                await asyncio.sleep(2)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        mock_chain.return_value.ainvoke = slow
+        self.rag.deadline_intent_reserve = self.rag.deadline_prediction_reserve = self.rag.deadline_review_reserve = 0
+
+        async def run():
+            result = await self.rag.aquery("想要北歐風的房間", deadline=0.2)
+            await asyncio.sleep(0)
+            return result
+
+        start = time.perf_counter()
+        result = asyncio.run(run())
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertTrue(result["degraded"])
+        self.assertEqual(cancelled, [True])
@@ -1,9 +1,12 @@
+import asyncio
 import json
 import os
 import tempfile
+import threading
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from src.RAG import RAGPipeline
+from src.RoomCatalog import RoomCatalog
 import re
 
 class TestRAGPipeline(unittest.TestCase):
@@ -12,36 +15,161 @@ class TestRAGPipeline(unittest.TestCase):
         self.rag.llm = MagicMock()
 
     """
-    Mock → ChatPromptTemplate.from_messages() 方法
-    因為 classify_intent() 裡會使用 ChatPromptTemplate.from_messages() 來建立 Prompt 模板 → 用於提示語生成
+    Mock → PromptRegistry.chain() 方法
+    因為 classify_intent() 會向 PromptRegistry 取得「Prompt 模板 | LLM」的 chain → 用於提示語生成
     這裡把它 mock 掉 → 測試時不去真正運行 Prompt 模板，只測邏輯流程。
     """
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_classify_intent_room_recommend(self, mock_prompt):
         mock_chain = MagicMock()
         mock_chain.invoke.return_value = '房型推薦'
 
         #  組成一個 chain → 用來生成 AI 回應
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
         result = self.rag.classify_intent('請推薦三人房')
         self.assertEqual(result, '房型推薦')
 
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_classify_intent_greeting(self, mock_prompt):
         mock_chain = MagicMock()
         mock_chain.invoke.return_value = '打招呼'
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
         result = self.rag.classify_intent('你好')
         self.assertEqual(result, '打招呼')
 
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_classify_intent_other(self, mock_prompt):
         mock_chain = MagicMock()
         mock_chain.invoke.return_value = '其他'
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
         result = self.rag.classify_intent('今天天氣如何？')
         self.assertEqual(result, '其他')
 
+    """
+    規則能確定意圖時（如打招呼、明確的價格條件）不應呼叫 LLM；無法確定時才交給 LLM
+    """
+    @patch('src.RAG.PromptRegistry.chain')
+    def test_classify_intent_rule_fast_path(self, mock_prompt):
+        mock_chain = MagicMock()
+        mock_chain.invoke.return_value = '其他'
+        mock_prompt.return_value = mock_chain
+
+        self.assertEqual(self.rag.classify_intent('你好'), '打招呼')
+        self.assertEqual(self.rag.classify_intent('3000元以下雙人房'), '房型推薦')
+        mock_chain.invoke.assert_not_called()
+
+        self.assertEqual(self.rag.classify_intent('今天天氣如何？'), '其他')
+        mock_chain.invoke.assert_called_once()
+
+        stats = self.rag.stats()["intent"]
+        self.assertEqual(stats["rule_hits"], 2)
+        self.assertEqual(stats["llm_fallback"], 1)
+
+    """
+    非同步意圖分類：規則無法確定時以 ainvoke 呼叫 LLM，不使用同步的 invoke
+    """
+    @patch('src.RAG.PromptRegistry.chain')
+    def test_aclassify_intent(self, mock_prompt):
+        mock_chain = MagicMock()
+        mock_chain.ainvoke = AsyncMock(return_value=' 其他 ')
+        mock_prompt.return_value = mock_chain
+
+        self.assertEqual(asyncio.run(self.rag.aclassify_intent('你好')), '打招呼')
+        self.assertEqual(asyncio.run(self.rag.aclassify_intent('今天天氣如何？')), '其他')
+        mock_chain.ainvoke.assert_awaited_once_with({"question": '今天天氣如何？'})
+        mock_chain.invoke.assert_not_called()
+
+    @patch('src.RAG.PromptRegistry.chain')
+    def test_parse_request_valid_json(self, mock_prompt):
+        mock_chain = MagicMock()
+        mock_chain.invoke.return_value = (
+            '```json\n{"intent": "房型推薦", "price": {"min": null, "max": 3000, "min_strict": false, "max_strict": true}, '
+            '"area": {"min": 20, "max": null, "min_strict": false, "max_strict": false}, '
+            '"occupancy": 2, "styles": ["工業"], "features": ["浴缸"]}\n```'
+        )
+        mock_prompt.return_value = mock_chain
+
+        intent, constraints = self.rag.parse_request("3000以下、20坪以上有浴缸的工業風雙人房")
+        self.assertEqual(intent, "房型推薦")
+        self.assertEqual(constraints.price_range, (None, 3000, False, True))
+        self.assertEqual(constraints.area_range, (20, None, False, False))
+        self.assertEqual(constraints.occupancy, 2)
+        self.assertEqual(constraints.styles, ["工業"])
+        self.assertEqual(constraints.amenities, ["浴缸"])
+        # 使用者輸入以模板變數傳入
+        mock_chain.invoke.assert_called_once_with({"question": "3000以下、20坪以上有浴缸的工業風雙人房"})
+
+    @patch('src.RAG.PromptRegistry.chain')
+    def test_parse_request_malformed(self, mock_prompt):
+        mock_chain = MagicMock()
+        mock_prompt.return_value = mock_chain
+        malformed = [
+            '房型推薦',                                                       # 沒有 JSON
+            '{intent: 房型推薦}',                                               # 無法解析
+            '{"intent": "訂房"}',                                               # 意圖不在允許值內
+            '{"intent": "房型推薦", "price": {"min": "三千", "max": null}}',     # 數值型別錯誤
+            '{"intent": "房型推薦", "occupancy": true}',                        # 布林值不是人數
+            '{"intent": "房型推薦", "styles": "工業"}'                          # styles 不是列表
+        ]
+        for reply in malformed:
+            mock_chain.invoke.return_value = reply
+            self.assertIsNone(self.rag.parse_request("問題"), reply)
+
+    @patch('src.RAG.PromptRegistry.chain')
+    def test_parse_request_minimal_json(self, mock_prompt):
+        # 缺少的條件欄位視為沒有限制
+        mock_chain = MagicMock()
+        mock_chain.invoke.return_value = '{"intent": "打招呼"}'
+        mock_prompt.return_value = mock_chain
+        intent, constraints = self.rag.parse_request("你好")
+        self.assertEqual(intent, "打招呼")
+        self.assertFalse(constraints.has_numeric())
+
+    def test_extract_constraints(self):
+        self.rag.data = [
+            {"id": 0, "name": "A", "price": "1000", "area": "10", "features": "浴缸、陽台", "style": "工業", "maxOccupancy": "2人房"}
+        ]
+        constraints = self.rag.extract_constraints("3000元以下的工業雙人房，要有浴缸")
+        self.assertEqual(constraints.price_range, (None, 3000, False, False))
+        self.assertEqual(constraints.area_range, (None, None, False, False))
+        self.assertEqual(constraints.occupancy, 2)
+        self.assertEqual(constraints.styles, ["工業"])
+        self.assertEqual(constraints.amenities, ["浴缸"])
+
+    def test_verify_recommendation(self):
+        from src.Constraints import RoomConstraints
+
+        self.rag.data = [
+            {"id": 0, "name": "和式套房", "price": "5000", "area": "30", "features": "日式榻榻米、浴缸", "style": "日式", "maxOccupancy": "2人房"},
+            {"id": 1, "name": "泳池景家庭房", "price": "6500", "area": "35", "features": "游泳池、陽台", "style": "現代", "maxOccupancy": "4人房"}
+        ]
+        conclusion = "推薦房型：\n和式套房\n推薦理由：價格5000元\n\n結語：歡迎入住"
+
+        # 全部符合條件
+        self.assertTrue(self.rag.verify_recommendation(conclusion, RoomConstraints(price_range=(None, 6000, False, False), styles=["日式"])))
+        self.assertTrue(self.rag.verify_recommendation(conclusion, RoomConstraints(occupancy=2, amenities=["浴缸"])))
+        # 價格、人數、風格或設施不符
+        self.assertFalse(self.rag.verify_recommendation(conclusion, RoomConstraints(price_range=(None, 5000, False, True))))
+        self.assertFalse(self.rag.verify_recommendation(conclusion, RoomConstraints(occupancy=4)))
+        self.assertFalse(self.rag.verify_recommendation(conclusion, RoomConstraints(styles=["現代"])))
+        self.assertFalse(self.rag.verify_recommendation(conclusion, RoomConstraints(amenities=["陽台"])))
+        # 其中一間不符合
+        both = conclusion + "\n泳池景家庭房\n推薦理由：..."
+        self.assertFalse(self.rag.verify_recommendation(both, RoomConstraints(price_range=(None, 6000, False, False))))
+        # 無法判斷：沒有房型名稱、沒有可檢查的條件
+        self.assertIsNone(self.rag.verify_recommendation("目前沒有完全符合的房型", RoomConstraints(occupancy=2)))
+        self.assertIsNone(self.rag.verify_recommendation(conclusion, RoomConstraints()))
+        self.assertIsNone(self.rag.verify_recommendation(conclusion, None))
+
+        # 多種風格的房型與 catalog.bitmap 的篩選結果一致
+        self.rag.data = self.rag.data + [
+            {"id": 2, "name": "和洋套房", "price": "5500", "area": "30", "features": "榻榻米", "style": "日式/現代", "maxOccupancy": "2人房"}
+        ]
+        mixed = "推薦房型：\n和洋套房\n推薦理由：..."
+        self.assertTrue(self.rag.verify_recommendation(mixed, RoomConstraints(styles=["日式"])))
+        self.assertTrue(self.rag.verify_recommendation(mixed, RoomConstraints(styles=["現代"])))
+        self.assertEqual(self.rag.catalog.bitmap(styles=["日式"]), 0b101)
+
     def test_range_price_pattern(self):
         # 測試各種區間格式
         self.assertEqual(self.rag.extract_price_range("價格2000~3000元"), (2000, 3000, False, False))
@@ -172,6 +300,13 @@ class TestRAGPipeline(unittest.TestCase):
         self.assertEqual(self.rag.extract_area_range("40m²以下"), (None, 40, False, False))
         self.assertEqual(self.rag.extract_area_range("面積小於40m²"), (None, 40, False, True))
 
+    def test_extract_chinese_numerals(self):
+        # 中文數字的金額與人數
+        self.assertEqual(self.rag.extract_price_range("預算五千以內"), (None, 5000, False, False))
+        self.assertEqual(self.rag.extract_price_range("兩千到三千五百元"), (2000, 3500, False, False))
+        self.assertEqual(self.rag.extract_occupancy("十二人"), 12)
+        self.assertEqual(self.rag.extract_occupancy("兩位大人"), 2)
+
     def test_filter_by_area_range_all_none(self):
         # min_area, max_area 都為 None，應回傳所有有面積的資料
         summary = "名稱:房A 價格:2000 面積:20\n名稱:房B 價格:3000 面積:30\n名稱:房C 價格:4000 面積:40"
@@ -411,7 +546,7 @@ class TestRAGPipeline(unittest.TestCase):
         self.assertEqual(self.rag._parse_max_occupancy('未知'), 1)
         self.assertEqual(self.rag._parse_max_occupancy('abc'), 1)
 
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_auto_recommend_room_success(self, mock_prompt):
         # 模擬 LLM 回傳正確 JSON 格式且所有欄位皆有
         self.rag = RAGPipeline.__new__(RAGPipeline)
@@ -427,7 +562,7 @@ class TestRAGPipeline(unittest.TestCase):
         mock_chain = MagicMock()
         # LLM 回傳內容 (設定成永遠回傳固定的 JSON 字串)
         mock_chain.invoke.return_value = '{"name": "B", "price": 2000, "area": 20, "features": "小", "style": "北歐風", "maxOccupancy": "3"}'
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
 
         # JSON 字串 -> JSON Format
         result = self.rag.auto_recommend_room()
@@ -438,7 +573,7 @@ class TestRAGPipeline(unittest.TestCase):
     """
     當 LLM 回傳的房型名稱與現有資料重複時，auto_recommend_room() 應該要自動重試，直到取得一個新名稱的推薦房型。
     """
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_auto_recommend_room_duplicate_name(self, mock_prompt):
         self.rag = RAGPipeline.__new__(RAGPipeline)
         self.rag.data = [
@@ -452,7 +587,7 @@ class TestRAGPipeline(unittest.TestCase):
             '{"name": "A", "price": 2000, "area": 20, "features": "小", "style": "北歐風", "maxOccupancy": "3"}',
             '{"name": "B", "price": 3000, "area": 30, "features": "中", "style": "現代風", "maxOccupancy": "4"}'
         ]
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
         result = self.rag.auto_recommend_room()
         self.assertEqual(result, {
             "name": "B", "price": 3000, "area": 30, "features": "中", "style": "現代風", "maxOccupancy": 4
@@ -464,7 +599,7 @@ class TestRAGPipeline(unittest.TestCase):
     第二次解析成功，並完成型別轉換（e.g. maxOccupancy 轉為 int(5)）。
     最後得到期望的 dict 結構，並與 self.assertEqual(...) 成立。
     """
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_auto_recommend_room_invalid_json(self, mock_prompt):
         self.rag = RAGPipeline.__new__(RAGPipeline)
         self.rag.data = []
@@ -475,14 +610,14 @@ class TestRAGPipeline(unittest.TestCase):
             '這不是json',
             '{"name": "C", "price": 4000, "area": 40, "features": "大", "style": "日式", "maxOccupancy": "5"}'
         ]
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
         result = self.rag.auto_recommend_room()
         self.assertEqual(result, {
             "name": "C", "price": 4000, "area": 40, "features": "大", "style": "日式", "maxOccupancy": 5
         })
         self.assertEqual(mock_chain.invoke.call_count, 2)
 
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_auto_recommend_room_missing_field(self, mock_prompt):
         # LLM 回傳缺少欄位，應重試
         self.rag = RAGPipeline.__new__(RAGPipeline)
@@ -495,7 +630,7 @@ class TestRAGPipeline(unittest.TestCase):
             '{"name": "D", "price": 5000, "area": 50, "features": "大", "style": "美式"}',
             '{"name": "E", "price": 6000, "area": 60, "features": "大", "style": "現代", "maxOccupancy": "6"}'
         ]
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
         result = self.rag.auto_recommend_room()
         self.assertEqual(result, {
             "name": "E", "price": 6000, "area": 60, "features": "大", "style": "現代", "maxOccupancy": 6
@@ -505,7 +640,7 @@ class TestRAGPipeline(unittest.TestCase):
     """
     當 LLM 連續回傳無效 JSON 且超過最大重試次數時，auto_recommend_room() 應該回傳 None
     """
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_auto_recommend_room_max_retry(self, mock_prompt):
         self.rag = RAGPipeline.__new__(RAGPipeline)
         self.rag.data = []
@@ -513,7 +648,7 @@ class TestRAGPipeline(unittest.TestCase):
         self.rag.llm = MagicMock()
         mock_chain = MagicMock()
         mock_chain.invoke.return_value = '這不是json'      # 這表示每次呼叫 LLM，永遠回傳錯誤格式的字串，會讓 json.loads() 失敗
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
         result = self.rag.auto_recommend_room()
         self.assertIsNone(result)
         self.assertEqual(mock_chain.invoke.call_count, 5)
@@ -523,7 +658,7 @@ class TestRAGPipeline(unittest.TestCase):
     當 LLM 第一次回傳無法解析的 JSON（會觸發 JSONDecodeError），auto_recommend_room() 應該自動重試
     並在第二次成功後正確回傳解析後的房型資訊。
     """
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_auto_recommend_room_json_decode_Error(self, mock_prompt):
         # LLM 回傳格式錯誤，觸發 JSONDecodeError，應重試
         self.rag = RAGPipeline.__new__(RAGPipeline)
@@ -536,14 +671,14 @@ class TestRAGPipeline(unittest.TestCase):
             '{name: 無引號, price: 1000}',  # 無法解析的 JSON
             '{"name": "F", "price": 7000, "area": 70, "features": "大", "style": "現代", "maxOccupancy": "7"}'
         ]
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
         result = self.rag.auto_recommend_room()
         self.assertEqual(result, {
             "name": "F", "price": 7000, "area": 70, "features": "大", "style": "現代", "maxOccupancy": 7
         })
         self.assertEqual(mock_chain.invoke.call_count, 2)
 
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_auto_recommend_room_no_json_match(self, mock_prompt):
         # LLM 回傳內容中沒有任何大括號，match 會是 None，應觸發 continue
         self.rag = RAGPipeline.__new__(RAGPipeline)
@@ -556,7 +691,7 @@ class TestRAGPipeline(unittest.TestCase):
             '這裡沒有json格式',
             '{"name": "G", "price": 8000, "area": 80, "features": "大", "style": "現代", "maxOccupancy": "8"}'
         ]
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
         result = self.rag.auto_recommend_room()
         self.assertEqual(result, {
             "name": "G", "price": 8000, "area": 80, "features": "大", "style": "現代", "maxOccupancy": 8
@@ -565,37 +700,92 @@ class TestRAGPipeline(unittest.TestCase):
     """
     確認當 LLM 回應表示「推薦內容已符合使用者需求」時，review_recommendation 函數可以正確回傳這段訊息。
     """
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_review_recommendation_fully_match(self, mock_prompt):
         mock_chain = MagicMock()
         mock_chain.invoke.return_value = '推薦內容符合使用者需求，無需變更。'
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
         user_question = '我要兩人房，現代風格'
         llm_output = '推薦內容...'
         result = self.rag.review_recommendation(user_question, llm_output)
         self.assertEqual(result, '推薦內容符合使用者需求，無需變更。')
+        # 使用者需求與推薦內容只以模板變數傳入
+        mock_chain.invoke.assert_called_once_with({"question": user_question, "recommendation": llm_output})
 
     """
     驗證當 LLM 判斷「推薦內容不完全符合使用者需求」時，review_recommendation() 是否能正確回傳 LLM 給的建議內容。
     """
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_review_recommendation_not_fully_match(self, mock_prompt):
         reply = '目前沒有完全符合的房型'
         mock_chain = MagicMock()
         mock_chain.invoke.return_value = reply
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
         user_question = '我要三人房，工業風格'
         llm_output = '推薦內容...'
         result = self.rag.review_recommendation(user_question, llm_output)
         self.assertEqual(result, reply)
 
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    """
+    各呼叫階段依 stage_models 使用不同的模型；沒有設定的階段使用預設的 self.llm，設定相同的階段共用同一個 LLM
+    """
+    @patch('src.RAG.PromptRegistry.chain')
+    def test_stage_model_routing(self, mock_prompt):
+        self.rag.llm = self.rag.create_llm(model="large", base_url="http://large:11434")
+        self.rag.stage_models = self.rag.validate_stage_models({
+            "intent": {"model": "small", "temperature": 0, "max_tokens": 8},
+            "review": {"model": "small", "temperature": 0, "max_tokens": 8},
+            "auto_recommend": {"base_url": "http://other:11434"}
+        })
+        mock_chain = MagicMock()
+        mock_chain.invoke.return_value = '其他'
+        mock_prompt.return_value = mock_chain
+
+        self.rag.classify_intent('今天天氣如何？')
+        self.rag.review_recommendation('我要兩人房', '推薦內容...')
+        self.rag.LLM_Prediction('我要兩人房', '')
+        (intent_stage, intent_llm), (review_stage, review_llm), (prediction_stage, prediction_llm) = \
+            [call.args for call in mock_prompt.call_args_list]
+
+        self.assertEqual((intent_stage, review_stage, prediction_stage), ("intent", "review", "prediction"))
+        self.assertEqual((intent_llm.model, intent_llm.base_url, intent_llm.num_predict), ("small", "http://large:11434", 8))
+        self.assertEqual(intent_llm.temperature, 0)
+        self.assertIs(review_llm, intent_llm)
+        self.assertIs(prediction_llm, self.rag.llm)
+
+        routing = self.rag.llm_routing()
+        self.assertEqual(routing["structured"], {"model": "large", "base_url": "http://large:11434"})
+        self.assertEqual(routing["auto_recommend"], {"model": "large", "base_url": "http://other:11434"})
+
+    """
+    base_url 為多個網址時經由 OllamaPool 連線，相同網址組合的階段共用同一個連線池
+    """
+    def test_stage_model_endpoint_pool(self):
+        from src.OllamaPool import PooledOllama
+
+        self.rag.llm_health_interval = 0
+        self.rag.llm = self.rag.create_llm(model="large", base_url=["http://gpu-1:11434", "http://gpu-2:11434"])
+        self.rag.stage_models = self.rag.validate_stage_models({"intent": {"model": "small"}})
+        intent_llm = self.rag.llm_for("intent")
+        self.assertIsInstance(self.rag.llm, PooledOllama)
+        self.assertIsInstance(intent_llm, PooledOllama)
+        self.assertEqual((intent_llm.model, intent_llm.base_url), ("small", ("http://gpu-1:11434", "http://gpu-2:11434")))
+        self.assertIs(intent_llm.pool, self.rag.llm.pool)
+        self.assertEqual(list(self.rag.stats()["llm_pools"]), ["http://gpu-1:11434,http://gpu-2:11434"])
+
+    def test_validate_stage_models(self):
+        with self.assertRaises(ValueError):
+            RAGPipeline.validate_stage_models({"translate": {"model": "small"}})
+        with self.assertRaises(ValueError):
+            RAGPipeline.validate_stage_models({"intent": {"top_k": 5}})
+
+    @patch('src.RAG.PromptRegistry.chain')
     def test_llm_prediction_normal(self, mock_prompt):
         self.rag = RAGPipeline.__new__(RAGPipeline)
         self.rag.llm = MagicMock()
         mock_chain = MagicMock()
         mock_chain.invoke.return_value = "推薦房型：\n房型名稱\n推薦理由：..."
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
 
         question = "我要三人房"
         rooms_summary = "名稱:房A 價格:2000 面積:20 特色:大 風格:工業風 床數:2"
@@ -605,13 +795,13 @@ class TestRAGPipeline(unittest.TestCase):
         mock_prompt.assert_called_once()
         mock_chain.invoke.assert_called_once_with({"input": question, "rooms": rooms_summary})
 
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_llm_prediction_empty_rooms(self, mock_prompt):
         self.rag = RAGPipeline.__new__(RAGPipeline)
         self.rag.llm = MagicMock()
         mock_chain = MagicMock()
         mock_chain.invoke.return_value = "目前沒有符合條件的房型"
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
 
         question = "我要日式風格"
         rooms_summary = ""
@@ -620,13 +810,13 @@ class TestRAGPipeline(unittest.TestCase):
         self.assertEqual(result, "目前沒有符合條件的房型")
         mock_chain.invoke.assert_called_once_with({"input": question, "rooms": rooms_summary})
 
-    @patch('src.RAG.ChatPromptTemplate.from_messages')
+    @patch('src.RAG.PromptRegistry.chain')
     def test_llm_prediction_special_characters(self, mock_prompt):
         self.rag = RAGPipeline.__new__(RAGPipeline)
         self.rag.llm = MagicMock()
         mock_chain = MagicMock()
         mock_chain.invoke.return_value = "推薦房型：\n房型名稱：豪華房\n推薦理由：適合您"
-        mock_prompt.return_value.__or__.return_value = mock_chain
+        mock_prompt.return_value = mock_chain
 
         question = "我要$3000~$5000的房型"
         rooms_summary = "名稱:豪華房 價格:4000 面積:30 特色:大 風格:現代風 床數:2"
@@ -669,6 +859,410 @@ class TestRAGPipeline(unittest.TestCase):
             # 確保測試完畢會刪除臨時檔案，避免殘留
             os.remove(path)
             
+    """
+    驗證向量索引持久化後，重新建立 RAGPipeline 時只會嵌入新增或內容有變動的房型：
+        第一次建立：全部房型都需要嵌入
+        第二次建立（資料未變）：不需要嵌入任何房型
+        修改其中一筆、刪除一筆後再建立：只嵌入修改的那一筆，並刪除已不存在的房型
+    """
+    @patch('src.RAG.Ollama')
+    def test_init_persistent_vectorstore_only_embeds_changed_rooms(self, mock_ollama):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        class CountingEmbedding(DeterministicFakeEmbedding):
+            embedded: list = []
+
+            def embed_documents(self, texts):
+                self.embedded.extend(texts)
+                return super().embed_documents(texts)
+
+        data = [
+            {"id": 0, "name": "A", "price": "1000", "area": "10", "features": "大", "style": "工業風", "maxOccupancy": "2人房"},
+            {"id": 1, "name": "B", "price": "2000", "area": "20", "features": "小", "style": "北歐風", "maxOccupancy": "3人房"},
+            {"id": 2, "name": "C", "price": "3000", "area": "30", "features": "中", "style": "現代風", "maxOccupancy": "4人房"}
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, 'rooms.json')
+            persist_directory = os.path.join(tmp_dir, 'vector_db')
+
+            def build(rooms):
+                with open(json_path, 'w', encoding='utf-8') as f:
+                    json.dump(rooms, f, ensure_ascii=False)
+                embedding = CountingEmbedding(size=8, embedded=[])
+                return RAGPipeline(json_path, persist_directory=persist_directory, embeddings=embedding), embedding
+
+            rag, embedding = build(data)
+            self.assertEqual(len(embedding.embedded), 3)
+
+            rag, embedding = build(data)
+            self.assertEqual(embedding.embedded, [])
+            self.assertEqual(len(rag.vectorstore.get()["ids"]), 3)
+
+            changed = [dict(data[0], price="1500"), data[1]]
+            rag, embedding = build(changed)
+            self.assertEqual(len(embedding.embedded), 1)
+            self.assertIn("價格:1500", embedding.embedded[0])
+            self.assertEqual(sorted(rag.vectorstore.get()["ids"]), ["0", "1"])
+
+    """
+    更換嵌入模型（向量維度不同）後重新建立 RAGPipeline 時，清空索引並重新嵌入所有房型，不會沿用舊模型的向量
+    """
+    @patch('src.RAG.Ollama')
+    def test_init_reembeds_when_embedding_model_changes(self, mock_ollama):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        class CountingEmbedding(DeterministicFakeEmbedding):
+            embedded: list = []
+
+            def embed_documents(self, texts):
+                self.embedded.extend(texts)
+                return super().embed_documents(texts)
+
+        data = [
+            {"id": 0, "name": "A", "price": "1000", "area": "10", "features": "大", "style": "工業風", "maxOccupancy": "2人房"},
+            {"id": 1, "name": "B", "price": "2000", "area": "20", "features": "小", "style": "北歐風", "maxOccupancy": "3人房"}
+        ]
+
+        for backend in RAGPipeline.VECTOR_BACKENDS:
+            with self.subTest(backend=backend), tempfile.TemporaryDirectory() as tmp_dir:
+                json_path = os.path.join(tmp_dir, 'rooms.json')
+                with open(json_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+
+                def build(size):
+                    embedding = CountingEmbedding(size=size, embedded=[])
+                    rag = RAGPipeline(json_path, persist_directory=os.path.join(tmp_dir, 'vector_db'),
+                                      embeddings=embedding, vector_backend=backend)
+                    return rag, embedding
+
+                build(8)
+                rag, embedding = build(12)
+                self.assertEqual(len(embedding.embedded), 2)
+                self.assertEqual({metadata["embedding_model"] for metadata in rag.vectorstore.get()["metadatas"]},
+                                 {rag.embedding_model})
+                self.assertEqual(rag.vectorstore.similarity_search(rag.docs[1].page_content, k=1)[0].metadata["room_id"], "1")
+
+                rag, embedding = build(12)
+                self.assertEqual(embedding.embedded, [])
+
+    """
+    驗證 upsert_room / update_room / delete_room 只針對單一房型更新向量資料庫：
+        新增房型只嵌入一份文件
+        更新房型只重新嵌入該房型
+        刪除房型會同步從 data、docs 與向量資料庫中移除
+    """
+    @patch('src.RAG.Ollama')
+    def test_upsert_update_delete_room(self, mock_ollama):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        data = [
+            {"id": 0, "name": "A", "price": "1000", "area": "10", "features": "大", "style": "工業風", "maxOccupancy": "2人房"},
+            {"id": 1, "name": "B", "price": "2000", "area": "20", "features": "小", "style": "北歐風", "maxOccupancy": "3人房"}
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, 'rooms.json')
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+
+            embedding = DeterministicFakeEmbedding(size=8)
+            rag = RAGPipeline(json_path, persist_directory=os.path.join(tmp_dir, 'vector_db'), embeddings=embedding)
+
+            with patch.object(type(embedding), 'embed_documents', autospec=True,
+                              side_effect=lambda self, texts: [[0.1] * 8 for _ in texts]) as mock_embed:
+                new_room = {"id": 2, "name": "C", "price": "3000", "area": "30", "features": "中", "style": "現代風", "maxOccupancy": "4人房"}
+                rag.upsert_room(new_room)
+                self.assertEqual(len(mock_embed.call_args[0][1]), 1)
+                self.assertEqual(rag.data[-1], new_room)
+
+                updated = rag.update_room(0, {"price": "1500"})
+                self.assertEqual(updated["price"], "1500")
+                self.assertEqual(len(mock_embed.call_args[0][1]), 1)
+                self.assertIn("價格:1500", mock_embed.call_args[0][1][0])
+                self.assertEqual(mock_embed.call_count, 2)
+
+            self.assertIsNone(rag.update_room(99, {"price": "1"}))
+
+            self.assertTrue(rag.delete_room(1))
+            self.assertFalse(rag.delete_room(1))
+            self.assertEqual([item["id"] for item in rag.data], [0, 2])
+            self.assertEqual(sorted(doc.metadata["room_id"] for doc in rag.docs), ["0", "2"])
+            self.assertEqual(sorted(rag.vectorstore.get()["ids"]), ["0", "2"])
+
+    def test_extract_occupancy(self):
+        self.assertEqual(self.rag.extract_occupancy("我要雙人房"), 2)
+        self.assertEqual(self.rag.extract_occupancy("單人房就好"), 1)
+        self.assertEqual(self.rag.extract_occupancy("4人房"), 4)
+        self.assertEqual(self.rag.extract_occupancy("三位入住，預算5000"), 3)
+        self.assertEqual(self.rag.extract_occupancy("十二人的團體"), 12)
+        self.assertIsNone(self.rag.extract_occupancy("我要工業風"))
+
+    def test_build_where_filter(self):
+        self.assertIsNone(self.rag.build_where_filter())
+        self.assertIsNone(self.rag.build_where_filter((None, None, False, False), (None, None, False, False)))
+        self.assertEqual(self.rag.build_where_filter(occupancy=2), {"occupancy": {"$gte": 2}})
+        self.assertEqual(
+            self.rag.build_where_filter(price_range=(1000, 3000, True, False)),
+            {"$and": [{"price": {"$gt": 1000}}, {"price": {"$lte": 3000}}]}
+        )
+        # 只有上限時額外排除無法解析的數值
+        self.assertEqual(
+            self.rag.build_where_filter(area_range=(None, 30, False, True), occupancy=4),
+            {"$and": [{"area": {"$gte": 0}}, {"area": {"$lt": 30}}, {"occupancy": {"$gte": 4}}]}
+        )
+
+    """
+    驗證價格、面積、入住人數條件會以 where 傳入向量檢索，且取回的房型都符合條件
+    """
+    @patch('src.RAG.Ollama')
+    def test_getRoomIdsByRAG_prefilter(self, mock_ollama):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        data = [
+            {"id": i, "name": f"房{i}", "price": str(1000 + i * 500), "area": str(10 + i * 5), "features": "特色",
+             "style": "現代風", "maxOccupancy": f"{2 + i % 3}人房"} for i in range(8)
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, 'rooms.json')
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            rag = RAGPipeline(json_path, persist_directory=os.path.join(tmp_dir, 'vector_db'),
+                              embeddings=DeterministicFakeEmbedding(size=8))
+
+            room_ids = rag.getRoomIdsByRAG("預算3000以下的三人房", (None, 3000, False, False), None, 3)
+            # 價格 <= 3000 的為 0~4，其中入住人數 >= 3 的為 1、2、4
+            self.assertEqual(sorted(room_ids), ["1", "2", "4"])
+
+            self.assertEqual(rag.getRoomIdsByRAG("預算500以下", (None, 500, False, False)), [])
+
+    """
+    numpy 後端與 Chroma 後端的預先篩選結果相同，且重新啟動時沿用保存的向量不重新嵌入
+    """
+    @patch('src.RAG.Ollama')
+    def test_numpy_vector_backend(self, mock_ollama):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        class CountingEmbedding(DeterministicFakeEmbedding):
+            embedded: list = []
+
+            def embed_documents(self, texts):
+                self.embedded.extend(texts)
+                return super().embed_documents(texts)
+
+        data = [
+            {"id": i, "name": f"房{i}", "price": str(1000 + i * 500), "area": str(10 + i * 5), "features": "特色",
+             "style": "現代風", "maxOccupancy": f"{2 + i % 3}人房"} for i in range(8)
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, 'rooms.json')
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+
+            def build(backend):
+                embedding = CountingEmbedding(size=8, embedded=[])
+                rag = RAGPipeline(json_path, persist_directory=os.path.join(tmp_dir, backend),
+                                  embeddings=embedding, vector_backend=backend)
+                return rag, embedding
+
+            chroma_rag, _ = build("chroma")
+            numpy_rag, embedding = build("numpy")
+            self.assertEqual(len(embedding.embedded), 8)
+
+            question, price_range = "預算3000以下的三人房", (None, 3000, False, False)
+            # Chroma 預設以 L2 距離排序，假嵌入向量未正規化，因此只比較取回的房型
+            self.assertEqual(sorted(numpy_rag.getRoomIdsByRAG(question, price_range, None, 3)),
+                             sorted(chroma_rag.getRoomIdsByRAG(question, price_range, None, 3)))
+
+            numpy_rag, embedding = build("numpy")
+            self.assertEqual(embedding.embedded, [])
+            self.assertEqual(sorted(numpy_rag.getRoomIdsByRAG(question, price_range, None, 3)), ["1", "2", "4"])
+
+            with self.assertRaises(ValueError):
+                build("faiss")
+
+    """
+    驗證符合風格的候選房型太少時，會將 k 加倍重新檢索，直到足夠或達到上限
+    """
+    def test_getRoomIdsByRAG_adaptive_k(self):
+        rag = RAGPipeline.__new__(RAGPipeline)
+        rag.data = [{"id": i, "name": f"房{i}", "price": "1000", "area": "10", "features": "",
+                     "style": "工業風" if i == 0 else "現代風", "maxOccupancy": "2人房"} for i in range(100)]
+        rag.retrieval_k = 5
+        rag.max_retrieval_k = 20
+        rag.min_candidates = 1
+
+        def search(embedding, k, filter):
+            # 工業風的房型相似度排在第 15 名
+            docs = [MagicMock(page_content=f"風格:{'工業風' if i == 14 else '現代風'}", metadata={"room_id": str(i)})
+                    for i in range(k)]
+            return docs
+
+        rag.embeddings = MagicMock()
+        rag.vectorstore = MagicMock()
+        rag.vectorstore.similarity_search_by_vector.side_effect = search
+        room_ids = rag.getRoomIdsByRAG("我要工業風")
+
+        self.assertEqual([call.kwargs["k"] for call in rag.vectorstore.similarity_search_by_vector.call_args_list], [5, 10, 20])
+        self.assertEqual(room_ids[0], "14")
+        # 放寬 k 重新檢索時沿用同一個問題向量
+        rag.embeddings.embed_query.assert_called_once_with("我要工業風")
+
+    def test_getRoomIdsByRAG_no_widening_without_style(self):
+        rag = RAGPipeline.__new__(RAGPipeline)
+        rag.data = [{"id": i, "name": f"房{i}", "price": "1000", "area": "10", "features": "",
+                     "style": "現代風", "maxOccupancy": "2人房"} for i in range(50)]
+        rag.embeddings = MagicMock()
+        rag.embeddings.embed_query.return_value = [0.1, 0.2]
+        rag.vectorstore = MagicMock()
+        rag.vectorstore.similarity_search_by_vector.return_value = [MagicMock(page_content="", metadata={"room_id": str(i)}) for i in range(10)]
+        rag.getRoomIdsByRAG("推薦安靜的房間", (None, 2000, False, False))
+        rag.vectorstore.similarity_search_by_vector.assert_called_once_with(
+            [0.1, 0.2], k=10, filter={"$and": [{"price": {"$gte": 0}}, {"price": {"$lte": 2000}}]}
+        )
+
+    """
+    混合檢索：向量檢索漏掉逐字出現在特色中的設施時，BM25 關鍵字檢索以 RRF 補上，且只保留符合條件的房型；
+    新增房型後關鍵字索引逐筆更新
+    """
+    def test_getRoomIdsByRAG_hybrid(self):
+        rag = RAGPipeline.__new__(RAGPipeline)
+        rag.data = [{"id": i, "name": f"房{i}", "price": str(1000 * (i + 1)), "area": "10", "features": "浴缸" if i in (4, 5) else "沙發",
+                     "style": "現代風", "maxOccupancy": "2人房"} for i in range(6)]
+        rag.docs = []
+        rag.hybrid_retrieval = True
+        rag.retrieval_k = 3
+        rag.embeddings = MagicMock()
+        rag.vectorstore = MagicMock()
+        rag.vectorstore.similarity_search_by_vector.return_value = [MagicMock(page_content="", metadata={"room_id": str(i)}) for i in range(3)]
+
+        # 融合後兩個排序的第一名並列最前面，結果仍只保留 k 個房型
+        room_ids = rag.getRoomIdsByRAG("想要有浴缸的房間")
+        self.assertEqual(room_ids, ["0", "4", "1"])
+
+        # 價格條件排除房型 5（6000 元）
+        room_ids = rag.getRoomIdsByRAG("想要有浴缸的房間", (None, 5000, False, False))
+        self.assertIn("4", room_ids)
+        self.assertNotIn("5", room_ids)
+
+        rag.upsert_room({"id": 6, "name": "湖景套房", "price": "2000", "area": "10", "features": "按摩浴缸", "style": "現代風", "maxOccupancy": "2人房"})
+        self.assertIn("6", [room_id for room_id, _ in rag.keyword_index.search("浴缸")])
+        rag.delete_room(4)
+        self.assertNotIn("4", [room_id for room_id, _ in rag.keyword_index.search("浴缸")])
+
+    """
+    有設施條件時以點陣圖算出候選房型，以 room_id $in 限制向量檢索；新增房型後點陣圖逐筆更新，不重建房型目錄
+    """
+    def test_getRoomIdsByRAG_amenity_candidates(self):
+        rag = RAGPipeline.__new__(RAGPipeline)
+        rag.data = [{"id": i, "name": f"房{i}", "price": "1000", "area": "10", "features": "浴缸、陽台" if i in (1, 3) else "陽台",
+                     "style": "工業風", "maxOccupancy": "4人房" if i < 3 else "2人房"} for i in range(5)]
+        rag.docs = []
+        rag.embeddings = MagicMock()
+        rag.embeddings.embed_query.return_value = [0.1, 0.2]
+        rag.vectorstore = MagicMock()
+        rag.vectorstore.similarity_search_by_vector.return_value = [MagicMock(page_content="", metadata={"room_id": "1"})]
+
+        self.assertEqual(rag.getRoomIdsByRAG("工業風四人房要有浴缸", None, None, 4, ["工業風"], ["浴缸"]), ["1"])
+        rag.vectorstore.similarity_search_by_vector.assert_called_once_with(
+            [0.1, 0.2], k=1, filter={"$and": [{"occupancy": {"$gte": 4}}, {"room_id": {"$in": ["1"]}}]}
+        )
+
+        # 在目錄的快照上逐筆更新後替換，不由 self.data 重建也不複製整個目錄；查詢中仍持有的舊目錄維持不變
+        catalog = rag.catalog
+        with patch('src.RAG.RoomCatalog') as rebuild, patch.object(RoomCatalog, '_detach') as detach:
+            rag.upsert_room({"id": 5, "name": "房5", "price": "1000", "area": "10", "features": "浴缸", "style": "工業風", "maxOccupancy": "4人房"})
+        rebuild.assert_not_called()
+        detach.assert_not_called()
+        self.assertEqual(len(catalog), 5)
+        self.assertEqual(catalog.bitmap(amenities=["浴缸"]), 0b1010)
+        self.assertEqual(len(rag.catalog), 6)
+        rag.getRoomIdsByRAG("工業風四人房要有浴缸", None, None, 4, ["工業風"], ["浴缸"])
+        self.assertEqual(rag.vectorstore.similarity_search_by_vector.call_args.kwargs["filter"]["$and"][1],
+                         {"room_id": {"$in": ["1", "5"]}})
+
+        # 沒有房型符合所有條件時不需檢索
+        self.assertEqual(rag.getRoomIdsByRAG("兩人房要有浴缸", None, None, 6, [], ["浴缸"]), [])
+        self.assertEqual(rag.vectorstore.similarity_search_by_vector.call_count, 2)
+
+    """
+    相同（正規化後）的問題只嵌入與檢索一次；房型資料異動後檢索結果重新計算，但問題向量仍可沿用
+    """
+    def test_getRoomIdsByRAG_cache(self):
+        rag = RAGPipeline.__new__(RAGPipeline)
+        rag.data = [{"id": i, "name": f"房{i}", "price": "1000", "area": "10", "features": "",
+                     "style": "現代風", "maxOccupancy": "2人房"} for i in range(5)]
+        rag.embeddings = MagicMock()
+        rag.embeddings.embed_query.return_value = [0.1, 0.2]
+        rag.vectorstore = MagicMock()
+        rag.vectorstore.similarity_search_by_vector.return_value = [MagicMock(page_content="", metadata={"room_id": str(i)}) for i in range(5)]
+
+        first = rag.getRoomIdsByRAG("推薦安靜的房間")
+        self.assertEqual(rag.getRoomIdsByRAG(" 推薦安靜的房間？"), first)
+        rag.embeddings.embed_query.assert_called_once()
+        rag.vectorstore.similarity_search_by_vector.assert_called_once()
+
+        # 條件不同時重新檢索
+        rag.getRoomIdsByRAG("推薦安靜的房間", (None, 2000, False, False))
+        self.assertEqual(rag.vectorstore.similarity_search_by_vector.call_count, 2)
+
+        rag.docs = []
+        rag.update_room(1, {"price": "1200"})
+        rag.getRoomIdsByRAG("推薦安靜的房間")
+        self.assertEqual(rag.vectorstore.similarity_search_by_vector.call_count, 3)
+        rag.embeddings.embed_query.assert_called_once()
+
+    """
+    房型異動以複本替換資料與目錄：同時進行的查詢看到的目錄欄位長度一致，以 id 找房型不需逐一掃描
+    """
+    def test_room_updates_are_atomic_for_readers(self):
+        rag = RAGPipeline.__new__(RAGPipeline)
+        rag.data = [{"id": i, "name": f"房{i}", "price": "1000", "area": "10", "features": "浴缸",
+                     "style": "現代風", "maxOccupancy": "2人房"} for i in range(50)]
+        rag.docs = [rag.build_document(item) for item in rag.data]
+        rag.vectorstore = MagicMock()
+        stop, inconsistent = threading.Event(), []
+
+        def read():
+            while not stop.is_set():
+                catalog = rag.catalog
+                if not len(catalog.ids) == len(catalog.price) == len(catalog.occupancy) == len(catalog.rooms):
+                    inconsistent.append(len(catalog.ids))
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        for i in range(50, 250):
+            rag.upsert_room({"id": i, "name": f"房{i}", "price": "2000", "area": "10", "features": "",
+                             "style": "現代風", "maxOccupancy": "2人房"})
+            rag.delete_room(i - 50)
+        stop.set()
+        reader.join()
+
+        self.assertEqual(inconsistent, [])
+        self.assertEqual(rag.catalog.ids, [str(i) for i in range(200, 250)])
+        self.assertEqual([item["id"] for item in rag.data], list(range(200, 250)))
+        self.assertEqual(sorted(int(doc.metadata["room_id"]) for doc in rag.docs), list(range(200, 250)))
+        self.assertEqual(rag._find_room_index(230), 30)
+        self.assertEqual(rag.update_room(230, {"price": "3000"})["price"], "3000")
+        self.assertEqual(rag.catalog.price[30], 3000)
+
+    def test_catalog_rebuilt_when_data_changes(self):
+        rag = RAGPipeline.__new__(RAGPipeline)
+        rag.data = [{"id": 0, "name": "A", "price": "1000", "area": "10", "features": "大", "style": "工業風", "maxOccupancy": "2人房"}]
+        self.assertEqual(rag.catalog.price.tolist(), [1000])
+        # 重新指定 data 後，房型目錄應自動重建
+        rag.data = [{"id": 0, "name": "A", "price": "1500", "area": "10", "features": "大", "style": "工業風", "maxOccupancy": "2人房"}]
+        self.assertEqual(rag.catalog.price.tolist(), [1500])
+
+    def test_build_document_content_hash(self):
+        rag = RAGPipeline.__new__(RAGPipeline)
+        item = {"id": 5, "name": "A", "price": "1000", "area": "10", "features": "大", "style": "工業風", "maxOccupancy": "2人房"}
+        doc = rag.build_document(item)
+        self.assertEqual(doc.metadata["room_id"], "5")
+        # 內容相同時雜湊值相同，內容改變時雜湊值不同
+        self.assertEqual(doc.metadata["content_hash"], rag.build_document(dict(item)).metadata["content_hash"])
+        self.assertNotEqual(doc.metadata["content_hash"], rag.build_document(dict(item, area="12")).metadata["content_hash"])
+
     def test_query_generic_recommend(self):
         # 測試 intent 為『泛用推薦』時，是否隨機回傳三筆資料
         # 準備假資料
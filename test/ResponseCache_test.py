@@ -0,0 +1,93 @@
+import unittest
+
+from src.ResponseCache import LRUCache, ResponseCache, normalize_question
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        # 以問題中的關鍵字決定向量：含「浴缸」的問題彼此相似
+        self.vectors = {"浴缸": [1.0, 0.0], "陽台": [0.0, 1.0]}
+        self.embedded = []
+        self.cache = ResponseCache(embed=self.embed, max_size=3, ttl=60, similarity_threshold=0.9, clock=self.clock)
+
+    def embed(self, text):
+        self.embedded.append(text)
+        return next((vector for keyword, vector in self.vectors.items() if keyword in text), [0.6, 0.8])
+
+    def test_normalize_question(self):
+        self.assertEqual(normalize_question("  有浴缸的房型嗎？ "), "有浴缸的房型嗎")
+        self.assertEqual(normalize_question("Hello  World!"), "hello world")
+
+    def test_exact_hit(self):
+        self.cache.put("有浴缸的房型嗎", 0, {"conclusion": "A"})
+        self.assertEqual(self.cache.get("有浴缸的房型嗎？", 0), {"conclusion": "A"})
+        self.assertEqual(self.cache.stats()["exact_hits"], 1)
+
+    def test_returns_copy(self):
+        self.cache.put("你好", 0, {"rooms": []})
+        self.cache.get("你好", 0)["rooms"].append("x")
+        self.assertEqual(self.cache.get("你好", 0), {"rooms": []})
+
+    def test_semantic_hit_requires_same_signature(self):
+        self.cache.put("有浴缸的房型嗎", 0, {"conclusion": "A"}, signature="s1")
+        self.assertEqual(self.cache.get("想要可以泡澡的浴缸", 0, signature="s1"), {"conclusion": "A"})
+        # 向量相似但條件不同，不可共用回應
+        self.assertIsNone(self.cache.get("3000以下有浴缸", 0, signature="s2"))
+        # 條件相同但向量不相似
+        self.assertIsNone(self.cache.get("有陽台的房型", 0, signature="s1"))
+
+        stats = self.cache.stats()
+        self.assertEqual((stats["semantic_hits"], stats["misses"]), (1, 2))
+
+    def test_catalog_version_invalidates(self):
+        self.cache.put("有浴缸的房型嗎", 0, {"conclusion": "A"})
+        self.assertIsNone(self.cache.get("有浴缸的房型嗎", 1))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_ttl_expires(self):
+        self.cache.put("有浴缸的房型嗎", 0, {"conclusion": "A"})
+        self.clock.now = 61
+        self.assertIsNone(self.cache.get("有浴缸的房型嗎", 0))
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(embed=None, max_size=3)
+        for question in ("q1", "q2", "q3"):
+            cache.put(question, 0, {"conclusion": question})
+        cache.get("q1", 0)
+        cache.put("q4", 0, {"conclusion": "q4"})
+
+        self.assertIsNone(cache.get("q2", 0))
+        self.assertIsNotNone(cache.get("q1", 0))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_exact_only_without_embed(self):
+        cache = ResponseCache(embed=None)
+        cache.put("有浴缸的房型嗎", 0, {"conclusion": "A"})
+        self.assertIsNone(cache.get("想要浴缸", 0))
+        self.assertEqual(cache.get("有浴缸的房型嗎", 0), {"conclusion": "A"})
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_get_put_and_eviction(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats(), {"size": 2, "hits": 2, "misses": 1, "evictions": 1, "hit_rate": 2 / 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import unittest
+
+import numpy as np
+
+from src.RoomCatalog import RoomCatalog, parse_number, format_room
+
+
+class TestRoomCatalog(unittest.TestCase):
+    def setUp(self):
+        self.rooms = [
+            {"id": 0, "name": "房A", "price": "2000", "area": "20", "features": "大", "style": "工業風", "maxOccupancy": "2人房"},
+            {"id": 1, "name": "房B", "price": "3000", "area": "30", "features": "中", "style": "北歐風", "maxOccupancy": "4人房"},
+            {"id": 2, "name": "房C", "price": "4000", "area": "40", "features": "小", "style": "現代風", "maxOccupancy": "3人房"},
+            {"id": 3, "name": "房D", "price": "未定", "area": "", "features": "無", "style": "", "maxOccupancy": ""}
+        ]
+        self.catalog = RoomCatalog(self.rooms)
+
+    def test_parse_number(self):
+        self.assertEqual(parse_number("5000"), 5000)
+        self.assertEqual(parse_number("2人房"), 2)
+        self.assertEqual(parse_number(30), 30)
+        self.assertEqual(parse_number("未知"), -1)
+        self.assertEqual(parse_number(None), -1)
+
+    def test_columns_are_typed(self):
+        # 字串欄位在載入時就轉成整數陣列
+        self.assertEqual(self.catalog.price.dtype, np.int32)
+        self.assertEqual(self.catalog.price.tolist(), [2000, 3000, 4000, -1])
+        self.assertEqual(self.catalog.area.tolist(), [20, 30, 40, -1])
+        self.assertEqual(self.catalog.occupancy.tolist(), [2, 4, 3, -1])
+        self.assertEqual(self.catalog.ids, ["0", "1", "2", "3"])
+
+    def test_mask_without_constraints_keeps_all(self):
+        self.assertEqual(self.catalog.mask().tolist(), [True, True, True, True])
+
+    def test_mask_price_range(self):
+        self.assertEqual(self.catalog.mask(price_range=(3000, None, False, False)).tolist(), [False, True, True, False])
+        self.assertEqual(self.catalog.mask(price_range=(3000, None, True, False)).tolist(), [False, False, True, False])
+        self.assertEqual(self.catalog.mask(price_range=(None, 3000, False, True)).tolist(), [True, False, False, False])
+
+    def test_mask_area_and_occupancy(self):
+        mask = self.catalog.mask(area_range=(20, 40, False, False), occupancy=3)
+        self.assertEqual(mask.tolist(), [False, True, True, False])
+
+    def test_filter_ids_keeps_retrieval_order(self):
+        # 篩選後保留原本檢索的排序，並略過不存在的 id
+        result = self.catalog.filter_ids(["2", "99", "0", "1"], price_range=(None, 3000, False, False))
+        self.assertEqual(result, ["0", "1"])
+        result = self.catalog.filter_ids(["2", "0", "1"], price_range=(None, None, False, False))
+        self.assertEqual(result, ["2", "0", "1"])
+
+    def test_filter_ids_empty(self):
+        self.assertEqual(self.catalog.filter_ids([], price_range=(1000, 2000, False, False)), [])
+
+    """
+    不經檢索的排序：先比較符合的數值條件數量，再比較符合的風格與設施數量，最後維持目錄順序
+    """
+    def test_rank(self):
+        self.assertEqual(self.catalog.rank(), [0, 1, 2, 3])
+        self.assertEqual(self.catalog.rank(price_range=(None, 3000, False, False), styles=["現代風"]), [0, 1, 2, 3])
+        self.assertEqual(self.catalog.rank(occupancy=3, styles=["現代風"], limit=2), [2, 1])
+        # 沒有房型完全符合時仍回傳最接近的房型
+        self.assertEqual(self.catalog.rank(price_range=(None, 1000, False, False), occupancy=4, amenities=["中"], limit=1), [1])
+
+    def test_summarize(self):
+        summary = self.catalog.summarize(["1", "0"])
+        self.assertEqual(summary, format_room(self.rooms[1]) + "\n" + format_room(self.rooms[0]))
+        self.assertEqual(self.catalog.summarize([]), "")
+
+    def test_get(self):
+        self.assertEqual(self.catalog.get(2)["name"], "房C")
+        self.assertIsNone(self.catalog.get(99))
+
+    def test_vocabulary(self):
+        self.assertEqual(self.catalog.styles, ["工業風", "北歐風", "現代風"])
+        self.assertEqual(self.catalog.amenities, ["大", "中", "小", "無"])
+
+
+class TestRoomCatalogBitmaps(unittest.TestCase):
+    def setUp(self):
+        self.rooms = [
+            {"id": 0, "name": "工業風家庭房", "price": "4000", "area": "30", "features": "浴缸、沙發", "style": "工業風", "maxOccupancy": "4人房"},
+            {"id": 1, "name": "工業風雙人房", "price": "3000", "area": "20", "features": "按摩浴缸", "style": "工業風", "maxOccupancy": "2人房"},
+            {"id": 2, "name": "北歐風家庭房", "price": "5000", "area": "35", "features": "浴缸、陽台", "style": "北歐風", "maxOccupancy": "6人房"},
+            {"id": 3, "name": "工業風四人房", "price": "4500", "area": "28", "features": "陽台", "style": "工業風", "maxOccupancy": "4人房"},
+        ]
+        self.catalog = RoomCatalog(self.rooms)
+
+    def ids(self, bitmap):
+        return [room_id for room_id, keep in zip(self.catalog.ids, self.catalog.bitmap_mask(bitmap)) if keep]
+
+    def test_conjunctive_bitmap(self):
+        # 工業風 + 浴缸 + 4人：設施關鍵字同時比對「浴缸」與「按摩浴缸」
+        self.assertEqual(self.ids(self.catalog.bitmap(styles=["工業風"], amenities=["浴缸"], occupancy=4)), ["0"])
+        self.assertEqual(self.ids(self.catalog.bitmap(styles=["工業風"], amenities=["浴缸"])), ["0", "1"])
+        self.assertEqual(self.ids(self.catalog.bitmap(styles=["工業風", "北歐風"], occupancy=5)), ["2"])
+        self.assertEqual(self.ids(self.catalog.bitmap(amenities=["浴缸", "陽台"])), ["2"])
+        self.assertEqual(self.ids(self.catalog.bitmap(styles=["日式"])), [])
+
+    def test_multi_style_room(self):
+        # 風格關鍵字比對包含該字詞的風格：「日式」同時比對「日式」與「日式/現代」
+        self.catalog.upsert({"id": 4, "name": "和洋套房", "price": "6000", "area": "25", "features": "榻榻米", "style": "日式/現代", "maxOccupancy": "2人房"})
+        self.catalog.upsert({"id": 5, "name": "和式套房", "price": "5000", "area": "20", "features": "榻榻米", "style": "日式", "maxOccupancy": "2人房"})
+        self.assertEqual(self.ids(self.catalog.bitmap(styles=["日式"])), ["4", "5"])
+        self.assertEqual(self.ids(self.catalog.bitmap(styles=["現代"])), ["4"])
+        self.assertEqual(int(self.catalog.mask(styles=["日式"]).sum()), 2)
+
+    def test_unknown_amenity_is_ignored(self):
+        # 房型目錄中沒有出現過的設施無法判斷，不列入篩選
+        self.assertEqual(self.ids(self.catalog.bitmap(amenities=["游泳池"])), ["0", "1", "2", "3"])
+
+    def test_mask_combines_bitmaps_with_ranges(self):
+        mask = self.catalog.mask(price_range=(None, 4500, False, False), amenities=["浴缸"])
+        self.assertEqual(mask.tolist(), [True, True, False, False])
+        self.assertEqual(self.catalog.filter_ids(["2", "1", "0"], amenities=["陽台"]), ["2"])
+
+    def test_upsert_updates_bitmaps(self):
+        self.catalog.upsert({"id": 4, "name": "和式套房", "price": "6000", "area": "25", "features": "浴缸、榻榻米", "style": "日式", "maxOccupancy": "4人房"})
+        self.assertEqual(self.ids(self.catalog.bitmap(amenities=["浴缸"], occupancy=4)), ["0", "2", "4"])
+        self.assertIn("日式", self.catalog.styles)
+        self.assertEqual(self.catalog.price.tolist(), [4000, 3000, 5000, 4500, 6000])
+
+        # 取代既有房型時清除舊的設施
+        self.catalog.upsert(dict(self.rooms[0], features="沙發"))
+        self.assertEqual(self.ids(self.catalog.bitmap(amenities=["浴缸"], occupancy=4)), ["2", "4"])
+
+    def test_copy_is_independent(self):
+        copied = self.catalog.copy()
+        copied.upsert({"id": 4, "name": "和式套房", "price": "6000", "area": "25", "features": "浴缸", "style": "日式", "maxOccupancy": "4人房"})
+        copied.remove("0")
+        self.assertEqual(self.catalog.ids, ["0", "1", "2", "3"])
+        self.assertEqual(self.catalog.price.tolist(), [4000, 3000, 5000, 4500])
+        self.assertNotIn("日式", self.catalog.styles)
+        self.assertEqual(self.ids(self.catalog.bitmap(amenities=["浴缸"], occupancy=4)), ["0", "2"])
+        self.assertEqual(copied.ids, ["1", "2", "3", "4"])
+        self.assertEqual(len(copied.price), len(copied.ids))
+
+    """
+    快照與較新的目錄共用欄位陣列：新增房型寫入預留容量，舊快照的長度與點陣圖不變，容量以兩倍擴充
+    """
+    def test_snapshot_shares_columns(self):
+        first = self.catalog.snapshot()
+        first.upsert({"id": 4, "name": "和式套房", "price": "6000", "area": "25", "features": "浴缸", "style": "日式", "maxOccupancy": "4人房"})
+        second = first.snapshot()
+        second.upsert({"id": 5, "name": "和洋套房", "price": "7000", "area": "30", "features": "浴缸", "style": "日式", "maxOccupancy": "2人房"})
+        self.assertTrue(np.shares_memory(first.price, second.price))
+        self.assertEqual((len(self.catalog), len(first), len(second)), (4, 5, 6))
+        self.assertEqual(first.ids, ["0", "1", "2", "3", "4"])
+        self.assertEqual(len(first.rooms), len(first.price))
+        self.assertEqual(self.ids(self.catalog.bitmap(amenities=["浴缸"])), ["0", "1", "2"])
+        self.assertEqual(first.filter_ids(["5", "4"]), ["4"])
+        self.assertIsNone(first.get(5))
+
+        # 在較舊的快照上修改時先複製成獨立的目錄，不覆寫較新目錄的房型
+        first.upsert({"id": 6, "name": "閣樓", "price": "3000", "area": "15", "features": "", "style": "工業風", "maxOccupancy": "2人房"})
+        self.assertEqual(second.ids, ["0", "1", "2", "3", "4", "5"])
+        self.assertEqual(second.get(5)["name"], "和洋套房")
+        self.assertEqual(first.ids, ["0", "1", "2", "3", "4", "6"])
+
+        catalog, grows = RoomCatalog([]), 0
+        for index in range(1000):
+            capacity = len(catalog._price)
+            catalog.upsert({"id": index, "name": f"房{index}", "price": "1000", "area": "10", "features": "", "style": "", "maxOccupancy": "2人房"})
+            grows += len(catalog._price) != capacity
+        self.assertEqual(len(catalog.price), 1000)
+        self.assertLessEqual(grows, 7)
+
+    def test_remove_shifts_bitmaps(self):
+        self.assertTrue(self.catalog.remove("1"))
+        self.assertFalse(self.catalog.remove("1"))
+        self.assertEqual(self.catalog.ids, ["0", "2", "3"])
+        self.assertEqual(self.catalog.get(3)["name"], "工業風四人房")
+        self.assertEqual(self.ids(self.catalog.bitmap(styles=["工業風"])), ["0", "3"])
+        self.assertNotIn("按摩浴缸", self.catalog.amenities)
+        self.assertEqual(self.catalog.occupancy.tolist(), [4, 6, 4])
+
+        # 逐筆更新的結果與重新建立的目錄相同
+        rebuilt = RoomCatalog([self.rooms[0], self.rooms[2], self.rooms[3]])
+        for bitmaps in ("style_bitmaps", "name_bitmaps", "amenity_bitmaps", "occupancy_bitmaps"):
+            self.assertEqual(getattr(self.catalog, bitmaps), getattr(rebuilt, bitmaps))
+
+    def test_matchers(self):
+        self.assertEqual(self.catalog.style_matcher.find("想要工業風或北歐風"), ["工業風", "北歐風"])
+        self.assertEqual(self.catalog.amenity_matcher.find("有按摩浴缸嗎"), ["按摩浴缸", "浴缸"])
+        self.assertEqual(self.catalog.rows_named("推薦北歐風家庭房與工業風雙人房"), [1, 2])
+
+        # 房型異動後比對器重新建立
+        self.catalog.upsert({"id": 4, "name": "和式套房", "price": "6000", "area": "25", "features": "榻榻米", "style": "日式", "maxOccupancy": "2人房"})
+        self.assertEqual(self.catalog.style_matcher.find("日式"), ["日式"])
+        self.assertEqual(self.catalog.rows_named("和式套房"), [4])
+        self.catalog.remove("1")
+        self.assertEqual(self.catalog.rows_named("工業風雙人房、和式套房"), [3])
@@ -36,6 +36,45 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertIn('response', resp.get_json())
 
+    # 測試串流聊天以 Server-Sent Events 依序送出推薦內容與完整回應
+    def test_chat_stream(self):
+        from unittest.mock import patch
+        from app import rag
+        response = {'rooms': {}, 'conclusion': '推薦房型：和式套房'}
+        events = iter([('token', '推薦房型：'), ('token', '和式套房'), ('done', response)])
+        with patch.object(rag, 'query_stream', return_value=events):
+            resp = self.client.post('/chat/stream', json={'message': '請推薦房型'})
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.mimetype.startswith('text/event-stream'))
+            text = resp.data.decode('utf-8')
+
+        blocks = [block for block in text.split('\n\n') if block]
+        self.assertEqual(blocks[0], 'event: token\ndata: {"text": "推薦房型："}')
+        self.assertEqual(blocks[1], 'event: token\ndata: {"text": "和式套房"}')
+        self.assertTrue(blocks[2].startswith('event: done\ndata: '))
+        self.assertEqual(json.loads(blocks[2].split('data: ', 1)[1]), {'response': response})
+
+    # 測試 LLM 排程器忙碌時 /chat 與 /chat/stream 回傳 503 與 Retry-After
+    def test_chat_busy(self):
+        from unittest.mock import patch
+        from app import rag
+        from src.LLMScheduler import SchedulerBusyError
+
+        def busy_stream(question):
+            raise SchedulerBusyError(3, "LLM 排隊的請求已滿")
+            yield
+
+        with patch.object(rag, 'query', side_effect=SchedulerBusyError(3, "LLM 排隊的請求已滿")):
+            resp = self.client.post('/chat', json={'message': '請推薦房型'})
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.headers['Retry-After'], '3')
+        self.assertEqual(resp.get_json()['retry_after'], 3)
+
+        with patch.object(rag, 'query_stream', side_effect=busy_stream):
+            resp = self.client.post('/chat/stream', json={'message': '請推薦房型'})
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.headers['Retry-After'], '3')
+
     # 測試登入成功的情況
     def test_login_success(self):
         resp = self.client.post('/login', data={'username': 'admin', 'password': 'admin'}, follow_redirects=True)
@@ -106,6 +145,16 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(resp.get_json().get('error'), '無法推薦房型')
         app.rag.auto_recommend_room = original_func
 
+    # 測試 LLM 排程器忙碌時自動推薦回傳 503
+    def test_auto_recommend_busy(self):
+        from unittest.mock import patch
+        from app import rag
+        from src.LLMScheduler import SchedulerBusyError
+        with patch.object(rag, 'auto_recommend_room', side_effect=SchedulerBusyError(5)):
+            resp = self.client.get('/auto_recommend')
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.headers['Retry-After'], '5')
+
     # 測試生成房型圖片功能是否能正確回應
     def test_generate_room_image(self):
         data = {'name': '測試房型', 'features': '測試'}
@@ -202,3 +251,55 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(resp.get_json().get('failure'), False)
 
+    # 測試更新房型功能是否能正確回應並寫回 JSON
+    def test_update_room(self):
+        room_id = self.jsonData[0]['id']
+        resp = self.client.post('/update_room', json={'id': room_id, 'price': '9999', 'maxOccupancy': '3'})
+        self.assertEqual(resp.status_code, 200)
+        result = resp.get_json()
+        self.assertTrue(result.get('success'))
+        self.assertEqual(result['room']['price'], '9999')
+        self.assertEqual(result['room']['maxOccupancy'], '3人房')
+
+        with open(os.path.join(self.ROOT, 'static/rooms.json'), 'r', encoding='utf-8') as f:
+            rooms = json.load(f)
+        self.assertEqual(rooms[0]['price'], '9999')
+
+    # 測試更新不存在的房型時回傳 404
+    def test_update_room_not_found(self):
+        resp = self.client.post('/update_room', json={'id': -1, 'price': '9999'})
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(resp.get_json().get('error'), '找不到房型')
+
+    # 測試刪除房型功能是否能正確回應並寫回 JSON
+    def test_delete_room(self):
+        room_id = self.jsonData[-1]['id']
+        resp = self.client.post('/delete_room', json={'id': room_id})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.get_json().get('success'))
+
+        with open(os.path.join(self.ROOT, 'static/rooms.json'), 'r', encoding='utf-8') as f:
+            rooms = json.load(f)
+        self.assertNotIn(room_id, [room['id'] for room in rooms])
+
+        # 還原向量資料庫中的房型
+        import app
+        app.rag.upsert_room(self.jsonData[-1])
+
+    # 測試刪除不存在的房型時回傳 404
+    def test_delete_room_not_found(self):
+        resp = self.client.post('/delete_room', json={'id': -1})
+        self.assertEqual(resp.status_code, 404)
+
+    # 測試未登入時無法存取執行統計
+    def test_stats_requires_login(self):
+        resp = self.client.get('/stats')
+        self.assertEqual(resp.status_code, 401)
+
+    # 測試登入後可取得意圖分類的命中統計
+    def test_stats_with_login(self):
+        with self.client.session_transaction() as sess:
+            sess['logged_in'] = True
+        resp = self.client.get('/stats')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('hit_rate', resp.get_json()['intent'])
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch, AsyncMock
+
+from asgi import application, rag
+from src.LLMScheduler import SchedulerBusyError
+
+
+"""
+以 ASGI 介面直接呼叫 application，回傳 (狀態碼, 回應內容)
+"""
+def call(method, path, body=b"", with_headers=False):
+    async def run():
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+                 "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+                 "headers": [(b"content-type", b"application/json")], "server": ("testserver", 80)}
+        await application(scope, receive, send)
+        start = next(message for message in sent if message["type"] == "http.response.start")
+        content = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+        if with_headers:
+            return start["status"], dict(start["headers"]), content
+        return start["status"], content
+
+    return asyncio.run(run())
+
+
+class AsgiTestCase(unittest.TestCase):
+    # 測試 /chat 由非同步的 rag.aquery 處理
+    def test_chat(self):
+        response = {"rooms": [], "conclusion": "您好"}
+        with patch.object(rag, 'aquery', new_callable=AsyncMock, return_value=response) as mock_aquery:
+            status, content = call("POST", "/chat", json.dumps({"message": "你好"}).encode())
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(content), {"response": response})
+        mock_aquery.assert_awaited_once_with("你好")
+
+    # 測試 /chat/stream 由非同步的 rag.aquery_stream 處理，以 Server-Sent Events 送出
+    def test_chat_stream(self):
+        response = {"rooms": {}, "conclusion": "推薦房型：和式套房"}
+
+        async def stream(question):
+            yield "token", "推薦房型："
+            yield "done", response
+
+        with patch.object(rag, 'aquery_stream', side_effect=stream):
+            status, content = call("POST", "/chat/stream", json.dumps({"message": "請推薦房型"}).encode())
+        self.assertEqual(status, 200)
+        blocks = [block for block in content.decode("utf-8").split("\n\n") if block]
+        self.assertEqual(blocks[0], 'event: token\ndata: {"text": "推薦房型："}')
+        self.assertEqual(json.loads(blocks[1].split("data: ", 1)[1]), {"response": response})
+
+    # 測試 LLM 排程器忙碌時 /chat 與 /chat/stream 回傳 503 與 Retry-After
+    def test_chat_busy(self):
+        async def busy_stream(question):
+            raise SchedulerBusyError(2)
+            yield
+
+        body = json.dumps({"message": "請推薦房型"}).encode()
+        with patch.object(rag, 'aquery', new_callable=AsyncMock, side_effect=SchedulerBusyError(2)):
+            status, headers, content = call("POST", "/chat", body, with_headers=True)
+        self.assertEqual(status, 503)
+        self.assertEqual(headers[b"retry-after"], b"2")
+        self.assertEqual(json.loads(content)["retry_after"], 2)
+
+        with patch.object(rag, 'aquery_stream', side_effect=busy_stream):
+            status, headers, content = call("POST", "/chat/stream", body, with_headers=True)
+        self.assertEqual(status, 503)
+        self.assertEqual(headers[b"retry-after"], b"2")
+
+    # 測試缺少 message 時回傳 400
+    def test_chat_invalid_body(self):
+        status, content = call("POST", "/chat", b"{}")
+        self.assertEqual(status, 400)
+        self.assertIn("error", json.loads(content))
+
+    # 測試其他路由交給 Flask 處理
+    def test_flask_routes(self):
+        status, content = call("GET", "/stats")
+        self.assertEqual(status, 401)
+        self.assertEqual(json.loads(content), {"error": "請先登入"})
+
+
+if __name__ == '__main__':
+    unittest.main()